@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+测量日志对事件循环的影响：并发运行 N 个模拟上传任务，每个任务在 log_context 中持续写业务日志，
+同时用一个 1ms 的定时任务测量事件循环的调度延迟。
+
+    python -m benchmarks.log_latency --jobs 50 --messages 200
+    python -m benchmarks.log_latency --mode legacy
+
+legacy 模式按旧的配置注册 handler：每个业务 logger 一个同步写入的文件 sink、各自带过滤函数和 diagnose。
+日志写入临时目录，不影响 logs/ 下的文件。
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from loguru import logger
+
+from utils.log import BUSINESS_LOGGERS, BusinessLogRouter, FILE_FORMAT, log_context
+
+TICK_SECONDS = 0.001
+
+
+def setup_handlers(mode: str, directory: Path) -> list:
+    """按 mode 注册文件 handler，返回各业务的 logger"""
+    logger.remove()
+    loggers = []
+    if mode == "legacy":
+        for log_name, file_path in BUSINESS_LOGGERS.values():
+            logger.add(directory / file_path, filter=lambda record, name=log_name:
+                       record["extra"].get("business_name") == name, level="INFO", rotation="10 MB",
+                       backtrace=True, diagnose=True)
+            loggers.append(logger.bind(business_name=log_name))
+    else:
+        router = BusinessLogRouter(directory)
+        logger.add(router, filter=lambda record: "business_name" in record["extra"], level="INFO",
+                   format=FILE_FORMAT, backtrace=True, diagnose=True)
+        for log_name, file_path in BUSINESS_LOGGERS.values():
+            router.paths[log_name] = file_path
+            loggers.append(logger.bind(business_name=log_name))
+    return loggers
+
+
+async def fake_upload(job_id: int, business_logger, messages: int):
+    with log_context(job_id=job_id, platform="mock", account=f"account{job_id % 10}"):
+        for index in range(messages):
+            business_logger.info(f"[-] 正在上传视频中... {index}/{messages}")
+            # 模拟等待页面事件
+            await asyncio.sleep(0.002)
+
+
+async def measure_lag(stop: asyncio.Event) -> list:
+    lags = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK_SECONDS)
+        lags.append((time.perf_counter() - start - TICK_SECONDS) * 1000)
+    return lags
+
+
+async def run(jobs: int, messages: int, loggers: list) -> dict:
+    stop = asyncio.Event()
+    ticker = asyncio.ensure_future(measure_lag(stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(fake_upload(job_id, loggers[job_id % len(loggers)], messages)
+                           for job_id in range(jobs)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    lags = sorted(await ticker)
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "lag_p50_ms": round(statistics.median(lags), 3),
+        "lag_p99_ms": round(lags[int(len(lags) * 0.99) - 1], 3),
+        "lag_max_ms": round(lags[-1], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure event-loop lag caused by logging under concurrent uploads.")
+    parser.add_argument("--jobs", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=200, help="log lines per job")
+    parser.add_argument("--mode", choices=["current", "legacy"], default="current")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        loggers = setup_handlers(args.mode, Path(directory))
+        result = asyncio.run(run(args.jobs, args.messages, loggers))
+        # 等待队列中的记录写完再删除临时目录
+        logger.remove()
+    print(f"{args.mode}: {args.jobs} 个任务 x {args.messages} 条日志，耗时 {result['elapsed_s']} s，"
+          f"事件循环延迟 p50 {result['lag_p50_ms']} ms / p99 {result['lag_p99_ms']} ms / "
+          f"max {result['lag_max_ms']} ms")
+
+
+if __name__ == '__main__':
+    main()
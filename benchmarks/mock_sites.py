@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+本地模拟创作者中心，按各 uploader 依赖的页面结构提供抖音、视频号、快手、TikTok、百家号的静态页面。
+
+每个平台挂在 /<platform> 前缀下，例如 http://127.0.0.1:8800/douyin/creator-micro/content/upload，
+页面选择视频后把文件 POST 到 /<platform>/api/upload，服务端按 --latency / --bandwidth 模拟网络。
+uploader 通过 utils.base_social_media.set_creator_base_url() 或 SAU_<PLATFORM>_BASE_URL 指向这里::
+
+    python -m benchmarks.mock_sites --port 8800 --bandwidth 20
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlparse
+
+from utils.base_social_media import SOCIAL_MEDIA_DOUYIN, SOCIAL_MEDIA_TENCENT, SOCIAL_MEDIA_TIKTOK, \
+    SOCIAL_MEDIA_KUAISHOU, SOCIAL_MEDIA_BAIJIAHAO
+
+SITES_DIR = Path(__file__).parent / "sites"
+MOCK_PLATFORMS = [SOCIAL_MEDIA_DOUYIN, SOCIAL_MEDIA_TENCENT, SOCIAL_MEDIA_TIKTOK, SOCIAL_MEDIA_KUAISHOU,
+                  SOCIAL_MEDIA_BAIJIAHAO]
+READ_CHUNK = 256 * 1024
+
+# 平台内的特殊页面，其余路径都返回平台的单页应用
+_SPECIAL_PAGES = {
+    (SOCIAL_MEDIA_TIKTOK, "/upload-frame"): "tiktok_frame.html",
+}
+# 真实站点会重定向的地址
+_REDIRECTS = {
+    (SOCIAL_MEDIA_TIKTOK, "/creator-center/upload"): "/tiktokstudio/upload",
+}
+
+
+class MockSiteServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency: float = 0.0, bandwidth: float = 0.0):
+        """latency 为每个请求附加的延迟（秒），bandwidth 为上传带宽（MB/s，0 表示不限）"""
+        super().__init__(address, MockSiteHandler)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.uploads = 0
+        self.bytes_received = 0
+        self.lock = threading.Lock()
+        self._pages = {}
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def platform_url(self, platform: str) -> str:
+        return f"{self.base_url}/{platform}"
+
+    def page(self, name: str) -> bytes:
+        if name not in self._pages:
+            self._pages[name] = (SITES_DIR / name).read_bytes()
+        return self._pages[name]
+
+    def start(self):
+        """在后台线程中运行，供 benchmark 在同一进程内使用"""
+        self._thread = threading.Thread(target=self.serve_forever, name="mock-sites", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+class MockSiteHandler(BaseHTTPRequestHandler):
+    server: MockSiteServer
+    protocol_version = "HTTP/1.1"
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: dict = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _reply(self, status: int, body: dict):
+        self._send(status, json.dumps(body).encode('utf-8'), "application/json")
+
+    def _route(self):
+        """返回 (platform, 平台内路径)"""
+        path = urlparse(self.path).path
+        platform, _, rest = path.lstrip('/').partition('/')
+        return platform, '/' + rest
+
+    def do_GET(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if urlparse(self.path).path == "/mock.js":
+            return self._send(200, self.server.page("mock.js"), "application/javascript; charset=utf-8")
+        platform, path = self._route()
+        if platform not in MOCK_PLATFORMS:
+            return self._reply(404, {"error": "not found"})
+        if (platform, path) in _REDIRECTS:
+            return self._send(302, b"", "text/plain", {"Location": f"/{platform}{_REDIRECTS[(platform, path)]}"})
+        page = _SPECIAL_PAGES.get((platform, path), f"{platform}.html")
+        self._send(200, self.server.page(page), "text/html; charset=utf-8")
+
+    def do_POST(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        platform, path = self._route()
+        if platform not in MOCK_PLATFORMS or path != "/api/upload":
+            return self._reply(404, {"error": "not found"})
+        remaining = int(self.headers.get("Content-Length") or 0)
+        size = remaining
+        start = time.perf_counter()
+        while remaining > 0:
+            chunk = self.rfile.read(min(READ_CHUNK, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            if self.server.bandwidth:
+                # 按带宽计算这部分数据最早应在何时收完
+                received = size - remaining
+                delay = received / (self.server.bandwidth * 1024 * 1024) - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+        with self.server.lock:
+            self.server.uploads += 1
+            self.server.bytes_received += size - remaining
+            upload_id = self.server.uploads
+        self._reply(200, {"id": upload_id, "size": size - remaining})
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local mock creator sites for the uploader benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--latency", type=float, default=0, help="extra delay per request, in milliseconds")
+    parser.add_argument("--bandwidth", type=float, default=0, help="upload bandwidth in MB/s, 0 for unlimited")
+    args = parser.parse_args()
+    server = MockSiteServer((args.host, args.port), latency=args.latency / 1000, bandwidth=args.bandwidth)
+    for platform in MOCK_PLATFORMS:
+        print(f"export SAU_{platform.upper()}_BASE_URL={server.platform_url(platform)}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+测量定时发布选择器的耗时：在一个与视频号结构相同的日期/小时/分钟选择器上，
+比较逐个元素取 inner_text 的旧写法与 utils.actions.click_by_text（一次 locator filter）。
+
+    python -m benchmarks.picker_latency --rounds 50
+    python -m benchmarks.picker_latency --slow-mo 5
+
+旧写法对列表中目标之前的每个元素都要调用一次，每次都是一个 driver 往返（这里最多 142 次），
+新写法每个列表一次；--slow-mo 给每次调用附加延迟，模拟远程浏览器或繁忙的机器。
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from playwright.async_api import async_playwright
+
+from utils.actions import click_by_text
+
+# 点击后把所选的值写到 #result，用来确认两种写法选中的是同一个元素
+_PICKER_HTML = """<!DOCTYPE html>
+<html><body>
+<table class="weui-desktop-picker__table"><tbody><tr><td>%s</td></tr></tbody></table>
+<ol class="weui-desktop-picker__time__hour">%s</ol>
+<ol class="weui-desktop-picker__time__minute">%s</ol>
+<div id="result"></div>
+<script>
+document.querySelectorAll('a:not(.weui-desktop-picker__disabled), li').forEach(el => el.addEventListener('click', () => {
+    document.getElementById('result').textContent += el.textContent.trim() + ' ';
+}));
+</script>
+</body></html>"""
+# 选择器中不可选的日期数，与月中发布时日历前半部分置灰的情况相当
+DISABLED_DAYS = 10
+
+
+def picker_html() -> str:
+    days = ''.join(f'<a class="weui-desktop-picker__disabled">{day}</a>' if day <= DISABLED_DAYS else f'<a>{day}</a>'
+                   for day in range(1, 32))
+    hours = ''.join(f'<li>{hour:02d}</li>' for hour in range(24))
+    minutes = ''.join(f'<li>{minute:02d}</li>' for minute in range(60))
+    return _PICKER_HTML % (days, hours, minutes)
+
+
+async def pick_legacy(page, day: int, hour: int, minute: int):
+    """改动前 set_schedule_time_tencent 的写法"""
+    elements = await page.query_selector_all('table.weui-desktop-picker__table a')
+    for element in elements:
+        if 'weui-desktop-picker__disabled' in await element.evaluate('el => el.className'):
+            continue
+        text = await element.inner_text()
+        if text.strip() == str(day):
+            await element.click()
+            break
+    for selector, value in (('ol.weui-desktop-picker__time__hour', hour),
+                            ('ol.weui-desktop-picker__time__minute', minute)):
+        ol = page.locator(selector)
+        count = await ol.locator('li').count()
+        for i in range(count):
+            li = ol.locator('li').nth(i)
+            if await li.inner_text() == f"{value:02d}":
+                await li.click()
+                break
+
+
+async def pick_batched(page, day: int, hour: int, minute: int):
+    await click_by_text(page.locator('table.weui-desktop-picker__table a:not(.weui-desktop-picker__disabled)'),
+                        str(day))
+    await click_by_text(page.locator('ol.weui-desktop-picker__time__hour li'), f"{hour:02d}")
+    await click_by_text(page.locator('ol.weui-desktop-picker__time__minute li'), f"{minute:02d}")
+
+
+async def run(rounds: int, slow_mo: float, seed: int) -> dict:
+    rng = random.Random(seed)
+    targets = [(rng.randint(DISABLED_DAYS + 1, 31), rng.randint(0, 23), rng.randint(0, 59)) for _ in range(rounds)]
+    results = {}
+    async with async_playwright() as playwright:
+        browser = await playwright.chromium.launch(headless=True, slow_mo=slow_mo)
+        page = await browser.new_page()
+        for mode, pick in (("legacy", pick_legacy), ("batched", pick_batched)):
+            timings = []
+            for day, hour, minute in targets:
+                await page.set_content(picker_html())
+                start = time.perf_counter()
+                await pick(page, day, hour, minute)
+                timings.append((time.perf_counter() - start) * 1000)
+                picked = (await page.inner_text('#result')).split()
+                if picked != [str(day), f"{hour:02d}", f"{minute:02d}"]:
+                    raise RuntimeError(f"{mode} 选中了 {picked}，目标为 {day} {hour:02d}:{minute:02d}")
+            timings.sort()
+            results[mode] = {
+                "p50_ms": round(statistics.median(timings), 1),
+                "p95_ms": round(timings[max(int(len(timings) * 0.95) - 1, 0)], 1),
+                "max_ms": round(timings[-1], 1),
+            }
+        await browser.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-element and batched schedule picker lookups.")
+    parser.add_argument("--rounds", type=int, default=30, help="random date/time picks per mode")
+    parser.add_argument("--slow-mo", type=float, default=0, help="delay in ms added to every Playwright call")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.rounds, args.slow_mo, args.seed))
+    for mode, result in results.items():
+        print(f"{mode:<8} p50 {result['p50_ms']} ms / p95 {result['p95_ms']} ms / max {result['max_ms']} ms")
+    print(f"p50 加速 {results['legacy']['p50_ms'] / max(results['batched']['p50_ms'], 0.1):.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""
+离线基准测试：在本地模拟站点上运行未经修改的各平台 uploader，统计端到端与各阶段耗时、并发吞吐与内存峰值。
+
+    python -m benchmarks.run_benchmark --jobs 8 --concurrency 4 --size-mb 20
+    python -m benchmarks.run_benchmark --platforms douyin kuaishou --bandwidth 20 --schedule
+
+默认以无头模式运行（与 config.json 中 browser.headless 为 true 时相同的兼容设置），--headed 时有界面，
+两者的 CPU 时间与内存峰值之差即无头模式为每个并发上传节省的资源（有界面需要显示器，服务器上可用 xvfb-run）。
+
+保存基线并在之后的运行中检查回退（超过阈值时退出码为 1）::
+
+    python -m benchmarks.run_benchmark --output benchmarks/baseline.json
+    python -m benchmarks.run_benchmark --baseline benchmarks/baseline.json --max-regression 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from benchmarks.mock_sites import MockSiteServer, MOCK_PLATFORMS
+from utils.actions import set_fast_mode
+from utils.base_social_media import SOCIAL_MEDIA_DOUYIN, SOCIAL_MEDIA_TENCENT, SOCIAL_MEDIA_TIKTOK, \
+    SOCIAL_MEDIA_KUAISHOU, SOCIAL_MEDIA_BAIJIAHAO, set_creator_base_url
+from utils.browser_mode import set_headless
+from utils.browser_pool import BrowserPool
+from utils.interception import get_interception_stats, set_interception_enabled
+from utils.tracing import ROOT_SPAN, set_tracing_enabled, set_trace_file, load_records, summarize
+
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None
+
+BENCH_TITLE = "基准测试视频"
+BENCH_TAGS = ["benchmark", "mock"]
+RSS_SAMPLE_INTERVAL = 0.2
+
+
+def _create_uploader(platform: str, video: str, account_file: str, publish_date, context):
+    if platform == SOCIAL_MEDIA_DOUYIN:
+        from uploader.douyin_uploader.main import DouYinVideo
+        return DouYinVideo(BENCH_TITLE, video, BENCH_TAGS, publish_date, account_file, context=context)
+    elif platform == SOCIAL_MEDIA_TENCENT:
+        from uploader.tencent_uploader.main import TencentVideo
+        return TencentVideo(BENCH_TITLE, f"{BENCH_TITLE} #{' #'.join(BENCH_TAGS)}", video, publish_date, account_file,
+                            context=context)
+    elif platform == SOCIAL_MEDIA_TIKTOK:
+        from uploader.tk_uploader.main_chrome import TiktokVideo
+        return TiktokVideo(BENCH_TITLE, video, BENCH_TAGS, publish_date, account_file, context=context)
+    elif platform == SOCIAL_MEDIA_KUAISHOU:
+        from uploader.ks_uploader.main import KSVideo
+        return KSVideo(BENCH_TITLE, video, BENCH_TAGS, publish_date, account_file, context=context)
+    elif platform == SOCIAL_MEDIA_BAIJIAHAO:
+        from uploader.baijiahao_uploader.main import BaiJiaHaoVideo
+        return BaiJiaHaoVideo(BENCH_TITLE, video, BENCH_TAGS, publish_date, account_file, context=context)
+    raise ValueError(f"不支持的平台: {platform}")
+
+
+def _tree_usage(root_pid: int) -> tuple:
+    """root_pid 及其所有子进程（playwright driver、浏览器）的 RSS 之和（字节），以及 {pid: 已用 CPU 秒数}"""
+    children, cpu_ticks = {}, {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", 'rb') as f:
+                # comm 字段可能包含空格，从最后一个 ')' 之后解析
+                fields = f.read().rsplit(b')', 1)[1].split()
+        except OSError:
+            continue
+        children.setdefault(int(fields[1]), []).append(int(entry))
+        # utime + stime
+        cpu_ticks[int(entry)] = int(fields[11]) + int(fields[12])
+    total, cpu, stack = 0, {}, [root_pid]
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    ticks_per_second = os.sysconf("SC_CLK_TCK")
+    while stack:
+        pid = stack.pop()
+        try:
+            with open(f"/proc/{pid}/statm", 'r') as f:
+                total += int(f.read().split()[1]) * page_size
+        except OSError:
+            continue
+        cpu[pid] = cpu_ticks.get(pid, 0) / ticks_per_second
+        stack.extend(children.get(pid, []))
+    return total, cpu
+
+
+class RssSampler(object):
+    """
+    后台线程定期采样进程树的 RSS 与 CPU 时间，记录 RSS 峰值；没有 /proc 时退回本进程的 ru_maxrss，不统计 CPU。
+    已退出的浏览器进程按最后一次采样计入 CPU 时间。
+    """
+
+    def __init__(self, interval: float = RSS_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.peak = 0
+        self._cpu = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._use_proc = os.path.isdir("/proc/self")
+
+    @property
+    def cpu_seconds(self) -> float:
+        return sum(self._cpu.values())
+
+    def _sample(self, pid: int):
+        rss, cpu = _tree_usage(pid)
+        self.peak = max(self.peak, rss)
+        self._cpu.update(cpu)
+
+    def _run(self):
+        pid = os.getpid()
+        while not self._stop.is_set():
+            self._sample(pid)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        if self._use_proc:
+            self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._sample(os.getpid())
+        elif resource is not None:
+            maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # macOS 上单位为字节，Linux 上为 KB
+            self.peak = maxrss if sys.platform == "darwin" else maxrss * 1024
+        return False
+
+
+def make_video(directory: Path, size_mb: float) -> Path:
+    video = directory / "benchmark.mp4"
+    block = b"\0" * (1024 * 1024)
+    with open(video, 'wb') as f:
+        for _ in range(int(size_mb)):
+            f.write(block)
+        f.write(block[:int((size_mb % 1) * 1024 * 1024)])
+    return video
+
+
+async def run_platform(pool: BrowserPool, platform: str, jobs: int, concurrency: int, video: Path,
+                       account_file: Path, publish_date) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    errors = []
+
+    async def run_one(index: int):
+        async with semaphore:
+            try:
+                # UA、视口等兼容设置由浏览器池按 platform 设置
+                async with pool.context(account_file, platform=platform) as context:
+                    app = _create_uploader(platform, str(video), str(account_file), publish_date, context)
+                    await app.main()
+            except Exception as e:
+                errors.append(f"#{index}: {e}")
+                print(f"[-] {platform} #{index} 失败: {e}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run_one(index) for index in range(jobs)))
+    wall = time.perf_counter() - start
+    succeeded = jobs - len(errors)
+    return {
+        "jobs": jobs,
+        "errors": len(errors),
+        "wall_s": round(wall, 3),
+        "uploads_per_min": round(succeeded / wall * 60, 2) if wall else 0.0,
+        "mb_per_s": round(succeeded * video.stat().st_size / 1024 / 1024 / wall, 2) if wall else 0.0,
+    }
+
+
+async def run_benchmark(args) -> dict:
+    set_fast_mode(True)
+    set_tracing_enabled(True)
+    set_interception_enabled(not args.no_intercept)
+    set_headless(not args.headed)
+    with tempfile.TemporaryDirectory(prefix="sau-bench-") as workdir:
+        workdir = Path(workdir)
+        trace_file = workdir / "trace.jsonl"
+        set_trace_file(trace_file)
+        video = make_video(workdir, args.size_mb)
+        account_file = workdir / "account.json"
+        account_file.write_text(json.dumps({"cookies": [], "origins": []}), encoding='utf-8')
+        publish_date = 0
+        if args.schedule:
+            publish_date = (datetime.now() + timedelta(days=1)).replace(hour=10, minute=0, second=0, microsecond=0)
+
+        server = MockSiteServer(("127.0.0.1", 0), latency=args.latency / 1000, bandwidth=args.bandwidth).start()
+        for platform in args.platforms:
+            set_creator_base_url(platform, server.platform_url(platform))
+        results = {"platforms": {}}
+        try:
+            with RssSampler() as sampler:
+                async with BrowserPool(size=args.browsers, launch_options={'headless': not args.headed}) as pool:
+                    for platform in args.platforms:
+                        print(f"[+] {platform}: {args.jobs} 个任务，并发 {args.concurrency}")
+                        results["platforms"][platform] = await run_platform(
+                            pool, platform, args.jobs, args.concurrency, video, account_file, publish_date)
+        finally:
+            server.stop()
+            for platform in args.platforms:
+                set_creator_base_url(platform, None)
+
+        records = load_records(trace_file)
+        for row in summarize(records):
+            stages = results["platforms"].setdefault(row["platform"], {}).setdefault("stages", {})
+            stages[row["span"]] = {key: row[key] for key in ("count", "errors", "p50", "p95", "p99", "max")}
+        for platform, stats in get_interception_stats().items():
+            if platform in results["platforms"]:
+                results["platforms"][platform]["blocked"] = {"requests": stats.requests,
+                                                             "upload_bytes": stats.upload_bytes}
+        results["peak_rss_mb"] = round(sampler.peak / 1024 / 1024, 1)
+        results["cpu_s"] = round(sampler.cpu_seconds, 2)
+        uploads = args.jobs * len(args.platforms)
+        # 平台依次运行，同时进行的上传数为 concurrency
+        results["per_upload"] = {
+            "cpu_s": round(sampler.cpu_seconds / uploads, 2) if uploads else 0.0,
+            "peak_rss_mb": round(results["peak_rss_mb"] / min(args.concurrency, args.jobs), 1) if uploads else 0.0,
+        }
+        results["config"] = {key: getattr(args, key) for key in
+                             ("jobs", "concurrency", "browsers", "size_mb", "latency", "bandwidth", "schedule",
+                              "no_intercept", "headed")}
+    return results
+
+
+def print_results(results: dict):
+    header = f"{'platform':<12}{'stage':<12}{'count':>7}{'p50(s)':>10}{'p95(s)':>10}{'p99(s)':>10}"
+    print(header)
+    print("-" * len(header))
+    for platform, result in results["platforms"].items():
+        for span, stage in result.get("stages", {}).items():
+            print(f"{platform:<12}{span:<12}{stage['count']:>7}{stage['p50'] / 1000:>10.2f}"
+                  f"{stage['p95'] / 1000:>10.2f}{stage['p99'] / 1000:>10.2f}")
+    print()
+    for platform, result in results["platforms"].items():
+        print(f"{platform:<12}{result['jobs']} jobs, {result['errors']} errors, {result['wall_s']:.1f}s, "
+              f"{result['uploads_per_min']} uploads/min, {result['mb_per_s']} MB/s")
+    print(f"peak RSS: {results['peak_rss_mb']} MB ({results['per_upload']['peak_rss_mb']} MB per concurrent upload)")
+    print(f"CPU: {results['cpu_s']} s ({results['per_upload']['cpu_s']} s per upload)")
+
+
+def check_regressions(results: dict, baseline: dict, max_regression: float) -> list:
+    """与基线比较端到端 p95、吞吐与内存峰值，返回超过阈值的回退说明"""
+    problems = []
+    for platform, result in results["platforms"].items():
+        if result.get("errors"):
+            problems.append(f"{platform}: {result['errors']} 个任务失败")
+        base = baseline.get("platforms", {}).get(platform)
+        if not base:
+            continue
+        p95 = result.get("stages", {}).get(ROOT_SPAN, {}).get("p95")
+        base_p95 = base.get("stages", {}).get(ROOT_SPAN, {}).get("p95")
+        if p95 and base_p95 and p95 > base_p95 * (1 + max_regression):
+            problems.append(f"{platform}: 端到端 p95 {base_p95 / 1000:.2f}s -> {p95 / 1000:.2f}s")
+        if base.get("uploads_per_min") and result["uploads_per_min"] < base["uploads_per_min"] * (1 - max_regression):
+            problems.append(f"{platform}: 吞吐 {base['uploads_per_min']} -> {result['uploads_per_min']} uploads/min")
+    base_rss = baseline.get("peak_rss_mb")
+    if base_rss and results["peak_rss_mb"] > base_rss * (1 + max_regression):
+        problems.append(f"内存峰值 {base_rss} MB -> {results['peak_rss_mb']} MB")
+    base_cpu = baseline.get("cpu_s")
+    if base_cpu and results["cpu_s"] > base_cpu * (1 + max_regression):
+        problems.append(f"CPU 时间 {base_cpu} s -> {results['cpu_s']} s")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline uploader benchmark against local mock creator sites.")
+    parser.add_argument("--platforms", nargs="+", choices=MOCK_PLATFORMS, default=MOCK_PLATFORMS)
+    parser.add_argument("--jobs", type=int, default=4, help="uploads per platform")
+    parser.add_argument("--concurrency", type=int, default=4, help="concurrent uploads per platform")
+    parser.add_argument("--browsers", type=int, default=1, help="browsers in the pool")
+    parser.add_argument("--size-mb", type=float, default=10, help="size of the generated video")
+    parser.add_argument("--latency", type=float, default=0, help="extra delay per request, in milliseconds")
+    parser.add_argument("--bandwidth", type=float, default=0, help="upload bandwidth in MB/s, 0 for unlimited")
+    parser.add_argument("--schedule", action="store_true", help="schedule the posts to exercise the date pickers")
+    parser.add_argument("--headed", action="store_true")
+    parser.add_argument("--no-intercept", action="store_true", help="disable the request interception profiles")
+    parser.add_argument("--output", help="write the results as JSON, e.g. to use as a baseline")
+    parser.add_argument("--baseline", help="baseline JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args()
+
+    results = asyncio.run(run_benchmark(args))
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            problems = check_regressions(results, json.load(f), args.max_regression)
+        for problem in problems:
+            print(f"[-] 回退: {problem}")
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
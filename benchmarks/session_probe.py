@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+用本地桩服务器检查 utils.session_check.SessionValidator 的判定与缓存，并对比探测与命中缓存的耗时。
+
+桩服务器模拟创作者中心的三种响应：cookie 有效时返回 200，失效时 302 到 /login，被风控时返回 403。
+每个平台的 probe_url 都指向桩服务器，不访问真实站点::
+
+    python -m benchmarks.session_probe
+    python -m benchmarks.session_probe --rounds 200 --latency 0.05
+
+探测期间同时运行一个每 5 ms 唤醒一次的任务，记录事件循环最长的停顿，探测阻塞了事件循环时停顿接近 --latency。
+判定与预期不符或探测阻塞了事件循环时退出码为 1。
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from utils.session_check import PLATFORM_SESSION_RULES, SessionValidator
+
+# cookie 值 -> 桩服务器的响应
+SESSION_VALID = "valid"
+SESSION_EXPIRED = "expired"
+SESSION_BLOCKED = "blocked"
+
+
+class StubCreatorServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency: float = 0.0):
+        super().__init__(address, StubCreatorHandler)
+        self.latency = latency
+        self.requests = 0
+        self.lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="stub-creator", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+class StubCreatorHandler(BaseHTTPRequestHandler):
+    server: StubCreatorServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, headers: dict = None, body: bytes = b"ok"):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if self.path.startswith("/login"):
+            self._reply(200, body=b"login")
+            return
+        cookie = self.headers.get("Cookie", "")
+        if f"={SESSION_VALID}" in cookie:
+            self._reply(200)
+        elif f"={SESSION_BLOCKED}" in cookie:
+            self._reply(403)
+        else:
+            self._reply(302, {"Location": "/login?redirect=" + self.path})
+
+
+def stub_rules(base_url: str) -> dict:
+    """各平台的规则，probe_url 换成桩服务器上的地址，cookie 域名换成 127.0.0.1"""
+    rules = {}
+    for platform, rule in PLATFORM_SESSION_RULES.items():
+        rules[platform] = dict(rule, domain="127.0.0.1", probe_url=f"{base_url}/{platform}/upload")
+    return rules
+
+
+def write_storage_state(directory: Path, platform: str, rule: dict, session: str) -> Path:
+    names = rule['session_cookies'] or ("session",)
+    cookies = [{"name": name, "value": session, "domain": "127.0.0.1", "path": "/",
+                "expires": time.time() + 3600} for name in names]
+    account_file = directory / f"{platform}_{session}.json"
+    account_file.write_text(json.dumps({"cookies": cookies, "origins": []}), encoding='utf-8')
+    return account_file
+
+
+LOOP_TICK = 0.005
+
+
+async def _watch_loop(stalls: dict):
+    """记录事件循环两次唤醒之间超出 LOOP_TICK 的最长时间"""
+    while True:
+        await asyncio.sleep(LOOP_TICK)
+        now = time.perf_counter()
+        stalls['max'] = max(stalls['max'], (now - stalls['last'] - LOOP_TICK) * 1000)
+        stalls['last'] = now
+
+
+async def run(rounds: int, latency: float) -> dict:
+    server = StubCreatorServer(("127.0.0.1", 0), latency=latency).start()
+    errors = []
+    probe_ms, cached_ms = [], []
+    stalls = {'max': 0.0, 'last': time.perf_counter()}
+    watcher = asyncio.ensure_future(_watch_loop(stalls))
+    try:
+        rules = stub_rules(server.base_url)
+        with tempfile.TemporaryDirectory() as tmp:
+            directory = Path(tmp)
+            validator = SessionValidator(cache_file=directory / "session_cache.json", rules=rules,
+                                         probe_enabled=True)
+            for platform, rule in rules.items():
+                for session, expected in ((SESSION_VALID, True), (SESSION_EXPIRED, False),
+                                          (SESSION_BLOCKED, False)):
+                    account_file = write_storage_state(directory, platform, rule, session)
+                    verdict = await validator.check(account_file, platform)
+                    if verdict is not expected:
+                        errors.append(f"{platform}/{session}: 判定为 {verdict}，应为 {expected}")
+                    # 只缓存有效的结果
+                    if validator.cached(account_file, platform) is not (True if expected else None):
+                        errors.append(f"{platform}/{session}: 缓存状态不正确")
+
+                account_file = write_storage_state(directory, platform, rule, SESSION_VALID)
+                before = server.requests
+                for _ in range(rounds):
+                    validator.invalidate(account_file, platform)
+                    start = time.perf_counter()
+                    await validator.check(account_file, platform)
+                    probe_ms.append((time.perf_counter() - start) * 1000)
+                    start = time.perf_counter()
+                    await validator.check(account_file, platform)
+                    cached_ms.append((time.perf_counter() - start) * 1000)
+                if server.requests - before != rounds:
+                    errors.append(f"{platform}: 命中缓存时仍发出了请求（{server.requests - before} 次探测，"
+                                  f"应为 {rounds} 次）")
+
+                # 上传中被重定向到登录页后，缓存不再返回有效
+                validator.invalidate(account_file, platform)
+                if validator.cached(account_file, platform) is not None:
+                    errors.append(f"{platform}: invalidate 后缓存仍然有效")
+    finally:
+        watcher.cancel()
+        # 事件循环一直被阻塞时 watcher 没有机会醒来，补上最后一段
+        stalls['max'] = max(stalls['max'], (time.perf_counter() - stalls['last'] - LOOP_TICK) * 1000)
+        server.stop()
+    # 阻塞的探测会让事件循环停顿整个 latency
+    if latency and stalls['max'] >= latency * 1000 * 0.8:
+        errors.append(f"探测期间事件循环停顿了 {stalls['max']:.1f} ms")
+    return {
+        "errors": errors,
+        "loop_stall_ms": round(stalls['max'], 1),
+        "probe_p50_ms": round(statistics.median(probe_ms), 2),
+        "cached_p50_ms": round(statistics.median(cached_ms), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check SessionValidator verdicts and caching against a local stub server.")
+    parser.add_argument("--rounds", type=int, default=10, help="probe/cached check pairs per platform")
+    parser.add_argument("--latency", type=float, default=0.1, help="delay in seconds added to every stub response")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.rounds, args.latency))
+    print(f"probe  p50 {result['probe_p50_ms']} ms")
+    print(f"cached p50 {result['cached_p50_ms']} ms")
+    print(f"max event loop stall {result['loop_stall_ms']} ms")
+    for error in result["errors"]:
+        print(f"[-] {error}")
+    if result["errors"]:
+        sys.exit(1)
+    print("[+] 判定与缓存均符合预期")
+
+
+if __name__ == '__main__':
+    main()
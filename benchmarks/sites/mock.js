@@ -0,0 +1,49 @@
+// 模拟站点公共脚本：页面路径的第一段为平台名，例如 /douyin/creator-micro/content/upload
+window.sauMock = {
+    platform: location.pathname.split('/')[1],
+
+    url(path) {
+        return '/' + this.platform + path;
+    },
+
+    // 把选择的视频 POST 到模拟服务端，服务端按配置的延迟与带宽接收
+    upload(file) {
+        return fetch(this.url('/api/upload'), {
+            method: 'POST',
+            body: file,
+            headers: {'X-File-Name': encodeURIComponent(file.name)},
+        }).then((response) => {
+            if (!response.ok) {
+                throw new Error('upload failed: ' + response.status);
+            }
+            return response.json();
+        });
+    },
+
+    // 单页应用内切换地址，不重新加载页面
+    go(path) {
+        history.pushState(null, '', this.url(path));
+    },
+
+    // 整页跳转，iframe 中调用时跳转顶层页面
+    navigate(path) {
+        window.top.location.href = this.url(path);
+    },
+
+    render(root, html) {
+        root.innerHTML = html;
+        return root;
+    },
+
+    pad(value) {
+        return String(value).padStart(2, '0');
+    },
+
+    range(start, end, format) {
+        const items = [];
+        for (let value = start; value <= end; value++) {
+            items.push(format(value));
+        }
+        return items.join('');
+    },
+};
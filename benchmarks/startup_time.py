@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+统计 CLI 的启动耗时：在子进程中运行 `python -X importtime cli_main.py --help`，汇总各模块的导入耗时。
+
+    python -m benchmarks.startup_time
+    python -m benchmarks.startup_time --top 30 --command login
+
+保存基线并在之后的运行中检查回退（超过阈值时退出码为 1）::
+
+    python -m benchmarks.startup_time --output benchmarks/startup_baseline.json
+    python -m benchmarks.startup_time --baseline benchmarks/startup_baseline.json --max-regression 0.2
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from conf import BASE_DIR
+
+CLI = Path(BASE_DIR) / "cli_main.py"
+
+
+def parse_importtime(stderr: str) -> dict:
+    """
+    解析 -X importtime 的输出，返回 {模块名: (self_us, cumulative_us)}。
+    输出格式为 "import time: self [us] | cumulative | imported package"。
+    """
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            # 表头
+            continue
+        name = fields[2].strip()
+        modules[name] = (int(fields[0]), int(fields[1]))
+    return modules
+
+
+def measure_once(cli_args: list) -> dict:
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", str(CLI)] + cli_args, cwd=BASE_DIR,
+                          capture_output=True, text=True)
+    wall_ms = (time.perf_counter() - start) * 1000
+    modules = parse_importtime(proc.stderr)
+    return {
+        "wall_ms": wall_ms,
+        "import_ms": sum(self_us for self_us, _ in modules.values()) / 1000,
+        "modules": modules,
+        "returncode": proc.returncode,
+    }
+
+
+def measure(cli_args: list, repeat: int) -> dict:
+    """运行 repeat 次，耗时取中位数，模块明细取导入总耗时最小的一次"""
+    runs = [measure_once(cli_args) for _ in range(repeat)]
+    fastest = min(runs, key=lambda run: run["import_ms"])
+    return {
+        "command": ' '.join(["cli_main.py"] + cli_args),
+        "wall_ms": round(statistics.median(run["wall_ms"] for run in runs), 1),
+        "import_ms": round(statistics.median(run["import_ms"] for run in runs), 1),
+        "modules_imported": len(fastest["modules"]),
+        "modules": fastest["modules"],
+        "returncode": fastest["returncode"],
+    }
+
+
+def print_results(result: dict, top: int):
+    print(f"{result['command']}: 启动 {result['wall_ms']:.1f} ms，导入 {result['import_ms']:.1f} ms，"
+          f"共 {result['modules_imported']} 个模块")
+    slowest = sorted(result["modules"].items(), key=lambda item: item[1][1], reverse=True)[:top]
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for name, (self_us, cumulative_us) in slowest:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name}")
+
+
+def check_regressions(result: dict, baseline: dict, max_regression: float) -> list:
+    failures = []
+    for metric in ("wall_ms", "import_ms"):
+        before, after = baseline.get(metric), result[metric]
+        if before and after > before * (1 + max_regression):
+            failures.append(f"{metric}: {before} -> {after}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cli_main.py startup time with -X importtime.")
+    parser.add_argument("--command", nargs='*', default=["--help"],
+                        help="arguments passed to cli_main.py, default: --help")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="show the N slowest modules by cumulative time")
+    parser.add_argument("--max-ms", type=float, help="fail if the median startup time exceeds this")
+    parser.add_argument("--output", help="write the result as JSON, usable as --baseline later")
+    parser.add_argument("--baseline", help="compare against a previous --output")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    result = measure(args.command, args.repeat)
+    print_results(result, args.top)
+    if result["returncode"] != 0:
+        print(f"[-] cli_main.py 退出码为 {result['returncode']}")
+
+    summary = {key: value for key, value in result.items() if key != "modules"}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+    failures = []
+    if args.max_ms and result["wall_ms"] > args.max_ms:
+        failures.append(f"wall_ms: {result['wall_ms']} > {args.max_ms}")
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            failures += check_regressions(result, json.load(f), args.max_regression)
+    for failure in failures:
+        print(f"[-] 回退 {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
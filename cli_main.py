@@ -1,23 +1,20 @@
 import argparse
 import asyncio
 from datetime import datetime
-from os.path import exists
 from pathlib import Path
 
 from conf import BASE_DIR
-from uploader.douyin_uploader.main import douyin_setup, DouYinVideo
-from uploader.ks_uploader.main import ks_setup, KSVideo
-from uploader.tencent_uploader.main import weixin_setup, TencentVideo
-from uploader.tk_uploader.main_chrome import tiktok_setup, TiktokVideo
-from utils.base_social_media import get_supported_social_media, get_cli_action, SOCIAL_MEDIA_DOUYIN, \
-    SOCIAL_MEDIA_TENCENT, SOCIAL_MEDIA_TIKTOK, SOCIAL_MEDIA_KUAISHOU
-from utils.constant import TencentZoneTypes
-from utils.files_times import get_title_and_hashtags
+from utils.base_social_media import get_cli_action
+from utils.browser_mode import set_headless
+from utils.interception import set_interception_enabled
+from utils.uploader_registry import available_uploaders, load_uploader
 
 
 def parse_schedule(schedule_raw):
+    """按 config.json 中的 timezone 解释输入的时间，与 slot_planner / UploadScheduler 一致"""
     if schedule_raw:
-        schedule = datetime.strptime(schedule_raw, '%Y-%m-%d %H:%M')
+        from utils.files_times import localize
+        schedule = localize(datetime.strptime(schedule_raw, '%Y-%m-%d %H:%M'))
     else:
         schedule = None
     return schedule
@@ -26,9 +23,13 @@ def parse_schedule(schedule_raw):
 async def main():
     # 主解析器
     parser = argparse.ArgumentParser(description="Upload video to multiple social-media.")
-    parser.add_argument("platform", metavar='platform', choices=get_supported_social_media(), help="Choose social-media platform: douyin tencent tiktok kuaishou")
+    platforms = available_uploaders()
+    parser.add_argument("platform", metavar='platform', choices=platforms, help=f"Choose social-media platform: {' '.join(platforms)}")
 
     parser.add_argument("account_name", type=str, help="Account name for the platform: xiaoA")
+    parser.add_argument("--no-intercept", action="store_true",
+                        help="Load creator pages in full instead of blocking analytics and fonts")
+    parser.add_argument("--headless", action="store_true", help="Run the upload browser without a window (login stays headed)")
     subparsers = parser.add_subparsers(dest="action", metavar='action', help="Choose action", required=True)
 
     actions = get_cli_action()
@@ -41,10 +42,22 @@ async def main():
             action_parser.add_argument("video_file", help="Path to the Video file")
             action_parser.add_argument("-pt", "--publish_type", type=int, choices=[0, 1],
                                        help="0 for immediate, 1 for scheduled", default=0)
-            action_parser.add_argument('-t', '--schedule', help='Schedule UTC time in %Y-%m-%d %H:%M format')
+            action_parser.add_argument('-t', '--schedule', help='Schedule time in %%Y-%%m-%%d %%H:%%M format, in the timezone from config.json')
+            action_parser.add_argument("--force", action="store_true",
+                                       help="Upload even if this account already uploaded the same video content")
+        elif action == 'watch':
+            action_parser.add_argument("watch_dir", nargs='?', default=str(Path(BASE_DIR) / "videos"),
+                                       help="Drop directory to watch for new videos")
+            action_parser.add_argument("--workers", type=int, default=1, help="Concurrent uploads")
+            action_parser.add_argument("--stable-seconds", type=float, default=5,
+                                       help="Seconds a file's size and mtime must stay unchanged before upload")
 
     # 解析命令行参数
     args = parser.parse_args()
+    if args.no_intercept:
+        set_interception_enabled(False)
+    if args.headless:
+        set_headless(True)
     
     # 检查视频文件和目录
     if args.action == 'upload':
@@ -74,19 +87,26 @@ async def main():
     account_file = Path(BASE_DIR / "cookies" / f"{args.platform}_{args.account_name}.json")
     account_file.parent.mkdir(exist_ok=True)
 
-    # 根据 action 处理不同的逻辑
+    # 根据 action 处理不同的逻辑，平台模块在这里才被导入
     if args.action == 'login':
         print(f"Logging in with account {args.account_name} on platform {args.platform}")
-        if args.platform == SOCIAL_MEDIA_DOUYIN:
-            await douyin_setup(str(account_file), handle=True)
-        elif args.platform == SOCIAL_MEDIA_TIKTOK:
-            await tiktok_setup(str(account_file), handle=True)
-        elif args.platform == SOCIAL_MEDIA_TENCENT:
-            await weixin_setup(str(account_file), handle=True)
-        elif args.platform == SOCIAL_MEDIA_KUAISHOU:
-            await ks_setup(str(account_file), handle=True)
+        await load_uploader(args.platform).setup(account_file, handle=True)
     elif args.action == 'upload':
-        title, tags = get_title_and_hashtags(args.video_file)
+        from utils.covers import prepare_cover
+        from utils.dedup import get_dedup_index
+        from utils.metadata_index import get_video_metadata
+        from utils.preflight import check_video
+        from utils.transcode import upload_rendition
+
+        # 与 UploadScheduler 使用同一个去重索引，同一账号已上传过相同内容时跳过
+        dedup = get_dedup_index()
+        if not args.force:
+            duplicate = await asyncio.to_thread(dedup.find_upload, args.video_file, args.platform, account_file)
+            if duplicate:
+                print(f"跳过：账号 {args.account_name} 已上传过相同内容的视频 {duplicate}，使用 --force 重新上传")
+                return
+
+        metadata = await asyncio.to_thread(get_video_metadata, args.video_file)
         video_file = args.video_file
 
         if args.publish_type == 0:
@@ -96,24 +116,26 @@ async def main():
             print("Scheduling videos...")
             publish_date = parse_schedule(args.schedule)
 
-        if args.platform == SOCIAL_MEDIA_DOUYIN:
-            await douyin_setup(account_file, handle=False)
-            app = DouYinVideo(title, video_file, tags, publish_date, account_file)
-        elif args.platform == SOCIAL_MEDIA_TIKTOK:
-            await tiktok_setup(account_file, handle=True)
-            app = TiktokVideo(title, video_file, tags, publish_date, account_file)
-        elif args.platform == SOCIAL_MEDIA_TENCENT:
-            await weixin_setup(account_file, handle=True)
-            category = TencentZoneTypes.LIFESTYLE.value
-            app = TencentVideo(title, video_file, tags, publish_date, account_file, category, original_declaration)
-        elif args.platform == SOCIAL_MEDIA_KUAISHOU:
-            await ks_setup(account_file, handle=True)
-            app = KSVideo(title, video_file, tags, publish_date, account_file)
-        else:
-            print("Wrong platform, please check your input")
-            exit()
+        # 同名封面在原始视频旁边，需在替换为转码文件之前查找
+        thumbnail = await prepare_cover(video_file, args.platform)
+        async with upload_rendition(video_file, args.platform) as video_file:
+            issues = check_video(video_file, args.platform)
+            if issues:
+                print(f"错误：视频未通过 {args.platform} 的预检 - {'；'.join(issues)}")
+                return
+
+            plugin = load_uploader(args.platform)
+            if not await plugin.setup(account_file, handle=True):
+                print(f"错误：{args.platform} 账号 {args.account_name} 未登录")
+                return
+            await plugin.upload(metadata.title, metadata.tags, video_file, publish_date, account_file, thumbnail,
+                                description=metadata.description)
+        await asyncio.to_thread(dedup.record, args.video_file, args.platform, account_file)
+    elif args.action == 'watch':
+        from utils.scheduler import watch_directory
 
-        await app.main()
+        await watch_directory(args.platform, args.account_name, args.watch_dir, workers=args.workers,
+                              stable_seconds=args.stable_seconds)
 
 
 if __name__ == "__main__":
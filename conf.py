@@ -1,5 +1,39 @@
+import json
+import os
 from pathlib import Path
 
 BASE_DIR = Path(__file__).parent.resolve()
 XHS_SERVER = "http://127.0.0.1:11901"
-LOCAL_CHROME_PATH = "/Applications/Microsoft Edge.app/Contents/MacOS/Microsoft Edge"
+# 不存在时按 config.json 中的 browser.channel 启动，见 utils.browser_mode
+LOCAL_CHROME_PATH = os.environ.get("SAU_CHROME_PATH", "/Applications/Microsoft Edge.app/Contents/MacOS/Microsoft Edge")
+CONFIG_FILE = BASE_DIR / "config.json"
+
+_config = None
+_reset_hooks = []
+
+
+def get_config_section(name: str, default=None):
+    """config.json 中的一项，首次调用时读取整个文件并缓存；缺少该项、文件不存在或格式错误时返回 default"""
+    global _config
+    if _config is None:
+        try:
+            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+                _config = json.load(f)
+        except (OSError, ValueError):
+            _config = {}
+    value = _config.get(name)
+    return default if value is None else value
+
+
+def on_config_reset(hook):
+    """注册 reset_config() 时调用的函数，各模块用它清除由配置派生的缓存"""
+    _reset_hooks.append(hook)
+    return hook
+
+
+def reset_config():
+    """清除 config.json 和各模块由其派生的缓存，下次使用时重新读取（例如测试中修改配置后）"""
+    global _config
+    _config = None
+    for hook in _reset_hooks:
+        hook()
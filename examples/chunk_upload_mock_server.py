@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+本地 mock 分片上传服务，实现 utils.chunk_upload.ContentRangeProtocol 的服务端，用于验证分片上传与断点续传。
+
+    python -m examples.chunk_upload_mock_server --port 8765 --upload videos/demo.mp4
+    # 加 --fail-every 5 让每第 5 个分片请求返回 500，可观察重试
+
+验证断点续传时单独启动服务，另开终端上传，Ctrl+C 中断后再次执行即只补传缺失的分片::
+
+    python -m examples.chunk_upload_mock_server --port 8765
+    python -m examples.chunk_upload_mock_server --server http://127.0.0.1:8765 --upload videos/demo.mp4
+"""
+import argparse
+import hashlib
+import json
+import re
+import tempfile
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+_CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+)")
+
+
+class MockChunkServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, storage_dir: Path, fail_every: int = 0):
+        super().__init__(address, MockChunkHandler)
+        self.storage_dir = Path(storage_dir)
+        self.fail_every = fail_every
+        self.uploads = {}
+        self.requests = 0
+        self.lock = threading.Lock()
+
+
+class MockChunkHandler(BaseHTTPRequestHandler):
+    server: MockChunkServer
+
+    def _reply(self, status: int, body: dict = None, headers: dict = None):
+        payload = json.dumps(body or {}).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def do_POST(self):
+        parts = self.path.strip('/').split('/')
+        if parts == ["uploads"]:
+            meta = json.loads(self._read_body() or b"{}")
+            upload_id = uuid.uuid4().hex
+            path = self.server.storage_dir / f"{upload_id}.part"
+            with open(path, 'wb') as f:
+                f.truncate(meta.get("size", 0))
+            with self.server.lock:
+                self.server.uploads[upload_id] = {"path": path, "size": meta.get("size", 0)}
+            return self._reply(200, {"upload_id": upload_id})
+        if len(parts) == 3 and parts[0] == "uploads" and parts[2] == "complete":
+            self._read_body()
+            upload = self.server.uploads.get(parts[1])
+            if upload is None:
+                return self._reply(404, {"error": "unknown upload"})
+            digest = hashlib.sha256(upload["path"].read_bytes()).hexdigest()
+            return self._reply(200, {"upload_id": parts[1], "size": upload["size"], "sha256": digest})
+        self._reply(404, {"error": "not found"})
+
+    def do_PUT(self):
+        parts = self.path.strip('/').split('/')
+        data = self._read_body()
+        upload = self.server.uploads.get(parts[1]) if len(parts) == 2 and parts[0] == "uploads" else None
+        if upload is None:
+            return self._reply(404, {"error": "unknown upload"})
+        with self.server.lock:
+            self.server.requests += 1
+            failing = self.server.fail_every and self.server.requests % self.server.fail_every == 0
+        if failing:
+            return self._reply(500, {"error": "injected failure"})
+        match = _CONTENT_RANGE.fullmatch(self.headers.get("Content-Range", ""))
+        if not match or int(match.group(2)) - int(match.group(1)) + 1 != len(data):
+            return self._reply(400, {"error": "bad Content-Range"})
+        start = int(match.group(1))
+        with open(upload["path"], 'r+b') as f:
+            f.seek(start)
+            f.write(data)
+        self._reply(200, {}, {"ETag": hashlib.md5(data).hexdigest()})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="mock chunk upload server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fail-every", type=int, default=0, help="每 N 个分片请求注入一次 500")
+    parser.add_argument("--upload", help="用 ChunkedUpload 上传该文件")
+    parser.add_argument("--server", help="上传到已启动的 mock 服务，不在本进程内启动")
+    parser.add_argument("--chunk-size", type=int, default=1024 * 1024)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.server
+    if base_url is None:
+        storage_dir = Path(tempfile.mkdtemp(prefix="mock_chunk_"))
+        server = MockChunkServer(("127.0.0.1", args.port), storage_dir, args.fail_every)
+        base_url = f"http://127.0.0.1:{args.port}"
+        print(f"mock chunk server on {base_url}, storage: {storage_dir}")
+        if not args.upload:
+            server.serve_forever()
+            return
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    from utils.chunk_upload import ChunkedUpload, ContentRangeProtocol
+
+    file = Path(args.upload)
+    upload = ChunkedUpload(file, ContentRangeProtocol(base_url),
+                           chunk_size=args.chunk_size, workers=args.workers,
+                           on_progress=lambda done, total: print(f"\r{done}/{total}", end=""))
+    result = upload.run()
+    print()
+    expected = hashlib.sha256(file.read_bytes()).hexdigest()
+    print(f"uploaded {result['size']} bytes, sha256 {'ok' if result['sha256'] == expected else 'MISMATCH'}")
+    if server is not None:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
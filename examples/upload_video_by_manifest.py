@@ -0,0 +1,59 @@
+import argparse
+import asyncio
+from pathlib import Path
+
+from conf import BASE_DIR
+from utils.browser_mode import set_headless
+from utils.dedup import DedupIndex
+from utils.interception import set_interception_enabled
+from utils.job_store import JobStore, JOB_STORE_FILE
+from utils.profile_manager import set_profiles_enabled
+from utils.scheduler import UploadScheduler, load_manifest, resume_jobs, plan_publish_times, JOB_DONE
+from utils.slot_planner import load_planner
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Upload videos concurrently from a manifest file.")
+    parser.add_argument("manifest", nargs='?', default=str(Path(BASE_DIR) / "manifest.json"),
+                        help="JSON list of {platform, account, video, publish_time}")
+    parser.add_argument("--max-contexts", type=int, default=16, help="global cap on open browser contexts")
+    parser.add_argument("--browsers", type=int, default=4, help="number of warm browsers in the pool")
+    parser.add_argument("--account-limit", type=int, default=1, help="concurrent uploads per account")
+    parser.add_argument("--db", default=str(JOB_STORE_FILE), help="job store used to resume an interrupted batch")
+    parser.add_argument("--retry-failed", action="store_true", help="reset failed jobs that ran out of attempts")
+    parser.add_argument("--no-dedup", action="store_true", help="upload even if the account already has the same video")
+    parser.add_argument("--no-preflight", action="store_true", help="skip the duration/resolution/size/codec checks")
+    parser.add_argument("--plan", action="store_true",
+                        help="schedule jobs without publish_time using the slot rules in config.json")
+    parser.add_argument("--no-intercept", action="store_true",
+                        help="load creator pages in full instead of blocking analytics and fonts")
+    parser.add_argument("--profiles", action="store_true",
+                        help="reuse a persistent browser profile (cookies and caches) per account")
+    parser.add_argument("--headless", action="store_true", help="run browsers without a window")
+    args = parser.parse_args()
+    if args.no_intercept:
+        set_interception_enabled(False)
+    if args.profiles:
+        set_profiles_enabled(True)
+    if args.headless:
+        set_headless(True)
+
+    store = JobStore(args.db)
+    if args.retry_failed:
+        store.reset()
+    jobs = load_manifest(args.manifest)
+    total = len(jobs)
+    jobs = resume_jobs(jobs, store)
+    print(f"共 {total} 个上传任务，待执行 {len(jobs)} 个")
+    if args.plan:
+        planned = plan_publish_times(jobs, load_planner())
+        print(f"已为 {planned} 个任务安排发布时间")
+    scheduler = UploadScheduler(max_contexts=args.max_contexts, browsers=args.browsers,
+                                account_limit=args.account_limit, store=store,
+                                dedup=None if args.no_dedup else DedupIndex(), preflight=not args.no_preflight)
+    results = asyncio.run(scheduler.run(jobs))
+    done = [job for job in results if job.status == JOB_DONE]
+    print(f"完成 {len(done)}/{len(results)}")
+    for job in results:
+        if job.status != JOB_DONE:
+            print(f"  {job.platform}/{job.account} {job.video.name}: {job.status} {job.error or ''}")
@@ -3,8 +3,11 @@ from pathlib import Path
 
 from uploader.bilibili_uploader.main import read_cookie_json_file, extract_keys_from_json, random_emoji, BilibiliUploader
 from conf import BASE_DIR
+from utils.base_social_media import SOCIAL_MEDIA_BILIBILI
 from utils.constant import VideoZoneTypes
+from utils.dedup import DedupIndex
 from utils.files_times import generate_schedule_time_next_day, get_title_and_hashtags
+from utils.transcode import prepare_video
 
 if __name__ == '__main__':
     filepath = Path(BASE_DIR) / "videos"
@@ -24,7 +27,12 @@ if __name__ == '__main__':
     file_num = len(files)
     timestamps = generate_schedule_time_next_day(file_num, 1, daily_times=[16], timestamps=True)
 
+    dedup = DedupIndex()
     for index, file in enumerate(files):
+        # 同一账号已上传过相同内容的视频直接跳过
+        if dedup.is_duplicate(file, SOCIAL_MEDIA_BILIBILI, account_file):
+            print(f"跳过重复视频: {file.name}")
+            continue
         title, tags = get_title_and_hashtags(str(file))
         # just avoid error, bilibili don't allow same title of video.
         title += random_emoji()
@@ -35,8 +43,10 @@ if __name__ == '__main__':
         print(f"Hashtag：{tags}")
         # I set desc same as title, do what u like.
         desc = title
-        bili_uploader = BilibiliUploader(cookie_data, file, title, desc, tid, tags, timestamps[index])
-        bili_uploader.upload()
+        bili_uploader = BilibiliUploader(cookie_data, prepare_video(file, SOCIAL_MEDIA_BILIBILI), title, desc, tid,
+                                         tags, timestamps[index])
+        if bili_uploader.upload():
+            dedup.record(file, SOCIAL_MEDIA_BILIBILI, account_file)
 
         # life is beautiful don't so rush. be kind be patience
         time.sleep(30)
@@ -3,7 +3,42 @@ from pathlib import Path
 
 from conf import BASE_DIR
 from uploader.douyin_uploader.main import douyin_setup, DouYinVideo
+from utils.base_social_media import SOCIAL_MEDIA_DOUYIN
+from utils.browser_pool import BrowserPool
+from utils.covers import generate_covers_many, is_auto_cover_enabled
+from utils.dedup import DedupIndex
 from utils.files_times import generate_schedule_time_next_day, get_title_and_hashtags
+from utils.job_store import JobStore
+
+
+async def upload_all(store, jobs, publish_datetimes, account_file):
+    # 整批视频共用一个常驻浏览器，避免每个视频冷启动一次
+    dedup = DedupIndex()
+    async with BrowserPool(size=1) as pool:
+        for index, job in enumerate(jobs):
+            file = Path(job['file'])
+            title, tags = get_title_and_hashtags(str(file))
+            # 打印视频文件名、标题和 hashtag
+            print(f"视频文件名：{file}")
+            print(f"标题：{title}")
+            print(f"Hashtag：{tags}")
+            # 同一账号已上传过相同内容的视频直接跳过
+            if dedup.is_duplicate(file, SOCIAL_MEDIA_DOUYIN, account_file):
+                print(f"跳过重复视频: {file.name}")
+                store.skip(job['id'], "duplicate")
+                continue
+            store.start(job['id'])
+            try:
+                async with pool.context(account_file, platform=SOCIAL_MEDIA_DOUYIN) as context:
+                    # 封面优先使用同名图片，没有时仅在开启 auto_cover 时从视频中生成
+                    app = DouYinVideo(title, file, tags, publish_datetimes[index], account_file, context=context)
+                    await app.main()
+            except Exception as e:
+                store.fail(job['id'], e)
+                print(f"上传失败: {file.name}, 错误: {e}")
+                continue
+            store.finish(job['id'], scheduled=bool(publish_datetimes[index]))
+            dedup.record(file, SOCIAL_MEDIA_DOUYIN, account_file)
 
 
 if __name__ == '__main__':
@@ -13,19 +48,13 @@ if __name__ == '__main__':
     folder_path = Path(filepath)
     # 获取文件夹中的所有文件
     files = list(folder_path.glob("*.mp4"))
-    file_num = len(files)
-    publish_datetimes = generate_schedule_time_next_day(file_num, 1, daily_times=[16])
+    # 只上传尚未完成的视频，中断后重新运行即从断点继续
+    store = JobStore()
+    jobs = store.resume(files, SOCIAL_MEDIA_DOUYIN, str(account_file))
+    print(f"待上传 {len(jobs)}/{len(files)} 个视频")
+    publish_datetimes = generate_schedule_time_next_day(len(jobs), 1, daily_times=[16])
     cookie_setup = asyncio.run(douyin_setup(account_file, handle=False))
-    for index, file in enumerate(files):
-        title, tags = get_title_and_hashtags(str(file))
-        thumbnail_path = file.with_suffix('.png')
-        # 打印视频文件名、标题和 hashtag
-        print(f"视频文件名：{file}")
-        print(f"标题：{title}")
-        print(f"Hashtag：{tags}")
-        # 暂时没有时间修复封面上传，故先隐藏掉该功能
-        # if thumbnail_path.exists():
-            # app = DouYinVideo(title, file, tags, publish_datetimes[index], account_file, thumbnail_path=thumbnail_path)
-        # else:
-        app = DouYinVideo(title, file, tags, publish_datetimes[index], account_file)
-        asyncio.run(app.main(), debug=False)
+    if is_auto_cover_enabled():
+        # 在进程池中一次性生成整批封面，上传时直接命中缓存
+        generate_covers_many([job['file'] for job in jobs], [SOCIAL_MEDIA_DOUYIN])
+    asyncio.run(upload_all(store, jobs, publish_datetimes, account_file), debug=False)
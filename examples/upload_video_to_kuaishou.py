@@ -3,7 +3,40 @@ from pathlib import Path
 
 from conf import BASE_DIR
 from uploader.ks_uploader.main import ks_setup, KSVideo
+from utils.base_social_media import SOCIAL_MEDIA_KUAISHOU
+from utils.browser_pool import BrowserPool
+from utils.dedup import DedupIndex
 from utils.files_times import generate_schedule_time_next_day, get_title_and_hashtags
+from utils.job_store import JobStore
+
+
+async def upload_all(store, jobs, publish_datetimes, account_file):
+    # 整批视频共用一个常驻浏览器，避免每个视频冷启动一次
+    dedup = DedupIndex()
+    async with BrowserPool(size=1) as pool:
+        for index, job in enumerate(jobs):
+            file = Path(job['file'])
+            title, tags = get_title_and_hashtags(str(file))
+            # 打印视频文件名、标题和 hashtag
+            print(f"视频文件名：{file}")
+            print(f"标题：{title}")
+            print(f"Hashtag：{tags}")
+            # 同一账号已上传过相同内容的视频直接跳过
+            if dedup.is_duplicate(file, SOCIAL_MEDIA_KUAISHOU, account_file):
+                print(f"跳过重复视频: {file.name}")
+                store.skip(job['id'], "duplicate")
+                continue
+            store.start(job['id'])
+            try:
+                async with pool.context(account_file, platform=SOCIAL_MEDIA_KUAISHOU) as context:
+                    app = KSVideo(title, file, tags, publish_datetimes[index], account_file, context=context)
+                    await app.main()
+            except Exception as e:
+                store.fail(job['id'], e)
+                print(f"上传失败: {file.name}, 错误: {e}")
+                continue
+            store.finish(job['id'], scheduled=bool(publish_datetimes[index]))
+            dedup.record(file, SOCIAL_MEDIA_KUAISHOU, account_file)
 
 
 if __name__ == '__main__':
@@ -13,14 +46,10 @@ if __name__ == '__main__':
     folder_path = Path(filepath)
     # 获取文件夹中的所有文件
     files = list(folder_path.glob("*.mp4"))
-    file_num = len(files)
-    publish_datetimes = generate_schedule_time_next_day(file_num, 1, daily_times=[16])
+    # 只上传尚未完成的视频，中断后重新运行即从断点继续
+    store = JobStore()
+    jobs = store.resume(files, SOCIAL_MEDIA_KUAISHOU, str(account_file))
+    print(f"待上传 {len(jobs)}/{len(files)} 个视频")
+    publish_datetimes = generate_schedule_time_next_day(len(jobs), 1, daily_times=[16])
     cookie_setup = asyncio.run(ks_setup(account_file, handle=False))
-    for index, file in enumerate(files):
-        title, tags = get_title_and_hashtags(str(file))
-        # 打印视频文件名、标题和 hashtag
-        print(f"视频文件名：{file}")
-        print(f"标题：{title}")
-        print(f"Hashtag：{tags}")
-        app = KSVideo(title, file, tags, publish_datetimes[index], account_file)
-        asyncio.run(app.main(), debug=False)
+    asyncio.run(upload_all(store, jobs, publish_datetimes, account_file), debug=False)
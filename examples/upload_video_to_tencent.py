@@ -3,7 +3,6 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 import asyncio
 import re
-import shutil
 import json
 from datetime import datetime
 from playwright.async_api import Page
@@ -13,14 +12,75 @@ from conf import BASE_DIR
 # 确保从 tencent_uploader 导入格式化函数
 from uploader.tencent_uploader.main import weixin_setup, TencentVideo, format_str_for_short_title
 # --- 修改结束 ---
+from utils.base_social_media import SOCIAL_MEDIA_TENCENT
+from utils.browser_pool import BrowserPool
+from utils.dedup import DedupIndex
 from utils.constant import TencentZoneTypes
-# 导入修改后的 get_title_and_hashtags 和 generate_schedule_times
-from utils.files_times import generate_schedule_times, get_title_and_hashtags
+from utils.files_times import generate_schedule_times
+from utils.metadata_index import get_video_metadata
+from utils.job_store import JobStore
+from utils.scheduler import archive_video
 
 def natural_key(s):
     # 提取字符串中的数字用于自然排序
     return [int(text) if text.isdigit() else text.lower() for text in re.split(r'(\d+)', s)]
 
+
+async def upload_all(store, jobs, publish_datetimes, account_file, category, original_declaration, published_dir):
+    # 整批视频共用一个常驻浏览器，避免每个视频冷启动一次
+    dedup = DedupIndex()
+    async with BrowserPool(size=1) as pool:
+        for index, job in enumerate(jobs):
+            file = Path(job['file'])
+            # --- 修改开始 ---
+            # 1. 从元数据索引获取原始标题，以及描述 + 话题
+            metadata = get_video_metadata(file)
+            raw_short_title, title_and_tags = metadata.title, metadata.caption or metadata.title
+            # 2. 在这里调用特定平台的格式化函数
+            short_title = format_str_for_short_title(raw_short_title)
+            # --- 修改结束 ---
+
+            print(f"视频文件名：{file}")
+            print(f"格式化后短标题：{short_title}") # 打印格式化后的
+            print(f"标题和话题内容：{title_and_tags}")
+            current_publish_time = publish_datetimes[index]
+            print(f"实际发布时间：{current_publish_time}")
+
+            # 添加原创声明状态提示
+            print(f"原创声明状态：{'启用' if original_declaration else '禁用'}")
+
+            # 同一账号已上传过相同内容的视频直接跳过
+            if dedup.is_duplicate(file, SOCIAL_MEDIA_TENCENT, account_file):
+                print(f"跳过重复视频: {file.name}")
+                store.skip(job['id'], "duplicate")
+                continue
+            store.start(job['id'])
+            uploaded = False
+            try:
+                async with pool.context(account_file, platform=SOCIAL_MEDIA_TENCENT) as context:
+                    app = TencentVideo(
+                        short_title=short_title, # 传递格式化后的短标题
+                        title_and_tags=title_and_tags,
+                        file_path=str(file),
+                        publish_date=current_publish_time,
+                        account_file=str(account_file),
+                        category=category,
+                        original_declaration=original_declaration,  # 传递原创声明配置
+                        context=context
+                    )
+                    await app.main()
+                store.finish(job['id'], scheduled=bool(current_publish_time))
+                dedup.record(file, SOCIAL_MEDIA_TENCENT, account_file)
+                uploaded = True
+                # 上传成功后移动视频、封面图和txt
+                archive_video(file, published_dir)
+                print(f"已移动到published文件夹: {file.name}")
+            except Exception as e:
+                # 已上传成功但移动文件失败时保留已完成的状态
+                if not uploaded:
+                    store.fail(job['id'], e)
+                print(f"上传失败未移动: {file.name}, 错误: {e}")
+
 if __name__ == '__main__':
     filepath = Path(BASE_DIR) / "videos"
     account_file = Path(BASE_DIR / "cookies" / "tencent_uploader" / "account.json")
@@ -44,6 +104,12 @@ if __name__ == '__main__':
         print("例如: video1.mp4 对应 video1.txt")
         print("="*50 + "\n")
         sys.exit(0)
+
+    # 只上传尚未完成的视频，中断后重新运行即从断点继续
+    store = JobStore()
+    jobs = store.resume(files, SOCIAL_MEDIA_TENCENT, str(account_file))
+    print(f"待上传 {len(jobs)}/{file_num} 个视频")
+    file_num = len(jobs)
     
     # 读取 config.json 并生成发布时间
     config_path = Path(BASE_DIR) / "config.json"
@@ -93,52 +159,7 @@ if __name__ == '__main__':
     category = TencentZoneTypes.LIFESTYLE.value  # 标记原创需要否则不需要传
     published_dir = Path(BASE_DIR) / "published"
     published_dir.mkdir(exist_ok=True)
-    for index, file in enumerate(files):
-        # --- 修改开始 ---
-        # 1. 调用 get_title_and_hashtags 获取原始标题
-        raw_short_title, title_and_tags = get_title_and_hashtags(str(file))
-        # 2. 在这里调用特定平台的格式化函数
-        short_title = format_str_for_short_title(raw_short_title)
-        # --- 修改结束 ---
-
-        print(f"视频文件名：{file}")
-        print(f"格式化后短标题：{short_title}") # 打印格式化后的
-        print(f"标题和话题内容：{title_and_tags}")
-        current_publish_time = publish_datetimes[index]
-        print(f"实际发布时间：{current_publish_time}")
-
-        app = TencentVideo(
-            short_title=short_title, # 传递格式化后的短标题
-            title_and_tags=title_and_tags,
-            file_path=str(file),
-            publish_date=current_publish_time,
-            account_file=str(account_file),
-            category=category,
-            original_declaration=original_declaration  # 传递原创声明配置
-        )
-        
-        # 添加原创声明状态提示
-        print(f"原创声明状态：{'启用' if original_declaration else '禁用'}")
-        
-        try:
-            asyncio.run(app.main(), debug=False)
-            # 上传成功后移动视频、封面图和txt
-            shutil.move(str(file), str(published_dir / file.name))
-            
-            # 支持多种图片格式
-            for img_ext in ['.png', '.jpg', '.jpeg', '.webp']:
-                cover = file.with_suffix(img_ext)
-                if cover.exists():
-                    shutil.move(str(cover), str(published_dir / cover.name))
-                    break
-            
-            txt = file.with_suffix('.txt')
-            if txt.exists():
-                shutil.move(str(txt), str(published_dir / txt.name))
-            print(f"已移动到published文件夹: {file.name}")
-        except Exception as e:
-            print(f"上传失败未移动: {file.name}, 错误: {e}")
-
+    asyncio.run(upload_all(store, jobs, publish_datetimes, account_file, category, original_declaration, published_dir), debug=False)
 
 async def add_original(self, page: Page):
     """声明原创"""
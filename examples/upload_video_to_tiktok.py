@@ -4,7 +4,41 @@ from pathlib import Path
 from conf import BASE_DIR
 # from tk_uploader.main import tiktok_setup, TiktokVideo
 from uploader.tk_uploader.main_chrome import tiktok_setup, TiktokVideo
+from utils.base_social_media import SOCIAL_MEDIA_TIKTOK
+from utils.browser_pool import BrowserPool
+from utils.covers import generate_covers_many, is_auto_cover_enabled
+from utils.dedup import DedupIndex
 from utils.files_times import generate_schedule_time_next_day, get_title_and_hashtags
+from utils.job_store import JobStore
+
+
+async def upload_all(store, jobs, publish_datetimes, account_file):
+    # share one warm browser across the whole batch instead of a cold start per video
+    dedup = DedupIndex()
+    async with BrowserPool(size=1) as pool:
+        for index, job in enumerate(jobs):
+            file = Path(job['file'])
+            title, tags = get_title_and_hashtags(str(file))
+            print(f"video_file_name：{file}")
+            print(f"video_title：{title}")
+            print(f"video_hashtag：{tags}")
+            # skip videos this account has already uploaded
+            if dedup.is_duplicate(file, SOCIAL_MEDIA_TIKTOK, account_file):
+                print(f"skip duplicate video: {file.name}")
+                store.skip(job['id'], "duplicate")
+                continue
+            store.start(job['id'])
+            try:
+                async with pool.context(account_file, platform=SOCIAL_MEDIA_TIKTOK) as context:
+                    # the uploader picks a cover next to the video, or generates one when auto_cover is on
+                    app = TiktokVideo(title, file, tags, publish_datetimes[index], account_file, context=context)
+                    await app.main()
+            except Exception as e:
+                store.fail(job['id'], e)
+                print(f"upload failed: {file.name}, error: {e}")
+                continue
+            store.finish(job['id'], scheduled=bool(publish_datetimes[index]))
+            dedup.record(file, SOCIAL_MEDIA_TIKTOK, account_file)
 
 
 if __name__ == '__main__':
@@ -13,18 +47,13 @@ if __name__ == '__main__':
     folder_path = Path(filepath)
     # get video files from folder
     files = list(folder_path.glob("*.mp4"))
-    file_num = len(files)
-    publish_datetimes = generate_schedule_time_next_day(file_num, 1, daily_times=[16])
+    # only upload videos that are not done yet, rerun after a crash to resume
+    store = JobStore()
+    jobs = store.resume(files, SOCIAL_MEDIA_TIKTOK, str(account_file))
+    print(f"pending {len(jobs)}/{len(files)} videos")
+    publish_datetimes = generate_schedule_time_next_day(len(jobs), 1, daily_times=[16])
     cookie_setup = asyncio.run(tiktok_setup(account_file, handle=True))
-    for index, file in enumerate(files):
-        title, tags = get_title_and_hashtags(str(file))
-        thumbnail_path = file.with_suffix('.png')
-        print(f"video_file_name：{file}")
-        print(f"video_title：{title}")
-        print(f"video_hashtag：{tags}")
-        if thumbnail_path.exists():
-            print(f"thumbnail_file_name：{thumbnail_path}")
-            app = TiktokVideo(title, file, tags, publish_datetimes[index], account_file, thumbnail_path)
-        else:
-            app = TiktokVideo(title, file, tags, publish_datetimes[index], account_file)
-        asyncio.run(app.main(), debug=False)
+    if is_auto_cover_enabled():
+        # generate covers for the whole batch in a process pool, uploads then hit the cache
+        generate_covers_many([job['file'] for job in jobs], [SOCIAL_MEDIA_TIKTOK])
+    asyncio.run(upload_all(store, jobs, publish_datetimes, account_file), debug=False)
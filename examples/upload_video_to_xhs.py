@@ -5,7 +5,9 @@ from time import sleep
 from xhs import XhsClient
 
 from conf import BASE_DIR
+from utils.base_social_media import SOCIAL_MEDIA_XHS
 from utils.files_times import generate_schedule_time_next_day, get_title_and_hashtags
+from utils.transcode import prepare_video
 from uploader.xhs_uploader.main import sign_local, beauty_print
 
 config = configparser.RawConfigParser()
@@ -57,7 +59,7 @@ if __name__ == '__main__':
 
         hash_tags_str = ' ' + ' '.join(['#' + tag + '[话题]#' for tag in hash_tags])
 
-        note = xhs_client.create_video_note(title=title[:20], video_path=str(file),
+        note = xhs_client.create_video_note(title=title[:20], video_path=str(prepare_video(file, SOCIAL_MEDIA_XHS)),
                                             desc=title + tags_str + hash_tags_str,
                                             topics=topics,
                                             is_private=False,
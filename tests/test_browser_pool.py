@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+pytest.importorskip("playwright")
+
+from utils import diagnostics
+from utils.browser_pool import ContextLease
+
+
+class _Closable(object):
+    def __init__(self, events: list, name: str):
+        self.events = events
+        self.name = name
+
+    async def close(self):
+        self.events.append(f"close {self.name}")
+
+
+def test_lease_saves_failure_then_closes(monkeypatch):
+    events = []
+
+    async def capture_failure(error):
+        events.append(f"capture {error}")
+    monkeypatch.setattr("utils.browser_pool.capture_failure", capture_failure)
+    lease = ContextLease(_Closable(events, "browser"), _Closable(events, "context"), owns_browser=True,
+                         owns_context=True)
+
+    async def upload():
+        async with lease:
+            raise RuntimeError("selector timeout")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(upload())
+    assert events == ["capture selector timeout", "close context", "close browser"]
+
+
+def test_failure_is_saved_once(monkeypatch, tmp_path):
+    recorder = diagnostics.DiagnosticsRecorder("douyin", directory=tmp_path)
+    saved = []
+
+    async def save_failure(reason, error):
+        saved.append(reason)
+        return tmp_path
+    monkeypatch.setattr(recorder, "save_failure", save_failure)
+
+    async def fail_twice():
+        await recorder.record_failure(RuntimeError("failed"))
+        await recorder.record_failure(RuntimeError("failed"))
+
+    asyncio.run(fail_twice())
+    assert saved == ["failed"]
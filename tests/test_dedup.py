@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import os
+
+import pytest
+
+from utils.base_social_media import SOCIAL_MEDIA_DOUYIN
+from utils import dedup as dedup_module
+from utils.dedup import DedupIndex
+
+
+@pytest.fixture
+def dedup(tmp_path):
+    index = DedupIndex(tmp_path / "dedup.db")
+    yield index
+    index.close()
+
+
+def test_uploads_are_shared_between_entry_points(dedup, tmp_path):
+    pytest.importorskip("playwright")
+    from utils.scheduler import UploadJob, UploadScheduler
+
+    video = tmp_path / "1.mp4"
+    video.write_bytes(b"video" * 1000)
+    job = UploadJob(SOCIAL_MEDIA_DOUYIN, "xiaoA", video)
+    # examples 中的脚本传入 str(account_file)，CLI 传入 Path
+    dedup.record(video, SOCIAL_MEDIA_DOUYIN, str(job.account_file))
+    scheduler = UploadScheduler(pool=object(), dedup=dedup)
+    assert asyncio.run(scheduler._find_duplicate(job)) == str(video)
+    assert not dedup.is_duplicate(video, SOCIAL_MEDIA_DOUYIN, job.account_file.with_name("douyin_xiaoB.json"))
+
+
+def test_same_head_tail_and_size_is_not_enough(dedup, tmp_path, monkeypatch):
+    monkeypatch.setattr(dedup_module, "PARTIAL_BYTES", 16)
+    head, tail = b"h" * 16, b"t" * 16
+    first = tmp_path / "1.mp4"
+    second = tmp_path / "2.mp4"
+    first.write_bytes(head + b"a" * 64 + tail)
+    second.write_bytes(head + b"b" * 64 + tail)
+    # 预筛选命中，但完整哈希不同
+    assert dedup.fingerprint(first)[0] == dedup.fingerprint(second)[0]
+    assert dedup.fingerprint(first)[1] != dedup.fingerprint(second)[1]
+
+    dedup.record(first, SOCIAL_MEDIA_DOUYIN, "douyin_xiaoA.json")
+    assert not dedup.is_duplicate(second, SOCIAL_MEDIA_DOUYIN, "douyin_xiaoA.json")
+    assert dedup.is_duplicate(first, SOCIAL_MEDIA_DOUYIN, "douyin_xiaoA.json")
+
+
+def test_cached_hashes_follow_size_and_mtime(dedup, tmp_path, monkeypatch):
+    hashed = []
+    full_hash = dedup_module.full_hash
+    monkeypatch.setattr(dedup_module, "full_hash", lambda path: hashed.append(path) or full_hash(path))
+    video = tmp_path / "1.mp4"
+    video.write_bytes(b"a" * 100)
+
+    original = dedup.fingerprint(video)
+    assert dedup.fingerprint(video) == original
+    assert len(hashed) == 1
+
+    # 大小不变、只修改内容和 mtime 也要重新计算
+    stat = video.stat()
+    video.write_bytes(b"b" * 100)
+    os.utime(video, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert dedup.fingerprint(video) != original
+    assert len(hashed) == 2
+
+    video.write_bytes(b"b" * 101)
+    os.utime(video, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    dedup.fingerprint(video)
+    assert len(hashed) == 3
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+from utils.base_social_media import SOCIAL_MEDIA_DOUYIN
+from utils.job_store import HOSTNAME, JobStore, STATE_FAILED, STATE_PENDING, STATE_PUBLISHED, STATE_UPLOADED, \
+    STATE_UPLOADING
+
+
+@pytest.fixture
+def db(tmp_path):
+    return tmp_path / "jobs.db"
+
+
+def _set_owner(db, job_id: int, host: str, pid: int):
+    """模拟另一个进程在上传中途退出或仍在运行"""
+    with sqlite3.connect(str(db)) as conn:
+        conn.execute("UPDATE jobs SET state = ?, owner_host = ?, owner_pid = ? WHERE id = ?",
+                     (STATE_UPLOADING, host, pid, job_id))
+
+
+def test_recover_only_resets_jobs_whose_owner_is_gone(db):
+    with JobStore(db) as store:
+        dead_id, live_id, remote_id = (store.enqueue(f"{name}.mp4", SOCIAL_MEDIA_DOUYIN, "a")
+                                       for name in ("dead", "live", "remote"))
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    live = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    try:
+        _set_owner(db, dead_id, HOSTNAME, dead.pid)
+        _set_owner(db, live_id, HOSTNAME, live.pid)
+        # 其他主机上的进程无法判断存活
+        _set_owner(db, remote_id, HOSTNAME + "-other", dead.pid)
+
+        with JobStore(db) as store:
+            states = {row['id']: row['state'] for row in store.runnable()}
+            assert states == {dead_id: STATE_PENDING}
+            assert store.counts()[STATE_UPLOADING] == 2
+    finally:
+        live.kill()
+        live.wait()
+
+
+def test_attempts_are_counted_by_start_only(db):
+    with JobStore(db, max_attempts=2) as store:
+        job_id = store.enqueue("1.mp4", SOCIAL_MEDIA_DOUYIN, "a")
+        assert store.start(job_id) == 1
+        store.fail(job_id, "timeout")
+        row = store.get("1.mp4", SOCIAL_MEDIA_DOUYIN, "a")
+        assert (row['state'], row['attempts'], row['error']) == (STATE_FAILED, 1, "timeout")
+        assert [job['id'] for job in store.runnable()] == [job_id]
+
+        assert store.start(job_id) == 2
+        store.fail(job_id, "timeout")
+        # 达到 max_attempts 后不再执行，reset() 之后重新开始计数
+        assert store.runnable() == []
+        assert store.reset() == 1
+        assert store.get("1.mp4", SOCIAL_MEDIA_DOUYIN, "a")['attempts'] == 0
+
+
+def test_resume_keeps_file_order_and_skips_finished_jobs(db):
+    files = ["c.mp4", "a.mp4", "b.mp4", "d.mp4"]
+    with JobStore(db) as store:
+        store.enqueue("b.mp4", SOCIAL_MEDIA_DOUYIN, "a")
+        finished = store.enqueue("d.mp4", SOCIAL_MEDIA_DOUYIN, "a")
+        store.start(finished)
+        store.finish(finished, scheduled=True)
+        assert store.get("d.mp4", SOCIAL_MEDIA_DOUYIN, "a")['state'] == STATE_UPLOADED
+
+        jobs = store.resume(files, SOCIAL_MEDIA_DOUYIN, "a")
+        assert [job['file'].rsplit('/', 1)[-1] for job in jobs] == ["c.mp4", "a.mp4", "b.mp4"]
+        # 其他账号的任务互不影响
+        assert len(store.resume(files, SOCIAL_MEDIA_DOUYIN, "b")) == 4
+
+        store.start(jobs[0]['id'])
+        store.finish(jobs[0]['id'])
+        assert store.counts(SOCIAL_MEDIA_DOUYIN)[STATE_PUBLISHED] == 1
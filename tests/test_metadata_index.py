@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+
+from utils import metadata_index
+from utils.metadata_index import MetadataIndex
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = MetadataIndex(tmp_path / "metadata.db")
+    yield index
+    index.close()
+
+
+def _video(folder, name: str, txt: str = None):
+    video = folder / f"{name}.mp4"
+    video.write_bytes(b"")
+    if txt is not None:
+        video.with_suffix(".txt").write_text(txt, encoding="utf-8")
+    return video
+
+
+def test_get_rescans_only_when_the_video_changes(index, tmp_path, monkeypatch):
+    folder = tmp_path / "videos"
+    folder.mkdir()
+    video = _video(folder, "1", "旧标题\n#a")
+    _video(folder, "2", "第二个\n#b")
+    scans = []
+    scan = index.scan
+    monkeypatch.setattr(index, "scan", lambda path: scans.append(path) or scan(path))
+
+    assert index.get(video).title == "旧标题"
+    assert index.get(video).title == "旧标题"
+    assert index.get(folder / "2.mp4").tags == ["b"]
+    assert len(scans) == 1
+
+    video.with_suffix(".txt").write_text("新标题\n#a #c", encoding="utf-8")
+    stat = video.with_suffix(".txt").stat()
+    os.utime(video.with_suffix(".txt"), ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    metadata = index.get(video)
+    assert (metadata.title, metadata.tags) == ("新标题", ["a", "c"])
+    assert len(scans) == 2
+
+    # 新增的同名封面也会触发重新扫描
+    video.with_suffix(".png").write_bytes(b"")
+    assert index.get(video).cover == video.with_suffix(".png")
+
+
+def test_undecodable_txt_only_affects_its_own_video(index, tmp_path):
+    broken = _video(tmp_path, "broken")
+    broken.with_suffix(".txt").write_bytes("标题".encode("gbk"))
+    good = _video(tmp_path, "good", "好标题\n正文\n#话题")
+
+    results = index.scan(tmp_path)
+    assert results[str(broken)].title == "broken"
+    assert results[str(good)].description == "正文"
+
+
+def test_caption_joins_body_and_tags():
+    assert metadata_index.format_caption("正文", ["a", "b"]) == "正文\n#a #b"
+    assert metadata_index.format_caption("", ["a"]) == "#a"
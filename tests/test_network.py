@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+from utils import network
+from utils.network import CircuitBreaker, CircuitOpenError, repeat_until_confirmed
+from utils.wait_engine import StageTimeout
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = CircuitBreaker("test", min_calls=3)
+    monkeypatch.setitem(network._breakers, "test", breaker)
+    return breaker
+
+
+async def _click():
+    pass
+
+
+def _confirm_after(polls: int):
+    state = {"polls": 0}
+
+    async def confirmed(timeout_ms):
+        state["polls"] += 1
+        if state["polls"] >= polls:
+            return True
+        await asyncio.sleep(timeout_ms / 1000)
+        return False
+    return confirmed
+
+
+def _publish(confirmed, timeout: float = 1):
+    return asyncio.run(repeat_until_confirmed("test", "publish", _click, confirmed, timeout=timeout, interval=0.01))
+
+
+def test_confirmed_publish_is_one_success(breaker):
+    _publish(_confirm_after(5))
+    assert list(ok for _, ok in breaker._events) == [True]
+
+
+def test_hanging_publish_trips_the_breaker(breaker):
+    for _ in range(breaker.min_calls):
+        with pytest.raises(StageTimeout):
+            _publish(_confirm_after(10 ** 6), timeout=0.05)
+    assert breaker.is_open
+    with pytest.raises(CircuitOpenError):
+        _publish(_confirm_after(1))
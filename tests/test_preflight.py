@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+import os
+import struct
+
+import pytest
+
+from utils import preflight
+from utils.base_social_media import SOCIAL_MEDIA_DOUYIN
+from utils.preflight import Mp4ParseError, PreflightCache, check_media, parse_mp4, probe_many
+
+IDENTITY = (0x10000, 0, 0, 0, 0x10000, 0, 0, 0, 0x40000000)
+ROTATE_90 = (0, 0x10000, 0, -0x10000, 0, 0, 0, 0, 0x40000000)
+
+
+def box(box_type: bytes, *payload: bytes) -> bytes:
+    payload = b"".join(payload)
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def large_box(box_type: bytes, payload: bytes) -> bytes:
+    """size == 1，长度放在 64 位的 largesize 中"""
+    return struct.pack(">I4sQ", 1, box_type, 16 + len(payload)) + payload
+
+
+def full_box(box_type: bytes, version: int, payload: bytes) -> bytes:
+    return box(box_type, struct.pack(">B3x", version), payload)
+
+
+def mvhd(timescale: int, duration: int, version: int = 0, box_type: bytes = b"mvhd") -> bytes:
+    if version == 1:
+        return full_box(box_type, 1, struct.pack(">QQIQ", 0, 0, timescale, duration) + bytes(80))
+    return full_box(box_type, 0, struct.pack(">IIII", 0, 0, timescale, duration) + bytes(80))
+
+
+def tkhd(width: int, height: int, version: int = 0, matrix=IDENTITY) -> bytes:
+    if version == 1:
+        head = struct.pack(">QQIIQ", 0, 0, 1, 0, 0)
+    else:
+        head = struct.pack(">IIIII", 0, 0, 1, 0, 0)
+    tail = bytes(16) + struct.pack(">9i", *matrix) + struct.pack(">II", width << 16, height << 16)
+    return full_box(b"tkhd", version, head + tail)
+
+
+def track(handler: bytes, codec: bytes, timescale: int, duration: int, width: int = 0, height: int = 0,
+          version: int = 0, matrix=IDENTITY) -> bytes:
+    hdlr = full_box(b"hdlr", 0, struct.pack(">I4s", 0, handler) + bytes(12) + b"\0")
+    sample_entry = box(codec, bytes(6), struct.pack(">H", 1), bytes(16), struct.pack(">HH", width, height),
+                       bytes(50))
+    stsd = full_box(b"stsd", 0, struct.pack(">I", 1) + sample_entry)
+    mdia = box(b"mdia", mvhd(timescale, duration, version, b"mdhd"), hdlr, box(b"minf", box(b"stbl", stsd)))
+    return box(b"trak", tkhd(width, height, version, matrix), mdia)
+
+
+def moov(duration: int = 12500, version: int = 0, matrix=IDENTITY, extra: bytes = b"") -> bytes:
+    return box(b"moov", mvhd(1000, duration, version),
+               track(b"vide", b"avc1", 90000, duration * 90, 1920, 1080, version, matrix),
+               track(b"soun", b"mp4a", 44100, duration * 44, version=version), extra)
+
+
+FTYP = box(b"ftyp", b"isom", struct.pack(">I", 512), b"isomiso2avc1mp41")
+
+
+def write(tmp_path, data: bytes, name: str = "video.mp4"):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return path
+
+
+def test_faststart_file(tmp_path):
+    info = parse_mp4(write(tmp_path, FTYP + moov() + box(b"mdat", bytes(1000))))
+    assert info["brand"] == "isom"
+    assert (info["duration"], info["width"], info["height"]) == (12.5, 1920, 1080)
+    assert (info["video_codec"], info["audio_codec"]) == ("avc1", "mp4a")
+    assert info["faststart"] is True
+    assert check_media(info, SOCIAL_MEDIA_DOUYIN) == []
+
+
+def test_64bit_headers_and_moov_after_large_mdat(tmp_path):
+    data = FTYP + large_box(b"mdat", bytes(4096)) + moov(duration=5_000_000_000, version=1)
+    info = parse_mp4(write(tmp_path, data))
+    assert info["duration"] == 5_000_000.0
+    assert (info["width"], info["height"], info["video_codec"]) == (1920, 1080, "avc1")
+    assert info["faststart"] is False
+
+
+def test_rotated_video_reports_display_size(tmp_path):
+    info = parse_mp4(write(tmp_path, FTYP + moov(matrix=ROTATE_90)))
+    assert (info["width"], info["height"]) == (1080, 1920)
+
+
+def test_fragmented_duration_comes_from_mehd(tmp_path):
+    mehd = full_box(b"mehd", 1, struct.pack(">Q", 30000))
+    data = FTYP + moov(duration=0, extra=box(b"mvex", mehd)) + box(b"moof") + box(b"mdat", bytes(16))
+    assert parse_mp4(write(tmp_path, data))["duration"] == 30.0
+
+
+def test_mdat_to_end_of_file_without_moov(tmp_path):
+    # size == 0 的 box 延伸到文件末尾；moov 还没写入
+    data = FTYP + struct.pack(">I4s", 0, b"mdat") + bytes(64)
+    with pytest.raises(Mp4ParseError):
+        parse_mp4(write(tmp_path, data))
+
+
+def test_truncated_file_is_reported_not_raised(tmp_path):
+    data = FTYP + moov()
+    path = write(tmp_path, data[:len(FTYP) + 40])
+    cache = PreflightCache(tmp_path / "preflight.db")
+    info, error = probe_many([path], cache=cache)[os.path.abspath(path)]
+    assert info is None and error
+    cache.close()
+
+
+def test_cache_is_invalidated_when_the_file_changes(tmp_path, monkeypatch):
+    path = write(tmp_path, FTYP + moov() + box(b"mdat"))
+    cache = PreflightCache(tmp_path / "preflight.db")
+    probed = []
+    worker = preflight._probe_worker
+    monkeypatch.setattr(preflight, "_probe_worker", lambda key: probed.append(key) or worker(key))
+
+    first = probe_many([path], cache=cache)
+    assert probe_many([path], cache=cache) == first
+    assert len(probed) == 1
+
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    probe_many([path], cache=cache)
+    assert len(probed) == 2
+    cache.close()
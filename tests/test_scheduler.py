@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import contextlib
+import time
+
+import pytest
+
+pytest.importorskip("playwright")
+
+from utils import metadata_index, network
+from utils import scheduler as scheduler_module
+from utils.base_social_media import SOCIAL_MEDIA_DOUYIN, SOCIAL_MEDIA_TENCENT
+from utils.job_store import JobStore, STATE_FAILED, STATE_PENDING
+from utils.network import CircuitBreaker
+from utils.scheduler import UploadJob, UploadScheduler, JOB_DONE, JOB_FAILED, JOB_SKIPPED
+
+
+@contextlib.asynccontextmanager
+async def _original_video(video, platform):
+    yield video
+
+
+async def _no_cover(video, platform):
+    return None
+
+
+class _ConcurrencyProbe(object):
+    def __init__(self):
+        self.running = 0
+        self.peak = 0
+        self.started = []
+
+    async def upload(self, job, video, thumbnail=None):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        self.started.append(job.account)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+
+
+@pytest.fixture
+def fake_upload(monkeypatch):
+    monkeypatch.setattr(scheduler_module, "prepare_cover", _no_cover)
+    monkeypatch.setattr(scheduler_module, "upload_rendition", _original_video)
+
+
+def _store_job(store, job):
+    job.job_id = store.enqueue(job.video, job.platform, job.account)
+    return job
+
+
+def _run(scheduler, jobs):
+    async def run():
+        await scheduler.start()
+        return await asyncio.gather(*(scheduler.run_job(job) for job in jobs))
+    return asyncio.run(run())
+
+
+def test_account_backlog_does_not_hold_platform_slots(fake_upload):
+    limit = 4
+    scheduler = UploadScheduler(platform_limits={SOCIAL_MEDIA_DOUYIN: limit}, account_limit=1,
+                                pool=object(), preflight=False)
+    probe = _ConcurrencyProbe()
+    scheduler._upload = probe.upload
+
+    async def account_ok(job):
+        return True
+    scheduler._check_account = account_ok
+
+    # 积压的账号排在最前面，旧的加锁顺序下它的任务会占满平台名额
+    jobs = [UploadJob(SOCIAL_MEDIA_DOUYIN, "backlog", f"backlog_{i}.mp4") for i in range(20)]
+    jobs += [UploadJob(SOCIAL_MEDIA_DOUYIN, f"account{i}", f"account{i}.mp4") for i in range(limit * 2)]
+    results = _run(scheduler, jobs)
+
+    assert all(job.status == JOB_DONE for job in results)
+    assert probe.peak == limit
+    # 其他账号的任务不用排在积压账号的所有任务之后
+    assert probe.started[:limit * 2 + 1].count("backlog") == 1
+
+
+def test_invalid_cookie_is_recorded_and_rechecked(fake_upload, monkeypatch, tmp_path):
+    verdicts = [False, True]
+
+    async def setup_account(platform, account_file):
+        return verdicts.pop(0)
+    monkeypatch.setattr(scheduler_module, "_setup_account", setup_account)
+    store = JobStore(tmp_path / "jobs.db")
+    scheduler = UploadScheduler(pool=object(), preflight=False, store=store, account_check_ttl=0)
+    scheduler._upload = _ConcurrencyProbe().upload
+
+    first = _store_job(store, UploadJob(SOCIAL_MEDIA_DOUYIN, "a", "1.mp4"))
+    _run(scheduler, [first])
+    assert first.status == JOB_SKIPPED
+    row = store.get(first.video, first.platform, first.account)
+    assert row["state"] == STATE_FAILED and "cookie" in row["error"] and row["attempts"] == 0
+
+    # 校验结果过期后重新校验，重新登录的账号可以继续上传
+    second = _store_job(store, UploadJob(SOCIAL_MEDIA_DOUYIN, "a", "2.mp4"))
+    _run(scheduler, [second])
+    assert second.status == JOB_DONE
+
+
+def test_circuit_open_leaves_job_pending(fake_upload, monkeypatch, tmp_path):
+    breaker = CircuitBreaker(SOCIAL_MEDIA_DOUYIN)
+    breaker.opened_at = time.monotonic()
+    monkeypatch.setitem(network._breakers, SOCIAL_MEDIA_DOUYIN, breaker)
+    store = JobStore(tmp_path / "jobs.db")
+    scheduler = UploadScheduler(pool=object(), preflight=False, store=store)
+
+    async def account_ok(job):
+        return True
+    scheduler._check_account = account_ok
+
+    job = _store_job(store, UploadJob(SOCIAL_MEDIA_DOUYIN, "a", "1.mp4"))
+    _run(scheduler, [job])
+    assert job.status == JOB_FAILED
+    assert store.get(job.video, job.platform, job.account)["state"] == STATE_PENDING
+
+
+def test_tencent_description_keeps_txt_body(monkeypatch, tmp_path):
+    from uploader.tencent_uploader.main import TencentVideo
+
+    monkeypatch.setattr(metadata_index, "_default_index", metadata_index.MetadataIndex(tmp_path / "metadata.db"))
+    video = tmp_path / "clip.mp4"
+    video.write_bytes(b"")
+    video.with_suffix(".txt").write_text("一个测试短标题\n第一行正文\n第二行正文\n#话题1 #话题2\n", encoding="utf-8")
+    uploaded = []
+
+    async def main(app):
+        uploaded.append(app)
+    monkeypatch.setattr(TencentVideo, "main", main)
+
+    class _Pool(object):
+        @contextlib.asynccontextmanager
+        async def context(self, account_file, platform=None):
+            yield None
+
+    scheduler = UploadScheduler(pool=_Pool(), preflight=False)
+    job = UploadJob(SOCIAL_MEDIA_TENCENT, "a", video)
+    asyncio.run(scheduler._upload(job, video))
+
+    assert uploaded[0].short_title == "一个测试短标题"
+    assert uploaded[0].title_and_tags == "第一行正文\n第二行正文\n#话题1 #话题2"
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from utils.session_check import SessionValidator, set_session_probe_enabled
+
+PLATFORM = "stub"
+
+
+class _CreatorPage(BaseHTTPRequestHandler):
+    """带有效 sessionid 时返回上传页，sessionid=outage 时模拟平台故障，否则像创作者平台一样重定向到登录页"""
+
+    def do_GET(self):
+        if self.path.startswith("/login"):
+            self.send_response(200)
+        elif "sessionid=outage" in (self.headers.get("Cookie") or ""):
+            self.send_response(500)
+        elif "sessionid=valid" in (self.headers.get("Cookie") or ""):
+            self.send_response(200)
+        else:
+            self.send_response(302)
+            self.send_header("Location", "/login?next=upload")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def creator_site():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _CreatorPage)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def _account(tmp_path, session_id: str):
+    account_file = tmp_path / f"{session_id}.json"
+    account_file.write_text(json.dumps({"cookies": [
+        {"name": "sessionid", "value": session_id, "domain": "127.0.0.1", "expires": -1},
+    ]}), encoding="utf-8")
+    return account_file
+
+
+@pytest.fixture
+def validator(creator_site, tmp_path):
+    rules = {PLATFORM: {'domain': "127.0.0.1", 'session_cookies': ("sessionid",),
+                        'probe_url': creator_site + "/upload", 'login_markers': ("login",)}}
+    set_session_probe_enabled(True)
+    yield SessionValidator(cache_file=tmp_path / "session_cache.json", rules=rules)
+    set_session_probe_enabled(None)
+
+
+def test_probe_accepts_a_live_session(validator, tmp_path):
+    account_file = _account(tmp_path, "valid")
+    assert asyncio.run(validator.check(account_file, PLATFORM)) is True
+    assert validator.cached(account_file, PLATFORM) is True
+
+
+def test_probe_rejects_a_session_redirected_to_login(validator, tmp_path):
+    # cookie 本身没有过期时间，只有探测能发现服务端已经让它失效
+    account_file = _account(tmp_path, "expired")
+    assert asyncio.run(validator.check(account_file, PLATFORM)) is False
+    assert validator.cached(account_file, PLATFORM) is None
+
+
+def test_probe_leaves_server_errors_undecided(validator, tmp_path):
+    # 平台故障不能让有效的账号被当作已退出登录
+    account_file = _account(tmp_path, "outage")
+    assert asyncio.run(validator.check(account_file, PLATFORM)) is None
+    assert validator.cached(account_file, PLATFORM) is None
+
+
+def test_probe_is_off_unless_configured(validator, tmp_path):
+    set_session_probe_enabled(False)
+    assert asyncio.run(validator.check(_account(tmp_path, "expired"), PLATFORM)) is None
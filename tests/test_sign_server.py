@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+pytest.importorskip("playwright")
+
+from uploader.xhs_uploader.sign_server import XhsSigner
+
+
+def test_failed_startup_is_retried(monkeypatch):
+    attempts = []
+
+    async def startup(self):
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("browser not installed")
+    monkeypatch.setattr(XhsSigner, "_startup", startup)
+    signer = XhsSigner()
+
+    with pytest.raises(RuntimeError):
+        signer.start()
+    assert not signer.health()["running"]
+    # 第二次调用重新启动，而不是当作已在运行
+    assert signer.start() is signer
+    assert len(attempts) == 2 and signer.health()["running"]
+    signer._loop.call_soon_threadsafe(signer._loop.stop)
+    signer._thread.join()
+
+
+def test_startup_wait_times_out(monkeypatch):
+    async def startup(self):
+        await asyncio.sleep(1)
+    monkeypatch.setattr(XhsSigner, "_startup", startup)
+
+    with pytest.raises(TimeoutError):
+        XhsSigner(startup_timeout=0.05).start()
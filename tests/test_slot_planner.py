@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime, timedelta, timezone
+
+from utils.base_social_media import SOCIAL_MEDIA_DOUYIN
+from utils.files_times import get_timezone
+from utils.slot_planner import SlotPlanner, SlotRule
+
+TZ = "Asia/Shanghai"
+
+
+def _local(value: str) -> datetime:
+    return datetime.strptime(value, "%Y-%m-%d %H:%M").replace(tzinfo=get_timezone(TZ))
+
+
+def test_slots_are_timezone_aware_in_the_rule_timezone():
+    # 2024-05-08 00:00 UTC 即上海时间 08:00
+    start = datetime(2024, 5, 8, tzinfo=timezone.utc)
+    planner = SlotPlanner(SlotRule(daily_times=["08:00", "20:00"], timezone=TZ), start=start)
+    slots = [planner.next_slot(SOCIAL_MEDIA_DOUYIN, "a") for _ in range(3)]
+    assert all(slot.utcoffset() == timedelta(hours=8) for slot in slots)
+    assert slots == [_local("2024-05-08 08:00"), _local("2024-05-08 20:00"), _local("2024-05-09 08:00")]
+
+
+def test_reserved_and_blacked_out_slots_are_skipped():
+    rule = SlotRule(daily_times=["08:00", "12:00", "18:00"], timezone=TZ,
+                    blackouts=[["2024-05-08 17:00", "2024-05-08 19:00"]])
+    planner = SlotPlanner(rule, start=_local("2024-05-08 00:00"))
+    # 清单中写明的时间，不带时区时按规则的时区解释
+    planner.reserve(SOCIAL_MEDIA_DOUYIN, "a", datetime(2024, 5, 8, 12, 0))
+    slots = [planner.next_slot(SOCIAL_MEDIA_DOUYIN, "a") for _ in range(3)]
+    assert slots == [_local("2024-05-08 08:00"), _local("2024-05-09 08:00"), _local("2024-05-09 12:00")]
+
+
+def test_spacing_and_daily_cap_apply_per_account():
+    rule = SlotRule(daily_cap=2, min_spacing=180, timezone=TZ, window=("08:00", "22:00"))
+    planner = SlotPlanner(rule, start=_local("2024-05-08 08:00"))
+    planner.reserve(SOCIAL_MEDIA_DOUYIN, "a", _local("2024-05-08 12:00"))
+    slots = planner.plan([("1.mp4", SOCIAL_MEDIA_DOUYIN, "a"), ("2.mp4", SOCIAL_MEDIA_DOUYIN, "a"),
+                          ("3.mp4", SOCIAL_MEDIA_DOUYIN, "b")])
+    # 08:00 与预留的 12:00 相隔超过 3 小时；当天已满两条，下一条顺延到次日
+    assert [when for _, when in slots] == [_local("2024-05-08 08:00"), _local("2024-05-09 08:00"),
+                                           _local("2024-05-08 08:00")]
+
+    spaced = SlotPlanner(SlotRule(min_spacing=180, timezone=TZ), start=_local("2024-05-08 08:00"))
+    spaced.reserve(SOCIAL_MEDIA_DOUYIN, "a", _local("2024-05-08 10:00"))
+    assert spaced.next_slot(SOCIAL_MEDIA_DOUYIN, "a") == _local("2024-05-08 14:00")
+    assert spaced.next_slot(SOCIAL_MEDIA_DOUYIN, "b") == _local("2024-05-08 08:00")
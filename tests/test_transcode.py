@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import os
+
+import pytest
+
+from utils import dedup, transcode
+from utils.base_social_media import SOCIAL_MEDIA_DOUYIN
+
+# moov 在 mdat 之后的 H.264 视频只需要 faststart 封装
+REMUX_INFO = {"duration": 10.0, "width": 1920, "height": 1080, "bitrate": 1_000_000, "video_codec": "avc1",
+              "faststart": False, "size": 1024}
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    cache_dir = tmp_path / "transcode"
+    cache_dir.mkdir()
+    monkeypatch.setattr(transcode, "_settings", {"enabled": True, "budget": 0, "ffmpeg": "ffmpeg"})
+    monkeypatch.setattr(transcode, "_pinned", {})
+    index = dedup.DedupIndex(tmp_path / "dedup.db")
+    monkeypatch.setattr(dedup, "_default_index", index)
+    yield cache_dir
+    index.close()
+
+
+def _rendition(cache_dir, name: str, age: int):
+    """缓存中的转码文件，age 越大越早被淘汰"""
+    path = cache_dir / f"{name}.mp4"
+    path.write_bytes(b"\0" * 1024)
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns - age * 1_000_000_000))
+    return path
+
+
+def test_evict_skips_pinned_renditions(cache_dir):
+    pinned = _rendition(cache_dir, "queued", age=300)
+    stale = _rendition(cache_dir, "stale", age=200)
+    fresh = _rendition(cache_dir, "fresh", age=100)
+    assert transcode._pin(pinned)
+
+    # 另一个任务刚转码完 fresh，预算为 0 时其余未锁定的文件都会被淘汰
+    assert transcode.evict(0, cache_dir, keep=fresh) == 1
+    assert pinned.exists() and fresh.exists() and not stale.exists()
+
+    transcode._unpin(pinned)
+    assert transcode.evict(0, cache_dir, keep=fresh) == 1
+    assert not pinned.exists()
+
+
+def test_pins_are_reference_counted(cache_dir):
+    rendition = _rendition(cache_dir, "shared", age=100)
+    assert transcode._pin(rendition) and transcode._pin(rendition)
+    transcode._unpin(rendition)
+    assert transcode.evict(0, cache_dir) == 0
+    transcode._unpin(rendition)
+    assert transcode.evict(0, cache_dir) == 1
+    assert not transcode._pin(rendition)
+
+
+def test_upload_rendition_is_pinned_until_the_upload_ends(cache_dir, tmp_path, monkeypatch):
+    source = tmp_path / "1.mp4"
+    source.write_bytes(b"video" * 100)
+    monkeypatch.setattr(transcode, "probe_many", lambda videos: {str(source.resolve()): (REMUX_INFO, None)})
+    prepare_video = transcode.prepare_video
+    monkeypatch.setattr(transcode, "prepare_video",
+                        lambda video, platform, pin=False: prepare_video(video, platform, cache_dir, pin))
+    # 转码结果已在缓存中，不需要运行 ffmpeg
+    target = cache_dir / (f"{transcode.content_hash(source.resolve())[:32]}-{SOCIAL_MEDIA_DOUYIN}-"
+                          f"{transcode._profile_tag(transcode.RENDITION_PROFILES[SOCIAL_MEDIA_DOUYIN])}.mp4")
+    target.write_bytes(b"rendition")
+
+    async def upload():
+        async with transcode.upload_rendition(source, SOCIAL_MEDIA_DOUYIN) as video:
+            assert video == target
+            transcode.evict(0, cache_dir)
+            assert target.exists()
+        assert transcode.evict(0, cache_dir) == 1
+
+    asyncio.run(upload())
+    assert not target.exists()
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+import importlib.metadata
+
+import pytest
+
+from utils import uploader_registry
+from utils.uploader_registry import UploaderPlugin, available_uploaders, load_uploader
+
+
+class ThirdPartyPlugin(UploaderPlugin):
+    uses_browser = False
+
+
+@pytest.fixture
+def installed_plugin(monkeypatch):
+    entry_point = importlib.metadata.EntryPoint(name="thirdparty", value=f"{__name__}:ThirdPartyPlugin",
+                                                group=uploader_registry.ENTRY_POINT_GROUP)
+
+    def entry_points(group=None):
+        return [entry_point] if group == uploader_registry.ENTRY_POINT_GROUP else []
+    monkeypatch.setattr(importlib.metadata, "entry_points", entry_points)
+    monkeypatch.setattr(uploader_registry, "_installed", None)
+    yield "thirdparty"
+    uploader_registry._plugins.pop("thirdparty", None)
+
+
+def test_installed_plugins_are_offered_to_the_cli(installed_plugin):
+    platforms = available_uploaders()
+    assert platforms[:len(uploader_registry.BUILTIN_UPLOADERS)] == list(uploader_registry.BUILTIN_UPLOADERS)
+    assert installed_plugin in platforms
+    plugin = load_uploader(installed_plugin)
+    assert isinstance(plugin, ThirdPartyPlugin) and plugin.name == installed_plugin
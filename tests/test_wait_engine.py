@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+from utils.wait_engine import Deadline, StageTimeout, wait_for_first
+
+
+class TimeoutError(Exception):
+    """与 playwright 的 TimeoutError 同名，不是内置 TimeoutError 的子类"""
+
+
+class _Locator(object):
+    def __init__(self, error: Exception = None, delay: float = 0):
+        self.error = error
+        self.delay = delay
+
+    @property
+    def first(self):
+        return self
+
+    async def wait_for(self, state, timeout):
+        assert timeout >= 1
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+
+
+def test_expired_deadline_never_passes_zero_timeout():
+    deadline = Deadline(0)
+    assert deadline.expired
+    assert deadline.remaining_ms() == 1
+
+
+def test_wait_for_first_returns_first_satisfied():
+    conditions = {'failed': _Locator(RuntimeError("crashed")), 'done': _Locator(delay=0.01)}
+    assert asyncio.run(wait_for_first(conditions, 1)) == 'done'
+
+
+def test_wait_for_first_reraises_when_nothing_timed_out():
+    conditions = {'done': _Locator(RuntimeError("Target page has been closed")),
+                  'failed': _Locator(RuntimeError("Target crashed"))}
+    with pytest.raises(RuntimeError):
+        asyncio.run(wait_for_first(conditions, 1))
+
+
+def test_wait_for_first_reports_timeouts_as_stage_timeout():
+    conditions = {'done': _Locator(TimeoutError("Timeout 10ms exceeded")),
+                  'failed': _Locator(RuntimeError("Target crashed"))}
+    with pytest.raises(StageTimeout):
+        asyncio.run(wait_for_first(conditions, 1))
+    with pytest.raises(StageTimeout):
+        asyncio.run(wait_for_first({'done': _Locator(delay=1)}, 0.05))
@@ -1,5 +1,4 @@
 # -*- coding: utf-8 -*-
-import asyncio
 import random
 from datetime import datetime
 
@@ -7,9 +6,19 @@ from playwright.async_api import Playwright, async_playwright, Page # Add Page h
 import os
 
 from conf import LOCAL_CHROME_PATH
-from utils.base_social_media import set_init_script
+from utils.actions import click_when_ready, cosmetic_pause
+from utils.base_social_media import set_init_script, SOCIAL_MEDIA_BAIJIAHAO, creator_url
+from utils.browser_pool import default_launch_options, open_context
+from utils.files_times import to_browser_time
+from utils.session_check import session_validator
+from utils.tracing import trace_upload, trace_stage
+from utils.diagnostics import capture_failures
+from utils.interception import intercept_requests
+from utils.transcode import prepare_upload
+from utils.uploader_registry import UploaderPlugin
 from utils.log import baijiahao_logger
-from utils.network import async_retry
+from utils.network import async_retry, with_retry
+from utils.wait_engine import Deadline, wait_for_first, NAVIGATION_TIMEOUT, UPLOAD_TIMEOUT
 
 
 async def baijiahao_cookie_gen(account_file):
@@ -27,23 +36,28 @@ async def baijiahao_cookie_gen(account_file):
         context = await set_init_script(context)
         # Pause the page, and start recording manually.
         page = await context.new_page()
-        await page.goto("https://baijiahao.baidu.com/builder/theme/bjh/login")
+        await page.goto(creator_url(SOCIAL_MEDIA_BAIJIAHAO, "/builder/theme/bjh/login"))
         await page.pause()
         # 点击调试器的继续，保存cookie
         await context.storage_state(path=account_file)
         baijiahao_logger.success("cookie saved")
 
 
-async def cookie_auth(account_file):
+async def _browser_cookie_auth(account_file):
     async with async_playwright() as playwright:
         browser = await playwright.chromium.launch(headless=True, channel="msedge")
         context = await browser.new_context(storage_state=account_file)
         context = await set_init_script(context)
+        context = await intercept_requests(context, SOCIAL_MEDIA_BAIJIAHAO)
         # 创建一个新的页面
         page = await context.new_page()
         # 访问指定的 URL
-        await page.goto("https://baijiahao.baidu.com/builder/rc/home")
-        await page.wait_for_timeout(timeout=5000)
+        await page.goto(creator_url(SOCIAL_MEDIA_BAIJIAHAO, "/builder/rc/home"))
+        # 等待页面网络空闲后再判断是否出现登录入口，最多等待5秒
+        try:
+            await page.wait_for_load_state('networkidle', timeout=5000)
+        except Exception:
+            pass
 
         if await page.get_by_text('注册/登录百家号').count():
             baijiahao_logger.error("等待5秒 cookie 失效")
@@ -53,6 +67,16 @@ async def cookie_auth(account_file):
             return True
 
 
+async def cookie_auth(account_file):
+    # 先在本地检查 cookie 过期时间并复用缓存结果，无法判定时才启动浏览器校验
+    verdict = await session_validator.check(account_file, SOCIAL_MEDIA_BAIJIAHAO)
+    if verdict is not None:
+        return verdict
+    valid = await _browser_cookie_auth(account_file)
+    session_validator.remember(account_file, SOCIAL_MEDIA_BAIJIAHAO, valid)
+    return valid
+
+
 async def baijiahao_setup(account_file, handle=False):
     if not os.path.exists(account_file) or not await cookie_auth(account_file):
         if not handle:
@@ -62,7 +86,8 @@ async def baijiahao_setup(account_file, handle=False):
     return True
 
 class BaiJiaHaoVideo(object):
-    def __init__(self, title, file_path, tags, publish_date: datetime, account_file, proxy_setting=None):
+    def __init__(self, title, file_path, tags, publish_date: datetime, account_file, proxy_setting=None,
+                 browser=None, context=None):
         self.title = title  # 视频标题
         self.file_path = file_path
         self.tags = tags
@@ -71,11 +96,15 @@ class BaiJiaHaoVideo(object):
         self.date_format = '%Y年%m月%d日 %H:%M'
         self.local_executable_path = LOCAL_CHROME_PATH
         self.proxy_setting = proxy_setting
+        # 可注入浏览器池中的 browser / context，未注入时自行启动浏览器
+        self.browser = browser
+        self.context = context
 
     async def set_schedule_time(self, page, publish_date):
         """
         todo 时间选择，日后在处理 百家号的时间选择不准确，目前是随机
         """
+        publish_date = to_browser_time(publish_date)
         publish_date_day = f"{publish_date.month}月{publish_date.day}日" if publish_date.day >9  else f"{publish_date.month}月0{publish_date.day}日"
         publish_date_hour = f"{publish_date.hour}点"
         publish_date_min = f"{publish_date.minute}分"
@@ -88,9 +117,9 @@ class BaiJiaHaoVideo(object):
             except:
                 await page.locator('div.select-wrap').nth(0).click()
         # page.locator(f'div.rc-virtual-list-holder-inner >> text={publish_date_day}').click()
-        await page.wait_for_timeout(2000)
-        await page.locator(f'div.rc-virtual-list  div.cheetah-select-item >> text={publish_date_day}').click()
-        await page.wait_for_timeout(2000)
+        # 日期选项可能还带有星期或"今天"等文字，按包含匹配，与原先的 text= 选择器一致
+        await click_when_ready(page.locator('div.rc-virtual-list  div.cheetah-select-item')
+                               .filter(has_text=publish_date_day).first)
 
         # 改为随机点击一个 hour
         for _ in range(3):
@@ -100,15 +129,13 @@ class BaiJiaHaoVideo(object):
                 break
             except:
                 await page.locator('div.select-wrap').nth(1).click()
-        await page.wait_for_timeout(2000)
-        current_choice_hour = await page.locator('div.rc-virtual-list:visible div.cheetah-select-item-option').count()
-        await page.wait_for_timeout(2000)
-        await page.locator('div.rc-virtual-list:visible div.cheetah-select-item-option').nth(
-            random.randint(1, current_choice_hour-3)).click()
+        hour_options = page.locator('div.rc-virtual-list:visible div.cheetah-select-item-option')
+        await hour_options.first.wait_for(state="visible")
+        current_choice_hour = await hour_options.count()
+        await click_when_ready(hour_options.nth(random.randint(1, current_choice_hour-3)))
         # 2024.08.05 current_choice_hour的获取可能有问题，页面有7，这里获取了10，暂时硬编码至6
 
-        await page.wait_for_timeout(2000)
-        await page.locator("button >> text=定时发布").click()
+        await click_when_ready(page.locator("button >> text=定时发布"))
 
 
     async def handle_upload_error(self, page):
@@ -117,91 +144,86 @@ class BaiJiaHaoVideo(object):
         print("视频出错了，重新上传中")
 
     async def upload(self, playwright: Playwright) -> None:
-        # 使用 Chromium 浏览器启动一个浏览器实例
-        browser = await playwright.chromium.launch(headless=False, executable_path=self.local_executable_path, proxy=self.proxy_setting, channel="msedge")
-        # 创建一个浏览器上下文，使用指定的 cookie 文件
-        context = await browser.new_context(storage_state=f"{self.account_file}", user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/127.0.4324.150 Safari/537.36')
-        # context = await set_init_script(context)
-        await context.grant_permissions(['geolocation'])
-
-        # 创建一个新的页面
-        page = await context.new_page()
-        # 访问指定的 URL
-        await page.goto("https://baijiahao.baidu.com/builder/rc/edit?type=videoV2", timeout=60000)
-        baijiahao_logger.info(f"正在上传-------{self.title}.mp4")
-        # 等待页面跳转到指定的 URL，没进入，则自动等待到超时
-        baijiahao_logger.info('正在打开主页...')
-        await page.wait_for_url("https://baijiahao.baidu.com/builder/rc/edit?type=videoV2", timeout=60000)
-
-        # 点击 "上传视频" 按钮
-        await page.locator("div[class^='video-main-container'] input").set_input_files(self.file_path)
+        # 使用注入的 browser/context，或启动一个 Chromium 浏览器实例，并使用指定的 cookie 文件创建上下文
+        launch_options = default_launch_options(self.local_executable_path)
+        launch_options['proxy'] = self.proxy_setting
+        # 退出时（包括出错）关闭自行创建的浏览器上下文和浏览器实例
+        async with await open_context(playwright, self.account_file, browser=self.browser, context=self.context,
+                                      launch_options=launch_options, platform=SOCIAL_MEDIA_BAIJIAHAO) as lease:
+            context = lease.context
+            await context.grant_permissions(['geolocation'])
+
+            trace_stage("navigate")
+            # 创建一个新的页面
+            page = await context.new_page()
+            # 访问指定的 URL
+            await with_retry(SOCIAL_MEDIA_BAIJIAHAO, "navigate",
+                             lambda: page.goto(creator_url(SOCIAL_MEDIA_BAIJIAHAO, "/builder/rc/edit?type=videoV2"),
+                                               timeout=60000))
+            baijiahao_logger.info(f"正在上传-------{self.title}.mp4")
+            # 等待页面跳转到指定的 URL，没进入，则自动等待到超时
+            baijiahao_logger.info('正在打开主页...')
+            await page.wait_for_url(creator_url(SOCIAL_MEDIA_BAIJIAHAO, "/builder/rc/edit?type=videoV2"), timeout=60000)
+
+            # 点击 "上传视频" 按钮
+            trace_stage("transfer")
+            await with_retry(SOCIAL_MEDIA_BAIJIAHAO, "transfer",
+                             lambda: page.locator("div[class^='video-main-container'] input").set_input_files(
+                                 self.file_path))
+
+            # 等待进入视频发布页面
+            baijiahao_logger.info("正在等待进入视频发布页面...")
+            await page.locator("div#formMain").wait_for(state="visible", timeout=NAVIGATION_TIMEOUT * 1000)
+
+            # 填充标题和话题
+            # 这里为了避免页面变化，故使用相对位置定位：作品标题父级右侧第一个元素的input子元素
+            baijiahao_logger.info("正在填充标题和话题...")
+            trace_stage("form_fill")
+            await self.add_title_tags(page)
+
+            trace_stage("transfer")
+            upload_status = await self.uploading_video(page)
+            if not upload_status:
+                baijiahao_logger.error(f"发现上传出错了... 文件:{self.file_path}")
+                raise
+
+            # 判断视频封面图是否生成成功
+            baijiahao_logger.info("正在确认封面完成, 准备去点击定时/发布...")
+            await page.locator("div.cheetah-spin-container img").first.wait_for(state="attached",
+                                                                                timeout=UPLOAD_TIMEOUT * 1000)
+            baijiahao_logger.info("封面已完成，点击定时/发布...")
 
-        # 等待页面跳转到指定的 URL
-        while True:
-            # 判断是是否进入视频发布页面，没进入，则自动等待到超时
+            trace_stage("publish")
+            await self.publish_video(page, self.publish_date)
+            # 跳转到内容管理页即发布成功，出现安全验证弹窗则退出，二者任一出现立即唤醒
             try:
-                await page.wait_for_selector("div#formMain:visible")
-                break
-            except:
-                baijiahao_logger.info("正在等待进入视频发布页面...")
-                await asyncio.sleep(0.1)
+                await page.wait_for_url(creator_url(SOCIAL_MEDIA_BAIJIAHAO, "/builder/rc/clue**"), timeout=7000)
+            except Exception:
+                if await page.locator('div.passMod_dialog-container >> text=百度安全验证:visible').count():
+                    baijiahao_logger.error("出现验证，退出")
+                    raise Exception("出现验证，退出")
+                raise
+            baijiahao_logger.success("视频发布成功")
 
-        # 填充标题和话题
-        # 这里为了避免页面变化，故使用相对位置定位：作品标题父级右侧第一个元素的input子元素
-        await asyncio.sleep(1)
-        baijiahao_logger.info("正在填充标题和话题...")
-        await self.add_title_tags(page)
+            await context.storage_state(path=self.account_file)  # 保存cookie
+            baijiahao_logger.info('cookie更新完毕！')
+            await cosmetic_pause(2)  # 这里延迟是为了方便眼睛直观的观看
 
-        upload_status = await self.uploading_video(page)
-        if not upload_status:
-            baijiahao_logger.error(f"发现上传出错了... 文件:{self.file_path}")
-            raise
 
-        # 判断视频封面图是否生成成功
-        while True:
-            baijiahao_logger.info("正在确认封面完成, 准备去点击定时/发布...")
-            if await page.locator("div.cheetah-spin-container img").count():
-                baijiahao_logger.info("封面已完成，点击定时/发布...")
-                break
-            else:
-                baijiahao_logger.info("等待封面生成...")
-                await asyncio.sleep(3)
-
-        await self.publish_video(page, self.publish_date)
-        await page.wait_for_timeout(2000)
-        if await page.locator('div.passMod_dialog-container >> text=百度安全验证:visible').count():
-            baijiahao_logger.error("出现验证，退出")
-            raise Exception("出现验证，退出")
-        await page.wait_for_url("https://baijiahao.baidu.com/builder/rc/clue**", timeout=5000)
-        baijiahao_logger.success("视频发布成功")
-
-        await context.storage_state(path=self.account_file)  # 保存cookie
-        baijiahao_logger.info('cookie更新完毕！')
-        await asyncio.sleep(2)  # 这里延迟是为了方便眼睛直观的观看
-        # 关闭浏览器上下文和浏览器实例
-        await context.close()
-        await browser.close()
-
-
-    @async_retry(timeout=300)  # 例如，最多重试3次，超时时间为180秒
+    @async_retry(timeout=300, platform=SOCIAL_MEDIA_BAIJIAHAO, stage="transfer")
     async def uploading_video(self, page):
-        while True:
-            upload_failed = await page.locator('div .cover-overlay:has-text("上传失败")').count()
-            if upload_failed:
-                baijiahao_logger.error("发现上传出错了...")
-                # await self.handle_upload_error(page)  # 假设这是处理上传错误的函数
-                return False
-
-            uploading = await page.locator('div .cover-overlay:has-text("上传中")').count()
-            if uploading:
-                baijiahao_logger.info("正在上传视频中...")
-                await asyncio.sleep(2)  # 等待2秒再次检查
-                continue
-
-            # 检查上传是否成功
-            if not uploading and not upload_failed:
-                baijiahao_logger.success("视频上传完毕")
-                return True
+        baijiahao_logger.info("正在上传视频中...")
+        # "上传中" 消失或出现 "上传失败"，任一发生立即唤醒
+        state = await wait_for_first({
+            'failed': page.locator('div .cover-overlay:has-text("上传失败")'),
+            'done': (page.locator('div .cover-overlay:has-text("上传中")'), "detached"),
+        }, Deadline(UPLOAD_TIMEOUT, "视频上传"))
+        if state == 'failed' or await page.locator('div .cover-overlay:has-text("上传失败")').count():
+            baijiahao_logger.error("发现上传出错了...")
+            # await self.handle_upload_error(page)  # 假设这是处理上传错误的函数
+            return False
+        baijiahao_logger.success("视频上传完毕")
+        return True
 
     async def set_schedule_publish(self, page, publish_date):
         while True:
@@ -210,7 +232,6 @@ class BaiJiaHaoVideo(object):
             try:
                 await schedule_element.click()
                 await page.wait_for_selector('div.select-wrap:visible', timeout=3000)
-                await page.wait_for_timeout(timeout=2000)
                 baijiahao_logger.info("开始点击发布定时...")
                 await self.set_schedule_time(page, publish_date)
                 break
@@ -218,7 +239,7 @@ class BaiJiaHaoVideo(object):
                 baijiahao_logger.error(f"定时发布失败: {e}")
                 raise  # 重新抛出异常，让重试装饰器捕获
 
-    @async_retry(timeout=300)  # 例如，最多重试3次，超时时间为180秒
+    @async_retry(timeout=300, max_retries=3, platform=SOCIAL_MEDIA_BAIJIAHAO, stage="publish")
     async def publish_video(self, page: Page, publish_date): # Page is used here
         if publish_date != 0:
             # 定时发布
@@ -243,6 +264,24 @@ class BaiJiaHaoVideo(object):
         await title_container.fill(self.title[:30])
 
     async def main(self):
-        async with async_playwright() as playwright:
-            await self.upload(playwright)
-
+        # 开启转码时上传按平台压缩后的文件
+        self.file_path = await prepare_upload(self.file_path, SOCIAL_MEDIA_BAIJIAHAO)
+        async with trace_upload(SOCIAL_MEDIA_BAIJIAHAO, self.account_file, self.file_path):
+            if self.browser is not None or self.context is not None:
+                async with capture_failures(SOCIAL_MEDIA_BAIJIAHAO, self.account_file):
+                    await self.upload(None)
+                return
+            # 在 playwright 关闭浏览器之前保存失败现场
+            async with async_playwright() as playwright, capture_failures(SOCIAL_MEDIA_BAIJIAHAO, self.account_file):
+                await self.upload(playwright)
+
+
+class BaijiahaoPlugin(UploaderPlugin):
+    name = SOCIAL_MEDIA_BAIJIAHAO
+
+    async def setup(self, account_file, handle=False):
+        return await baijiahao_setup(str(account_file), handle=handle)
+
+    def create(self, short_title, tags, video, publish_date, account_file, thumbnail=None, context=None,
+               description=""):
+        return BaiJiaHaoVideo(short_title, video, tags, publish_date, str(account_file), context=context)
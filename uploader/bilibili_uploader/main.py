@@ -1,9 +1,19 @@
+import asyncio
 import json
+import os
 import pathlib
 import random
 from biliup.plugins.bili_webup import BiliBili, Data
 
+from utils.base_social_media import SOCIAL_MEDIA_BILIBILI
+from utils.chunk_upload import ChunkProtocol, ChunkedUpload, ChunkUploadError
+from utils.constant import VideoZoneTypes
 from utils.log import bilibili_logger
+from utils.transcode import prepare_upload
+from utils.uploader_registry import UploaderPlugin
+
+PREUPLOAD_URL = "https://member.bilibili.com/preupload"
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/127.0.0.0 Safari/537.36"
 
 
 def extract_keys_from_json(data):
@@ -39,8 +49,61 @@ def random_emoji():
     return random.choice(emoji_list)
 
 
+class UposProtocol(ChunkProtocol):
+    """b站 upos 分片上传协议，供 ChunkedUpload 断点续传使用"""
+    name = "bilibili-upos"
+
+    def __init__(self, cookie_data, timeout: float = 60):
+        self.cookies = {k: v for k, v in cookie_data.items() if k != 'access_token'}
+        self.timeout = timeout
+
+    def _headers(self, state: dict = None) -> dict:
+        headers = {'User-Agent': USER_AGENT, 'Referer': "https://member.bilibili.com/"}
+        if state:
+            headers['X-Upos-Auth'] = state['auth']
+        return headers
+
+    def begin(self, session, file, file_size, chunk_size):
+        params = {'name': file.name, 'r': 'upos', 'profile': 'ugcfx/bup', 'ssl': 0, 'version': '2.8.12',
+                  'build': 2081200, 'size': file_size}
+        ret = session.get(PREUPLOAD_URL, params=params, cookies=self.cookies, headers=self._headers(),
+                          timeout=self.timeout).json()
+        state = {
+            'name': file.name,
+            'url': f"https:{ret['endpoint']}/{ret['upos_uri'].replace('upos://', '')}",
+            'auth': ret['auth'],
+            'biz_id': ret['biz_id'],
+            'upos_uri': ret['upos_uri'],
+            'chunk_size': ret['chunk_size'],
+        }
+        ret = session.post(f"{state['url']}?uploads&output=json", headers=self._headers(state),
+                           timeout=self.timeout).json()
+        state['upload_id'] = ret['upload_id']
+        return state
+
+    def upload_chunk(self, session, state, index, offset, data, total):
+        chunks = (total + state['chunk_size'] - 1) // state['chunk_size']
+        params = {'uploadId': state['upload_id'], 'chunks': chunks, 'total': total, 'chunk': index,
+                  'size': len(data), 'partNumber': index + 1, 'start': offset, 'end': offset + len(data)}
+        response = session.put(state['url'], params=params, data=data, headers=self._headers(state),
+                               timeout=self.timeout)
+        response.raise_for_status()
+        return {'partNumber': index + 1, 'eTag': 'etag'}
+
+    def finish(self, session, state, parts):
+        params = {'name': state['name'], 'uploadId': state['upload_id'], 'biz_id': state['biz_id'],
+                  'output': 'json', 'profile': 'ugcfx/bup'}
+        ret = session.post(state['url'], params=params, json={'parts': parts}, headers=self._headers(state),
+                           timeout=self.timeout).json()
+        if ret.get('OK') != 1:
+            raise ChunkUploadError(f"{state['name']} 分片合并失败: {ret}")
+        return {'title': os.path.splitext(state['name'])[0],
+                'filename': os.path.splitext(os.path.basename(state['upos_uri']))[0],
+                'desc': ''}
+
+
 class BilibiliUploader(object):
-    def __init__(self, cookie_data, file: pathlib.Path, title, desc, tid, tags, dtime):
+    def __init__(self, cookie_data, file: pathlib.Path, title, desc, tid, tags, dtime, resumable: bool = False):
         self.upload_thread_num = 3
         self.copyright = 1
         self.lines = 'AUTO'
@@ -51,6 +114,8 @@ class BilibiliUploader(object):
         self.tid = tid
         self.tags = tags
         self.dtime = dtime
+        # 使用 ChunkedUpload 上传视频，中断后可续传
+        self.resumable = resumable
         self._init_data()
 
     def _init_data(self):
@@ -62,12 +127,23 @@ class BilibiliUploader(object):
         self.data.set_tag(self.tags)
         self.data.dtime = self.dtime
 
+    def _resumable_upload(self):
+        def on_progress(uploaded, total):
+            bilibili_logger.info(f'[-] {self.file.name} 已上传 {uploaded * 100 // max(total, 1)}%')
+
+        upload = ChunkedUpload(self.file, UposProtocol(self.cookie_data), workers=self.upload_thread_num,
+                               on_progress=on_progress)
+        return upload.run()
+
     def upload(self):
         with BiliBili(self.data) as bili:
             bili.login_by_cookies(self.cookie_data)
             bili.access_token = self.cookie_data.get('access_token')
-            video_part = bili.upload_file(str(self.file), lines=self.lines,
-                                          tasks=self.upload_thread_num)  # 上传视频，默认线路AUTO自动选择，线程数量3。
+            if self.resumable:
+                video_part = self._resumable_upload()
+            else:
+                video_part = bili.upload_file(str(self.file), lines=self.lines,
+                                              tasks=self.upload_thread_num)  # 上传视频，默认线路AUTO自动选择，线程数量3。
             video_part['title'] = self.title
             self.data.append(video_part)
             ret = bili.submit()  # 提交视频
@@ -77,3 +153,30 @@ class BilibiliUploader(object):
             else:
                 bilibili_logger.error(f'[-] {self.file.name}上传 失败, error messge: {ret.get("message")}')
                 return False
+
+
+class BilibiliPlugin(UploaderPlugin):
+    name = SOCIAL_MEDIA_BILIBILI
+    uses_browser = False
+    tid = VideoZoneTypes.LIFE.value
+
+    async def setup(self, account_file, handle=False):
+        if os.path.exists(account_file):
+            return True
+        if handle:
+            # 使用 biliup 扫码登录生成 cookie 文件，见 examples/get_bilibili_cookie.py
+            bilibili_logger.info(f'[+] cookie文件不存在，请先执行 biliup -u {account_file} login')
+        return False
+
+    async def upload(self, short_title, tags, video, publish_date, account_file, thumbnail=None,
+                     context=None, description=""):
+        cookie_data = extract_keys_from_json(read_cookie_json_file(pathlib.Path(account_file)))
+        # bilibili 不允许重复的标题
+        title = short_title + random_emoji()
+        dtime = int(publish_date.timestamp()) if publish_date else 0
+        video = await prepare_upload(pathlib.Path(video), self.name)
+        # 简介使用 .txt 中的正文，没有正文时沿用标题；话题通过 tags 单独提交
+        uploader = BilibiliUploader(cookie_data, video, title, description or title, self.tid, tags, dtime,
+                                    resumable=True)
+        if not await asyncio.to_thread(uploader.upload):
+            raise Exception(f"{pathlib.Path(video).name} 上传失败")
@@ -3,24 +3,36 @@ from datetime import datetime
 
 from playwright.async_api import Playwright, async_playwright, Page
 import os
-import asyncio
 
 from conf import LOCAL_CHROME_PATH
-from utils.base_social_media import set_init_script
+from utils.base_social_media import set_init_script, SOCIAL_MEDIA_DOUYIN, creator_url
+from utils.browser_pool import default_launch_options, open_context
+from utils.files_times import to_browser_time
+from utils.actions import click_when_ready, cosmetic_pause, fill_and_verify, wait_for_value
+from utils.session_check import session_validator
+from utils.tracing import trace_upload, trace_stage
+from utils.diagnostics import capture_failures, capture
+from utils.interception import intercept_requests
+from utils.transcode import prepare_upload
+from utils.covers import prepare_cover
+from utils.uploader_registry import UploaderPlugin
+from utils.network import repeat_until_confirmed, with_retry
+from utils.wait_engine import Deadline, wait_for_first, wait_for_gone, wait_for_any_url, UPLOAD_TIMEOUT
 from utils.log import douyin_logger
 
 
-async def cookie_auth(account_file):
+async def _browser_cookie_auth(account_file):
     async with async_playwright() as playwright:
         browser = await playwright.chromium.launch(headless=True, channel="msedge")
         context = await browser.new_context(storage_state=account_file)
         context = await set_init_script(context)
+        context = await intercept_requests(context, SOCIAL_MEDIA_DOUYIN)
         # 创建一个新的页面
         page = await context.new_page()
         # 访问指定的 URL
-        await page.goto("https://creator.douyin.com/creator-micro/content/upload")
+        await page.goto(creator_url(SOCIAL_MEDIA_DOUYIN, "/creator-micro/content/upload"))
         try:
-            await page.wait_for_url("https://creator.douyin.com/creator-micro/content/upload", timeout=5000)
+            await page.wait_for_url(creator_url(SOCIAL_MEDIA_DOUYIN, "/creator-micro/content/upload"), timeout=5000)
         except:
             print("[+] 等待5秒 cookie 失效")
             await context.close()
@@ -35,6 +47,16 @@ async def cookie_auth(account_file):
             return True
 
 
+async def cookie_auth(account_file):
+    # 先在本地检查 cookie 过期时间并复用缓存结果，无法判定时才启动浏览器校验
+    verdict = await session_validator.check(account_file, SOCIAL_MEDIA_DOUYIN)
+    if verdict is not None:
+        return verdict
+    valid = await _browser_cookie_auth(account_file)
+    session_validator.remember(account_file, SOCIAL_MEDIA_DOUYIN, valid)
+    return valid
+
+
 async def douyin_setup(account_file, handle=False):
     if not os.path.exists(account_file) or not await cookie_auth(account_file):
         if not handle:
@@ -57,14 +79,15 @@ async def douyin_cookie_gen(account_file):
         context = await set_init_script(context)
         # Pause the page, and start recording manually.
         page = await context.new_page()
-        await page.goto("https://creator.douyin.com/")
+        await page.goto(creator_url(SOCIAL_MEDIA_DOUYIN, "/"))
         await page.pause()
         # 点击调试器的继续，保存cookie
         await context.storage_state(path=account_file)
 
 
 class DouYinVideo(object):
-    def __init__(self, title, file_path, tags, publish_date: datetime, account_file, thumbnail_path=None):
+    def __init__(self, title, file_path, tags, publish_date: datetime, account_file, thumbnail_path=None,
+                 browser=None, context=None):
         self.title = title  # 视频标题
         self.file_path = file_path
         self.tags = tags
@@ -73,159 +96,159 @@ class DouYinVideo(object):
         self.date_format = '%Y年%m月%d日 %H:%M'
         self.local_executable_path = LOCAL_CHROME_PATH
         self.thumbnail_path = thumbnail_path
+        # 可注入浏览器池中的 browser / context，未注入时自行启动浏览器
+        self.browser = browser
+        self.context = context
 
     async def set_schedule_time_douyin(self, page, publish_date):
+        publish_date = to_browser_time(publish_date)
         # 选择包含特定文本内容的 label 元素
         label_element = page.locator("[class^='radio']:has-text('定时发布')")
         # 在选中的 label 元素下点击 checkbox
         await label_element.click()
-        await asyncio.sleep(1)
         publish_date_hour = publish_date.strftime("%Y-%m-%d %H:%M")
 
-        await asyncio.sleep(1)
-        await page.locator('.semi-input[placeholder="日期和时间"]').click()
+        # 等待日期输入框出现后输入，并确认输入框中已是目标时间
+        date_input = page.locator('.semi-input[placeholder="日期和时间"]')
+        await click_when_ready(date_input)
         await page.keyboard.press("Control+KeyA")
         await page.keyboard.type(str(publish_date_hour))
+        await wait_for_value(date_input, publish_date_hour)
         await page.keyboard.press("Enter")
 
-        await asyncio.sleep(1)
-
     async def handle_upload_error(self, page):
         douyin_logger.info('视频出错了，重新上传中')
         await page.locator('div.progress-div [class^="upload-btn-input"]').set_input_files(self.file_path)
 
     async def upload(self, playwright: Playwright) -> None:
-        # 使用 Chromium 浏览器启动一个浏览器实例
-        if self.local_executable_path:
-            browser = await playwright.chromium.launch(headless=False, executable_path=self.local_executable_path, channel="msedge")
-        else:
-            browser = await playwright.chromium.launch(headless=False, channel="msedge")
-        # 创建一个浏览器上下文，使用指定的 cookie 文件
-        context = await browser.new_context(storage_state=f"{self.account_file}")
-        context = await set_init_script(context)
+        # 使用注入的 browser/context，或启动一个 Chromium 浏览器实例，并使用指定的 cookie 文件创建上下文
+        # 退出时（包括出错）关闭自行创建的浏览器上下文和浏览器实例
+        async with await open_context(playwright, self.account_file, browser=self.browser, context=self.context,
+                                      launch_options=default_launch_options(self.local_executable_path),
+                                      platform=SOCIAL_MEDIA_DOUYIN) as lease:
+            context = lease.context
 
-        # 创建一个新的页面
-        page = await context.new_page()
-        # 访问指定的 URL
-        await page.goto("https://creator.douyin.com/creator-micro/content/upload")
-        douyin_logger.info(f'[+]正在上传-------{self.title}.mp4')
-        # 等待页面跳转到指定的 URL，没进入，则自动等待到超时
-        douyin_logger.info(f'[-] 正在打开主页...')
-        await page.wait_for_url("https://creator.douyin.com/creator-micro/content/upload")
-        # 点击 "上传视频" 按钮
-        await page.locator("div[class^='container'] input").set_input_files(self.file_path)
-
-        # 等待页面跳转到指定的 URL 2025.01.08修改在原有基础上兼容两种页面
-        while True:
-            try:
-                # 尝试等待第一个 URL
-                await page.wait_for_url(
-                    "https://creator.douyin.com/creator-micro/content/publish?enter_from=publish_page", timeout=3000)
-                douyin_logger.info("[+] 成功进入version_1发布页面!")
-                break  # 成功进入页面后跳出循环
-            except Exception:
-                try:
-                    # 如果第一个 URL 超时，再尝试等待第二个 URL
-                    await page.wait_for_url(
-                        "https://creator.douyin.com/creator-micro/content/post/video?enter_from=publish_page",
-                        timeout=3000)
-                    douyin_logger.info("[+] 成功进入version_2发布页面!")
-
-                    break  # 成功进入页面后跳出循环
-                except:
-                    print("  [-] 超时未进入视频发布页面，重新尝试...")
-                    await asyncio.sleep(0.5)  # 等待 0.5 秒后重新尝试
-        # 填充标题和话题
-        # 检查是否存在包含输入框的元素
-        # 这里为了避免页面变化，故使用相对位置定位：作品标题父级右侧第一个元素的input子元素
-        await asyncio.sleep(1)
-        douyin_logger.info(f'  [-] 正在填充标题和话题...')
-        title_container = page.get_by_text('作品标题').locator("..").locator("xpath=following-sibling::div[1]").locator("input")
-        if await title_container.count():
-            await title_container.fill(self.title[:30])
-        else:
+            trace_stage("navigate")
+            # 创建一个新的页面
+            page = await context.new_page()
+            # 访问指定的 URL
+            await with_retry(SOCIAL_MEDIA_DOUYIN, "navigate",
+                             lambda: page.goto(creator_url(SOCIAL_MEDIA_DOUYIN, "/creator-micro/content/upload")))
+            douyin_logger.info(f'[+]正在上传-------{self.title}.mp4')
+            # 等待页面跳转到指定的 URL，没进入，则自动等待到超时
+            douyin_logger.info(f'[-] 正在打开主页...')
+            await page.wait_for_url(creator_url(SOCIAL_MEDIA_DOUYIN, "/creator-micro/content/upload"))
+            # 点击 "上传视频" 按钮
+            trace_stage("transfer")
+            await with_retry(SOCIAL_MEDIA_DOUYIN, "transfer",
+                             lambda: page.locator("div[class^='container'] input").set_input_files(self.file_path))
+
+            # 等待页面跳转到指定的 URL 2025.01.08修改在原有基础上兼容两种页面，任一页面出现即继续
+            publish_page_v1 = creator_url(SOCIAL_MEDIA_DOUYIN, "/creator-micro/content/publish?enter_from=publish_page")
+            publish_page_v2 = creator_url(SOCIAL_MEDIA_DOUYIN, "/creator-micro/content/post/video?enter_from=publish_page")
+            entered = await wait_for_any_url(page, [publish_page_v1, publish_page_v2], timeout=120, stage="进入发布页面")
+            douyin_logger.info(f"[+] 成功进入{'version_1' if entered == publish_page_v1 else 'version_2'}发布页面!")
+            # 填充标题和话题
+            # 检查是否存在包含输入框的元素
+            # 这里为了避免页面变化，故使用相对位置定位：作品标题父级右侧第一个元素的input子元素
+            trace_stage("form_fill")
+            douyin_logger.info(f'  [-] 正在填充标题和话题...')
+            title_container = page.get_by_text('作品标题').locator("..").locator("xpath=following-sibling::div[1]").locator("input")
             titlecontainer = page.locator(".notranslate")
-            await titlecontainer.click()
-            await page.keyboard.press("Backspace")
-            await page.keyboard.press("Control+KeyA")
-            await page.keyboard.press("Delete")
-            await page.keyboard.type(self.title)
-            await page.keyboard.press("Enter")
-        css_selector = ".zone-container"
-        for index, tag in enumerate(self.tags, start=1):
-            await page.type(css_selector, "#" + tag)
-            await page.press(css_selector, "Space")
-        douyin_logger.info(f'总共添加{len(self.tags)}个话题')
-
-        while True:
-            # 判断重新上传按钮是否存在，如果不存在，代表视频正在上传，则等待
-            try:
-                #  新版：定位重新上传
-                number = await page.locator('[class^="long-card"] div:has-text("重新上传")').count()
-                if number > 0:
+            # 等待任一种标题输入框渲染出来，优先使用作品标题 input
+            await wait_for_first({'input': title_container, 'editor': titlecontainer}, timeout=30, stage="等待标题输入框")
+            if await title_container.count():
+                await fill_and_verify(title_container, self.title[:30])
+            else:
+                await titlecontainer.click()
+                await page.keyboard.press("Backspace")
+                await page.keyboard.press("Control+KeyA")
+                await page.keyboard.press("Delete")
+                await page.keyboard.type(self.title)
+                await page.keyboard.press("Enter")
+            css_selector = ".zone-container"
+            for index, tag in enumerate(self.tags, start=1):
+                await page.type(css_selector, "#" + tag)
+                await page.press(css_selector, "Space")
+            douyin_logger.info(f'总共添加{len(self.tags)}个话题')
+
+            # 出现重新上传按钮代表视频上传完毕，出现上传失败则重新上传，二者任一出现立即唤醒
+            douyin_logger.info("  [-] 正在上传视频中...")
+            trace_stage("transfer")
+            deadline = Deadline(UPLOAD_TIMEOUT, "视频上传")
+            while True:
+                state = await wait_for_first({
+                    #  新版：定位重新上传
+                    'done': page.locator('[class^="long-card"] div:has-text("重新上传")'),
+                    'failed': page.locator('div.progress-div > div:has-text("上传失败")'),
+                }, deadline)
+                if state == 'done':
                     douyin_logger.success("  [-]视频上传完毕")
                     break
-                else:
-                    douyin_logger.info("  [-] 正在上传视频中...")
-                    await asyncio.sleep(2)
-
-                    if await page.locator('div.progress-div > div:has-text("上传失败")').count():
-                        douyin_logger.error("  [-] 发现上传出错了... 准备重试")
-                        await self.handle_upload_error(page)
-            except:
-                douyin_logger.info("  [-] 正在上传视频中...")
-                await asyncio.sleep(2)
+                douyin_logger.error("  [-] 发现上传出错了... 准备重试")
+                await self.handle_upload_error(page)
+                await wait_for_gone(page.locator('div.progress-div > div:has-text("上传失败")'), deadline)
         
-        #上传视频封面
-        await self.set_thumbnail(page, self.thumbnail_path)
+            #上传视频封面
+            trace_stage("form_fill")
+            await self.set_thumbnail(page, self.thumbnail_path)
 
-        # 更换可见元素
-        await self.set_location(page, "杭州市")
+            # 更换可见元素
+            await self.set_location(page, "杭州市")
 
-        # 頭條/西瓜
-        third_part_element = '[class^="info"] > [class^="first-part"] div div.semi-switch'
-        # 定位是否有第三方平台
-        if await page.locator(third_part_element).count():
-            # 检测是否是已选中状态
-            if 'semi-switch-checked' not in await page.eval_on_selector(third_part_element, 'div => div.className'):
-                await page.locator(third_part_element).locator('input.semi-switch-native-control').click()
+            # 頭條/西瓜
+            third_part_element = '[class^="info"] > [class^="first-part"] div div.semi-switch'
+            # 定位是否有第三方平台
+            if await page.locator(third_part_element).count():
+                # 检测是否是已选中状态
+                if 'semi-switch-checked' not in await page.eval_on_selector(third_part_element, 'div => div.className'):
+                    await page.locator(third_part_element).locator('input.semi-switch-native-control').click()
 
-        if self.publish_date != 0:
-            await self.set_schedule_time_douyin(page, self.publish_date)
+            if self.publish_date != 0:
+                await self.set_schedule_time_douyin(page, self.publish_date)
 
-        # 判断视频是否发布成功
-        while True:
             # 判断视频是否发布成功
-            try:
-                publish_button = page.get_by_role('button', name="发布", exact=True)
-                if await publish_button.count():
-                    await publish_button.click()
-                await page.wait_for_url("https://creator.douyin.com/creator-micro/content/manage**",
-                                        timeout=3000)  # 如果自动跳转到作品页面，则代表发布成功
-                douyin_logger.success("  [-]视频发布成功")
-                break
-            except:
-                douyin_logger.info("  [-] 视频正在发布中...")
-                await page.screenshot(full_page=True)
-                await asyncio.sleep(0.5)
-
-        await context.storage_state(path=self.account_file)  # 保存cookie
-        douyin_logger.success('  [-]cookie更新完毕！')
-        await asyncio.sleep(2)  # 这里延迟是为了方便眼睛直观的观看
-        # 关闭浏览器上下文和浏览器实例
-        await context.close()
-        await browser.close()
+            trace_stage("publish")
+            await repeat_until_confirmed(SOCIAL_MEDIA_DOUYIN, "publish", lambda: self.click_publish(page),
+                                         lambda timeout: self.publish_confirmed(page, timeout))
+            douyin_logger.success("  [-]视频发布成功")
+
+            await context.storage_state(path=self.account_file)  # 保存cookie
+            douyin_logger.success('  [-]cookie更新完毕！')
+            await cosmetic_pause(2)  # 这里延迟是为了方便眼睛直观的观看
     
+    async def click_publish(self, page):
+        publish_button = page.get_by_role('button', name="发布", exact=True)
+        if await publish_button.count():
+            await publish_button.click()
+
+    async def publish_confirmed(self, page, timeout: float) -> bool:
+        """自动跳转到作品页面代表发布成功"""
+        try:
+            await page.wait_for_url(creator_url(SOCIAL_MEDIA_DOUYIN, "/creator-micro/content/manage**"),
+                                    timeout=timeout)
+            return True
+        except Exception:
+            return False
+
     async def set_thumbnail(self, page: Page, thumbnail_path: str):
-        if thumbnail_path:
+        if not thumbnail_path:
+            return
+        try:
             await page.click('text="选择封面"')
             await page.wait_for_selector("div.semi-modal-content:visible")
             await page.click('text="设置竖封面"')
-            await page.wait_for_timeout(2000)  # 等待2秒
-            # 定位到上传区域并点击
-            await page.locator("div[class^='semi-upload upload'] >> input.semi-upload-hidden-input").set_input_files(thumbnail_path)
-            await page.wait_for_timeout(2000)  # 等待2秒
-            await page.locator("div[class^='extractFooter'] button:visible:has-text('完成')").click()
+            # 等待上传区域渲染后上传封面
+            upload_input = page.locator("div[class^='semi-upload upload'] >> input.semi-upload-hidden-input")
+            await upload_input.wait_for(state="attached")
+            await upload_input.set_input_files(thumbnail_path)
+            # 完成按钮在封面处理完成后才可点击，click_when_ready 会等待其可见且可用
+            await click_when_ready(page.locator("div[class^='extractFooter'] button:visible:has-text('完成')"))
+        except Exception as e:
+            douyin_logger.error(f"  [-] 设置封面失败，使用默认封面继续发布: {e}")
+            # 封面失败不影响发布，保存现场后关闭封面弹窗
+            await capture("cover_upload", e, page)
+            await page.keyboard.press("Escape")
             # finish_confirm_element = page.locator("div[class^='confirmBtn'] >> div:has-text('完成')")
             # if await finish_confirm_element.count():
             #     await finish_confirm_element.click()
@@ -235,15 +258,35 @@ class DouYinVideo(object):
         # todo supoort location later
         # await page.get_by_text('添加标签').locator("..").locator("..").locator("xpath=following-sibling::div").locator(
         #     "div.semi-select-single").nth(0).click()
-        await page.locator('div.semi-select span:has-text("输入地理位置")').click()
+        await click_when_ready(page.locator('div.semi-select span:has-text("输入地理位置")'))
         await page.keyboard.press("Backspace")
-        await page.wait_for_timeout(2000)
         await page.keyboard.type(location)
         await page.wait_for_selector('div[role="listbox"] [role="option"]', timeout=5000)
         await page.locator('div[role="listbox"] [role="option"]').first.click()
 
     async def main(self):
-        async with async_playwright() as playwright:
-            await self.upload(playwright)
+        if not self.thumbnail_path:
+            # 没有指定封面时使用同名图片或自动生成的竖封面；需在替换为转码文件前查找
+            self.thumbnail_path = await prepare_cover(self.file_path, SOCIAL_MEDIA_DOUYIN)
+        # 开启转码时上传按平台压缩后的文件
+        self.file_path = await prepare_upload(self.file_path, SOCIAL_MEDIA_DOUYIN)
+        async with trace_upload(SOCIAL_MEDIA_DOUYIN, self.account_file, self.file_path):
+            if self.browser is not None or self.context is not None:
+                async with capture_failures(SOCIAL_MEDIA_DOUYIN, self.account_file):
+                    await self.upload(None)
+                return
+            # 在 playwright 关闭浏览器之前保存失败现场
+            async with async_playwright() as playwright, capture_failures(SOCIAL_MEDIA_DOUYIN, self.account_file):
+                await self.upload(playwright)
+
+
+class DouyinPlugin(UploaderPlugin):
+    name = SOCIAL_MEDIA_DOUYIN
 
+    async def setup(self, account_file, handle=False):
+        return await douyin_setup(str(account_file), handle=handle)
 
+    def create(self, short_title, tags, video, publish_date, account_file, thumbnail=None, context=None,
+               description=""):
+        return DouYinVideo(short_title, video, tags, publish_date, str(account_file), thumbnail_path=thumbnail,
+                           context=context)
@@ -3,23 +3,33 @@ from datetime import datetime
 
 from playwright.async_api import Playwright, async_playwright
 import os
-import asyncio
 
 from conf import LOCAL_CHROME_PATH
-from utils.base_social_media import set_init_script
-from utils.files_times import get_absolute_path
+from utils.base_social_media import set_init_script, SOCIAL_MEDIA_KUAISHOU, creator_url
+from utils.browser_pool import default_launch_options, open_context
+from utils.files_times import get_absolute_path, to_browser_time
+from utils.actions import click_when_ready, cosmetic_pause, type_and_verify, wait_for_value
+from utils.session_check import session_validator
+from utils.tracing import trace_upload, trace_stage
+from utils.diagnostics import capture_failures
+from utils.interception import intercept_requests
+from utils.transcode import prepare_upload
+from utils.uploader_registry import UploaderPlugin
+from utils.network import repeat_until_confirmed, with_retry
+from utils.wait_engine import StageTimeout, wait_for_first, wait_for_gone
 from utils.log import kuaishou_logger
 
 
-async def cookie_auth(account_file):
+async def _browser_cookie_auth(account_file):
     async with async_playwright() as playwright:
         browser = await playwright.chromium.launch(headless=True, channel="msedge")
         context = await browser.new_context(storage_state=account_file)
         context = await set_init_script(context)
+        context = await intercept_requests(context, SOCIAL_MEDIA_KUAISHOU)
         # 创建一个新的页面
         page = await context.new_page()
         # 访问指定的 URL
-        await page.goto("https://cp.kuaishou.com/article/publish/video")
+        await page.goto(creator_url(SOCIAL_MEDIA_KUAISHOU, "/article/publish/video"))
         try:
             await page.wait_for_selector("div.names div.container div.name:text('机构服务')", timeout=5000)  # 等待5秒
 
@@ -30,6 +40,16 @@ async def cookie_auth(account_file):
             return True
 
 
+async def cookie_auth(account_file):
+    # 先在本地检查 cookie 过期时间并复用缓存结果，无法判定时才启动浏览器校验
+    verdict = await session_validator.check(account_file, SOCIAL_MEDIA_KUAISHOU)
+    if verdict is not None:
+        return verdict
+    valid = await _browser_cookie_auth(account_file)
+    session_validator.remember(account_file, SOCIAL_MEDIA_KUAISHOU, valid)
+    return valid
+
+
 async def ks_setup(account_file, handle=False):
     account_file = get_absolute_path(account_file, "ks_uploader")
     if not os.path.exists(account_file) or not await cookie_auth(account_file):
@@ -55,14 +75,14 @@ async def get_ks_cookie(account_file):
         context = await set_init_script(context)
         # Pause the page, and start recording manually.
         page = await context.new_page()
-        await page.goto("https://cp.kuaishou.com")
+        await page.goto(creator_url(SOCIAL_MEDIA_KUAISHOU))
         await page.pause()
         # 点击调试器的继续，保存cookie
         await context.storage_state(path=account_file)
 
 
 class KSVideo(object):
-    def __init__(self, title, file_path, tags, publish_date: datetime, account_file):
+    def __init__(self, title, file_path, tags, publish_date: datetime, account_file, browser=None, context=None):
         self.title = title  # 视频标题
         self.file_path = file_path
         self.tags = tags
@@ -70,147 +90,154 @@ class KSVideo(object):
         self.account_file = account_file
         self.date_format = '%Y-%m-%d %H:%M'
         self.local_executable_path = LOCAL_CHROME_PATH
+        # 可注入浏览器池中的 browser / context，未注入时自行启动浏览器
+        self.browser = browser
+        self.context = context
 
     async def handle_upload_error(self, page):
         kuaishou_logger.error("视频出错了，重新上传中")
         await page.locator('div.progress-div [class^="upload-btn-input"]').set_input_files(self.file_path)
 
     async def upload(self, playwright: Playwright) -> None:
-        # 使用 Chromium 浏览器启动一个浏览器实例
-        print(self.local_executable_path)
-        if self.local_executable_path:
-            browser = await playwright.chromium.launch(
-                headless=False,
-                executable_path=self.local_executable_path,
-                channel="msedge"
-            )
-        else:
-            browser = await playwright.chromium.launch(
-                headless=False,
-                channel="msedge"
-            )  # 创建一个浏览器上下文，使用指定的 cookie 文件
-        context = await browser.new_context(storage_state=f"{self.account_file}")
-        context = await set_init_script(context)
-        context.on("close", lambda: context.storage_state(path=self.account_file))
+        # 使用注入的 browser/context，或启动一个 Chromium 浏览器实例，并使用指定的 cookie 文件创建上下文
+        # 退出时（包括出错）关闭自行创建的浏览器上下文和浏览器实例
+        async with await open_context(playwright, self.account_file, browser=self.browser, context=self.context,
+                                      launch_options=default_launch_options(self.local_executable_path),
+                                      platform=SOCIAL_MEDIA_KUAISHOU) as lease:
+            context = lease.context
+
+            trace_stage("navigate")
+            # 创建一个新的页面
+            page = await context.new_page()
+            # 访问指定的 URL
+            await with_retry(SOCIAL_MEDIA_KUAISHOU, "navigate",
+                             lambda: page.goto(creator_url(SOCIAL_MEDIA_KUAISHOU, "/article/publish/video")))
+            kuaishou_logger.info('正在上传-------{}.mp4'.format(self.title))
+            # 等待页面跳转到指定的 URL，没进入，则自动等待到超时
+            kuaishou_logger.info('正在打开主页...')
+            await page.wait_for_url(creator_url(SOCIAL_MEDIA_KUAISHOU, "/article/publish/video"))
+            # 点击 "上传视频" 按钮
+            upload_button = page.locator("button[class^='_upload-btn']")
+            await upload_button.wait_for(state='visible')  # 确保按钮可见
+
+            trace_stage("transfer")
+            await with_retry(SOCIAL_MEDIA_KUAISHOU, "transfer", lambda: self.choose_video_file(page, upload_button))
+
+            # if not await page.get_by_text("封面编辑").count():
+            #     raise Exception("似乎没有跳转到到编辑页面")
+
+            # 等待编辑页面的描述框或新功能提示出现
+            description_editor = page.get_by_text("描述").locator("xpath=following-sibling::div")
+            new_feature_button = page.locator('button[type="button"] span:text("我知道了")')
+            await wait_for_first({'tip': new_feature_button, 'editor': description_editor}, timeout=60,
+                                 stage="进入编辑页面")
+            if await new_feature_button.count() > 0:
+                await new_feature_button.click()
+
+            trace_stage("form_fill")
+            kuaishou_logger.info("正在填充标题和话题...")
+            await click_when_ready(description_editor)
+            kuaishou_logger.info("clear existing title")
+            await page.keyboard.press("Backspace")
+            await page.keyboard.press("Control+KeyA")
+            await page.keyboard.press("Delete")
+            kuaishou_logger.info("filling new  title")
+            await page.keyboard.type(self.title)
+            await page.keyboard.press("Enter")
+
+            # 快手只能添加3个话题，每个话题输入后等待其出现在描述框中
+            for index, tag in enumerate(self.tags[:3], start=1):
+                kuaishou_logger.info("正在添加第%s个话题" % index)
+                await type_and_verify(page, description_editor, f"#{tag} ")
+
+            # 等待 '上传中' 文本消失，最大等待时间为 2 分钟
+            kuaishou_logger.info("正在上传视频中...")
+            trace_stage("transfer")
+            try:
+                await wait_for_gone(page.locator("text=上传中"), timeout=120, stage="视频上传")
+                kuaishou_logger.success("视频上传完毕")
+            except StageTimeout:
+                kuaishou_logger.warning("超过最大等待时间，视频上传可能未完成。")
+            except Exception as e:
+                kuaishou_logger.error(f"检查上传状态时发生错误: {e}")
 
-        # 创建一个新的页面
-        page = await context.new_page()
-        # 访问指定的 URL
-        await page.goto("https://cp.kuaishou.com/article/publish/video")
-        kuaishou_logger.info('正在上传-------{}.mp4'.format(self.title))
-        # 等待页面跳转到指定的 URL，没进入，则自动等待到超时
-        kuaishou_logger.info('正在打开主页...')
-        await page.wait_for_url("https://cp.kuaishou.com/article/publish/video")
-        # 点击 "上传视频" 按钮
-        upload_button = page.locator("button[class^='_upload-btn']")
-        await upload_button.wait_for(state='visible')  # 确保按钮可见
+            # 定时任务
+            trace_stage("form_fill")
+            if self.publish_date != 0:
+                await self.set_schedule_time(page, self.publish_date)
+
+            # 判断视频是否发布成功
+            trace_stage("publish")
+            await repeat_until_confirmed(SOCIAL_MEDIA_KUAISHOU, "publish", lambda: self.click_publish(page),
+                                         lambda timeout: self.publish_confirmed(page, timeout), base_delay=1)
+            kuaishou_logger.success("视频发布成功")
+
+            await context.storage_state(path=self.account_file)  # 保存cookie
+            kuaishou_logger.info('cookie更新完毕！')
+            await cosmetic_pause(2)  # 这里延迟是为了方便眼睛直观的观看
 
+    async def choose_video_file(self, page, upload_button):
         async with page.expect_file_chooser() as fc_info:
             await upload_button.click()
         file_chooser = await fc_info.value
         await file_chooser.set_files(self.file_path)
 
-        await asyncio.sleep(2)
-
-        # if not await page.get_by_text("封面编辑").count():
-        #     raise Exception("似乎没有跳转到到编辑页面")
-
-        await asyncio.sleep(1)
-
-        # 等待按钮可交互
-        new_feature_button = page.locator('button[type="button"] span:text("我知道了")')
-        if await new_feature_button.count() > 0:
-            await new_feature_button.click()
-
-        kuaishou_logger.info("正在填充标题和话题...")
-        await page.get_by_text("描述").locator("xpath=following-sibling::div").click()
-        kuaishou_logger.info("clear existing title")
-        await page.keyboard.press("Backspace")
-        await page.keyboard.press("Control+KeyA")
-        await page.keyboard.press("Delete")
-        kuaishou_logger.info("filling new  title")
-        await page.keyboard.type(self.title)
-        await page.keyboard.press("Enter")
+    async def click_publish(self, page):
+        """点击发布并确认"""
+        publish_button = page.get_by_text("发布", exact=True)
+        if await publish_button.count() > 0:
+            await publish_button.click()
 
-        # 快手只能添加3个话题
-        for index, tag in enumerate(self.tags[:3], start=1):
-            kuaishou_logger.info("正在添加第%s个话题" % index)
-            await page.keyboard.type(f"#{tag} ")
-            await asyncio.sleep(2)
-
-        max_retries = 60  # 设置最大重试次数,最大等待时间为 2 分钟
-        retry_count = 0
-
-        while retry_count < max_retries:
-            try:
-                # 获取包含 '上传中' 文本的元素数量
-                number = await page.locator("text=上传中").count()
-
-                if number == 0:
-                    kuaishou_logger.success("视频上传完毕")
-                    break
-                else:
-                    if retry_count % 5 == 0:
-                        kuaishou_logger.info("正在上传视频中...")
-                    await asyncio.sleep(2)
-            except Exception as e:
-                kuaishou_logger.error(f"检查上传状态时发生错误: {e}")
-                await asyncio.sleep(2)  # 等待 2 秒后重试
-            retry_count += 1
-
-        if retry_count == max_retries:
-            kuaishou_logger.warning("超过最大重试次数，视频上传可能未完成。")
-
-        # 定时任务
-        if self.publish_date != 0:
-            await self.set_schedule_time(page, self.publish_date)
-
-        # 判断视频是否发布成功
-        while True:
-            try:
-                publish_button = page.get_by_text("发布", exact=True)
-                if await publish_button.count() > 0:
-                    await publish_button.click()
-
-                await asyncio.sleep(1)
-                confirm_button = page.get_by_text("确认发布")
-                if await confirm_button.count() > 0:
-                    await confirm_button.click()
-
-                # 等待页面跳转，确认发布成功
-                await page.wait_for_url(
-                    "https://cp.kuaishou.com/article/manage/video?status=2&from=publish",
-                    timeout=5000,
-                )
-                kuaishou_logger.success("视频发布成功")
-                break
-            except Exception as e:
-                kuaishou_logger.info(f"视频正在发布中... 错误: {e}")
-                await page.screenshot(full_page=True)
-                await asyncio.sleep(1)
+        confirm_button = page.get_by_text("确认发布")
+        try:
+            await confirm_button.first.wait_for(state="visible", timeout=1000)
+            await confirm_button.click()
+        except Exception:
+            pass
 
-        await context.storage_state(path=self.account_file)  # 保存cookie
-        kuaishou_logger.info('cookie更新完毕！')
-        await asyncio.sleep(2)  # 这里延迟是为了方便眼睛直观的观看
-        # 关闭浏览器上下文和浏览器实例
-        await context.close()
-        await browser.close()
+    async def publish_confirmed(self, page, timeout: float) -> bool:
+        """跳转到作品管理页代表发布成功"""
+        try:
+            await page.wait_for_url(creator_url(SOCIAL_MEDIA_KUAISHOU, "/article/manage/video?status=2&from=publish"),
+                                    timeout=timeout)
+            return True
+        except Exception:
+            return False
 
     async def main(self):
-        async with async_playwright() as playwright:
-            await self.upload(playwright)
+        # 开启转码时上传按平台压缩后的文件
+        self.file_path = await prepare_upload(self.file_path, SOCIAL_MEDIA_KUAISHOU)
+        async with trace_upload(SOCIAL_MEDIA_KUAISHOU, self.account_file, self.file_path):
+            if self.browser is not None or self.context is not None:
+                async with capture_failures(SOCIAL_MEDIA_KUAISHOU, self.account_file):
+                    await self.upload(None)
+                return
+            # 在 playwright 关闭浏览器之前保存失败现场
+            async with async_playwright() as playwright, capture_failures(SOCIAL_MEDIA_KUAISHOU, self.account_file):
+                await self.upload(playwright)
 
     async def set_schedule_time(self, page, publish_date):
+        publish_date = to_browser_time(publish_date)
         kuaishou_logger.info("click schedule")
         publish_date_hour = publish_date.strftime("%Y-%m-%d %H:%M:%S")
         await page.locator("label:text('发布时间')").locator('xpath=following-sibling::div').locator(
             '.ant-radio-input').nth(1).click()
-        await asyncio.sleep(1)
 
-        await page.locator('div.ant-picker-input input[placeholder="选择日期时间"]').click()
-        await asyncio.sleep(1)
+        date_input = page.locator('div.ant-picker-input input[placeholder="选择日期时间"]')
+        await click_when_ready(date_input)
 
         await page.keyboard.press("Control+KeyA")
         await page.keyboard.type(str(publish_date_hour))
+        await wait_for_value(date_input, publish_date_hour)
         await page.keyboard.press("Enter")
-        await asyncio.sleep(1)
+
+
+class KuaishouPlugin(UploaderPlugin):
+    name = SOCIAL_MEDIA_KUAISHOU
+
+    async def setup(self, account_file, handle=False):
+        return await ks_setup(str(account_file), handle=handle)
+
+    def create(self, short_title, tags, video, publish_date, account_file, thumbnail=None, context=None,
+               description=""):
+        return KSVideo(short_title, video, tags, publish_date, str(account_file), context=context)
@@ -3,14 +3,31 @@ from datetime import datetime, timedelta
 
 from playwright.async_api import Playwright, async_playwright, Page # 在这里添加 Page
 import os
-import asyncio
 
-from conf import LOCAL_CHROME_PATH
-from utils.base_social_media import set_init_script
-from utils.files_times import get_absolute_path
+from conf import LOCAL_CHROME_PATH, get_config_section
+from utils.base_social_media import set_init_script, SOCIAL_MEDIA_TENCENT, creator_url
+from utils.browser_pool import default_launch_options, open_context
+from utils.files_times import get_absolute_path, to_browser_time
+from utils.metadata_index import format_caption
+from utils.actions import click_by_text, click_when_ready, cosmetic_pause
+from utils.session_check import session_validator
+from utils.tracing import trace_upload, trace_stage
+from utils.diagnostics import capture, capture_failures
+from utils.interception import intercept_requests
+from utils.transcode import prepare_upload
+from utils.covers import prepare_cover
+from utils.uploader_registry import UploaderPlugin
+from utils.constant import TencentZoneTypes
+from utils.network import repeat_until_confirmed, with_retry
+from utils.wait_engine import Deadline, wait_for_first, wait_for_gone, UPLOAD_TIMEOUT
 from utils.log import tencent_logger
 
 
+def read_original_declaration() -> bool:
+    """config.json 中的原创声明开关，默认开启；由 conf 缓存，reset_config() 后重新读取"""
+    return bool(get_config_section("original_declaration", True))
+
+
 def format_str_for_short_title(origin_title: str) -> str:
     # 定义允许的特殊字符 (根据用户描述更新)
     # 书名号《》, 引号", 冒号：, 加号+, 问号?, 百分号%, 摄氏度°
@@ -38,15 +55,16 @@ def format_str_for_short_title(origin_title: str) -> str:
     return formatted_string
 
 
-async def cookie_auth(account_file):
+async def _browser_cookie_auth(account_file):
     async with async_playwright() as playwright:
         browser = await playwright.chromium.launch(headless=True)
         context = await browser.new_context(storage_state=account_file)
         context = await set_init_script(context)
+        context = await intercept_requests(context, SOCIAL_MEDIA_TENCENT)
         # 创建一个新的页面
         page = await context.new_page()
         # 访问指定的 URL
-        await page.goto("https://channels.weixin.qq.com/platform/post/create")
+        await page.goto(creator_url(SOCIAL_MEDIA_TENCENT, "/platform/post/create"))
         try:
             await page.wait_for_selector('div.title-name:has-text("微信小店")', timeout=5000)  # 等待5秒
             tencent_logger.error("[+] 等待5秒 cookie 失效")
@@ -56,6 +74,16 @@ async def cookie_auth(account_file):
             return True
 
 
+async def cookie_auth(account_file):
+    # 先在本地检查 cookie 过期时间并复用缓存结果，无法判定时才启动浏览器校验
+    verdict = await session_validator.check(account_file, SOCIAL_MEDIA_TENCENT)
+    if verdict is not None:
+        return verdict
+    valid = await _browser_cookie_auth(account_file)
+    session_validator.remember(account_file, SOCIAL_MEDIA_TENCENT, valid)
+    return valid
+
+
 async def get_tencent_cookie(account_file):
     async with async_playwright() as playwright:
         options = {
@@ -71,7 +99,7 @@ async def get_tencent_cookie(account_file):
         # Pause the page, and start recording manually.
         context = await set_init_script(context)
         page = await context.new_page()
-        await page.goto("https://channels.weixin.qq.com")
+        await page.goto(creator_url(SOCIAL_MEDIA_TENCENT))
         await page.pause()
         # 点击调试器的继续，保存cookie
         await context.storage_state(path=account_file)
@@ -89,7 +117,8 @@ async def weixin_setup(account_file, handle=False):
 
 
 class TencentVideo(object):
-    def __init__(self, short_title, title_and_tags, file_path, publish_date: datetime, account_file, category=None, original_declaration=True):
+    def __init__(self, short_title, title_and_tags, file_path, publish_date: datetime, account_file, category=None, original_declaration=True,
+                 cover_path=None, browser=None, context=None):
         self.short_title = short_title  # 短标题
         self.title_and_tags = title_and_tags  # 标题和话题内容
         self.file_path = file_path
@@ -98,8 +127,13 @@ class TencentVideo(object):
         self.category = category
         self.local_executable_path = LOCAL_CHROME_PATH
         self.original_declaration = original_declaration  # 添加原创声明配置
+        self.cover_path = cover_path
+        # 可注入浏览器池中的 browser / context，未注入时自行启动浏览器
+        self.browser = browser
+        self.context = context
 
     async def set_schedule_time_tencent(self, page, publish_date):
+        publish_date = to_browser_time(publish_date)
         label_element = page.locator("label").filter(has_text="定时").nth(1)
         await label_element.click()
 
@@ -114,39 +148,14 @@ class TencentVideo(object):
         if page_month != current_month:
             await page.click('button.weui-desktop-btn__icon__right')
 
-        # 获取页面元素
-        elements = await page.query_selector_all('table.weui-desktop-picker__table a')
-
-        # 遍历元素并点击匹配的元素
-        for element in elements:
-            if 'weui-desktop-picker__disabled' in await element.evaluate('el => el.className'):
-                continue
-            text = await element.inner_text()
-            if text.strip() == str(publish_date.day):
-                await element.click()
-                break
+        # 点击目标日期，跳过不可选的日期
+        await click_by_text(page.locator('table.weui-desktop-picker__table a:not(.weui-desktop-picker__disabled)'),
+                            str(publish_date.day))
 
         # 选择时间（鼠标点选小时和分钟）
         await page.click('input[placeholder="请选择时间"]')
-        await page.wait_for_selector('ol.weui-desktop-picker__time__hour', timeout=3000)
-        # 点击目标小时
-        hour_str = f"{publish_date.hour:02d}"
-        hour_ol = page.locator('ol.weui-desktop-picker__time__hour')
-        hour_count = await hour_ol.locator('li').count()
-        for i in range(hour_count):
-            li = hour_ol.locator('li').nth(i)
-            if await li.inner_text() == hour_str:
-                await li.click()
-                break
-        # 点击目标分钟
-        minute_str = f"{publish_date.minute:02d}"
-        minute_ol = page.locator('ol.weui-desktop-picker__time__minute')
-        minute_count = await minute_ol.locator('li').count()
-        for i in range(minute_count):
-            li = minute_ol.locator('li').nth(i)
-            if await li.inner_text() == minute_str:
-                await li.click()
-                break
+        await click_by_text(page.locator('ol.weui-desktop-picker__time__hour li'), f"{publish_date.hour:02d}")
+        await click_by_text(page.locator('ol.weui-desktop-picker__time__minute li'), f"{publish_date.minute:02d}")
         # 点击空白处，令选择生效
         await page.click("body")
 
@@ -159,16 +168,11 @@ class TencentVideo(object):
 
     async def upload_cover(self, page: Page, cover_path: str):
         try:
-            # 1. 等待并点击"更换封面"按钮
-            btn_selector = 'div.finder-tag-wrap.btn .tag-inner:text("更换封面")'
-            for _ in range(60):
-                btn = await page.query_selector(btn_selector)
-                if btn:
-                    btn_class = await btn.evaluate('el => el.parentElement.className')
-                    if 'disabled' not in btn_class and 'is-disabled' not in btn_class:
-                        break
-                await asyncio.sleep(1)
-            else:
+            # 1. 等待"更换封面"按钮变为可用（父元素 class 中不再包含 disabled）并点击
+            btn = page.locator('div.finder-tag-wrap.btn:not([class*="disabled"]) > .tag-inner:text("更换封面")').first
+            try:
+                await btn.wait_for(state="visible", timeout=60000)
+            except Exception:
                 tencent_logger.error("更换封面按钮长时间不可用，放弃上传封面")
                 return
             await btn.click()
@@ -179,36 +183,29 @@ class TencentVideo(object):
             await input_locator.wait_for(state="attached", timeout=5000)
             await input_locator.set_input_files(cover_path)
             tencent_logger.info(f"已上传封面图片: {cover_path}")
-            await page.screenshot(path="cover_uploaded.png")
-
-            # 3. 等待图片预览区域变化（可选，增强健壮性）
-            await page.wait_for_timeout(2000)  # 等2秒让图片加载
 
-            # 4. 自动点击"确认"按钮
-            confirm_selector = 'button:has-text("确认")'
+            # 3. 自动点击"确认"按钮，图片加载完成前按钮不可用，click 会等待其变为可用
             try:
-                await page.wait_for_selector(confirm_selector, timeout=8000)
-                confirm_buttons = await page.query_selector_all(confirm_selector)
-                for btn in confirm_buttons:
-                    if await btn.is_visible():
-                        await btn.click()
-                        tencent_logger.info("已点击最终 '确认' 按钮")
-                        await page.screenshot(path="after_final_confirm.png")
-                        break
+                await click_when_ready(page.locator('button:visible:has-text("确认")'), timeout=10000)
+                tencent_logger.info("已点击最终 '确认' 按钮")
             except Exception as e:
                 tencent_logger.warning(f"查找或点击最终 '确认' 按钮失败: {e}")
 
-            await asyncio.sleep(2)  # 等待页面反应
+            # 4. 等待封面编辑弹窗关闭
+            try:
+                await page.locator('div.cover-control-wrap').first.wait_for(state="hidden", timeout=10000)
+            except Exception:
+                tencent_logger.warning("封面编辑弹窗未按时关闭")
         except Exception as e:
             tencent_logger.error(f"上传封面图片失败: {e}")
-            await page.screenshot(path="cover_upload_error.png")
+            # 封面失败不影响发布，保存现场后继续
+            await capture("cover_upload", e, page)
 
     async def set_no_location(self, page):
         try:
             # 1. 点击"位置"区域，弹出下拉框
             await page.click('div.label:has-text("位置") + div .position-display-wrap')
-            await page.wait_for_timeout(500)  # 等待下拉框弹出
-            # 2. 点击"不显示位置"选项
+            # 2. 等待下拉框弹出后点击"不显示位置"选项
             await page.wait_for_selector('div.common-option-list-wrap', timeout=2000)
             await page.click('div.option-item .name:text("不显示位置")')
             tencent_logger.info("已设置为不显示位置")
@@ -216,80 +213,71 @@ class TencentVideo(object):
             tencent_logger.error(f"设置不显示位置失败: {e}")
 
     async def upload_cover_image(self, page):
-        """查找并上传封面图片"""
-        # 获取视频文件名（不含扩展名）
-        base_name = os.path.splitext(os.path.basename(self.file_path))[0]
-        # 支持多种封面图片格式，按优先级顺序查找
-        exts = [".png", ".jpeg", ".jpg", ".webp"]
-        cover_path = None
-        video_dir = os.path.dirname(self.file_path) # 获取视频文件所在目录
-        for ext in exts:
-            candidate = os.path.join(video_dir, f"{base_name}{ext}")
-            if os.path.exists(candidate):
-                cover_path = candidate
-                break # 找到第一个匹配的封面
-
-        if cover_path:
-            tencent_logger.info(f"  [-] 找到封面图，准备上传: {cover_path}")
+        """上传 main() 中选定的封面图片"""
+        if self.cover_path:
+            tencent_logger.info(f"  [-] 找到封面图，准备上传: {self.cover_path}")
             # 调用实际执行上传页面操作的方法
-            await self.upload_cover(page, cover_path) 
+            await self.upload_cover(page, str(self.cover_path))
         else:
-            tencent_logger.info(f"  [-] 未找到与视频同名的封面图片: {base_name}.[png/jpeg/jpg/webp]，跳过封面上传。")
-            # 未找到封面，不执行任何上传操作
+            tencent_logger.info("  [-] 未找到封面图片，跳过封面上传。")
 
     async def upload(self, playwright: Playwright) -> None:
         # 使用 Chromium (这里使用系统内浏览器，用chromium 会造成h264错误
-        browser = await playwright.chromium.launch(headless=False, executable_path=self.local_executable_path, channel="msedge")
-        # 创建一个浏览器上下文，使用指定的 cookie 文件
-        context = await browser.new_context(storage_state=f"{self.account_file}")
-        context = await set_init_script(context)
-
-        # 创建一个新的页面
-        page = await context.new_page()
-        # 访问指定的 URL
-        await page.goto("https://channels.weixin.qq.com/platform/post/create")
-        tencent_logger.info(f'[+]正在上传-------{self.title_and_tags}.mp4')
-        # 等待页面跳转到指定的 URL，没进入，则自动等待到超时
-        await page.wait_for_url("https://channels.weixin.qq.com/platform/post/create")
-        # await page.wait_for_selector('input[type="file"]', timeout=10000)
-        file_input = page.locator('input[type="file"]')
-        await file_input.set_input_files(self.file_path)
-        # 检查上传状态，失败自动重试
-        await self.detect_upload_status(page)
-        # 填充标题和话题
-        await self.add_title_tags(page)
-        # 添加商品
-        # await self.add_product(page)
-        # 合集功能
-        await self.add_collection(page)
-        # 原创选择
-        if self.original_declaration:
-            print("开始执行原创声明流程...")
-            await self.add_original(page)
-            print("原创声明流程执行完成")
-        else:
-            print("已跳过原创声明流程（根据配置）")
+        # 优先使用注入的 browser/context，并使用指定的 cookie 文件创建上下文
+        # 退出时（包括出错）关闭自行创建的浏览器上下文和浏览器实例
+        async with await open_context(playwright, self.account_file, browser=self.browser, context=self.context,
+                                      launch_options=default_launch_options(self.local_executable_path),
+                                      platform=SOCIAL_MEDIA_TENCENT) as lease:
+            context = lease.context
+
+            trace_stage("navigate")
+            # 创建一个新的页面
+            page = await context.new_page()
+            # 访问指定的 URL
+            await with_retry(SOCIAL_MEDIA_TENCENT, "navigate",
+                             lambda: page.goto(creator_url(SOCIAL_MEDIA_TENCENT, "/platform/post/create")))
+            tencent_logger.info(f'[+]正在上传-------{self.title_and_tags}.mp4')
+            # 等待页面跳转到指定的 URL，没进入，则自动等待到超时
+            await page.wait_for_url(creator_url(SOCIAL_MEDIA_TENCENT, "/platform/post/create"))
+            # await page.wait_for_selector('input[type="file"]', timeout=10000)
+            trace_stage("transfer")
+            file_input = page.locator('input[type="file"]')
+            await with_retry(SOCIAL_MEDIA_TENCENT, "transfer", lambda: file_input.set_input_files(self.file_path))
+            # 检查上传状态，失败自动重试
+            await self.detect_upload_status(page)
+            # 填充标题和话题
+            trace_stage("form_fill")
+            await self.add_title_tags(page)
+            # 添加商品
+            # await self.add_product(page)
+            # 合集功能
+            await self.add_collection(page)
+            # 原创选择
+            if self.original_declaration:
+                print("开始执行原创声明流程...")
+                await self.add_original(page)
+                print("原创声明流程执行完成")
+            else:
+                print("已跳过原创声明流程（根据配置）")
         
-        # 设置不显示位置
-        await self.set_no_location(page)
-        # 默认定时发布：无论publish_date是否为0都定时，若为0则设为次日9点
-        if not self.publish_date or self.publish_date == 0:
-            now = datetime.now()
-            self.publish_date = now.replace(hour=9, minute=0, second=0, microsecond=0) + timedelta(days=1)
-        await self.set_schedule_time_tencent(page, self.publish_date)
-        # 添加短标题
-        await self.add_short_title(page)
-        # 上传同名封面图片（放到最后，确保视频解析完成后再操作）
-        await self.upload_cover_image(page) # 现在这个调用是有效的
-        # 点击发表
-        await self.click_publish(page)
-
-        await context.storage_state(path=f"{self.account_file}")  # 保存cookie
-        tencent_logger.success('  [-]cookie更新完毕！')
-        await asyncio.sleep(2)  # 这里延迟是为了方便眼睛直观的观看
-        # 关闭浏览器上下文和浏览器实例
-        await context.close()
-        await browser.close()
+            # 设置不显示位置
+            await self.set_no_location(page)
+            # 默认定时发布：无论publish_date是否为0都定时，若为0则设为次日9点
+            if not self.publish_date or self.publish_date == 0:
+                now = datetime.now()
+                self.publish_date = now.replace(hour=9, minute=0, second=0, microsecond=0) + timedelta(days=1)
+            await self.set_schedule_time_tencent(page, self.publish_date)
+            # 添加短标题
+            await self.add_short_title(page)
+            # 上传同名封面图片（放到最后，确保视频解析完成后再操作）
+            await self.upload_cover_image(page) # 现在这个调用是有效的
+            # 点击发表
+            trace_stage("publish")
+            await self.click_publish(page)
+
+            await context.storage_state(path=f"{self.account_file}")  # 保存cookie
+            tencent_logger.success('  [-]cookie更新完毕！')
+            await cosmetic_pause(2)  # 这里延迟是为了方便眼睛直观的观看
 
     async def add_title_tags(self, page):
         await page.locator("div.input-editor").click()
@@ -303,47 +291,51 @@ class TencentVideo(object):
             await short_title_element.fill(self.short_title)
 
     async def click_publish(self, page):
-        while True:
-            try:
-                publish_buttion = page.locator('div.form-btns button:has-text("发表")')
-                if await publish_buttion.count():
-                    await publish_buttion.click()
-                await page.wait_for_url("https://channels.weixin.qq.com/platform/post/list", timeout=1500)
-                tencent_logger.success("  [-]视频发布成功")
-                break
-            except Exception as e:
-                current_url = page.url
-                if "https://channels.weixin.qq.com/platform/post/list" in current_url:
-                    tencent_logger.success("  [-]视频发布成功")
-                    break
-                else:
-                    tencent_logger.exception(f"  [-] Exception: {e}")
-                    tencent_logger.info("  [-] 视频正在发布中...")
-                    await asyncio.sleep(0.5)
+        await repeat_until_confirmed(SOCIAL_MEDIA_TENCENT, "publish", lambda: self.publish_once(page),
+                                     lambda timeout: self.publish_confirmed(page, timeout), interval=1.5)
+        tencent_logger.success("  [-]视频发布成功")
+
+    async def publish_once(self, page):
+        publish_buttion = page.locator('div.form-btns button:has-text("发表")')
+        if await publish_buttion.count():
+            await publish_buttion.click()
+
+    async def publish_confirmed(self, page, timeout: float) -> bool:
+        """跳转到作品列表代表发布成功"""
+        try:
+            await page.wait_for_url(creator_url(SOCIAL_MEDIA_TENCENT, "/platform/post/list"), timeout=timeout)
+            return True
+        except Exception:
+            if creator_url(SOCIAL_MEDIA_TENCENT, "/platform/post/list") in page.url:
+                return True
+            tencent_logger.info("  [-] 视频正在发布中...")
+            return False
 
     async def detect_upload_status(self, page):
         retry_count = 0
         max_retries = 3
+        deadline = Deadline(UPLOAD_TIMEOUT, "视频上传")
+        tencent_logger.info("  [-] 正在上传视频中...")
         while True:
-            try:
-                # 匹配删除按钮，代表视频上传完毕
-                if "weui-desktop-btn_disabled" not in await page.get_by_role("button", name="发表").get_attribute('class'):
-                    tencent_logger.info("  [-]视频上传完毕")
-                    break
-                else:
-                    tencent_logger.info("  [-] 正在上传视频中...")
-                    await asyncio.sleep(2)
-                    # 出错了视频出错
-                    if await page.locator('div.status-msg.error').count() and await page.locator('div.media-status-content div.tag-inner:has-text("删除")').count():
-                        retry_count += 1
-                        if retry_count > max_retries:
-                            tencent_logger.error(f"  [-] 上传失败已达最大重试次数（{max_retries}次），终止流程。")
-                            raise Exception("视频上传失败，重试次数过多，已终止。")
-                        tencent_logger.error(f"  [-] 发现上传出错了...准备重试（第{retry_count}次）")
-                        await self.handle_upload_error(page)
-            except Exception as e:
-                tencent_logger.info(f"  [-] 正在上传视频中...（异常：{e}）")
-                await asyncio.sleep(2)
+            # 发表按钮不再是禁用状态代表视频上传完毕；出现错误提示则重新上传
+            state = await wait_for_first({
+                'done': page.locator('div.form-btns button:not(.weui-desktop-btn_disabled):has-text("发表")'),
+                'failed': page.locator('div.status-msg.error'),
+            }, deadline)
+            if state == 'done':
+                tencent_logger.info("  [-]视频上传完毕")
+                break
+            delete_button = page.locator('div.media-status-content div.tag-inner:has-text("删除")')
+            if not await delete_button.count():
+                # 错误提示已出现但删除按钮尚未渲染，等待下一次状态变化
+                await wait_for_first({'delete': delete_button}, deadline)
+            retry_count += 1
+            if retry_count > max_retries:
+                tencent_logger.error(f"  [-] 上传失败已达最大重试次数（{max_retries}次），终止流程。")
+                raise Exception("视频上传失败，重试次数过多，已终止。")
+            tencent_logger.error(f"  [-] 发现上传出错了...准备重试（第{retry_count}次）")
+            await self.handle_upload_error(page)
+            await wait_for_gone(page.locator('div.status-msg.error'), deadline)
 
     async def add_collection(self, page):
         # 默认不添加合集，直接跳过
@@ -385,5 +377,32 @@ class TencentVideo(object):
             # raise e # 根据需要决定是否抛出异常
 
     async def main(self):
-        async with async_playwright() as playwright:
-            await self.upload(playwright)
+        if not self.cover_path:
+            # 同名封面图优先，没有时自动生成；需在替换为转码文件前查找
+            self.cover_path = await prepare_cover(self.file_path, SOCIAL_MEDIA_TENCENT)
+        # 开启转码时上传按平台压缩后的文件
+        self.file_path = await prepare_upload(self.file_path, SOCIAL_MEDIA_TENCENT)
+        async with trace_upload(SOCIAL_MEDIA_TENCENT, self.account_file, self.file_path):
+            if self.browser is not None or self.context is not None:
+                async with capture_failures(SOCIAL_MEDIA_TENCENT, self.account_file):
+                    await self.upload(None)
+                return
+            # 在 playwright 关闭浏览器之前保存失败现场
+            async with async_playwright() as playwright, capture_failures(SOCIAL_MEDIA_TENCENT, self.account_file):
+                await self.upload(playwright)
+
+
+
+class TencentPlugin(UploaderPlugin):
+    name = SOCIAL_MEDIA_TENCENT
+
+    async def setup(self, account_file, handle=False):
+        return await weixin_setup(str(account_file), handle=handle)
+
+    def create(self, short_title, tags, video, publish_date, account_file, thumbnail=None, context=None,
+               description=""):
+        # 描述框中填写正文和话题，两者都没有时填写标题
+        title_and_tags = format_caption(description, tags) or short_title
+        return TencentVideo(format_str_for_short_title(short_title), title_and_tags, str(video), publish_date,
+                            str(account_file), TencentZoneTypes.LIFESTYLE.value, read_original_declaration(),
+                            cover_path=thumbnail, context=context)
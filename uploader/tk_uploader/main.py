@@ -4,22 +4,31 @@ from datetime import datetime
 
 from playwright.async_api import Playwright, async_playwright
 import os
-import asyncio
 from uploader.tk_uploader.tk_config import Tk_Locator
-from utils.base_social_media import set_init_script
-from utils.files_times import get_absolute_path
+from utils.base_social_media import set_init_script, SOCIAL_MEDIA_TIKTOK, creator_url
+from utils.browser_mode import is_headless, platform_context_options
+from utils.files_times import get_absolute_path, to_browser_time
+from utils.actions import click_by_text, cosmetic_pause, type_and_verify
+from utils.session_check import session_validator
+from utils.tracing import trace_upload, trace_stage
+from utils.diagnostics import capture_failures, attach_diagnostics
+from utils.interception import intercept_requests
+from utils.transcode import prepare_upload
+from utils.network import repeat_until_confirmed, with_retry
+from utils.wait_engine import Deadline, wait_for_first, wait_for_gone, UPLOAD_TIMEOUT
 from utils.log import tiktok_logger
 
 
-async def cookie_auth(account_file):
+async def _browser_cookie_auth(account_file):
     async with async_playwright() as playwright:
         browser = await playwright.firefox.launch(headless=True)
         context = await browser.new_context(storage_state=account_file)
         context = await set_init_script(context)
+        context = await intercept_requests(context, SOCIAL_MEDIA_TIKTOK)
         # 创建一个新的页面
         page = await context.new_page()
         # 访问指定的 URL
-        await page.goto("https://www.tiktok.com/tiktokstudio/upload?lang=en")
+        await page.goto(creator_url(SOCIAL_MEDIA_TIKTOK, "/tiktokstudio/upload?lang=en"))
         await page.wait_for_load_state('networkidle')
         try:
             # 选择所有的 select 元素
@@ -37,6 +46,16 @@ async def cookie_auth(account_file):
             return True
 
 
+async def cookie_auth(account_file):
+    # check expiry locally and reuse the cached verdict first, launch a browser only when undetermined
+    verdict = await session_validator.check(account_file, SOCIAL_MEDIA_TIKTOK)
+    if verdict is not None:
+        return verdict
+    valid = await _browser_cookie_auth(account_file)
+    session_validator.remember(account_file, SOCIAL_MEDIA_TIKTOK, valid)
+    return valid
+
+
 async def tiktok_setup(account_file, handle=False):
     account_file = get_absolute_path(account_file, "tk_uploader")
     if not os.path.exists(account_file) or not await cookie_auth(account_file):
@@ -62,7 +81,7 @@ async def get_tiktok_cookie(account_file):
         context = await set_init_script(context)
         # Pause the page, and start recording manually.
         page = await context.new_page()
-        await page.goto("https://www.tiktok.com/login?lang=en")
+        await page.goto(creator_url(SOCIAL_MEDIA_TIKTOK, "/login?lang=en"))
         await page.pause()
         # 点击调试器的继续，保存cookie
         await context.storage_state(path=account_file)
@@ -79,6 +98,7 @@ class TiktokVideo(object):
 
 
     async def set_schedule_time(self, page, publish_date):
+        publish_date = to_browser_time(publish_date)
         schedule_input_element = self.locator_base.get_by_label('Schedule')
         await schedule_input_element.wait_for(state='visible')  # 确保按钮可见
 
@@ -100,33 +120,20 @@ class TiktokVideo(object):
             await arrow.click()
 
         # day set
-        valid_days_locator = self.locator_base.locator(
-            'div.calendar-wrapper span.day.valid')
-        valid_days = await valid_days_locator.count()
-        for i in range(valid_days):
-            day_element = valid_days_locator.nth(i)
-            text = await day_element.inner_text()
-            if text.strip() == str(publish_date.day):
-                await day_element.click()
-                break
+        await click_by_text(self.locator_base.locator('div.calendar-wrapper span.day.valid'), str(publish_date.day))
         # time set
         await scheduled_picker.locator('div.TUXInputBox').nth(0).click()
 
         hour_str = publish_date.strftime("%H")
-        correct_minute = int(publish_date.minute / 5)
-        minute_str = f"{correct_minute:02d}"
-
-        hour_selector = f"span.tiktok-timepicker-left:has-text('{hour_str}')"
-        minute_selector = f"span.tiktok-timepicker-right:has-text('{minute_str}')"
+        # the picker lists minutes in steps of 5 ("00", "05", ... "55"), round down to one of them
+        minute_str = f"{publish_date.minute // 5 * 5:02d}"
 
         # pick hour first
-        await self.locator_base.locator(hour_selector).click()
+        await click_by_text(self.locator_base.locator('span.tiktok-timepicker-left'), hour_str)
         # click time button again
-        # 等待某个特定的元素出现或状态变化，表明UI已更新
-        await page.wait_for_timeout(1000)  # 等待500毫秒
         await scheduled_picker.locator('div.TUXInputBox').nth(0).click()
-        # pick minutes after
-        await self.locator_base.locator(minute_selector).click()
+        # pick minutes after, once the time picker has re-rendered
+        await click_by_text(self.locator_base.locator('span.tiktok-timepicker-right'), minute_str)
 
         # click title to remove the focus.
         await self.locator_base.locator("h1:has-text('Upload video')").click()
@@ -140,15 +147,23 @@ class TiktokVideo(object):
         await file_chooser.set_files(self.file_path)
 
     async def upload(self, playwright: Playwright) -> None:
-        browser = await playwright.firefox.launch(headless=False)
-        context = await browser.new_context(storage_state=f"{self.account_file}")
+        browser = await playwright.firefox.launch(headless=is_headless())
+        options = platform_context_options(SOCIAL_MEDIA_TIKTOK)
+        options.pop('init_script', None)
+        # headless Firefox keeps its normal UA, so only the viewport/locale settings apply
+        options.pop('user_agent', None)
+        context = await browser.new_context(storage_state=f"{self.account_file}", **options)
         context = await set_init_script(context)
+        context = await intercept_requests(context, SOCIAL_MEDIA_TIKTOK)
+        await attach_diagnostics(context)
+        trace_stage("navigate")
         page = await context.new_page()
 
-        await page.goto("https://www.tiktok.com/creator-center/upload")
+        await with_retry(SOCIAL_MEDIA_TIKTOK, "navigate",
+                         lambda: page.goto(creator_url(SOCIAL_MEDIA_TIKTOK, "/creator-center/upload")))
         tiktok_logger.info(f'[+]Uploading-------{self.title}.mp4')
 
-        await page.wait_for_url("https://www.tiktok.com/tiktokstudio/upload", timeout=10000)
+        await page.wait_for_url(creator_url(SOCIAL_MEDIA_TIKTOK, "/tiktokstudio/upload"), timeout=10000)
 
         try:
             await page.wait_for_selector('iframe[data-tt="Upload_index_iframe"], div.upload-container', timeout=10000)
@@ -162,22 +177,24 @@ class TiktokVideo(object):
             'button:has-text("Select video"):visible')
         await upload_button.wait_for(state='visible')  # 确保按钮可见
 
-        async with page.expect_file_chooser() as fc_info:
-            await upload_button.click()
-        file_chooser = await fc_info.value
-        await file_chooser.set_files(self.file_path)
+        trace_stage("transfer")
+        await with_retry(SOCIAL_MEDIA_TIKTOK, "transfer", lambda: self.choose_video_file(page, upload_button))
 
+        trace_stage("form_fill")
         await self.add_title_tags(page)
+        trace_stage("transfer")
         # detact upload status
         await self.detect_upload_status(page)
+        trace_stage("form_fill")
         if self.publish_date != 0:
             await self.set_schedule_time(page, self.publish_date)
 
+        trace_stage("publish")
         await self.click_publish(page)
 
         await context.storage_state(path=f"{self.account_file}")  # save cookie
         tiktok_logger.info('  [-] update cookie！')
-        await asyncio.sleep(2)  # close delay for look the video status
+        await cosmetic_pause(2)  # close delay for look the video status
         # close all
         await context.close()
         await browser.close()
@@ -195,62 +212,65 @@ class TiktokVideo(object):
 
         await page.keyboard.press("End")
 
-        await page.wait_for_timeout(1000)  # 等待1秒
-
-        await page.keyboard.insert_text(self.title)
-        await page.wait_for_timeout(1000)  # 等待1秒
+        # insert the title and wait until the editor reflects it
+        await type_and_verify(page, editor_locator, self.title, insert=True)
         await page.keyboard.press("End")
 
         await page.keyboard.press("Enter")
 
-        # tag part
+        # tag part, wait for every hashtag to show up in the editor instead of sleeping around it
         for index, tag in enumerate(self.tags, start=1):
             tiktok_logger.info("Setting the %s tag" % index)
             await page.keyboard.press("End")
-            await page.wait_for_timeout(1000)  # 等待1秒
-            await page.keyboard.insert_text("#" + tag + " ")
+            await type_and_verify(page, editor_locator, "#" + tag + " ", insert=True)
             await page.keyboard.press("Space")
-            await page.wait_for_timeout(1000)  # 等待1秒
 
             await page.keyboard.press("Backspace")
             await page.keyboard.press("End")
 
+    async def choose_video_file(self, page, upload_button):
+        async with page.expect_file_chooser() as fc_info:
+            await upload_button.click()
+        file_chooser = await fc_info.value
+        await file_chooser.set_files(self.file_path)
+
     async def click_publish(self, page):
-        success_flag_div = '#\\:r9\\:'
-        while True:
-            try:
-                publish_button = self.locator_base.locator('div.btn-post')
-                if await publish_button.count():
-                    await publish_button.click()
+        await repeat_until_confirmed(SOCIAL_MEDIA_TIKTOK, "publish", lambda: self.publish_once(page),
+                                     lambda timeout: self.publish_confirmed(timeout))
+        tiktok_logger.success("  [-] video published success")
 
-                await self.locator_base.locator(success_flag_div).wait_for(state="visible", timeout=3000)
-                tiktok_logger.success("  [-] video published success")
-                break
-            except Exception as e:
-                if await self.locator_base.locator(success_flag_div).count():
-                    tiktok_logger.success("  [-]video published success")
-                    break
-                else:
-                    tiktok_logger.exception(f"  [-] Exception: {e}")
-                    tiktok_logger.info("  [-] video publishing")
-                    await page.screenshot(full_page=True)
-                    await asyncio.sleep(0.5)
+    async def publish_once(self, page):
+        publish_button = self.locator_base.locator('div.btn-post')
+        if await publish_button.count():
+            await publish_button.click()
+
+    async def publish_confirmed(self, timeout: float) -> bool:
+        """the success dialog means the video was published"""
+        success_flag_div = '#\\:r9\\:'
+        try:
+            await self.locator_base.locator(success_flag_div).wait_for(state="visible", timeout=timeout)
+            return True
+        except Exception:
+            if await self.locator_base.locator(success_flag_div).count():
+                return True
+            tiktok_logger.info("  [-] video publishing")
+            return False
 
     async def detect_upload_status(self, page):
+        # wake up as soon as the Post button is enabled, or the "Select file" retry button shows up
+        deadline = Deadline(UPLOAD_TIMEOUT, "video upload")
+        tiktok_logger.info("  [-] video uploading...")
         while True:
-            try:
-                if await self.locator_base.locator('div.btn-post > button').get_attribute("disabled") is None:
-                    tiktok_logger.info("  [-]video uploaded.")
-                    break
-                else:
-                    tiktok_logger.info("  [-] video uploading...")
-                    await asyncio.sleep(2)
-                    if await self.locator_base.locator('button[aria-label="Select file"]').count():
-                        tiktok_logger.info("  [-] found some error while uploading now retry...")
-                        await self.handle_upload_error(page)
-            except:
-                tiktok_logger.info("  [-] video uploading...")
-                await asyncio.sleep(2)
+            state = await wait_for_first({
+                'done': self.locator_base.locator('div.btn-post > button:not([disabled])'),
+                'failed': self.locator_base.locator('button[aria-label="Select file"]'),
+            }, deadline)
+            if state == 'done':
+                tiktok_logger.info("  [-]video uploaded.")
+                break
+            tiktok_logger.info("  [-] found some error while uploading now retry...")
+            await self.handle_upload_error(page)
+            await wait_for_gone(self.locator_base.locator('button[aria-label="Select file"]'), deadline)
 
     async def choose_base_locator(self, page):
         # await page.wait_for_selector('div.upload-container')
@@ -260,6 +280,10 @@ class TiktokVideo(object):
             self.locator_base = page.locator(Tk_Locator.default) 
 
     async def main(self):
-        async with async_playwright() as playwright:
-            await self.upload(playwright)
+        # upload the smaller per-platform rendition when transcoding is enabled
+        self.file_path = await prepare_upload(self.file_path, SOCIAL_MEDIA_TIKTOK)
+        async with trace_upload(SOCIAL_MEDIA_TIKTOK, self.account_file, self.file_path):
+            # save the failure snapshot before playwright shuts the browser down
+            async with async_playwright() as playwright, capture_failures(SOCIAL_MEDIA_TIKTOK, self.account_file):
+                await self.upload(playwright)
 
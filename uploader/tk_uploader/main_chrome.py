@@ -4,24 +4,35 @@ from datetime import datetime
 
 from playwright.async_api import Playwright, async_playwright
 import os
-import asyncio
 
 from conf import LOCAL_CHROME_PATH
 from uploader.tk_uploader.tk_config import Tk_Locator
-from utils.base_social_media import set_init_script
-from utils.files_times import get_absolute_path
+from utils.base_social_media import set_init_script, SOCIAL_MEDIA_TIKTOK, creator_url
+from utils.browser_pool import default_launch_options, open_context
+from utils.files_times import get_absolute_path, to_browser_time
+from utils.actions import click_by_text, cosmetic_pause, type_and_verify
+from utils.session_check import session_validator
+from utils.tracing import trace_upload, trace_stage
+from utils.diagnostics import capture_failures
+from utils.interception import intercept_requests
+from utils.transcode import prepare_upload
+from utils.covers import prepare_cover
+from utils.uploader_registry import UploaderPlugin
+from utils.network import repeat_until_confirmed, with_retry
+from utils.wait_engine import Deadline, wait_for_first, wait_for_gone, UPLOAD_TIMEOUT
 from utils.log import tiktok_logger
 
 
-async def cookie_auth(account_file):
+async def _browser_cookie_auth(account_file):
     async with async_playwright() as playwright:
         browser = await playwright.chromium.launch(headless=True, channel="msedge")
         context = await browser.new_context(storage_state=account_file)
         context = await set_init_script(context)
+        context = await intercept_requests(context, SOCIAL_MEDIA_TIKTOK)
         # 创建一个新的页面
         page = await context.new_page()
         # 访问指定的 URL
-        await page.goto("https://www.tiktok.com/tiktokstudio/upload?lang=en")
+        await page.goto(creator_url(SOCIAL_MEDIA_TIKTOK, "/tiktokstudio/upload?lang=en"))
         await page.wait_for_load_state('networkidle')
         try:
             # 选择所有的 select 元素
@@ -39,6 +50,16 @@ async def cookie_auth(account_file):
             return True
 
 
+async def cookie_auth(account_file):
+    # check expiry locally and reuse the cached verdict first, launch a browser only when undetermined
+    verdict = await session_validator.check(account_file, SOCIAL_MEDIA_TIKTOK)
+    if verdict is not None:
+        return verdict
+    valid = await _browser_cookie_auth(account_file)
+    session_validator.remember(account_file, SOCIAL_MEDIA_TIKTOK, valid)
+    return valid
+
+
 async def tiktok_setup(account_file, handle=False):
     account_file = get_absolute_path(account_file, "tk_uploader")
     if not os.path.exists(account_file) or not await cookie_auth(account_file):
@@ -64,14 +85,14 @@ async def get_tiktok_cookie(account_file):
         context = await set_init_script(context)
         # Pause the page, and start recording manually.
         page = await context.new_page()
-        await page.goto("https://www.tiktok.com/login?lang=en")
+        await page.goto(creator_url(SOCIAL_MEDIA_TIKTOK, "/login?lang=en"))
         await page.pause()
         # 点击调试器的继续，保存cookie
         await context.storage_state(path=account_file)
 
 
 class TiktokVideo(object):
-    def __init__(self, title, file_path, tags, publish_date, account_file, thumbnail_path=None):
+    def __init__(self, title, file_path, tags, publish_date, account_file, thumbnail_path=None, browser=None, context=None):
         self.title = title
         self.file_path = file_path
         self.tags = tags
@@ -80,8 +101,12 @@ class TiktokVideo(object):
         self.account_file = account_file
         self.local_executable_path = LOCAL_CHROME_PATH
         self.locator_base = None
+        # injected browser / context from the browser pool, launch our own when both are None
+        self.browser = browser
+        self.context = context
 
     async def set_schedule_time(self, page, publish_date):
+        publish_date = to_browser_time(publish_date)
         schedule_input_element = self.locator_base.get_by_label('Schedule')
         await schedule_input_element.wait_for(state='visible')  # 确保按钮可见
 
@@ -107,32 +132,18 @@ class TiktokVideo(object):
             await arrow.click()
 
         # day set
-        valid_days_locator = self.locator_base.locator(
-            'div.calendar-wrapper span.day.valid')
-        valid_days = await valid_days_locator.count()
-        for i in range(valid_days):
-            day_element = valid_days_locator.nth(i)
-            text = await day_element.inner_text()
-            if text.strip() == str(publish_date.day):
-                await day_element.click()
-                break
+        await click_by_text(self.locator_base.locator('div.calendar-wrapper span.day.valid'), str(publish_date.day))
         # time set
         await scheduled_picker.locator('div.TUXInputBox').nth(0).click()
 
         hour_str = publish_date.strftime("%H")
-        correct_minute = int(publish_date.minute / 5)
-        minute_str = f"{correct_minute:02d}"
+        # the picker lists minutes in steps of 5 ("00", "05", ... "55"), round down to one of them
+        minute_str = f"{publish_date.minute // 5 * 5:02d}"
 
-        hour_selector = f"span.tiktok-timepicker-left:has-text('{hour_str}')"
-        minute_selector = f"span.tiktok-timepicker-right:has-text('{minute_str}')"
-
-        # pick hour first
-        await page.wait_for_timeout(1000)  # 等待500毫秒
-        await self.locator_base.locator(hour_selector).click()
-        # click time button again
-        await page.wait_for_timeout(1000)  # 等待500毫秒
+        # pick hour first, once the time picker has rendered
+        await click_by_text(self.locator_base.locator('span.tiktok-timepicker-left'), hour_str)
         # pick minutes after
-        await self.locator_base.locator(minute_selector).click()
+        await click_by_text(self.locator_base.locator('span.tiktok-timepicker-right'), minute_str)
 
         # click title to remove the focus.
         # await self.locator_base.locator("h1:has-text('Upload video')").click()
@@ -146,53 +157,56 @@ class TiktokVideo(object):
         await file_chooser.set_files(self.file_path)
 
     async def upload(self, playwright: Playwright) -> None:
-        browser = await playwright.chromium.launch(headless=False, executable_path=self.local_executable_path, channel="msedge")
-        context = await browser.new_context(storage_state=f"{self.account_file}")
-        context = await set_init_script(context)
-        page = await context.new_page()
-
-        # change language to eng first
-        await self.change_language(page)
-        await page.goto("https://www.tiktok.com/tiktokstudio/upload")
-        tiktok_logger.info(f'[+]Uploading-------{self.title}.mp4')
+        # the lease closes what we opened ourselves on exit, including on errors
+        async with await open_context(playwright, self.account_file, browser=self.browser, context=self.context,
+                                      launch_options=default_launch_options(self.local_executable_path),
+                                      platform=SOCIAL_MEDIA_TIKTOK) as lease:
+            context = lease.context
+            trace_stage("navigate")
+            page = await context.new_page()
+
+            # change language to eng first
+            await self.change_language(page)
+            await with_retry(SOCIAL_MEDIA_TIKTOK, "navigate",
+                             lambda: page.goto(creator_url(SOCIAL_MEDIA_TIKTOK, "/tiktokstudio/upload")))
+            tiktok_logger.info(f'[+]Uploading-------{self.title}.mp4')
+
+            await page.wait_for_url(creator_url(SOCIAL_MEDIA_TIKTOK, "/tiktokstudio/upload"), timeout=10000)
 
-        await page.wait_for_url("https://www.tiktok.com/tiktokstudio/upload", timeout=10000)
-
-        try:
-            await page.wait_for_selector('iframe[data-tt="Upload_index_iframe"], div.upload-container', timeout=10000)
-            tiktok_logger.info("Either iframe or div appeared.")
-        except Exception as e:
-            tiktok_logger.error("Neither iframe nor div appeared within the timeout.")
+            try:
+                await page.wait_for_selector('iframe[data-tt="Upload_index_iframe"], div.upload-container', timeout=10000)
+                tiktok_logger.info("Either iframe or div appeared.")
+            except Exception as e:
+                tiktok_logger.error("Neither iframe nor div appeared within the timeout.")
 
-        await self.choose_base_locator(page)
+            await self.choose_base_locator(page)
 
-        upload_button = self.locator_base.locator(
-            'button:has-text("Select video"):visible')
-        await upload_button.wait_for(state='visible')  # 确保按钮可见
+            upload_button = self.locator_base.locator(
+                'button:has-text("Select video"):visible')
+            await upload_button.wait_for(state='visible')  # 确保按钮可见
 
-        async with page.expect_file_chooser() as fc_info:
-            await upload_button.click()
-        file_chooser = await fc_info.value
-        await file_chooser.set_files(self.file_path)
+            trace_stage("transfer")
+            await with_retry(SOCIAL_MEDIA_TIKTOK, "transfer", lambda: self.choose_video_file(page, upload_button))
 
-        await self.add_title_tags(page)
-        # detect upload status
-        await self.detect_upload_status(page)
-        if self.thumbnail_path:
-            tiktok_logger.info(f'[+] Uploading thumbnail file {self.title}.png')
-            await self.upload_thumbnails(page)
+            trace_stage("form_fill")
+            await self.add_title_tags(page)
+            trace_stage("transfer")
+            # detect upload status
+            await self.detect_upload_status(page)
+            trace_stage("form_fill")
+            if self.thumbnail_path:
+                tiktok_logger.info(f'[+] Uploading thumbnail file {self.thumbnail_path}')
+                await self.upload_thumbnails(page)
 
-        if self.publish_date != 0:
-            await self.set_schedule_time(page, self.publish_date)
+            if self.publish_date != 0:
+                await self.set_schedule_time(page, self.publish_date)
 
-        await self.click_publish(page)
+            trace_stage("publish")
+            await self.click_publish(page)
 
-        await context.storage_state(path=f"{self.account_file}")  # save cookie
-        tiktok_logger.info('  [-] update cookie！')
-        await asyncio.sleep(2)  # close delay for look the video status
-        # close all
-        await context.close()
-        await browser.close()
+            await context.storage_state(path=f"{self.account_file}")  # save cookie
+            tiktok_logger.info('  [-] update cookie！')
+            await cosmetic_pause(2)  # close delay for look the video status
 
     async def add_title_tags(self, page):
 
@@ -207,22 +221,18 @@ class TiktokVideo(object):
 
         await page.keyboard.press("End")
 
-        await page.wait_for_timeout(1000)  # 等待1秒
-
-        await page.keyboard.insert_text(self.title)
-        await page.wait_for_timeout(1000)  # 等待1秒
+        # insert the title and wait until the editor reflects it
+        await type_and_verify(page, editor_locator, self.title, insert=True)
         await page.keyboard.press("End")
 
         await page.keyboard.press("Enter")
 
-        # tag part
+        # tag part, wait for every hashtag to show up in the editor instead of sleeping around it
         for index, tag in enumerate(self.tags, start=1):
             tiktok_logger.info("Setting the %s tag" % index)
             await page.keyboard.press("End")
-            await page.wait_for_timeout(1000)  # 等待1秒
-            await page.keyboard.insert_text("#" + tag + " ")
+            await type_and_verify(page, editor_locator, "#" + tag + " ", insert=True)
             await page.keyboard.press("Space")
-            await page.wait_for_timeout(1000)  # 等待1秒
 
             await page.keyboard.press("Backspace")
             await page.keyboard.press("End")
@@ -236,11 +246,12 @@ class TiktokVideo(object):
             await file_chooser.set_files(self.thumbnail_path)
         await self.locator_base.locator('div.cover-edit-panel:not(.hide-panel)').get_by_role(
             "button", name="Confirm").click()
-        await page.wait_for_timeout(3000)  # wait 3s, fix it later
+        # wait for the cover edit panel to close
+        await self.locator_base.locator('div.cover-edit-panel:not(.hide-panel)').first.wait_for(state="hidden")
 
     async def change_language(self, page):
         # set the language to english
-        await page.goto("https://www.tiktok.com")
+        await page.goto(creator_url(SOCIAL_MEDIA_TIKTOK))
         await page.wait_for_load_state('domcontentloaded')
         await page.wait_for_selector('[data-e2e="nav-more-menu"]')
         # 已经设置为英文, 省略这个步骤
@@ -251,40 +262,45 @@ class TiktokVideo(object):
         await page.locator('[data-e2e="language-select"]').click()
         await page.locator('#creator-tools-selection-menu-header >> text=English').click()
 
+    async def choose_video_file(self, page, upload_button):
+        async with page.expect_file_chooser() as fc_info:
+            await upload_button.click()
+        file_chooser = await fc_info.value
+        await file_chooser.set_files(self.file_path)
+
     async def click_publish(self, page):
-        success_flag_div = 'div.common-modal-confirm-modal'
-        while True:
-            try:
-                publish_button = self.locator_base.locator('div.button-group button').nth(0)
-                if await publish_button.count():
-                    await publish_button.click()
+        await repeat_until_confirmed(SOCIAL_MEDIA_TIKTOK, "publish", lambda: self.publish_once(page),
+                                     lambda timeout: self.publish_confirmed(page, timeout))
+        tiktok_logger.success("  [-] video published success")
 
-                await page.wait_for_url("https://www.tiktok.com/tiktokstudio/content",  timeout=3000)
-                tiktok_logger.success("  [-] video published success")
-                break
-            except Exception as e:
-                tiktok_logger.exception(f"  [-] Exception: {e}")
-                tiktok_logger.info("  [-] video publishing")
-                await asyncio.sleep(0.5)
+    async def publish_once(self, page):
+        publish_button = self.locator_base.locator('div.button-group button').nth(0)
+        if await publish_button.count():
+            await publish_button.click()
+
+    async def publish_confirmed(self, page, timeout: float) -> bool:
+        """landing on the content page means the video was published"""
+        try:
+            await page.wait_for_url(creator_url(SOCIAL_MEDIA_TIKTOK, "/tiktokstudio/content"), timeout=timeout)
+            return True
+        except Exception:
+            return False
 
     async def detect_upload_status(self, page):
+        # wake up as soon as the Post button is enabled, or the "Select file" retry button shows up
+        deadline = Deadline(UPLOAD_TIMEOUT, "video upload")
+        tiktok_logger.info("  [-] video uploading...")
         while True:
-            try:
-                # if await self.locator_base.locator('div.btn-post > button').get_attribute("disabled") is None:
-                if await self.locator_base.locator(
-                        'div.button-group > button >> text=Post').get_attribute("disabled") is None:
-                    tiktok_logger.info("  [-]video uploaded.")
-                    break
-                else:
-                    tiktok_logger.info("  [-] video uploading...")
-                    await asyncio.sleep(2)
-                    if await self.locator_base.locator(
-                            'button[aria-label="Select file"]').count():
-                        tiktok_logger.info("  [-] found some error while uploading now retry...")
-                        await self.handle_upload_error(page)
-            except:
-                tiktok_logger.info("  [-] video uploading...")
-                await asyncio.sleep(2)
+            state = await wait_for_first({
+                'done': self.locator_base.locator('div.button-group > button:not([disabled])').filter(has_text="Post"),
+                'failed': self.locator_base.locator('button[aria-label="Select file"]'),
+            }, deadline)
+            if state == 'done':
+                tiktok_logger.info("  [-]video uploaded.")
+                break
+            tiktok_logger.info("  [-] found some error while uploading now retry...")
+            await self.handle_upload_error(page)
+            await wait_for_gone(self.locator_base.locator('button[aria-label="Select file"]'), deadline)
 
     async def choose_base_locator(self, page):
         # await page.wait_for_selector('div.upload-container')
@@ -294,5 +310,28 @@ class TiktokVideo(object):
             self.locator_base = page.locator(Tk_Locator.default) 
 
     async def main(self):
-        async with async_playwright() as playwright:
-            await self.upload(playwright)
+        if not self.thumbnail_path:
+            # fall back to a cover next to the video or an auto-generated one
+            self.thumbnail_path = await prepare_cover(self.file_path, SOCIAL_MEDIA_TIKTOK)
+        # upload the smaller per-platform rendition when transcoding is enabled
+        self.file_path = await prepare_upload(self.file_path, SOCIAL_MEDIA_TIKTOK)
+        async with trace_upload(SOCIAL_MEDIA_TIKTOK, self.account_file, self.file_path):
+            if self.browser is not None or self.context is not None:
+                async with capture_failures(SOCIAL_MEDIA_TIKTOK, self.account_file):
+                    await self.upload(None)
+                return
+            # save the failure snapshot before playwright shuts the browser down
+            async with async_playwright() as playwright, capture_failures(SOCIAL_MEDIA_TIKTOK, self.account_file):
+                await self.upload(playwright)
+
+
+class TiktokPlugin(UploaderPlugin):
+    name = SOCIAL_MEDIA_TIKTOK
+
+    async def setup(self, account_file, handle=False):
+        return await tiktok_setup(str(account_file), handle=handle)
+
+    def create(self, short_title, tags, video, publish_date, account_file, thumbnail=None, context=None,
+               description=""):
+        return TiktokVideo(short_title, video, tags, publish_date, str(account_file), thumbnail,
+                           context=context)
@@ -1,46 +1,27 @@
+import asyncio
 import configparser
 import json
-import pathlib
-from time import sleep
+import os
+from pathlib import Path
 
 import requests
-from playwright.sync_api import sync_playwright
 
-from conf import BASE_DIR, XHS_SERVER
+from conf import XHS_SERVER
+from uploader.xhs_uploader.sign_server import get_signer
+from utils.base_social_media import SOCIAL_MEDIA_XHS
+from utils.files_times import to_browser_time
+from utils.log import xhs_logger
+from utils.metadata_index import format_caption, format_tags
+from utils.transcode import prepare_upload
+from utils.uploader_registry import UploaderPlugin
 
 config = configparser.RawConfigParser()
 config.read('accounts.ini')
 
 
 def sign_local(uri, data=None, a1="", web_session=""):
-    for _ in range(10):
-        try:
-            with sync_playwright() as playwright:
-                stealth_js_path = pathlib.Path(BASE_DIR / "utils/stealth.min.js")
-                chromium = playwright.chromium
-
-                # 如果一直失败可尝试设置成 False 让其打开浏览器，适当添加 sleep 可查看浏览器状态
-                browser = chromium.launch(headless=True)
-
-                browser_context = browser.new_context()
-                browser_context.add_init_script(path=stealth_js_path)
-                context_page = browser_context.new_page()
-                context_page.goto("https://www.xiaohongshu.com")
-                browser_context.add_cookies([
-                    {'name': 'a1', 'value': a1, 'domain': ".xiaohongshu.com", 'path': "/"}]
-                )
-                context_page.reload()
-                # 这个地方设置完浏览器 cookie 之后，如果这儿不 sleep 一下签名获取就失败了，如果经常失败请设置长一点试试
-                sleep(2)
-                encrypt_params = context_page.evaluate("([url, data]) => window._webmsxyw(url, data)", [uri, data])
-                return {
-                    "x-s": encrypt_params["X-s"],
-                    "x-t": str(encrypt_params["X-t"])
-                }
-        except Exception:
-            # 这儿有时会出现 window._webmsxyw is not a function 或未知跳转错误，因此加一个失败重试趴
-            pass
-    raise Exception("重试了这么多次还是无法签名成功，寄寄寄")
+    # 复用常驻的签名浏览器：每个 a1 保持一个预热好的页面，不再为每次签名启动一个浏览器
+    return get_signer().sign(uri, data, a1, web_session)
 
 
 def sign(uri, data=None, a1="", web_session=""):
@@ -56,3 +37,39 @@ def sign(uri, data=None, a1="", web_session=""):
 
 def beauty_print(data: dict):
     print(json.dumps(data, ensure_ascii=False, indent=2))
+
+
+def read_cookies(account_file) -> str:
+    """账号文件可以是 xhs_login_qrcode.py 打印的 cookie 字符串，也可以是 playwright 的 storage_state"""
+    content = Path(account_file).read_text(encoding='utf-8').strip()
+    if not content.startswith('{'):
+        return content
+    cookies = json.loads(content).get('cookies', [])
+    return '; '.join(f"{cookie['name']}={cookie['value']}" for cookie in cookies)
+
+
+class XhsPlugin(UploaderPlugin):
+    name = SOCIAL_MEDIA_XHS
+    uses_browser = False
+
+    async def setup(self, account_file, handle=False):
+        if os.path.exists(account_file):
+            return True
+        if handle:
+            xhs_logger.info(f'[+] cookie文件不存在，请运行 uploader/xhs_uploader/xhs_login_qrcode.py 扫码登录，'
+                            f'并将打印的 cookie 保存到 {account_file}')
+        return False
+
+    async def upload(self, short_title, tags, video, publish_date, account_file, thumbnail=None,
+                     context=None, description=""):
+        from xhs import XhsClient
+
+        xhs_client = XhsClient(read_cookies(account_file), sign=sign_local, timeout=60)
+        video = await prepare_upload(video, self.name)
+        # 正文和话题作为笔记描述，没有正文时沿用标题
+        desc = format_caption(description, tags) if description else short_title + ' ' + format_tags(tags)
+        # xhs 按本机时区解析 post_time
+        post_time = to_browser_time(publish_date).strftime("%Y-%m-%d %H:%M:%S") if publish_date else None
+        note = await asyncio.to_thread(xhs_client.create_video_note, title=short_title[:20], video_path=str(video),
+                                       desc=desc, is_private=False, post_time=post_time)
+        xhs_logger.success(f'[-] {Path(video).name} 上传成功: {note}')
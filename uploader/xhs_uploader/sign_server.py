@@ -0,0 +1,369 @@
+# -*- coding: utf-8 -*-
+"""
+常驻的小红书签名服务。
+
+在后台线程中运行一个 headless 浏览器，每个 a1 保持一个已加载 xiaohongshu.com 的页面，
+签名请求通过每个页面各自的队列串行调用 window._webmsxyw，页面定期做健康检查并自动刷新。
+
+进程内使用::
+
+    from uploader.xhs_uploader.sign_server import get_signer
+    xhs_client = XhsClient(cookies, sign=get_signer().sign)
+
+或作为 HTTP 服务供 main.sign() 调用（监听 conf.XHS_SERVER）::
+
+    python -m uploader.xhs_uploader.sign_server
+"""
+import argparse
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlparse
+
+from playwright.async_api import async_playwright
+
+from conf import BASE_DIR, XHS_SERVER
+from utils.log import xhs_logger
+
+XHS_HOME = "https://www.xiaohongshu.com"
+# 页面加载超过该时间（秒）后自动刷新
+REFRESH_INTERVAL = 30 * 60
+# 距上次确认 window._webmsxyw 可用超过该时间（秒）才重新检查
+HEALTH_CHECK_INTERVAL = 10
+SIGN_TIMEOUT = 30
+# 等待签名线程启动浏览器的最长时间（秒）
+STARTUP_TIMEOUT = 60
+MAX_PAGES = 16
+MAX_RETRIES = 3
+
+_SIGN_READY_JS = "() => typeof window._webmsxyw === 'function'"
+
+
+class _SignPage(object):
+    """一个 a1 对应的签名页面及其请求队列"""
+
+    def __init__(self, a1: str):
+        self.a1 = a1
+        self.context = None
+        self.page = None
+        self.loaded_at = 0.0
+        self.checked_at = 0.0
+        self.signs = 0
+        self.errors = 0
+        self.queue = asyncio.Queue()
+        self.worker = None
+
+
+class XhsSigner(object):
+    def __init__(self, headless: bool = True, refresh_interval: float = REFRESH_INTERVAL,
+                 max_pages: int = MAX_PAGES, sign_timeout: float = SIGN_TIMEOUT,
+                 startup_timeout: float = STARTUP_TIMEOUT):
+        self.headless = headless
+        self.refresh_interval = refresh_interval
+        self.max_pages = max_pages
+        self.sign_timeout = sign_timeout
+        self.startup_timeout = startup_timeout
+        self._loop = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._startup_error = None
+        self._playwright = None
+        self._browser = None
+        self._browser_lock = None
+        self._pages = OrderedDict()
+        self._maintainer = None
+
+    # ---- 线程与事件循环 ----
+
+    def start(self):
+        """启动签名线程并等待浏览器就绪；启动失败时抛出原因，下次调用会重新启动"""
+        with self._start_lock:
+            if self._thread is None:
+                self._ready.clear()
+                self._startup_error = None
+                self._thread = threading.Thread(target=self._run, name="xhs-signer", daemon=True)
+                self._thread.start()
+            if not self._ready.wait(self.startup_timeout):
+                raise TimeoutError(f"签名浏览器 {self.startup_timeout} 秒内未能启动")
+            if self._startup_error is not None:
+                error = self._startup_error
+                self._thread.join()
+                self._thread = None
+                raise error
+        return self
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._startup())
+        except Exception as e:
+            self._loop.close()
+            self._loop = None
+            self._startup_error = e
+            self._ready.set()
+            return
+        self._ready.set()
+        self._loop.run_forever()
+        self._loop.close()
+
+    async def _startup(self):
+        self._browser_lock = asyncio.Lock()
+        self._playwright = await async_playwright().start()
+        try:
+            await self._ensure_browser()
+        except BaseException:
+            # 不留下没有浏览器的 playwright 进程
+            await self._playwright.stop()
+            self._playwright = None
+            raise
+        self._maintainer = asyncio.ensure_future(self._maintain())
+
+    async def _shutdown(self):
+        if self._maintainer is not None:
+            self._maintainer.cancel()
+        for sign_page in list(self._pages.values()):
+            await self._discard(sign_page)
+        self._pages.clear()
+        if self._browser is not None:
+            try:
+                await self._browser.close()
+            except Exception:
+                pass
+        await self._playwright.stop()
+
+    def close(self):
+        if self._thread is None or self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._thread = None
+
+    # ---- 页面管理 ----
+
+    async def _ensure_browser(self):
+        async with self._browser_lock:
+            if self._browser is None or not self._browser.is_connected():
+                self._browser = await self._playwright.chromium.launch(headless=self.headless)
+            return self._browser
+
+    async def _load(self, sign_page: _SignPage):
+        """打开或重新打开 a1 对应的页面，直到 window._webmsxyw 可用"""
+        if sign_page.context is not None:
+            try:
+                await sign_page.context.close()
+            except Exception:
+                pass
+        browser = await self._ensure_browser()
+        sign_page.context = await browser.new_context()
+        await sign_page.context.add_init_script(path=Path(BASE_DIR / "utils/stealth.min.js"))
+        sign_page.page = await sign_page.context.new_page()
+        sign_page.page.set_default_timeout(self.sign_timeout * 1000)
+        await sign_page.page.goto(XHS_HOME)
+        await sign_page.context.add_cookies([
+            {'name': 'a1', 'value': sign_page.a1, 'domain': ".xiaohongshu.com", 'path': "/"}])
+        await sign_page.page.reload()
+        # 设置 cookie 后页面脚本需要一点时间完成初始化，等待签名函数就绪而不是固定 sleep
+        await sign_page.page.wait_for_function(_SIGN_READY_JS)
+        sign_page.loaded_at = sign_page.checked_at = time.monotonic()
+        xhs_logger.info(f"签名页面已就绪 a1={sign_page.a1[:6]}***")
+
+    async def _ensure_healthy(self, sign_page: _SignPage):
+        now = time.monotonic()
+        if sign_page.page is None or sign_page.page.is_closed() or now - sign_page.loaded_at > self.refresh_interval:
+            await self._load(sign_page)
+            return
+        if now - sign_page.checked_at > HEALTH_CHECK_INTERVAL:
+            if await sign_page.page.evaluate(_SIGN_READY_JS):
+                sign_page.checked_at = now
+            else:
+                await self._load(sign_page)
+
+    async def _discard(self, sign_page: _SignPage):
+        if sign_page.worker is not None:
+            sign_page.worker.cancel()
+        while not sign_page.queue.empty():
+            _, _, future = sign_page.queue.get_nowait()
+            if future is not None and not future.done():
+                future.set_exception(RuntimeError("签名页面已关闭"))
+        if sign_page.context is not None:
+            try:
+                await sign_page.context.close()
+            except Exception:
+                pass
+
+    async def _get_page(self, a1: str) -> _SignPage:
+        sign_page = self._pages.get(a1)
+        if sign_page is not None:
+            self._pages.move_to_end(a1)
+            return sign_page
+        sign_page = _SignPage(a1)
+        sign_page.worker = asyncio.ensure_future(self._worker(sign_page))
+        self._pages[a1] = sign_page
+        # 超过上限时关闭最久未使用的页面
+        while len(self._pages) > self.max_pages:
+            _, oldest = self._pages.popitem(last=False)
+            await self._discard(oldest)
+        return sign_page
+
+    async def _worker(self, sign_page: _SignPage):
+        while True:
+            uri, data, future = await sign_page.queue.get()
+            if future is None:
+                # 维护任务投递的健康检查
+                try:
+                    await self._ensure_healthy(sign_page)
+                except Exception as e:
+                    sign_page.errors += 1
+                    sign_page.loaded_at = 0
+                    xhs_logger.warning(f"签名页面健康检查失败 a1={sign_page.a1[:6]}***: {e}")
+                continue
+            if future.done():
+                continue
+            try:
+                await self._sign_with_retry(sign_page, uri, data, future)
+            except asyncio.CancelledError:
+                # 页面被淘汰或服务关闭时，不让调用方一直等到超时
+                if not future.done():
+                    future.set_exception(RuntimeError("签名页面已关闭"))
+                raise
+
+    async def _sign_with_retry(self, sign_page: _SignPage, uri, data, future):
+        last_error = None
+        for _ in range(MAX_RETRIES):
+            try:
+                await self._ensure_healthy(sign_page)
+                encrypt_params = await sign_page.page.evaluate(
+                    "([url, data]) => window._webmsxyw(url, data)", [uri, data])
+                sign_page.signs += 1
+                if not future.done():
+                    future.set_result({"x-s": encrypt_params["X-s"], "x-t": str(encrypt_params["X-t"])})
+                return
+            except Exception as e:
+                # 出现 window._webmsxyw is not a function 或未知跳转时重新加载页面再试
+                last_error = e
+                sign_page.errors += 1
+                sign_page.loaded_at = 0
+        if not future.done():
+            future.set_exception(RuntimeError(f"签名失败: {last_error}"))
+
+    async def _maintain(self):
+        """定期为空闲页面投递健康检查，过期页面在空闲时刷新而不是在下次签名时"""
+        while True:
+            await asyncio.sleep(HEALTH_CHECK_INTERVAL)
+            for sign_page in list(self._pages.values()):
+                if sign_page.queue.empty():
+                    sign_page.queue.put_nowait((None, None, None))
+
+    # ---- 对外接口 ----
+
+    async def async_sign(self, uri, data=None, a1: str = "", web_session: str = "") -> dict:
+        """在签名线程的事件循环内调用"""
+        sign_page = await self._get_page(a1)
+        future = asyncio.get_running_loop().create_future()
+        await sign_page.queue.put((uri, data, future))
+        return await future
+
+    def sign(self, uri, data=None, a1: str = "", web_session: str = "") -> dict:
+        """同步签名接口，签名与 main.sign_local 一致，可直接传给 XhsClient(sign=...)"""
+        self.start()
+        future = asyncio.run_coroutine_threadsafe(self.async_sign(uri, data, a1, web_session), self._loop)
+        # 每次重试最多包含 goto、reload、等待就绪与签名四步
+        return future.result(timeout=self.sign_timeout * 4 * MAX_RETRIES)
+
+    def health(self) -> dict:
+        now = time.monotonic()
+        return {
+            "running": self._thread is not None and self._startup_error is None,
+            "pages": [{
+                "a1": f"{sign_page.a1[:6]}***",
+                "loaded": sign_page.page is not None and sign_page.loaded_at > 0,
+                "age": round(now - sign_page.loaded_at, 1) if sign_page.loaded_at else None,
+                "queued": sign_page.queue.qsize(),
+                "signs": sign_page.signs,
+                "errors": sign_page.errors,
+            } for sign_page in list(self._pages.values())],
+        }
+
+
+_signer = None
+_signer_lock = threading.Lock()
+
+
+def get_signer() -> XhsSigner:
+    """进程内共享的签名器，首次签名时启动浏览器"""
+    global _signer
+    with _signer_lock:
+        if _signer is None:
+            _signer = XhsSigner()
+        return _signer
+
+
+class SignServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, signer: XhsSigner):
+        super().__init__(address, SignRequestHandler)
+        self.signer = signer
+
+
+class SignRequestHandler(BaseHTTPRequestHandler):
+    server: SignServer
+
+    def _reply(self, status: int, body: dict):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        if self.path.rstrip('/') != "/sign":
+            return self._reply(404, {"error": "not found"})
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            result = self.server.signer.sign(body.get("uri"), body.get("data"), body.get("a1", ""),
+                                             body.get("web_session", ""))
+        except Exception as e:
+            xhs_logger.error(f"签名失败: {e}")
+            return self._reply(500, {"error": str(e)})
+        self._reply(200, result)
+
+    def do_GET(self):
+        if self.path.rstrip('/') != "/health":
+            return self._reply(404, {"error": "not found"})
+        health = self.server.signer.health()
+        self._reply(200 if health["running"] else 503, health)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(host: str = None, port: int = None, signer: XhsSigner = None):
+    server_url = urlparse(XHS_SERVER)
+    host = host or server_url.hostname
+    port = port or server_url.port
+    signer = (signer or get_signer()).start()
+    server = SignServer((host, port), signer)
+    xhs_logger.info(f"签名服务已启动 http://{host}:{port}/sign")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        signer.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="xhs sign server")
+    parser.add_argument("--host", help="defaults to the host in conf.XHS_SERVER")
+    parser.add_argument("--port", type=int, help="defaults to the port in conf.XHS_SERVER")
+    parser.add_argument("--headed", action="store_true", help="show the signing browser for debugging")
+    args = parser.parse_args()
+    serve(args.host, args.port, XhsSigner(headless=not args.headed))
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+表单操作辅助层：每个动作都等待元素可操作、或等待输入框反映出输入的值，
+取代各 uploader 中固定的 asyncio.sleep / wait_for_timeout。
+"""
+import asyncio
+import os
+import re
+
+from conf import get_config_section, on_config_reset
+
+# 单个动作的默认等待时间（毫秒）
+ACTION_TIMEOUT = 30000
+
+_fast_mode = None
+
+
+def is_fast_mode() -> bool:
+    """
+    fast mode 下跳过仅为方便肉眼观察的延迟。
+    由环境变量 SAU_FAST_MODE 或 config.json 中的 fast_mode 开启。
+    """
+    global _fast_mode
+    if _fast_mode is None:
+        env = os.environ.get("SAU_FAST_MODE")
+        if env is not None:
+            _fast_mode = env.lower() in ("1", "true", "yes")
+        else:
+            _fast_mode = bool(get_config_section("fast_mode", False))
+    return _fast_mode
+
+
+@on_config_reset
+def set_fast_mode(enabled: bool = None):
+    """enabled 为 None 时恢复为按配置决定"""
+    global _fast_mode
+    _fast_mode = enabled
+
+
+async def cosmetic_pause(seconds: float):
+    """仅为方便观看的延迟，fast mode 下直接跳过"""
+    if not is_fast_mode():
+        await asyncio.sleep(seconds)
+
+
+async def click_when_ready(locator, timeout: float = ACTION_TIMEOUT, **click_options):
+    """等待元素可见后点击，click 本身会再等待元素 enabled 且稳定"""
+    locator = locator.first
+    await locator.wait_for(state="visible", timeout=timeout)
+    await locator.click(timeout=timeout, **click_options)
+
+
+async def wait_for_text(locator, text: str, timeout: float = ACTION_TIMEOUT):
+    """等待元素的文本中包含 text，适用于富文本编辑器"""
+    await locator.filter(has_text=text).first.wait_for(state="attached", timeout=timeout)
+
+
+async def wait_for_value(locator, value: str, timeout: float = ACTION_TIMEOUT):
+    """等待输入框的 value 反映出 value"""
+    handle = await locator.first.element_handle(timeout=timeout)
+    # 在元素所在的 frame 中等待，兼容 iframe 内的输入框；
+    # value 属性的变化不会触发 MutationObserver，因此按帧轮询
+    frame = await handle.owner_frame()
+    await frame.wait_for_function("([el, value]) => el.value !== undefined && el.value.includes(value)",
+                                  arg=[handle, value], polling="raf", timeout=timeout)
+
+
+async def fill_and_verify(locator, value: str, timeout: float = ACTION_TIMEOUT):
+    """填充输入框并等待其 value 生效"""
+    locator = locator.first
+    await locator.fill(value, timeout=timeout)
+    await wait_for_value(locator, value, timeout)
+
+
+async def type_and_verify(page, target, text: str, timeout: float = ACTION_TIMEOUT, insert: bool = False):
+    """
+    通过键盘输入 text，并等待 target 中出现 text。
+    insert=True 时使用 keyboard.insert_text 一次性插入。
+    """
+    if insert:
+        await page.keyboard.insert_text(text)
+    else:
+        await page.keyboard.type(text)
+    expected = text.strip()
+    if expected:
+        await wait_for_text(target, expected, timeout)
+
+
+def exact_text(options, text: str):
+    """options 中文本（去掉首尾空白）等于 text 的元素"""
+    return options.filter(has_text=re.compile(r"^\s*" + re.escape(text) + r"\s*$"))
+
+
+async def click_by_text(options, text: str, timeout: float = ACTION_TIMEOUT):
+    """
+    点击一组选项（日历中的日期、时间列表中的小时和分钟等）中文本等于 text 的那一个。
+    文本在浏览器中按 locator filter 匹配，只需一次调用，不必对每个选项分别取 inner_text；
+    选项尚未渲染时一并等待。
+    """
+    await exact_text(options, text).first.click(timeout=timeout)
+
+
+async def pick_option(trigger, option, timeout: float = ACTION_TIMEOUT):
+    """点击下拉框触发器，等待选项出现后点击"""
+    await click_when_ready(trigger, timeout)
+    await click_when_ready(option, timeout)
+
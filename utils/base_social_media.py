@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 from typing import List
 
@@ -8,16 +9,49 @@ SOCIAL_MEDIA_TENCENT = "tencent"
 SOCIAL_MEDIA_TIKTOK = "tiktok"
 SOCIAL_MEDIA_BILIBILI = "bilibili"
 SOCIAL_MEDIA_KUAISHOU = "kuaishou"
+SOCIAL_MEDIA_BAIJIAHAO = "baijiahao"
+SOCIAL_MEDIA_XHS = "xhs"
+
+# 各平台创作者中心的根地址，uploader 中的页面地址都由此拼出
+CREATOR_BASE_URLS = {
+    SOCIAL_MEDIA_DOUYIN: "https://creator.douyin.com",
+    SOCIAL_MEDIA_TENCENT: "https://channels.weixin.qq.com",
+    SOCIAL_MEDIA_TIKTOK: "https://www.tiktok.com",
+    SOCIAL_MEDIA_KUAISHOU: "https://cp.kuaishou.com",
+    SOCIAL_MEDIA_BAIJIAHAO: "https://baijiahao.baidu.com",
+}
+_base_url_overrides = {}
 
 
 def get_supported_social_media() -> List[str]:
-    return [SOCIAL_MEDIA_DOUYIN, SOCIAL_MEDIA_TENCENT, SOCIAL_MEDIA_TIKTOK, SOCIAL_MEDIA_KUAISHOU]
+    return [SOCIAL_MEDIA_DOUYIN, SOCIAL_MEDIA_TENCENT, SOCIAL_MEDIA_TIKTOK, SOCIAL_MEDIA_KUAISHOU,
+            SOCIAL_MEDIA_BILIBILI, SOCIAL_MEDIA_BAIJIAHAO, SOCIAL_MEDIA_XHS]
 
 
 def get_cli_action() -> List[str]:
     return ["upload", "login", "watch"]
 
 
+def set_creator_base_url(platform: str, base_url: str = None):
+    """覆盖平台根地址（例如指向 benchmarks 中的本地模拟站点），传 None 恢复默认"""
+    if base_url is None:
+        _base_url_overrides.pop(platform, None)
+    else:
+        _base_url_overrides[platform] = base_url.rstrip('/')
+
+
+def creator_url(platform: str, path: str = "") -> str:
+    """
+    拼出平台页面地址，根地址可被 set_creator_base_url() 或环境变量 SAU_<PLATFORM>_BASE_URL 覆盖::
+
+        creator_url(SOCIAL_MEDIA_DOUYIN, "/creator-micro/content/upload")
+    """
+    base = _base_url_overrides.get(platform) \
+        or os.environ.get(f"SAU_{platform.upper()}_BASE_URL", "").rstrip('/') \
+        or CREATOR_BASE_URLS[platform]
+    return base + path
+
+
 async def set_init_script(context):
     stealth_js_path = Path(BASE_DIR / "utils/stealth.min.js")
     await context.add_init_script(path=stealth_js_path)
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+浏览器的运行方式：有界面（默认，与原先一致）或无头。
+
+服务器上用无头模式不需要为每个 worker 准备虚拟显示器。无头 Chromium 与有界面时有几处差异，
+按平台用兼容设置补齐：UA 中的 HeadlessChrome 换成同版本的桌面 Chrome，视口 1280x720 换成 1920x1080，
+语言不再取系统设置；是否注入 stealth.min.js 也在这里按平台设置。
+
+扫码登录（各 uploader 的 *_cookie_gen）始终有界面，不受此设置影响。
+
+config.json::
+
+    "browser": {
+        "headless": true,
+        "channel": "msedge",
+        "platforms": {"tiktok": {"locale": "en-US"}}
+    }
+
+环境变量 SAU_HEADLESS=1 / 0 优先于 config.json。platforms 中的设置只在无头模式下生效。
+"""
+import os
+
+from conf import LOCAL_CHROME_PATH, get_config_section, on_config_reset
+from utils.base_social_media import SOCIAL_MEDIA_TIKTOK, SOCIAL_MEDIA_BAIJIAHAO
+
+DEFAULT_CHANNEL = "msedge"
+# 无法取得浏览器版本时（持久化配置目录在启动前就要确定 UA）使用的 Chrome 主版本号
+FALLBACK_CHROME_VERSION = "131"
+DESKTOP_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) " \
+                     "Chrome/{version}.0.0.0 Safari/537.36"
+
+# 两种模式下都使用的设置；百家号沿用原先的 UA，且不注入 stealth 脚本
+PLATFORM_CONTEXT_OPTIONS = {
+    SOCIAL_MEDIA_BAIJIAHAO: {
+        'init_script': False,
+        'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/127.0.4324.150 Safari/537.36',
+    },
+}
+# 无头模式下所有平台共用的兼容设置
+HEADLESS_CONTEXT_OPTIONS = {
+    'viewport': {'width': 1920, 'height': 1080},
+    'locale': 'zh-CN',
+}
+# 无头模式下各平台的兼容设置，优先于 HEADLESS_CONTEXT_OPTIONS
+PLATFORM_HEADLESS_OPTIONS = {
+    SOCIAL_MEDIA_TIKTOK: {'locale': 'en-US'},
+}
+
+_config = None
+
+
+def get_browser_config() -> dict:
+    global _config
+    if _config is None:
+        config = get_config_section("browser", {})
+        env = os.environ.get("SAU_HEADLESS")
+        headless = env.lower() in ("1", "true", "yes") if env is not None else bool(config.get("headless", False))
+        _config = {
+            "headless": headless,
+            "channel": config.get("channel", DEFAULT_CHANNEL),
+            "platforms": config.get("platforms") or {},
+        }
+    return _config
+
+
+@on_config_reset
+def _reset_config():
+    global _config
+    _config = None
+
+
+def is_headless() -> bool:
+    return get_browser_config()["headless"]
+
+
+def set_headless(headless: bool):
+    get_browser_config()["headless"] = headless
+
+
+def launch_options(executable_path=LOCAL_CHROME_PATH, headless: bool = None) -> dict:
+    """chromium.launch 的参数；executable_path 不存在时（例如 Linux 上的 macOS 默认路径）使用 channel"""
+    options = {'headless': is_headless() if headless is None else headless}
+    if executable_path and os.path.exists(executable_path):
+        options['executable_path'] = executable_path
+    elif get_browser_config()["channel"]:
+        options['channel'] = get_browser_config()["channel"]
+    return options
+
+
+def desktop_user_agent(browser_version: str = None) -> str:
+    """与浏览器同一主版本的桌面 Chrome UA，避免 UA 与实际支持的特性不一致"""
+    major = (browser_version or FALLBACK_CHROME_VERSION).split('.')[0]
+    return DESKTOP_USER_AGENT.format(version=major)
+
+
+def platform_context_options(platform: str, browser_version: str = None, headless: bool = None) -> dict:
+    """
+    平台的 new_context 参数，其中 'init_script' 表示是否注入 stealth.min.js，调用方需取出::
+
+        options = platform_context_options(SOCIAL_MEDIA_DOUYIN, browser.version)
+        init_script = options.pop('init_script', True)
+    """
+    if headless is None:
+        headless = is_headless()
+    options = {}
+    if headless:
+        options.update(HEADLESS_CONTEXT_OPTIONS)
+        options['user_agent'] = desktop_user_agent(browser_version)
+        options.update(PLATFORM_HEADLESS_OPTIONS.get(platform, {}))
+    options.update(PLATFORM_CONTEXT_OPTIONS.get(platform, {}))
+    if headless:
+        options.update(get_browser_config()["platforms"].get(platform, {}))
+    return options
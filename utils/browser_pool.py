@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+import asyncio
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from playwright.async_api import async_playwright
+
+from conf import LOCAL_CHROME_PATH
+from utils.base_social_media import set_init_script
+from utils.browser_mode import launch_options as mode_launch_options, platform_context_options
+from utils.diagnostics import attach_diagnostics, capture_failure
+from utils.interception import intercept_requests
+from utils.profile_manager import ProfileManager, get_profile_manager, get_profiles_config
+
+
+def default_launch_options(executable_path=LOCAL_CHROME_PATH) -> dict:
+    """各 uploader 的启动参数，是否无头见 utils.browser_mode"""
+    return mode_launch_options(executable_path)
+
+
+def _merge_platform_options(platform: str, context_options: dict, init_script: bool, browser_version: str = None,
+                            headless: bool = None):
+    """平台兼容设置加上调用方传入的参数（后者优先），返回 (new_context 参数, 是否注入 stealth 脚本)"""
+    options = platform_context_options(platform, browser_version, headless) if platform else {}
+    options.update(context_options or {})
+    return options, init_script and options.pop('init_script', True)
+
+
+class _BrowserSlot(object):
+    """池中的一个浏览器实例，记录使用次数与当前打开的 context 数"""
+
+    def __init__(self, browser):
+        self.browser = browser
+        self.uses = 0
+        self.active = 0
+        self.retiring = False
+        self.crashed = False
+        browser.on("disconnected", self._on_disconnected)
+
+    def _on_disconnected(self, *_):
+        self.crashed = True
+
+    @property
+    def usable(self) -> bool:
+        return not self.retiring and not self.crashed and self.browser.is_connected()
+
+
+class BrowserPool(object):
+    """
+    常驻浏览器池：保持 size 个浏览器热启动，为每个账号分配独立的 BrowserContext。
+
+    - 每个浏览器被分配 max_uses 次 context 后退役，等其上的 context 全部关闭后再关闭浏览器；
+    - 浏览器崩溃（disconnected）后在下次分配时自动重新拉起；
+    - 传入 profiles（ProfileManager）时，有 cookie 文件的账号改用各自的持久化配置目录，
+      每个目录单独启动一个浏览器进程，不占用池中的浏览器。
+
+    用法::
+
+        async with BrowserPool(size=2) as pool:
+            async with pool.context(account_file) as context:
+                app = DouYinVideo(title, file, tags, publish_date, account_file, context=context)
+                await app.main()
+    """
+
+    def __init__(self, size: int = 1, max_uses: int = 20, launch_options: dict = None, playwright=None,
+                 profiles: ProfileManager = None):
+        if size <= 0:
+            raise ValueError("size should be a positive integer")
+        self.size = size
+        self.max_uses = max_uses
+        self.launch_options = launch_options if launch_options is not None else default_launch_options()
+        self.profiles = profiles
+        self._playwright = playwright
+        self._playwright_manager = None
+        self._slots: list[_BrowserSlot] = []
+        self._lock = asyncio.Lock()
+
+    async def start(self):
+        if self._playwright is None:
+            self._playwright_manager = async_playwright()
+            self._playwright = await self._playwright_manager.start()
+        return self
+
+    async def close(self):
+        async with self._lock:
+            slots, self._slots = self._slots, []
+        for slot in slots:
+            await self._close_browser(slot)
+        if self._playwright_manager is not None:
+            await self._playwright_manager.__aexit__(None, None, None)
+            self._playwright_manager = None
+            self._playwright = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    @property
+    def playwright(self):
+        return self._playwright
+
+    async def _launch(self) -> _BrowserSlot:
+        browser = await self._playwright.chromium.launch(**self.launch_options)
+        return _BrowserSlot(browser)
+
+    @staticmethod
+    async def _close_browser(slot: _BrowserSlot):
+        try:
+            await slot.browser.close()
+        except Exception:
+            # 浏览器已崩溃或已关闭
+            pass
+
+    async def _acquire_slot(self) -> _BrowserSlot:
+        async with self._lock:
+            # 清理崩溃的浏览器
+            for slot in [s for s in self._slots if s.crashed or not s.browser.is_connected()]:
+                self._slots.remove(slot)
+                await self._close_browser(slot)
+            usable = [s for s in self._slots if s.usable]
+            if len(usable) < self.size:
+                slot = await self._launch()
+                self._slots.append(slot)
+            else:
+                # 选择当前负载最小的浏览器
+                slot = min(usable, key=lambda s: (s.active, s.uses))
+            slot.uses += 1
+            slot.active += 1
+            if self.max_uses and slot.uses >= self.max_uses:
+                slot.retiring = True
+            return slot
+
+    async def _release_slot(self, slot: _BrowserSlot):
+        async with self._lock:
+            slot.active -= 1
+            if slot.active > 0 or not (slot.retiring or slot.crashed):
+                return
+            if slot in self._slots:
+                self._slots.remove(slot)
+        await self._close_browser(slot)
+
+    @asynccontextmanager
+    async def context(self, account_file=None, init_script: bool = True, platform: str = None, **context_options):
+        """分配一个独立的 BrowserContext，account_file 为 playwright storage_state 文件，platform 用于请求拦截"""
+        headless = self.launch_options.get('headless')
+        if self.profiles is not None and account_file is not None:
+            context_options, init_script = _merge_platform_options(platform, context_options, init_script,
+                                                                   headless=headless)
+            profile = self.profiles.profile(account_file)
+            context = await profile.open(self._playwright, self.launch_options, context_options)
+            try:
+                yield await _prepare_context(context, init_script, platform)
+            finally:
+                await profile.close()
+            return
+        slot = await self._acquire_slot()
+        context = None
+        try:
+            context_options, init_script = _merge_platform_options(platform, context_options, init_script,
+                                                                   slot.browser.version, headless)
+            if account_file is not None:
+                context_options.setdefault('storage_state', str(account_file))
+            context = await slot.browser.new_context(**context_options)
+            yield await _prepare_context(context, init_script, platform)
+        finally:
+            if context is not None:
+                try:
+                    await context.close()
+                except Exception:
+                    pass
+            await self._release_slot(slot)
+
+
+async def _prepare_context(context, init_script: bool, platform: str):
+    if init_script:
+        context = await set_init_script(context)
+    if platform:
+        context = await intercept_requests(context, platform)
+    await attach_diagnostics(context)
+    return context
+
+
+class ContextLease(object):
+    """
+    uploader 使用的浏览器上下文租约。
+
+    注入了 context 时直接使用；注入了 browser 时在其上新建 context；
+    都未注入时按原逻辑自行启动浏览器，开启了持久化配置目录时打开账号的配置目录。close() 只关闭自己创建的对象。
+
+    作为 async with 使用时无论上传是否出错都会 close()；出错时先保存失败现场再关闭页面::
+
+        async with await open_context(playwright, account_file, ...) as lease:
+            page = await lease.context.new_page()
+    """
+
+    def __init__(self, browser, context, owns_browser: bool, owns_context: bool, profile=None):
+        self.browser = browser
+        self.context = context
+        self.owns_browser = owns_browser
+        self.owns_context = owns_context
+        self.profile = profile
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc is None:
+            await self.close()
+            return False
+        await capture_failure(exc)
+        try:
+            await self.close()
+        except Exception:
+            # 浏览器可能已经崩溃，关闭失败不能掩盖原来的异常
+            pass
+        return False
+
+    async def close(self):
+        if self.profile is not None:
+            await self.profile.close()
+        elif self.owns_context:
+            await self.context.close()
+        if self.owns_browser:
+            await self.browser.close()
+
+
+async def open_context(playwright, account_file, browser=None, context=None, launch_options: dict = None,
+                       context_options: dict = None, init_script: bool = True, platform: str = None) -> ContextLease:
+    if context is not None:
+        if platform:
+            # 浏览器池分配的 context 已安装过时不会重复安装
+            await intercept_requests(context, platform)
+        await attach_diagnostics(context)
+        return ContextLease(context.browser, context, owns_browser=False, owns_context=False)
+
+    launch_options = launch_options or default_launch_options()
+    if browser is None and account_file is not None and get_profiles_config()["enabled"]:
+        context_options, init_script = _merge_platform_options(platform, context_options, init_script,
+                                                               headless=launch_options.get('headless'))
+        profile = get_profile_manager().profile(account_file)
+        context = await profile.open(playwright, launch_options, context_options)
+        context = await _prepare_context(context, init_script, platform)
+        return ContextLease(None, context, owns_browser=False, owns_context=True, profile=profile)
+
+    owns_browser = browser is None
+    if owns_browser:
+        browser = await playwright.chromium.launch(**launch_options)
+    # 注入的 browser 无法得知是否无头，按当前设置
+    options, init_script = _merge_platform_options(platform, context_options, init_script, browser.version,
+                                                   launch_options.get('headless') if owns_browser else None)
+    if account_file is not None:
+        options.setdefault('storage_state', str(Path(account_file)))
+    context = await browser.new_context(**options)
+    context = await _prepare_context(context, init_script, platform)
+    return ContextLease(browser, context, owns_browser=owns_browser, owns_context=True)
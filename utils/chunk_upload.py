@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+分片、可断点续传的直连 HTTP 上传引擎。
+
+文件通过 mmap 按固定大小的分片读取，由线程池经同一个连接池并行上传，内存占用约为
+workers * chunk_size，与文件大小无关。每个分片完成后把进度写入文件旁的 sidecar
+（<video>.upload.json），中断后再次上传同一文件时只补传缺失的分片。
+
+具体平台的分片协议通过 ChunkProtocol 子类接入，ContentRangeProtocol 是一个通用实现，
+也便于对接本地的 mock 分片上传服务。
+"""
+import json
+import mmap
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_RETRIES = 3
+# 超过该时间（秒）的进度不再续传，服务端的上传会话通常已过期
+PROGRESS_TTL = 24 * 60 * 60
+PROGRESS_SUFFIX = ".upload.json"
+
+
+class ChunkUploadError(Exception):
+    """分片上传失败，进度已保存，可再次调用续传"""
+
+
+def create_http_session(pool_size: int = DEFAULT_WORKERS) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class ChunkProtocol(object):
+    """
+    分片上传协议。
+
+    begin() 返回的 state 会写入 sidecar，续传时原样传回；state 中的 chunk_size 可覆盖引擎的分片大小。
+    upload_chunk() 返回该分片的回执（如 etag），finish() 按分片顺序收到全部回执。
+    """
+    name = "chunk"
+
+    def begin(self, session: requests.Session, file: Path, file_size: int, chunk_size: int) -> dict:
+        raise NotImplementedError
+
+    def upload_chunk(self, session: requests.Session, state: dict, index: int, offset: int, data: bytes, total: int):
+        raise NotImplementedError
+
+    def finish(self, session: requests.Session, state: dict, parts: list):
+        raise NotImplementedError
+
+
+class ContentRangeProtocol(ChunkProtocol):
+    """
+    通用的 Content-Range 分片协议::
+
+        POST {base_url}/uploads                     {"name", "size"} -> {"upload_id"}
+        PUT  {base_url}/uploads/{upload_id}          Content-Range: bytes start-end/total
+        POST {base_url}/uploads/{upload_id}/complete {"parts": [...]} -> 任意 JSON
+    """
+    name = "content-range"
+
+    def __init__(self, base_url: str, headers: dict = None, timeout: float = 60):
+        self.base_url = base_url.rstrip('/')
+        self.headers = headers or {}
+        self.timeout = timeout
+
+    def begin(self, session, file, file_size, chunk_size):
+        response = session.post(f"{self.base_url}/uploads", json={"name": file.name, "size": file_size},
+                                headers=self.headers, timeout=self.timeout)
+        response.raise_for_status()
+        return {"upload_id": response.json()["upload_id"]}
+
+    def upload_chunk(self, session, state, index, offset, data, total):
+        headers = dict(self.headers)
+        headers["Content-Range"] = f"bytes {offset}-{offset + len(data) - 1}/{total}"
+        headers["Content-Type"] = "application/octet-stream"
+        response = session.put(f"{self.base_url}/uploads/{state['upload_id']}", data=data,
+                               headers=headers, timeout=self.timeout)
+        response.raise_for_status()
+        return {"index": index, "etag": response.headers.get("ETag")}
+
+    def finish(self, session, state, parts):
+        response = session.post(f"{self.base_url}/uploads/{state['upload_id']}/complete", json={"parts": parts},
+                                headers=self.headers, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+
+def get_progress_file(file) -> Path:
+    file = Path(file)
+    return file.with_name(file.name + PROGRESS_SUFFIX)
+
+
+class ChunkedUpload(object):
+    """
+    用法::
+
+        upload = ChunkedUpload(video_path, ContentRangeProtocol("http://127.0.0.1:8000"))
+        result = upload.run()
+
+    on_progress(uploaded_bytes, total_bytes) 在每个分片完成后被调用（来自工作线程）。
+    """
+
+    def __init__(self, file, protocol: ChunkProtocol, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 workers: int = DEFAULT_WORKERS, session: requests.Session = None, progress_file=None,
+                 max_retries: int = DEFAULT_MAX_RETRIES, on_progress=None):
+        if chunk_size <= 0:
+            raise ValueError("chunk_size should be a positive integer")
+        self.file = Path(file)
+        self.protocol = protocol
+        self.chunk_size = chunk_size
+        self.workers = max(1, workers)
+        self.session = session or create_http_session(self.workers)
+        self.progress_file = Path(progress_file) if progress_file else get_progress_file(self.file)
+        self.max_retries = max_retries
+        self.on_progress = on_progress
+        self._lock = threading.Lock()
+        self._progress = None
+
+    def _fingerprint(self) -> dict:
+        stat = self.file.stat()
+        return {"size": stat.st_size, "mtime": stat.st_mtime_ns, "protocol": self.protocol.name}
+
+    def _load_progress(self, fingerprint: dict):
+        try:
+            with open(self.progress_file, 'r', encoding='utf-8') as f:
+                progress = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # 文件被修改、换了协议或进度过旧时重新上传
+        if progress.get("file") != fingerprint or time.time() - progress.get("updated_at", 0) > PROGRESS_TTL:
+            return None
+        return progress
+
+    def _save_progress(self):
+        self._progress["updated_at"] = time.time()
+        tmp_file = self.progress_file.with_suffix('.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self._progress, f)
+        os.replace(tmp_file, self.progress_file)
+
+    def clear_progress(self):
+        try:
+            self.progress_file.unlink()
+        except FileNotFoundError:
+            pass
+
+    def _upload_chunk(self, buffer, index: int, total: int):
+        chunk_size = self._progress["chunk_size"]
+        offset = index * chunk_size
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            try:
+                # 每次重试重新切片，失败时不在内存中保留分片
+                data = buffer[offset:offset + chunk_size]
+                part = self.protocol.upload_chunk(self.session, self._progress["state"], index, offset, data, total)
+                break
+            except requests.RequestException as e:
+                last_error = e
+                if attempt < self.max_retries:
+                    time.sleep(min(2 ** attempt, 10))
+        else:
+            raise ChunkUploadError(f"{self.file.name} 第 {index} 个分片上传失败: {last_error}") from last_error
+
+        with self._lock:
+            self._progress["parts"][str(index)] = part
+            self._save_progress()
+            uploaded = min(len(self._progress["parts"]) * chunk_size, total)
+        if self.on_progress:
+            self.on_progress(uploaded, total)
+
+    def run(self):
+        fingerprint = self._fingerprint()
+        total = fingerprint["size"]
+        self._progress = self._load_progress(fingerprint)
+        if self._progress is None:
+            state = self.protocol.begin(self.session, self.file, total, self.chunk_size) or {}
+            self._progress = {
+                "file": fingerprint,
+                "chunk_size": int(state.get("chunk_size") or self.chunk_size),
+                "state": state,
+                "parts": {},
+            }
+            self._save_progress()
+
+        chunk_size = self._progress["chunk_size"]
+        chunks = (total + chunk_size - 1) // chunk_size
+        pending = [i for i in range(chunks) if str(i) not in self._progress["parts"]]
+        if pending:
+            with open(self.file, 'rb') as f, \
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer, \
+                    ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = [executor.submit(self._upload_chunk, buffer, index, total) for index in pending]
+                try:
+                    for future in as_completed(futures):
+                        future.result()
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    raise
+
+        parts = [self._progress["parts"][str(i)] for i in range(chunks)]
+        result = self.protocol.finish(self.session, self._progress["state"], parts)
+        self.clear_progress()
+        return result
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+自动封面：从视频中均匀抽取候选帧，按清晰度和亮度打分，用得分最高的一帧生成各平台尺寸的竖/横封面。
+
+- 候选帧由 ffmpeg 快速 seek 后缩小为灰度图输出，打分用 NumPy 对全部候选帧一次性向量化计算
+  （拉普拉斯方差衡量清晰度，偏暗、偏亮、近乎纯色的帧降权）；未安装 NumPy 时取中间的候选帧；
+- 每个视频只解码一次选中的帧，通过 split 滤镜同时裁出所有尺寸；
+- 结果以视频内容哈希为目录缓存在 cache/covers 下，重复运行不再调用 ffmpeg；
+- 与视频同名的封面图（见 find_cover）始终优先。
+
+由 config.json 中的 "auto_cover"（默认关闭）或环境变量 SAU_AUTO_COVER 开启，找不到 ffmpeg 时不生成。
+批量预先生成::
+
+    python -m utils.covers videos --platform douyin tiktok
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from conf import BASE_DIR, get_config_section, on_config_reset
+from utils.base_social_media import SOCIAL_MEDIA_DOUYIN, SOCIAL_MEDIA_TENCENT, SOCIAL_MEDIA_TIKTOK, \
+    SOCIAL_MEDIA_BILIBILI, SOCIAL_MEDIA_KUAISHOU, SOCIAL_MEDIA_BAIJIAHAO, SOCIAL_MEDIA_XHS
+from utils.dedup import content_hash
+from utils.files_times import find_cover
+from utils.preflight import MP4_SUFFIXES, probe_many
+from utils.transcode import ffmpeg_path
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+COVER_CACHE_DIR = Path(BASE_DIR / "cache" / "covers")
+CANDIDATE_FRAMES = 12
+# 只在 5% ~ 90% 的位置取帧，避开片头的黑场和片尾
+CANDIDATE_RANGE = (0.05, 0.9)
+SCORE_WIDTH = 320
+VERTICAL = "vertical"
+HORIZONTAL = "horizontal"
+
+# 各平台封面的 (宽, 高)，第一个方向为 uploader 默认使用的封面
+COVER_SPECS = {
+    SOCIAL_MEDIA_DOUYIN: {VERTICAL: (1080, 1440), HORIZONTAL: (1440, 1080)},
+    SOCIAL_MEDIA_TENCENT: {VERTICAL: (1080, 1440)},
+    SOCIAL_MEDIA_TIKTOK: {VERTICAL: (1080, 1920)},
+    SOCIAL_MEDIA_KUAISHOU: {VERTICAL: (1080, 1440), HORIZONTAL: (1920, 1080)},
+    SOCIAL_MEDIA_BAIJIAHAO: {HORIZONTAL: (1920, 1080)},
+    SOCIAL_MEDIA_BILIBILI: {HORIZONTAL: (1920, 1080)},
+    SOCIAL_MEDIA_XHS: {VERTICAL: (1080, 1440)},
+}
+
+_enabled = None
+
+
+def is_auto_cover_enabled() -> bool:
+    global _enabled
+    if _enabled is None:
+        env = os.environ.get("SAU_AUTO_COVER")
+        if env is not None:
+            _enabled = env.lower() in ("1", "true", "yes")
+        else:
+            _enabled = bool(get_config_section("auto_cover", False))
+    return _enabled and ffmpeg_path() is not None
+
+
+@on_config_reset
+def set_auto_cover_enabled(enabled: bool = None):
+    """enabled 为 None 时恢复为按配置决定"""
+    global _enabled
+    _enabled = enabled
+
+
+def _cover_name(platform: str, orientation: str) -> str:
+    width, height = COVER_SPECS[platform][orientation]
+    return f"{platform}-{orientation}-{width}x{height}.jpg"
+
+
+def candidate_times(duration: float, count: int = CANDIDATE_FRAMES) -> list:
+    start, end = CANDIDATE_RANGE
+    if count == 1:
+        return [duration * (start + end) / 2]
+    return [duration * (start + (end - start) * index / (count - 1)) for index in range(count)]
+
+
+def _grab_gray(ffmpeg: str, video: Path, at: float, width: int, height: int):
+    """把 at 秒处的帧缩小为 width x height 的灰度图，返回原始字节，失败时返回 None"""
+    proc = subprocess.run([ffmpeg, "-hide_banner", "-loglevel", "error", "-nostdin", "-ss", f"{at:.3f}",
+                           "-i", str(video), "-frames:v", "1", "-vf", f"scale={width}:{height}",
+                           "-f", "rawvideo", "-pix_fmt", "gray", "-"], capture_output=True)
+    if proc.returncode != 0 or len(proc.stdout) != width * height:
+        return None
+    return proc.stdout
+
+
+def score_frames(frames):
+    """
+    frames: (N, H, W) 的灰度帧，返回每一帧的得分。
+    得分 = log(1 + 拉普拉斯方差) * 曝光权重，对比度过低（黑场、纯色转场）的帧为 0。
+    """
+    frames = frames.astype(np.float32) / 255
+    laplacian = (4 * frames[:, 1:-1, 1:-1] - frames[:, :-2, 1:-1] - frames[:, 2:, 1:-1]
+                 - frames[:, 1:-1, :-2] - frames[:, 1:-1, 2:])
+    sharpness = laplacian.reshape(len(frames), -1).var(axis=1)
+    brightness = frames.reshape(len(frames), -1).mean(axis=1)
+    contrast = frames.reshape(len(frames), -1).std(axis=1)
+    exposure = np.clip(1 - np.abs(brightness - 0.5) * 2, 0.05, 1)
+    return np.where(contrast < 0.04, 0, np.log1p(sharpness * 1000) * exposure)
+
+
+def pick_frame(ffmpeg: str, video: Path, info: dict) -> float:
+    """返回最适合做封面的时间点（秒）"""
+    times = candidate_times(info["duration"])
+    if np is None:
+        return times[len(times) // 2]
+    height = max(2, round(SCORE_WIDTH * info["height"] / info["width"] / 2) * 2) if info.get("width") else 180
+    grabbed = [(at, _grab_gray(ffmpeg, video, at, SCORE_WIDTH, height)) for at in times]
+    grabbed = [(at, data) for at, data in grabbed if data is not None]
+    if not grabbed:
+        return times[0]
+    frames = np.stack([np.frombuffer(data, dtype=np.uint8).reshape(height, SCORE_WIDTH) for _, data in grabbed])
+    return grabbed[int(np.argmax(score_frames(frames)))][0]
+
+
+def _render(ffmpeg: str, video: Path, at: float, outputs: dict) -> bool:
+    """outputs: {文件路径: (宽, 高)}，一次解码同时输出所有尺寸，居中裁剪到目标宽高比"""
+    branches = [f"[s{index}]scale={width}:{height}:force_original_aspect_ratio=increase,"
+                f"crop={width}:{height}[o{index}]" for index, (width, height) in enumerate(outputs.values())]
+    split = f"[0:v]split={len(outputs)}" + ''.join(f"[s{index}]" for index in range(len(outputs)))
+    args = [ffmpeg, "-hide_banner", "-loglevel", "error", "-nostdin", "-y", "-ss", f"{at:.3f}", "-i", str(video),
+            "-filter_complex", ';'.join([split] + branches)]
+    temporary = {}
+    for index, path in enumerate(outputs):
+        temporary[path] = path.with_name(f".{path.stem}.tmp.jpg")
+        args += ["-map", f"[o{index}]", "-frames:v", "1", "-q:v", "2", str(temporary[path])]
+    if subprocess.run(args, capture_output=True).returncode != 0:
+        return False
+    for path, temp in temporary.items():
+        os.replace(temp, path)
+    return True
+
+
+def generate_covers(video, platforms=None, cache_dir: Path = COVER_CACHE_DIR) -> dict:
+    """生成（或读取缓存的）封面，返回 {(platform, orientation): 路径}"""
+    platforms = [platform for platform in (platforms or COVER_SPECS) if platform in COVER_SPECS]
+    ffmpeg = ffmpeg_path()
+    video = Path(video).resolve()
+    if ffmpeg is None or video.suffix.lower() not in MP4_SUFFIXES or not platforms:
+        return {}
+    directory = cache_dir / content_hash(video)[:32]
+    covers = {(platform, orientation): directory / _cover_name(platform, orientation)
+              for platform in platforms for orientation in COVER_SPECS[platform]}
+    missing = {path: COVER_SPECS[platform][orientation] for (platform, orientation), path in covers.items()
+               if not path.exists()}
+    if missing:
+        meta_file = directory / "meta.json"
+        try:
+            at = json.loads(meta_file.read_text(encoding='utf-8'))["time"]
+        except (OSError, ValueError, KeyError):
+            info, error = probe_many([video])[str(video)]
+            if error or not info.get("duration"):
+                return {}
+            at = pick_frame(ffmpeg, video, info)
+            directory.mkdir(parents=True, exist_ok=True)
+            meta_file.write_text(json.dumps({"video": str(video), "time": at}), encoding='utf-8')
+        if not _render(ffmpeg, video, at, missing):
+            return {}
+    return covers
+
+
+def _generate_worker(args):
+    video, platforms, cache_dir = args
+    try:
+        return str(video), generate_covers(video, platforms, cache_dir)
+    except Exception as e:
+        print(f"[-] {video} 封面生成失败: {e}")
+        return str(video), {}
+
+
+def generate_covers_many(videos, platforms=None, workers: int = None, cache_dir: Path = COVER_CACHE_DIR) -> dict:
+    """在进程池中为多个视频生成封面，返回 {视频路径: {(platform, orientation): 路径}}"""
+    probe_many(videos)
+    workers = workers or max(1, (os.cpu_count() or 1) // 2)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return dict(executor.map(_generate_worker, [(video, platforms, cache_dir) for video in videos]))
+
+
+def cover_for(video, platform: str, orientation: str = None):
+    """
+    uploader 使用的封面：优先取与视频同名的图片，否则自动生成；都没有时返回 None。
+    video 应为原始视频，转码后的文件在缓存目录中，旁边没有同名封面。
+    """
+    try:
+        cover = find_cover(video)
+        if cover is not None or not is_auto_cover_enabled() or platform not in COVER_SPECS:
+            return cover
+        orientation = orientation or next(iter(COVER_SPECS[platform]))
+        return generate_covers(video, [platform]).get((platform, orientation))
+    except Exception as e:
+        # 封面不是必需的，失败时继续上传
+        print(f"[-] {Path(video).name} 封面生成失败: {e}")
+        return None
+
+
+async def prepare_cover(video, platform: str, orientation: str = None):
+    return await asyncio.to_thread(cover_for, video, platform, orientation)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate per-platform covers from the best frame of each video.")
+    parser.add_argument("directory", help="folder of videos")
+    parser.add_argument("--platform", nargs='+', default=list(COVER_SPECS), choices=list(COVER_SPECS))
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args()
+    if ffmpeg_path() is None:
+        raise SystemExit("找不到 ffmpeg，请安装或通过 SAU_FFMPEG 指定路径")
+    videos = sorted(file for file in Path(args.directory).iterdir() if file.suffix.lower() in MP4_SUFFIXES)
+    for video, covers in generate_covers_many(videos, args.platform, args.workers).items():
+        print(video)
+        for (platform, orientation), path in covers.items():
+            print(f"  {platform} {orientation}: {path}")
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+基于内容哈希的去重索引，避免同一个视频被重复上传到同一账号。
+
+- 全量哈希以 mmap 分块流式计算，固定使用 hashlib.blake2b，结果不随安装的库变化；
+- 预筛哈希只读取文件大小和首尾各 1MB，只有预筛命中时才计算全量哈希；
+- 哈希结果按 (path, size, mtime) 缓存在 SQLite 中，重复扫描同一目录几乎没有开销。
+"""
+import hashlib
+import mmap
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from conf import BASE_DIR
+
+DEDUP_DB_FILE = Path(BASE_DIR / "db" / "dedup.db")
+HASH_ALGORITHM = "blake2b"
+PARTIAL_BYTES = 1024 * 1024
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS file_hashes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    partial TEXT NOT NULL,
+    full TEXT
+);
+CREATE TABLE IF NOT EXISTS uploads (
+    platform TEXT NOT NULL,
+    account TEXT NOT NULL,
+    full TEXT NOT NULL,
+    partial TEXT NOT NULL,
+    file TEXT NOT NULL,
+    uploaded_at REAL NOT NULL,
+    PRIMARY KEY (platform, account, full)
+);
+CREATE INDEX IF NOT EXISTS idx_uploads_partial ON uploads (platform, account, partial);
+"""
+
+
+def _new_hasher():
+    return hashlib.blake2b(digest_size=32)
+
+
+def partial_hash(path, size: int = None) -> str:
+    """文件大小 + 首尾各 PARTIAL_BYTES 字节的哈希，用于快速排除不重复的文件"""
+    size = os.path.getsize(path) if size is None else size
+    hasher = _new_hasher()
+    hasher.update(size.to_bytes(8, 'little'))
+    with open(path, 'rb') as f:
+        hasher.update(f.read(PARTIAL_BYTES))
+        if size > PARTIAL_BYTES:
+            f.seek(max(PARTIAL_BYTES, size - PARTIAL_BYTES))
+            hasher.update(f.read(PARTIAL_BYTES))
+    return f"{HASH_ALGORITHM}:{hasher.hexdigest()}"
+
+
+def full_hash(path) -> str:
+    """以 mmap 分块流式计算整个文件的哈希"""
+    hasher = _new_hasher()
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return f"{HASH_ALGORITHM}:{hasher.hexdigest()}"
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            view = memoryview(buffer)
+            try:
+                for offset in range(0, len(buffer), HASH_CHUNK_SIZE):
+                    hasher.update(view[offset:offset + HASH_CHUNK_SIZE])
+            finally:
+                view.release()
+    return f"{HASH_ALGORITHM}:{hasher.hexdigest()}"
+
+
+def account_key(account_file) -> str:
+    """去重记录中的账号：cookie 文件名（不含扩展名），与 tracing 中记录的 account 相同"""
+    return Path(account_file).stem
+
+
+class DedupIndex(object):
+    """
+    用法::
+
+        dedup = DedupIndex()
+        if dedup.is_duplicate(video, "douyin", account_file):
+            ...  # 跳过
+        ...  # 上传成功后
+        dedup.record(video, "douyin", account_file)
+
+    账号按 cookie 文件记录（见 account_key()），CLI、UploadScheduler 和 examples 中的脚本互相识别已上传的视频。
+    """
+
+    def __init__(self, path=DEDUP_DB_FILE):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _cached(self, key: str, size: int, mtime: int):
+        with self._lock:
+            row = self._conn.execute("SELECT size, mtime, partial, full FROM file_hashes WHERE path = ?",
+                                     (key,)).fetchone()
+        if row and row[0] == size and row[1] == mtime:
+            return row[2], row[3]
+        return None, None
+
+    def _store(self, key: str, size: int, mtime: int, partial: str, full: Optional[str]):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO file_hashes (path, size, mtime, partial, full) "
+                               "VALUES (?, ?, ?, ?, ?)", (key, size, mtime, partial, full))
+
+    def fingerprint(self, path, full: bool = True):
+        """返回 (partial, full)，full=False 时只保证 partial 已计算"""
+        key = os.path.abspath(path)
+        stat = os.stat(key)
+        partial, full_digest = self._cached(key, stat.st_size, stat.st_mtime_ns)
+        changed = False
+        if partial is None:
+            partial, changed = partial_hash(key, stat.st_size), True
+        if full and full_digest is None:
+            full_digest, changed = full_hash(key), True
+        if changed:
+            self._store(key, stat.st_size, stat.st_mtime_ns, partial, full_digest)
+        return partial, full_digest
+
+    def find_upload(self, path, platform: str, account_file) -> Optional[str]:
+        """同一账号下已上传过相同内容时返回当时的文件路径"""
+        partial, _ = self.fingerprint(path, full=False)
+        with self._lock:
+            candidates = self._conn.execute(
+                "SELECT full, file FROM uploads WHERE platform = ? AND account = ? AND partial = ?",
+                (platform, account_key(account_file), partial)).fetchall()
+        if not candidates:
+            return None
+        _, full_digest = self.fingerprint(path)
+        for digest, file in candidates:
+            if digest == full_digest:
+                return file
+        return None
+
+    def is_duplicate(self, path, platform: str, account_file) -> bool:
+        return self.find_upload(path, platform, account_file) is not None
+
+    def record(self, path, platform: str, account_file):
+        partial, full_digest = self.fingerprint(path)
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO uploads (platform, account, full, partial, file, uploaded_at) "
+                               "VALUES (?, ?, ?, ?, ?, ?)",
+                               (platform, account_key(account_file), full_digest, partial, os.path.abspath(path),
+                                time.time()))
+
+
+_default_index = None
+_default_lock = threading.Lock()
+
+
+def get_dedup_index() -> DedupIndex:
+    """进程内共享的默认去重索引，转码、封面等在多个线程中同时使用"""
+    global _default_index
+    with _default_lock:
+        if _default_index is None:
+            _default_index = DedupIndex()
+    return _default_index
+
+
+def content_hash(path) -> str:
+    """文件的全量内容哈希（不含算法前缀），缓存在默认的去重索引中，供转码、封面等缓存作为键"""
+    return get_dedup_index().fingerprint(path)[1].split(':', 1)[1]
@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+"""
+上传失败时的现场记录。
+
+上传过程中只在内存中保留廉价的信息：最近 N 条控制台消息和网络失败（请求失败或 HTTP 状态 >= 400），
+放在定长的环形缓冲里，正常完成的上传不写任何文件。上传失败或超过任务期限时，在 logs/diagnostics
+下为这次上传建一个目录，写入：
+
+- summary.json：平台、账号、失败原因、各页面的 URL，以及缓冲中的控制台消息和网络失败；
+- page<N>.html：页面 DOM（去掉 script / style / svg），page<N>.png：当前视口截图；
+- trace.zip：Playwright trace，仅在开启了 trace 时（见下）。
+
+trace 需要在出错前开始录制，按 config.json 中 "diagnostics": {"trace": ...} 选择（环境变量 SAU_DIAGNOSTICS_TRACE 优先）：
+
+- "on-retry"（默认）：只在任务的重试（attempt > 1）中录制，第一次正常上传不付出代价；
+- "retain-on-failure"：每次都录制，成功时丢弃；
+- "off"：不录制。
+
+目录总大小超过 "max_mb"（默认 200）时删除最旧的记录。用法::
+
+    async with async_playwright() as playwright, capture_failures(SOCIAL_MEDIA_DOUYIN, self.account_file):
+        await self.upload(playwright)
+
+open_context() 创建或接收 BrowserContext 时会调用 attach_diagnostics()，把它登记到当前的记录中。
+失败时若有页面停在平台的登录页，说明登录态已失效，会同时清除该账号缓存的 cookie 校验结果。
+"""
+import asyncio
+import json
+import os
+import shutil
+import time
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+
+from conf import BASE_DIR, get_config_section, on_config_reset
+from utils.session_check import is_login_url, session_validator
+from utils.tracing import bound_tag
+
+DIAGNOSTICS_DIR = Path(BASE_DIR / "logs" / "diagnostics")
+TRACE_MODES = ("off", "on-retry", "retain-on-failure")
+DEFAULT_TRACE_MODE = "on-retry"
+DEFAULT_MAX_MB = 200
+# 每种事件保留的条数
+DEFAULT_MAX_EVENTS = 100
+# 单个页面 DOM 的最大字符数，超出部分截断
+DOM_SNAPSHOT_CHARS = 2_000_000
+# 每项现场记录操作的超时，页面卡死时不拖住失败处理
+CAPTURE_TIMEOUT_MS = 5000
+
+# 在页面中复制 DOM 并去掉与排查无关的节点
+_DOM_SNAPSHOT_JS = """(selector) => {
+    const root = (selector && document.querySelector(selector)) || document.documentElement;
+    const copy = root.cloneNode(true);
+    copy.querySelectorAll('script, style, svg, noscript, link[rel="stylesheet"]').forEach(e => e.remove());
+    return copy.outerHTML;
+}"""
+
+_config = None
+_current = ContextVar("sau_diagnostics", default=None)
+
+
+def get_diagnostics_config() -> dict:
+    global _config
+    if _config is None:
+        config = get_config_section("diagnostics", {})
+        trace = os.environ.get("SAU_DIAGNOSTICS_TRACE", config.get("trace", DEFAULT_TRACE_MODE))
+        if trace not in TRACE_MODES:
+            raise ValueError(f"diagnostics.trace 应为 {', '.join(TRACE_MODES)} 之一，而不是 {trace!r}")
+        _config = {
+            "trace": trace,
+            "max_bytes": int(config.get("max_mb", DEFAULT_MAX_MB) * 1024 * 1024),
+            "max_events": int(config.get("max_events", DEFAULT_MAX_EVENTS)),
+        }
+    return _config
+
+
+@on_config_reset
+def _reset_config():
+    global _config
+    _config = None
+
+
+def _timestamp(seconds: float) -> str:
+    return datetime.fromtimestamp(seconds).strftime('%H:%M:%S.%f')[:-3]
+
+
+def _dir_size(path: Path) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def prune_diagnostics(directory=DIAGNOSTICS_DIR, max_bytes: int = None):
+    """删除最旧的记录（目录名以时间开头），直到总大小不超过 max_bytes"""
+    directory = Path(directory)
+    if max_bytes is None:
+        max_bytes = get_diagnostics_config()["max_bytes"]
+    if not directory.is_dir():
+        return
+    entries = sorted((entry for entry in directory.iterdir() if entry.is_dir()), key=lambda entry: entry.name)
+    sizes = [_dir_size(entry) for entry in entries]
+    total = sum(sizes)
+    for entry, size in zip(entries, sizes):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
+
+
+class DiagnosticsRecorder(object):
+    """一次上传的现场记录，事件处理只向 deque 追加元组"""
+
+    def __init__(self, platform: str, account: str = None, container: str = None, trace: bool = False,
+                 max_events: int = DEFAULT_MAX_EVENTS, directory=DIAGNOSTICS_DIR):
+        self.platform = platform
+        self.account = account
+        # 截取 DOM 的容器，未找到时截取整个页面
+        self.container = container
+        self.trace = trace
+        self.directory = Path(directory)
+        self.console = deque(maxlen=max_events)
+        self.network = deque(maxlen=max_events)
+        self.contexts = []
+        self._tracing = set()
+        self._listeners = []
+        # 由 capture_failures 设置，登录页跳转时清除该账号的 cookie 校验缓存
+        self.account_file = None
+        self._failure_saved = False
+
+    def _on_console(self, message):
+        self.console.append((time.time(), message.type, message.text))
+
+    def _on_request_failed(self, request):
+        self.network.append((time.time(), request.method, request.url, request.resource_type, request.failure))
+
+    def _on_response(self, response):
+        if response.status >= 400:
+            request = response.request
+            self.network.append((time.time(), request.method, response.url, request.resource_type,
+                                 f"HTTP {response.status}"))
+
+    async def attach(self, context):
+        if context in self.contexts:
+            return
+        self.contexts.append(context)
+        for event, handler in (("console", self._on_console), ("requestfailed", self._on_request_failed),
+                               ("response", self._on_response)):
+            context.on(event, handler)
+            self._listeners.append((context, event, handler))
+        if self.trace:
+            try:
+                await context.tracing.start(screenshots=True, snapshots=True)
+                self._tracing.add(context)
+            except Exception as e:
+                # 例如注入的 context 已在录制
+                print(f"[-] 无法开始录制 trace: {e}")
+
+    async def discard(self):
+        """上传成功：停止录制且不保存"""
+        for context in list(self._tracing):
+            try:
+                await context.tracing.stop()
+            except Exception:
+                # context 已由 uploader 关闭
+                pass
+        self._detach()
+
+    def _detach(self):
+        for context, event, handler in self._listeners:
+            try:
+                context.remove_listener(event, handler)
+            except Exception:
+                pass
+        self._listeners.clear()
+        self._tracing.clear()
+
+    def login_redirected(self) -> bool:
+        """是否有页面停在平台的登录页"""
+        for context in self.contexts:
+            try:
+                pages = context.pages
+            except Exception:
+                continue
+            if any(is_login_url(self.platform, page.url) for page in pages):
+                return True
+        return False
+
+    def _summary(self, reason: str, error, pages: list) -> dict:
+        return {
+            "platform": self.platform,
+            "account": self.account,
+            "reason": reason,
+            "error": f"{type(error).__name__}: {error}" if error is not None else None,
+            "time": datetime.now().isoformat(timespec='seconds'),
+            "attempt": bound_tag("attempt", 1),
+            "pages": pages,
+            "console": [{"time": _timestamp(ts), "type": kind, "text": text} for ts, kind, text in self.console],
+            "network": [{"time": _timestamp(ts), "method": method, "url": url, "resource_type": resource_type,
+                         "failure": failure} for ts, method, url, resource_type, failure in self.network],
+        }
+
+    async def _capture_page(self, page, target: Path, index: int) -> dict:
+        info = {"index": index, "url": page.url}
+        if page.is_closed():
+            info["closed"] = True
+            return info
+        try:
+            dom = await asyncio.wait_for(page.evaluate(_DOM_SNAPSHOT_JS, self.container),
+                                         CAPTURE_TIMEOUT_MS / 1000)
+            (target / f"page{index}.html").write_text(dom[:DOM_SNAPSHOT_CHARS], encoding='utf-8')
+        except Exception as e:
+            info["dom_error"] = str(e)
+        try:
+            # 只截当前视口，整页截图在很长的创作者页面上代价很高
+            await page.screenshot(path=str(target / f"page{index}.png"), timeout=CAPTURE_TIMEOUT_MS)
+        except Exception as e:
+            info["screenshot_error"] = str(e)
+        return info
+
+    async def save(self, reason: str, error=None, pages: list = None) -> Path:
+        """写入一份现场记录并返回其目录；pages 缺省为各 context 中打开的所有页面"""
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        name = '_'.join(str(part) for part in (stamp, self.platform, self.account, reason) if part)
+        target = self.directory / name
+        target.mkdir(parents=True, exist_ok=True)
+        if pages is None:
+            pages = [page for context in self.contexts for page in context.pages]
+        page_infos = [await self._capture_page(page, target, index) for index, page in enumerate(pages)]
+        with open(target / "summary.json", 'w', encoding='utf-8') as f:
+            json.dump(self._summary(reason, error, page_infos), f, ensure_ascii=False, indent=2)
+        return target
+
+    async def record_failure(self, error):
+        """保存一次失败的现场，同一次上传只保存一次；出错时只打印，不掩盖原来的异常"""
+        if self._failure_saved:
+            return
+        self._failure_saved = True
+        reason = "deadline" if isinstance(error, (asyncio.CancelledError, asyncio.TimeoutError)) else "failed"
+        if self.account_file and self.login_redirected():
+            # 缓存的校验结果仍为有效时，下一个任务会跳过校验直接上传
+            session_validator.invalidate(self.account_file, self.platform)
+            print(f"[-] {self.platform} 上传页面跳转到了登录页，已清除 cookie 校验缓存")
+            reason = "login"
+        try:
+            target = await self.save_failure(reason, error)
+            print(f"[-] {self.platform} 上传失败，现场已保存到 {target}")
+        except Exception as e:
+            print(f"[-] 保存失败现场出错: {e}")
+
+    async def save_failure(self, reason: str, error) -> Path:
+        target = await self.save(reason, error)
+        for index, context in enumerate(self._tracing):
+            try:
+                await context.tracing.stop(path=str(target / (f"trace{index}.zip" if index else "trace.zip")))
+            except Exception as e:
+                print(f"[-] 保存 trace 失败: {e}")
+        self._detach()
+        await asyncio.to_thread(prune_diagnostics, self.directory)
+        return target
+
+
+class capture_failures(object):
+    """
+    记录其中的上传，出现异常（包括因超过任务期限被取消）时保存现场后继续抛出。
+    container 为截取 DOM 的 CSS 选择器，缺省为整个页面。
+    """
+
+    def __init__(self, platform: str, account_file=None, container: str = None):
+        config = get_diagnostics_config()
+        mode = config["trace"]
+        trace = mode == "retain-on-failure" or (mode == "on-retry" and bound_tag("attempt", 1) > 1)
+        self.recorder = DiagnosticsRecorder(platform, Path(account_file).stem if account_file else None,
+                                            container=container, trace=trace, max_events=config["max_events"])
+        self.recorder.account_file = account_file
+        self._token = None
+
+    async def __aenter__(self):
+        self._token = _current.set(self.recorder)
+        return self.recorder
+
+    async def __aexit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        if exc_type is None:
+            await self.recorder.discard()
+            return False
+        await self.recorder.record_failure(exc)
+        return False
+
+
+async def capture_failure(error):
+    """
+    在关闭页面之前保存当前上传的失败现场，之后 capture_failures 不再重复保存；
+    不在 capture_failures 中时为空操作。
+    """
+    recorder = _current.get()
+    if recorder is not None:
+        await recorder.record_failure(error)
+
+
+async def attach_diagnostics(context):
+    """把 context 登记到当前的记录中，不在 capture_failures 中时为空操作"""
+    recorder = _current.get()
+    if recorder is not None:
+        await recorder.attach(context)
+    return context
+
+
+async def capture(reason: str, error=None, page=None):
+    """在上传过程中主动保存一份现场（例如可忽略的封面上传失败），不在 capture_failures 中时为空操作"""
+    recorder = _current.get()
+    if recorder is None:
+        return None
+    try:
+        target = await recorder.save(reason, error, pages=[page] if page is not None else None)
+        await asyncio.to_thread(prune_diagnostics, recorder.directory)
+        return target
+    except Exception as e:
+        print(f"[-] 保存现场出错: {e}")
+        return None
@@ -1,6 +1,6 @@
-import os
 from datetime import datetime, timedelta, date
 from pathlib import Path
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 import pytz
 # --- 修改开始 ---
 # 移除对特定 uploader 的导入
@@ -8,7 +8,53 @@ import pytz
 # --- 修改结束 ---
 import json # 确保 json 被导入，因为 get_publish_date 需要它
 
-from conf import BASE_DIR
+from conf import BASE_DIR, get_config_section, on_config_reset
+
+DEFAULT_TIMEZONE = "Asia/Shanghai"
+_timezones = {}
+
+
+def get_timezone(name: str = None):
+    """
+    返回时区对象，name 缺省时使用 config.json 中的 timezone（默认 Asia/Shanghai）。
+    优先使用标准库 zoneinfo，系统缺少时区数据库（如未安装 tzdata 的 Windows）时回退到 pytz。
+    """
+    if name is None:
+        if None in _timezones:
+            return _timezones[None]
+        _timezones[None] = get_timezone(get_config_section("timezone") or DEFAULT_TIMEZONE)
+        return _timezones[None]
+    if name not in _timezones:
+        try:
+            _timezones[name] = ZoneInfo(name)
+        except ZoneInfoNotFoundError:
+            _timezones[name] = pytz.timezone(name)
+    return _timezones[name]
+
+
+@on_config_reset
+def _reset_timezone():
+    _timezones.pop(None, None)
+
+
+def localize(dt: datetime, tz=None) -> datetime:
+    """把不带时区的时间视为 tz（默认为配置的时区）下的时间；已带时区的时间原样返回"""
+    if dt.tzinfo is not None:
+        return dt
+    tz = tz or get_timezone()
+    if hasattr(tz, 'localize'):
+        return tz.localize(dt)
+    return dt.replace(tzinfo=tz)
+
+
+def to_browser_time(publish_date):
+    """
+    uploader 在网页中填写定时时间前调用：带时区的时间换算成本机时区的时间（浏览器按本机时区解释输入），
+    不带时区的时间和 0（立即发布）原样返回。
+    """
+    if isinstance(publish_date, datetime) and publish_date.tzinfo is not None:
+        return publish_date.astimezone().replace(tzinfo=None)
+    return publish_date
 
 
 def get_absolute_path(file_path, uploader_name):
@@ -26,37 +72,25 @@ def get_absolute_path(file_path, uploader_name):
 
 def get_title_and_hashtags(video_path: str):
     """
-    从与视频同名的 .txt 文件中读取原始的短标题（第一行）和标题/话题内容（剩余行）。
-    不进行特定平台的格式化。
+    返回视频的 (标题, 话题列表)，来自同名的 .txt / .json / .yaml，不进行特定平台的格式化。
+    没有附加文件时标题为视频文件名（不含扩展名），话题为空列表。
     """
-    txt_path = Path(video_path).with_suffix('.txt')
-    raw_short_title = "" # 返回原始短标题
-    title_and_tags = ""
-    if txt_path.exists():
-        with open(txt_path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-            if lines:
-                # --- 修改开始 ---
-                # 获取第一行作为原始短标题，移除首尾空白
-                raw_short_title = lines[0].strip()
-                # --- 修改结束 ---
-                if len(lines) > 1:
-                    # 保留换行符，只移除首尾空白
-                    title_and_tags = ''.join(lines[1:]).strip()
-                # 如果只有一行，title_and_tags 保持为空字符串或可以设为 raw_short_title
-                # else:
-                #    title_and_tags = raw_short_title # 或者保持为空，取决于业务逻辑
-            else:
-                # 如果文件为空，使用视频文件名（不含扩展名）作为默认值
-                raw_short_title = Path(video_path).stem
-                title_and_tags = Path(video_path).stem
-    else:
-        # 如果txt文件不存在，使用视频文件名（不含扩展名）作为默认值
-        raw_short_title = Path(video_path).stem
-        title_and_tags = Path(video_path).stem
+    from utils.metadata_index import get_video_metadata
+    metadata = get_video_metadata(video_path)
+    return metadata.title, metadata.tags
+
 
-    # 返回原始的短标题和内容
-    return raw_short_title, title_and_tags
+# 与视频同名的封面图，按顺序取第一个存在的
+COVER_SUFFIXES = ('.png', '.jpg', '.jpeg', '.webp')
+
+
+def find_cover(video_path):
+    """查找与视频同名的封面图，不存在时返回 None"""
+    for suffix in COVER_SUFFIXES:
+        cover = Path(video_path).with_suffix(suffix)
+        if cover.exists():
+            return cover
+    return None
 
 
 def generate_schedule_time_next_day(total_videos, videos_per_day, daily_times=None, timestamps=False, start_days=0):
@@ -71,7 +105,7 @@ def generate_schedule_time_next_day(total_videos, videos_per_day, daily_times=No
         start_days (int): Number of days to offset from tomorrow (0 means tomorrow, 1 means day after tomorrow, etc.)
     
     Returns:
-        list: List of datetime objects or timestamps for scheduled uploads
+        list: List of timezone-aware datetime objects (in the configured timezone) or timestamps
     """
     from datetime import time, datetime, timedelta
 
@@ -87,8 +121,9 @@ def generate_schedule_time_next_day(total_videos, videos_per_day, daily_times=No
     # Sort daily times to ensure chronological order
     daily_times.sort()
     
-    # Calculate start date (tomorrow + offset days)
-    start_date = datetime.now().date() + timedelta(days=1 + start_days)
+    # Calculate start date (tomorrow + offset days) in the configured timezone
+    tz = get_timezone()
+    start_date = datetime.now(tz).date() + timedelta(days=1 + start_days)
     
     # Calculate how many days we need based on total videos and videos per day
     total_days = (total_videos + videos_per_day - 1) // videos_per_day
@@ -103,7 +138,7 @@ def generate_schedule_time_next_day(total_videos, videos_per_day, daily_times=No
         day_times = daily_times[:videos_per_day]
         for hour in day_times:
             if videos_scheduled < total_videos:
-                schedule_time = datetime.combine(current_date, time(hour=hour))
+                schedule_time = localize(datetime.combine(current_date, time(hour=hour)), tz)
                 schedule.append(schedule_time)
                 videos_scheduled += 1
         current_date += timedelta(days=1)
@@ -141,8 +176,12 @@ def generate_schedule_times(start_date_str: str, daily_times: list[str], num_vid
         num_videos: 需要安排发布的视频总数。
 
     Returns:
-        一个包含 datetime 对象的列表，表示每个视频的预定发布时间。
+        一个包含 datetime 对象的列表，表示每个视频的预定发布时间，时区为 config.json 中的 timezone。
     """
+    return [localize(dt) for dt in _generate_schedule_times(start_date_str, daily_times, num_videos)]
+
+
+def _generate_schedule_times(start_date_str: str, daily_times: list, num_videos: int) -> list:
     schedule_times = []
     try:
         current_date = datetime.strptime(start_date_str, "%Y-%m-%d").date()
@@ -152,7 +191,7 @@ def generate_schedule_times(start_date_str: str, daily_times: list[str], num_vid
 
     if not daily_times:
         print("错误：config.json 中的 publish_times 为空。无法生成时间表。")
-        now = datetime.now()
+        now = datetime.now().astimezone()
         return [now + timedelta(hours=i) for i in range(num_videos)]
 
     time_index = 0
@@ -184,9 +223,9 @@ def generate_schedule_times(start_date_str: str, daily_times: list[str], num_vid
 
 
 def parse_schedule(schedule_str: str) -> datetime:
-    """解析 YYYY-MM-DD HH:MM 格式的日期时间字符串"""
+    """解析 YYYY-MM-DD HH:MM 格式的日期时间字符串，按配置的时区返回带时区的时间"""
     try:
-        return datetime.strptime(schedule_str, '%Y-%m-%d %H:%M')
+        return localize(datetime.strptime(schedule_str, '%Y-%m-%d %H:%M'))
     except (ValueError, TypeError):
         print(f"错误：无法解析计划时间字符串 '{schedule_str}'。应为 'YYYY-MM-DD HH:MM' 格式。")
         return None # 或者返回当前时间 datetime.now()，或抛出异常
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+创作者页面的请求拦截。
+
+各平台的创作者中心会加载埋点上报、推荐流、字体和大图，uploader 并不需要它们。
+每个平台一个拦截配置（InterceptionProfile）：
+
+- deny_urls: 要拦截的 URL（Playwright 的 glob 写法，** 匹配任意字符，* 不跨 /，{a,b} 表示其一）；
+- deny_types: 要拦截的资源类型（font、image、media 等）；
+- allow_urls: 白名单，优先于以上两项，用于上传、验证码等必须放行的请求。
+
+默认配置只拦截各平台的埋点上报和字体文件；推荐流、大图等与页面改版相关的请求可在 config.json 中按平台追加。
+
+deny_urls 合并成一个正则注册到 context.route，由浏览器进程匹配，未命中的请求不经过 Python；
+只有配置了 deny_types 时才需要拦截所有请求再按类型判断，每个请求多一次往返，默认配置中不使用。
+
+被拦截的请求数和其中上行的字节数（埋点上报的请求体）按平台累计，见 get_interception_stats()；
+被拦截的响应没有下载，其大小无法得知，不计入。
+
+持久化配置目录（utils.profile_manager）的 context 不安装拦截：context.route() 会让 Playwright 关闭 HTTP 缓存，
+而配置目录正是为了复用缓存；这类 context 上的埋点和字体照常加载，但大多直接命中缓存。
+
+默认开启，可用环境变量 SAU_INTERCEPT=0、config.json 中的 "interception": {"enabled": false}
+或 set_interception_enabled(False) 关闭；config.json 中 "interception": {"profiles": {平台: {...}}}
+的各项会追加到默认配置中。
+"""
+import argparse
+import os
+import re
+
+from conf import get_config_section, on_config_reset
+from utils.base_social_media import SOCIAL_MEDIA_DOUYIN, SOCIAL_MEDIA_TENCENT, SOCIAL_MEDIA_TIKTOK, \
+    SOCIAL_MEDIA_KUAISHOU, SOCIAL_MEDIA_BAIJIAHAO
+
+# 所有平台共用
+COMMON_DENY_URLS = (
+    "**/*.{woff,woff2,ttf,otf,eot}",
+    "**/www.google-analytics.com/**",
+    "**/www.googletagmanager.com/**",
+    "**/*.doubleclick.net/**",
+)
+COMMON_ALLOW_URLS = (
+    "**/*captcha*",
+    "**/*captcha*/**",
+    "**/*verify*/**",
+    "**/*upload*/**",
+)
+
+DEFAULT_PROFILES = {
+    SOCIAL_MEDIA_DOUYIN: {
+        "deny_urls": ["**/mcs.zijieapi.com/**", "**/mon.zijieapi.com/**", "**/mon.snssdk.com/**",
+                      "**/log.snssdk.com/**", "**/*.ibytedapm.com/**"],
+    },
+    SOCIAL_MEDIA_TENCENT: {
+        "deny_urls": ["**/aegis.qq.com/**", "**/*.beacon.qq.com/**", "**/report.url.cn/**",
+                      "**/mp.weixin.qq.com/mp/jsmonitor**"],
+    },
+    SOCIAL_MEDIA_KUAISHOU: {
+        "deny_urls": ["**/log-sdk.ksapisrv.com/**", "**/*.kuaishou.com/rest/wd/common/log/**",
+                      "**/*.kuaishou.com/rest/n/log/**"],
+    },
+    SOCIAL_MEDIA_TIKTOK: {
+        "deny_urls": ["**/mcs*.tiktokv.com/**", "**/mon*.tiktokv.com/**", "**/mon*.byteoversea.com/**",
+                      "**/analytics.tiktok.com/**", "**/*.tiktokw.us/**"],
+    },
+    SOCIAL_MEDIA_BAIJIAHAO: {
+        "deny_urls": ["**/hm.baidu.com/**", "**/hmma.baidu.com/**", "**/nsclick.baidu.com/**",
+                      "**/eclick.baidu.com/**"],
+    },
+}
+
+_enabled = None
+_stats = {}
+
+
+def _load_config() -> dict:
+    return get_config_section("interception", {})
+
+
+def is_interception_enabled() -> bool:
+    global _enabled
+    if _enabled is None:
+        env = os.environ.get("SAU_INTERCEPT")
+        if env is not None:
+            _enabled = env.lower() in ("1", "true", "yes")
+        else:
+            _enabled = bool(_load_config().get("enabled", True))
+    return _enabled
+
+
+@on_config_reset
+def set_interception_enabled(enabled: bool = None):
+    """enabled 为 None 时恢复为按配置决定"""
+    global _enabled
+    _enabled = enabled
+
+
+def glob_to_regex(glob: str) -> str:
+    """与 Playwright 的 URL glob 一致：** 匹配任意字符，* 匹配 / 以外的字符，{a,b} 匹配其一"""
+    parts = []
+    in_group = False
+    index = 0
+    while index < len(glob):
+        char = glob[index]
+        if char == '*':
+            if glob[index:index + 2] == '**':
+                parts.append('.*')
+                index += 2
+                continue
+            parts.append('[^/]*')
+        elif char == '{':
+            in_group = True
+            parts.append('(?:')
+        elif char == '}' and in_group:
+            in_group = False
+            parts.append(')')
+        elif char == ',' and in_group:
+            parts.append('|')
+        else:
+            parts.append(re.escape(char))
+        index += 1
+    return ''.join(parts)
+
+
+def _compile(globs) -> re.Pattern:
+    if not globs:
+        return None
+    # 带上首尾锚点，浏览器进程中按 search 匹配时与 fullmatch 一致
+    return re.compile('^(?:' + '|'.join(glob_to_regex(glob) for glob in globs) + ')$')
+
+
+class InterceptionStats(object):
+    def __init__(self):
+        self.requests = 0
+        self.upload_bytes = 0
+        self.by_type = {}
+
+    def record(self, request):
+        self.requests += 1
+        body = request.post_data_buffer
+        if body:
+            self.upload_bytes += len(body)
+        self.by_type[request.resource_type] = self.by_type.get(request.resource_type, 0) + 1
+
+    def __repr__(self):
+        return f"拦截 {self.requests} 个请求，上行 {self.upload_bytes / 1024:.1f} KB {self.by_type}"
+
+
+class InterceptionProfile(object):
+    def __init__(self, deny_urls=(), deny_types=(), allow_urls=()):
+        self.deny_urls = list(deny_urls)
+        self.deny_types = frozenset(deny_types)
+        self.allow_urls = list(allow_urls)
+        self._deny = _compile(self.deny_urls)
+        self._allow = _compile(self.allow_urls)
+
+    @property
+    def empty(self) -> bool:
+        return self._deny is None and not self.deny_types
+
+    def blocks(self, url: str, resource_type: str) -> bool:
+        if self._allow is not None and self._allow.fullmatch(url):
+            return False
+        return resource_type in self.deny_types or (self._deny is not None and self._deny.fullmatch(url) is not None)
+
+    def route_pattern(self):
+        """注册到 context.route 的匹配规则：有 deny_types 时必须拦截所有请求"""
+        return "**/*" if self.deny_types else self._deny
+
+
+def get_profile(platform: str) -> InterceptionProfile:
+    """默认配置加上 config.json 中该平台的配置"""
+    merged = {"deny_urls": list(COMMON_DENY_URLS), "deny_types": [], "allow_urls": list(COMMON_ALLOW_URLS)}
+    for source in (DEFAULT_PROFILES.get(platform, {}), (_load_config().get("profiles") or {}).get(platform, {})):
+        for key, values in source.items():
+            merged[key] = merged[key] + list(values)
+    return InterceptionProfile(**merged)
+
+
+def get_interception_stats() -> dict:
+    """{平台: InterceptionStats}，本进程内累计"""
+    return dict(_stats)
+
+
+async def intercept_requests(context, platform: str, profile: InterceptionProfile = None):
+    """
+    按平台配置拦截 context 中的请求，未开启时原样返回。同一个 context 只安装一次::
+
+        context = await set_init_script(context)
+        context = await intercept_requests(context, SOCIAL_MEDIA_DOUYIN)
+    """
+    if not is_interception_enabled() or getattr(context, "_sau_intercepted", False) \
+            or getattr(context, "_sau_profile", False):
+        return context
+    profile = profile or get_profile(platform)
+    if profile.empty:
+        return context
+    stats = _stats.setdefault(platform, InterceptionStats())
+
+    async def handle(route):
+        request = route.request
+        if profile.blocks(request.url, request.resource_type):
+            stats.record(request)
+            await route.abort("blockedbyclient")
+        else:
+            await route.fallback()
+
+    await context.route(profile.route_pattern(), handle)
+    context._sau_intercepted = True
+    return context
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check whether a URL would be blocked for a platform.")
+    parser.add_argument("platform", choices=sorted(DEFAULT_PROFILES))
+    parser.add_argument("url", nargs='+')
+    parser.add_argument("--type", default="script", help="resource type of the request")
+    args = parser.parse_args()
+    profile = get_profile(args.platform)
+    for url in args.url:
+        print(f"{'[-] 拦截' if profile.blocks(url, args.type) else '[+] 放行'} {url}")
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+批量上传任务的持久化队列（SQLite WAL）。
+
+每个 (file, platform, account) 对应一条任务记录，状态流转::
+
+    pending -> uploading -> published / uploaded（已提交，等待平台定时发布）
+                         -> failed（attempts 未达上限时下次运行会重试）
+    pending -> skipped（例如同一账号已上传过相同内容）
+
+start() 会记录执行任务的主机名和 pid；进程崩溃时停留在 uploading 的任务会在下次打开时恢复为 pending，
+仍在其他存活进程中上传的任务保持不变。
+"""
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from conf import BASE_DIR
+
+JOB_STORE_FILE = Path(BASE_DIR / "db" / "jobs.db")
+MAX_ATTEMPTS = 3
+
+STATE_PENDING = "pending"
+STATE_UPLOADING = "uploading"
+STATE_UPLOADED = "uploaded"
+STATE_PUBLISHED = "published"
+STATE_FAILED = "failed"
+STATE_SKIPPED = "skipped"
+DONE_STATES = (STATE_UPLOADED, STATE_PUBLISHED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    file TEXT NOT NULL,
+    platform TEXT NOT NULL,
+    account TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    publish_time TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    owner_host TEXT,
+    owner_pid INTEGER,
+    UNIQUE (file, platform, account)
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs (platform, account, state);
+CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs (state);
+"""
+# 旧版本数据库缺少的列
+_MIGRATIONS = (
+    ("owner_host", "ALTER TABLE jobs ADD COLUMN owner_host TEXT"),
+    ("owner_pid", "ALTER TABLE jobs ADD COLUMN owner_pid INTEGER"),
+)
+HOSTNAME = socket.gethostname()
+
+
+def file_key(file) -> str:
+    return os.path.abspath(file)
+
+
+def _pid_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    if sys.platform == "win32":
+        import ctypes
+        # PROCESS_QUERY_LIMITED_INFORMATION；STILL_ACTIVE = 259
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)
+        if not handle:
+            # 拒绝访问说明进程存在
+            return ctypes.windll.kernel32.GetLastError() == 5
+        try:
+            code = ctypes.c_ulong()
+            ctypes.windll.kernel32.GetExitCodeProcess(handle, ctypes.byref(code))
+            return code.value == 259
+        finally:
+            ctypes.windll.kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+def _format_time(publish_time):
+    if not publish_time:
+        return None
+    if isinstance(publish_time, datetime):
+        return publish_time.strftime('%Y-%m-%d %H:%M')
+    return str(publish_time)
+
+
+class JobStore(object):
+    """
+    用法::
+
+        store = JobStore()
+        for job in store.resume(files, "douyin", account):
+            store.start(job['id'])
+            try:
+                ...
+                store.finish(job['id'], scheduled=bool(publish_time))
+            except Exception as e:
+                store.fail(job['id'], e)
+    """
+
+    def __init__(self, path=JOB_STORE_FILE, max_attempts: int = MAX_ATTEMPTS):
+        self.path = Path(path)
+        self.max_attempts = max_attempts
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        columns = {row['name'] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, sql in _MIGRATIONS:
+            if column not in columns:
+                self._conn.execute(sql)
+        self.recover()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _execute(self, sql: str, params=()) -> int:
+        with self._lock:
+            return self._conn.execute(sql, params).rowcount
+
+    def _query(self, sql: str, params=()) -> list:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def recover(self) -> int:
+        """
+        把上次崩溃时停留在 uploading 的任务恢复为 pending。
+        只恢复本机上 owner 进程已退出（或未记录 owner）的任务，其他主机上的任务无法判断存活，保持不变。
+        """
+        rows = self._query("SELECT id, owner_host, owner_pid FROM jobs WHERE state = ?", (STATE_UPLOADING,))
+        dead = [row['id'] for row in rows
+                if row['owner_pid'] is None
+                or (row['owner_host'] == HOSTNAME and not _pid_alive(row['owner_pid']))]
+        if not dead:
+            return 0
+        now = time.time()
+        # 带上 state 条件，避免覆盖检查之后被其他进程改掉的状态
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                before = self._conn.total_changes
+                self._conn.executemany("UPDATE jobs SET state = ?, owner_host = NULL, owner_pid = NULL, updated_at = ? "
+                                       "WHERE id = ? AND state = ?",
+                                       [(STATE_PENDING, now, job_id, STATE_UPLOADING) for job_id in dead])
+                recovered = self._conn.total_changes - before
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return recovered
+
+    def enqueue(self, file, platform: str, account: str, publish_time=None) -> int:
+        """添加任务，已存在时保持原状态不变，返回任务 id"""
+        self.enqueue_many([(file, platform, account, publish_time)])
+        return self.get(file, platform, account)['id']
+
+    def enqueue_many(self, jobs) -> int:
+        """批量添加 (file, platform, account, publish_time) 任务，在一个事务中完成"""
+        now = time.time()
+        rows = [(file_key(file), platform, account, _format_time(publish_time), now, now)
+                for file, platform, account, publish_time in jobs]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                before = self._conn.total_changes
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO jobs (file, platform, account, publish_time, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", rows)
+                added = self._conn.total_changes - before
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return added
+
+    def get(self, file, platform: str, account: str):
+        rows = self._query("SELECT * FROM jobs WHERE file = ? AND platform = ? AND account = ?",
+                           (file_key(file), platform, account))
+        return rows[0] if rows else None
+
+    def runnable(self, platform: str = None, account: str = None, limit: int = None) -> list:
+        """待执行的任务：pending，以及 attempts 未达上限的 failed"""
+        sql = "SELECT * FROM jobs WHERE (state = ? OR (state = ? AND attempts < ?))"
+        params = [STATE_PENDING, STATE_FAILED, self.max_attempts]
+        if platform is not None:
+            sql += " AND platform = ?"
+            params.append(platform)
+        if account is not None:
+            sql += " AND account = ?"
+            params.append(account)
+        sql += " ORDER BY id"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return self._query(sql, params)
+
+    def resume(self, files, platform: str, account: str) -> list:
+        """登记 files 中的新文件，并返回该账号下尚未完成的任务（按 files 的顺序）"""
+        files = [file_key(file) for file in files]
+        self.enqueue_many((file, platform, account, None) for file in files)
+        order = {file: index for index, file in enumerate(files)}
+        jobs = [job for job in self.runnable(platform, account) if job['file'] in order]
+        return sorted(jobs, key=lambda job: order[job['file']])
+
+    def _set_state(self, job_id: int, state: str, error: str = None):
+        # attempts 只在 start() 中增加
+        self._execute("UPDATE jobs SET state = ?, error = ?, updated_at = ? WHERE id = ?",
+                      (state, error, time.time(), job_id))
+
+    def start(self, job_id: int) -> int:
+        """标记为 uploading 并记录当前进程为 owner，返回这是第几次尝试"""
+        self._execute("UPDATE jobs SET state = ?, error = NULL, attempts = attempts + 1, owner_host = ?, owner_pid = ?, "
+                      "updated_at = ? WHERE id = ?",
+                      (STATE_UPLOADING, HOSTNAME, os.getpid(), time.time(), job_id))
+        rows = self._query("SELECT attempts FROM jobs WHERE id = ?", (job_id,))
+        return rows[0]['attempts'] if rows else 1
+
+    def finish(self, job_id: int, scheduled: bool = False):
+        """scheduled 为 True 表示已提交定时发布，记为 uploaded，否则记为 published"""
+        self._set_state(job_id, STATE_UPLOADED if scheduled else STATE_PUBLISHED)
+
+    def fail(self, job_id: int, error):
+        self._set_state(job_id, STATE_FAILED, error=str(error))
+
+    def skip(self, job_id: int, reason: str = None):
+        self._set_state(job_id, STATE_SKIPPED, error=reason)
+
+    def reset(self, platform: str = None, account: str = None) -> int:
+        """将失败的任务重新置为 pending 并清零重试次数"""
+        sql = "UPDATE jobs SET state = ?, attempts = 0, error = NULL, updated_at = ? WHERE state = ?"
+        params = [STATE_PENDING, time.time(), STATE_FAILED]
+        if platform is not None:
+            sql += " AND platform = ?"
+            params.append(platform)
+        if account is not None:
+            sql += " AND account = ?"
+            params.append(account)
+        return self._execute(sql, params)
+
+    def counts(self, platform: str = None) -> dict:
+        if platform is None:
+            rows = self._query("SELECT state, COUNT(*) FROM jobs GROUP BY state")
+        else:
+            rows = self._query("SELECT state, COUNT(*) FROM jobs WHERE platform = ? GROUP BY state", (platform,))
+        return {state: count for state, count in rows}
@@ -1,9 +1,35 @@
+"""
+日志。
+
+- 所有业务 logger 共用一个文件 sink（BusinessLogRouter）；它和控制台输出都只把记录放入进程内队列，
+  写文件、轮转、JSON 序列化都在一个后台线程中完成，不占用驱动 Playwright 的事件循环
+  （loguru 的 enqueue=True 会为多进程 pickle 每条记录，开销反而比同步写入更大）；
+- 每条业务日志同时写入对应平台的文本日志和 logs/jobs.jsonl（JSON 行，带 job_id、platform、account 等上下文）；
+- backtrace / diagnose 只作用于带异常的记录（logger.exception），普通日志不会渲染变量值；
+- log_context() 为其中产生的所有日志附加字段，调度器用它标记每个任务。
+"""
+import json
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
 from pathlib import Path
 from sys import stdout
 from loguru import logger
 
 from conf import BASE_DIR
 
+JSON_LOG_FILE = 'logs/jobs.jsonl'
+ROTATION_BYTES = 10 * 1024 * 1024
+RETENTION_DAYS = 10
+# 文本日志行首显示的上下文字段
+CONTEXT_FIELDS = ('job_id', 'platform', 'account')
+# 固定的格式字符串只解析一次（函数形式的 format 每条记录都要重新解析），时间、级别等在写线程中补上
+FILE_FORMAT = "{message}"
+# 后台线程每批最多处理的记录数
+WRITE_BATCH = 1000
+
 
 def log_formatter(record: dict) -> str:
     """
@@ -23,6 +49,180 @@ def log_formatter(record: dict) -> str:
     return f"<fg #70acde>{{time:YYYY-MM-DD HH:mm:ss}}</fg #70acde> | <fg {color}>{{level}}</fg {color}>: <light-white>{{message}}</light-white>\n"
 
 
+def _text_line(text: str, record: dict) -> str:
+    """text 为 loguru 按 FILE_FORMAT 渲染的消息（带异常时已附上 traceback），在写线程中补上行首"""
+    values = [str(record["extra"][field]) for field in CONTEXT_FIELDS if record["extra"].get(field) is not None]
+    prefix = f"[{' '.join(values)}] " if values else ""
+    return f"{record['time']:%Y-%m-%d %H:%M:%S}.{record['time'].microsecond // 1000:03d} | " \
+           f"{record['level'].name: <8} | {prefix}{text}"
+
+
+def _json_record(record: dict) -> dict:
+    data = {
+        "time": record["time"].isoformat(),
+        "level": record["level"].name,
+        "logger": record["extra"].get("business_name"),
+        "message": record["message"],
+    }
+    data.update((key, value) for key, value in record["extra"].items() if key != "business_name")
+    if record["exception"] is not None and record["exception"].type is not None:
+        data["exception"] = f"{record['exception'].type.__name__}: {record['exception'].value}"
+    return data
+
+
+class _BackgroundWriter(object):
+    """
+    一个后台线程执行所有日志输出，调用方只做一次 SimpleQueue.put。
+    线程每次取出队列中积压的记录，交给同一个目标的记录合并成一批处理，文件只写一次。
+    """
+
+    def __init__(self):
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, func, payload=None):
+        """func 在后台线程中以 [payload, ...] 调用"""
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                    self._thread.start()
+        self._queue.put((func, payload))
+
+    def _drain(self) -> list:
+        items = [self._queue.get()]
+        while items[-1] is not None and len(items) < WRITE_BATCH:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self):
+        while True:
+            items = self._drain()
+            batches = {}
+            for item in items:
+                if item is not None:
+                    batches.setdefault(item[0], []).append(item[1])
+            for func, payloads in batches.items():
+                try:
+                    func(payloads)
+                except Exception as e:
+                    print(f"日志写入失败: {e!r}", file=sys.stderr)
+            if items[-1] is None:
+                return
+
+    def stop(self):
+        """写完队列中的记录后结束线程，之后再 submit 会重新启动"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout=10)
+
+
+_writer = _BackgroundWriter()
+
+
+class QueuedStream(object):
+    """把写入交给后台线程的流，用作 loguru 的控制台 sink"""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def _write(self, texts: list):
+        self.stream.write(''.join(texts))
+        self.stream.flush()
+
+    def write(self, message):
+        _writer.submit(self._write, str(message))
+
+    def stop(self):
+        _writer.stop()
+
+
+class _RotatingFile(object):
+    """按大小轮转的追加写文件，只在后台写线程中使用"""
+
+    def __init__(self, path: Path, max_bytes: int = ROTATION_BYTES, retention_days: float = RETENTION_DAYS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.retention_days = retention_days
+        self._file = None
+        self._size = 0
+
+    def write(self, text: str):
+        data = text.encode('utf-8')
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, 'ab')
+            self._size = self._file.tell()
+        if self._size and self._size + len(data) > self.max_bytes:
+            self._rotate()
+        self._file.write(data)
+        self._file.flush()
+        self._size += len(data)
+
+    def _rotate(self):
+        self._file.close()
+        stamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S_%f')
+        self.path.rename(self.path.with_name(f"{self.path.stem}.{stamp}{self.path.suffix}"))
+        expired = time.time() - self.retention_days * 86400
+        for old in self.path.parent.glob(f"{self.path.stem}.*{self.path.suffix}"):
+            if old.stat().st_mtime < expired:
+                old.unlink(missing_ok=True)
+        self._file = open(self.path, 'ab')
+        self._size = 0
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class BusinessLogRouter(object):
+    """按 business_name 把日志写入各自的文件，并追加一行 JSON 到 JSON_LOG_FILE"""
+
+    def __init__(self, base_dir=BASE_DIR):
+        self.base_dir = Path(base_dir)
+        self.paths = {}
+        self._files = {}
+        self._json = _RotatingFile(self.base_dir / JSON_LOG_FILE)
+
+    def _file(self, path: str) -> _RotatingFile:
+        if path not in self._files:
+            self._files[path] = _RotatingFile(self.base_dir / path)
+        return self._files[path]
+
+    def _write(self, payloads: list):
+        grouped = {}
+        for text, record in payloads:
+            path = self.paths.get(record["extra"].get("business_name"))
+            if path is not None:
+                grouped.setdefault(path, []).append(_text_line(text, record))
+        for path, texts in grouped.items():
+            self._file(path).write(''.join(texts))
+        self._json.write(''.join(json.dumps(_json_record(record), ensure_ascii=False, default=str) + "\n"
+                                 for _, record in payloads))
+
+    def _close(self, _):
+        for file in list(self._files.values()) + [self._json]:
+            file.close()
+
+    def write(self, message):
+        _writer.submit(self._write, (str(message), message.record))
+
+    def stop(self):
+        # logger.remove()（包括退出时）由 loguru 调用：写完队列中的记录后关闭文件
+        _writer.submit(self._close)
+        _writer.stop()
+
+
+_router = None
+
+
 def create_logger(log_name: str, file_path: str):
     """
     Create custom logger for different business modules.
@@ -30,23 +230,52 @@ def create_logger(log_name: str, file_path: str):
     :param str file_path: Optional path to log file
     :returns: Configured logger
     """
-    def filter_record(record):
-        return record["extra"].get("business_name") == log_name
-
-    Path(BASE_DIR / file_path).parent.mkdir(exist_ok=True)
-    logger.add(Path(BASE_DIR / file_path), filter=filter_record, level="INFO", rotation="10 MB", retention="10 days", backtrace=True, diagnose=True)
+    global _router
+    if _router is None:
+        _router = BusinessLogRouter()
+        # 只有一个文件 handler，每条记录只经过一次过滤
+        logger.add(_router, filter=lambda record: "business_name" in record["extra"], level="INFO",
+                   format=FILE_FORMAT, backtrace=True, diagnose=True, catch=True)
+    _router.paths[log_name] = file_path
     return logger.bind(business_name=log_name)
 
 
+def log_context(**fields):
+    """
+    为其中（包括其中创建的任务）产生的日志附加字段，基于 contextvars，并发任务互不影响::
+
+        with log_context(job_id=12, platform="douyin", account="xiaoA"):
+            ...
+    """
+    return logger.contextualize(**fields)
+
+
 # Remove all existing handlers
 logger.remove()
-# Add a standard console handler
-logger.add(stdout, colorize=True, format=log_formatter)
-
-douyin_logger = create_logger('douyin', 'logs/douyin.log')
-tencent_logger = create_logger('tencent', 'logs/tencent.log')
-xhs_logger = create_logger('xhs', 'logs/xhs.log')
-tiktok_logger = create_logger('tiktok', 'logs/tiktok.log')
-bilibili_logger = create_logger('bilibili', 'logs/bilibili.log')
-kuaishou_logger = create_logger('kuaishou', 'logs/kuaishou.log')
-baijiahao_logger = create_logger('baijiahao', 'logs/baijiahao.log')
+# Add a standard console handler, written from the background writer thread
+logger.add(QueuedStream(stdout), colorize=True, format=log_formatter)
+
+# 模块属性名 -> (log_name, 日志文件)，在第一次取用 logger 时登记
+BUSINESS_LOGGERS = {
+    'douyin_logger': ('douyin', 'logs/douyin.log'),
+    'tencent_logger': ('tencent', 'logs/tencent.log'),
+    'xhs_logger': ('xhs', 'logs/xhs.log'),
+    'tiktok_logger': ('tiktok', 'logs/tiktok.log'),
+    'bilibili_logger': ('bilibili', 'logs/bilibili.log'),
+    'kuaishou_logger': ('kuaishou', 'logs/kuaishou.log'),
+    'baijiahao_logger': ('baijiahao', 'logs/baijiahao.log'),
+}
+
+
+def get_logger(name: str):
+    """按属性名获取业务 logger，例如 get_logger('douyin_logger')"""
+    if name not in globals():
+        globals()[name] = create_logger(*BUSINESS_LOGGERS[name])
+    return globals()[name]
+
+
+def __getattr__(name: str):
+    # `from utils.log import douyin_logger` 会走到这里
+    if name in BUSINESS_LOGGERS:
+        return get_logger(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+视频目录的元数据索引。
+
+用 os.scandir 一次列出目录，把视频与同名的 .txt、封面图、.json / .yaml 附加文件配对，
+解析成结构化的 VideoMetadata（标题、描述、话题列表、封面）。解析结果按目录存入 SQLite，
+再次扫描时只重新解析视频或附加文件的 mtime / 大小发生变化的条目。
+
+.txt 格式沿用原先的约定：第一行为标题，其余行为描述和话题（#话题1 #话题2）。
+.json / .yaml 可以包含 title、description、tags（列表或逗号分隔），其中的字段优先于 .txt，
+其余字段保存在 extra 中。未安装 PyYAML 时忽略 .yaml。
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+from pathlib import Path
+
+from conf import BASE_DIR
+from utils.files_times import COVER_SUFFIXES
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+METADATA_DB_FILE = Path(BASE_DIR / "db" / "metadata.db")
+VIDEO_SUFFIXES = ('.mp4', '.mov', '.m4v', '.webm', '.flv', '.mkv')
+SIDECAR_SUFFIXES = ('.txt', '.json', '.yaml', '.yml')
+
+HASHTAG_PATTERN = re.compile(r'#([^\s#]+)')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    folder TEXT NOT NULL,
+    name TEXT NOT NULL,
+    signature TEXT NOT NULL,
+    record TEXT NOT NULL,
+    PRIMARY KEY (folder, name)
+);
+"""
+
+
+class VideoMetadata(object):
+    def __init__(self, video, title: str, description: str = "", tags: list = None, cover=None, extra: dict = None):
+        # 路径以字符串保存，扫描大目录时避免为每个条目构造 Path
+        self._video = str(video)
+        self._cover = str(cover) if cover else None
+        self.title = title
+        self.description = description
+        self.tags = list(tags or [])
+        self.extra = extra or {}
+
+    @property
+    def video(self) -> Path:
+        return Path(self._video)
+
+    @property
+    def cover(self):
+        return Path(self._cover) if self._cover else None
+
+    @property
+    def caption(self) -> str:
+        """描述 + 话题，供需要整段文字的平台（视频号）直接填写"""
+        return format_caption(self.description, self.tags)
+
+    def to_dict(self) -> dict:
+        return {"title": self.title, "description": self.description, "tags": self.tags,
+                "cover": os.path.basename(self._cover) if self._cover else None, "extra": self.extra}
+
+    @classmethod
+    def from_dict(cls, video: str, data: dict):
+        cover = os.path.join(os.path.dirname(video), data["cover"]) if data.get("cover") else None
+        return cls(video, data["title"], data["description"], data["tags"], cover, data.get("extra"))
+
+    def __repr__(self):
+        return f"VideoMetadata({os.path.basename(self._video)}, {self.title!r}, {self.tags})"
+
+
+def format_tags(tags) -> str:
+    return ' '.join('#' + tag for tag in tags)
+
+
+def format_caption(description: str, tags) -> str:
+    """描述在前、话题在后，各占一段"""
+    return '\n'.join(part for part in (description, format_tags(tags)) if part)
+
+
+def parse_hashtags(text: str) -> list:
+    """按出现顺序提取不重复的 #话题"""
+    tags = []
+    for tag in HASHTAG_PATTERN.findall(text):
+        if tag not in tags:
+            tags.append(tag)
+    return tags
+
+
+def _parse_txt(path: Path):
+    """返回 (标题, 描述, 话题列表)，文件为空时标题为 None"""
+    lines = path.read_text(encoding='utf-8').splitlines()
+    if not lines:
+        return None, "", []
+    body = '\n'.join(lines[1:])
+    description = '\n'.join(line.strip() for line in HASHTAG_PATTERN.sub('', body).splitlines() if line.strip())
+    return lines[0].strip(), description, parse_hashtags(body)
+
+
+def _load_sidecar(path: Path) -> dict:
+    if path.suffix == '.json':
+        return json.loads(path.read_text(encoding='utf-8')) or {}
+    if yaml is None:
+        return {}
+    return yaml.safe_load(path.read_text(encoding='utf-8')) or {}
+
+
+_SIDECAR_ERRORS = (OSError, ValueError) + ((yaml.YAMLError,) if yaml is not None else ())
+
+
+def parse_video(video: Path, sidecars: dict, cover) -> VideoMetadata:
+    """sidecars: {后缀: 路径}；无法读取或解析的附加文件（例如不是 UTF-8）被忽略，不影响同目录的其他视频"""
+    title, description, tags = None, "", []
+    if '.txt' in sidecars:
+        try:
+            title, description, tags = _parse_txt(sidecars['.txt'])
+        except _SIDECAR_ERRORS as e:
+            print(f"[-] 忽略无法解析的 {sidecars['.txt']}: {e}")
+    extra = {}
+    for suffix in ('.json', '.yaml', '.yml'):
+        if suffix in sidecars:
+            try:
+                extra.update(_load_sidecar(sidecars[suffix]))
+            except _SIDECAR_ERRORS as e:
+                print(f"[-] 忽略无法解析的 {sidecars[suffix]}: {e}")
+    title = extra.pop("title", None) or title or video.stem
+    description = extra.pop("description", description)
+    sidecar_tags = extra.pop("tags", None)
+    if sidecar_tags is not None:
+        if isinstance(sidecar_tags, str):
+            sidecar_tags = sidecar_tags.split(',')
+        tags = [str(tag).strip().lstrip('#') for tag in sidecar_tags if str(tag).strip()]
+    if extra.get("cover"):
+        cover = video.with_name(extra.pop("cover"))
+    return VideoMetadata(video, title, description, tags, cover, extra)
+
+
+def _signature(group) -> str:
+    """[(文件名, mtime_ns, 大小)]"""
+    return '|'.join(f"{name}:{mtime}:{size}" for name, mtime, size in group)
+
+
+class MetadataIndex(object):
+    """
+    用法::
+
+        index = MetadataIndex()
+        for video, metadata in index.scan("videos").items():
+            print(metadata.title, metadata.tags)
+    """
+
+    def __init__(self, path=METADATA_DB_FILE):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._recent = {}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def scan(self, folder) -> dict:
+        """扫描目录，返回 {视频绝对路径: VideoMetadata}，按文件名排序"""
+        folder = os.path.abspath(folder)
+        groups = {}
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                stem, suffix = os.path.splitext(entry.name)
+                suffix = suffix.lower()
+                if suffix in VIDEO_SUFFIXES or suffix in SIDECAR_SUFFIXES or suffix in COVER_SUFFIXES:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        groups.setdefault(stem, {})[suffix] = (entry.name, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            stored = {name: (signature, record) for name, signature, record in self._conn.execute(
+                "SELECT name, signature, record FROM videos WHERE folder = ?", (folder,))}
+
+        results, names, changed, seen = {}, {}, [], set()
+        for stem, files in sorted(groups.items()):
+            for suffix in VIDEO_SUFFIXES:
+                if suffix not in files:
+                    continue
+                name = files[suffix][0]
+                video = os.path.join(folder, name)
+                seen.add(name)
+                related = sorted((key, value) for key, value in files.items() if key not in VIDEO_SUFFIXES)
+                # 视频与所有附加文件的 (文件名, mtime, 大小)，任一变化都会重新解析
+                group = [files[suffix]] + [value for _, value in related]
+                signature = _signature(group)
+                names[video] = ([value[0] for value in group], signature)
+                if name in stored and stored[name][0] == signature:
+                    results[video] = VideoMetadata.from_dict(video, json.loads(stored[name][1]))
+                    continue
+                related = dict(related)
+                sidecars = {key: Path(folder) / value[0] for key, value in related.items() if key in SIDECAR_SUFFIXES}
+                cover = next((Path(folder) / related[key][0] for key in COVER_SUFFIXES if key in related), None)
+                metadata = parse_video(Path(video), sidecars, cover)
+                results[video] = metadata
+                changed.append((folder, name, signature, json.dumps(metadata.to_dict(), ensure_ascii=False)))
+
+        removed = [(folder, name) for name in stored if name not in seen]
+        if changed or removed:
+            with self._lock:
+                self._conn.execute("BEGIN")
+                self._conn.executemany("INSERT OR REPLACE INTO videos (folder, name, signature, record) "
+                                       "VALUES (?, ?, ?, ?)", changed)
+                self._conn.executemany("DELETE FROM videos WHERE folder = ? AND name = ?", removed)
+                self._conn.execute("COMMIT")
+        self._recent[folder] = {video: names[video] + (metadata,) for video, metadata in results.items()}
+        return results
+
+    @staticmethod
+    def _is_fresh(video: Path, names: list, signature: str) -> bool:
+        """上次扫描后视频及其附加文件都没有变化，也没有新增同名的附加文件或封面"""
+        folder = video.parent
+        for suffix in SIDECAR_SUFFIXES + COVER_SUFFIXES:
+            name = video.stem + suffix
+            if name not in names and os.path.exists(folder / name):
+                return False
+        group = []
+        for name in names:
+            try:
+                stat = os.stat(folder / name)
+            except OSError:
+                return False
+            group.append((name, stat.st_mtime_ns, stat.st_size))
+        return _signature(group) == signature
+
+    def get(self, video) -> VideoMetadata:
+        """
+        单个视频的元数据。只在该视频不在上次的扫描结果中，或它的文件发生变化时重新扫描目录，
+        否则只 stat 这个视频的几个文件。会访问磁盘，协程中应通过 asyncio.to_thread 调用。
+        """
+        video = Path(os.path.abspath(video))
+        folder = str(video.parent)
+        cached = self._recent.get(folder, {}).get(str(video))
+        if cached is not None and self._is_fresh(video, cached[0], cached[1]):
+            return cached[2]
+        metadata = self.scan(folder).get(str(video))
+        if metadata is None:
+            # 不在支持的视频后缀中，仍按同名附加文件解析
+            sidecars = {suffix: video.with_suffix(suffix) for suffix in SIDECAR_SUFFIXES
+                        if video.with_suffix(suffix).exists()}
+            metadata = parse_video(video, sidecars, None)
+        return metadata
+
+
+_default_index = None
+_default_lock = threading.Lock()
+
+
+def get_video_metadata(video) -> VideoMetadata:
+    global _default_index
+    with _default_lock:
+        if _default_index is None:
+            _default_index = MetadataIndex()
+    return _default_index.get(video)
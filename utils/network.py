@@ -1,28 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+重试、退避与熔断。
+
+- 退避：指数退避 + 全抖动（full jitter），第 n 次重试前等待 random(0, min(max_delay, base_delay * 2^n)) 秒，
+  多个 worker 同时失败时不会同步地再次请求；
+- 分类：FatalError、编程错误（ValueError、TypeError 等）、阶段总超时和页面已关闭不重试，其余异常视为可重试；
+- 熔断：每个平台一个 CircuitBreaker，按阶段调用（重试用尽才算一次失败）统计最近 window 秒内的失败率，
+  达到阈值后打开，cooldown 秒内直接抛出 CircuitOpenError，进行中的重试也随之放弃，
+  调度器据此让该平台的任务立即失败、释放并发名额；冷却后放行一次试探，成功则关闭；
+- 重试预算：每个平台一个所有 worker 共享的令牌桶，每次重试消耗一个令牌，桶空时不再重试。
+
+用法::
+
+    await with_retry(SOCIAL_MEDIA_DOUYIN, "navigate", lambda: page.goto(url))
+
+    @async_retry(timeout=300, platform=SOCIAL_MEDIA_BAIJIAHAO)
+    async def publish_video(self, page, publish_date): ...
+"""
 import asyncio
+import random
 import time
+from collections import deque
 from functools import wraps
 
+from utils.wait_engine import Deadline, StageTimeout, PUBLISH_TIMEOUT
+
+# 熔断器默认参数：最近 120 秒内至少 10 次调用且失败率 >= 50% 时打开，60 秒后试探
+BREAKER_FAILURE_RATE = 0.5
+BREAKER_MIN_CALLS = 10
+BREAKER_WINDOW = 120
+BREAKER_COOLDOWN = 60
+# 重试预算：每个平台最多积攒 30 次重试，每 2 秒补充一次
+RETRY_BUDGET_CAPACITY = 30
+RETRY_BUDGET_REFILL = 0.5
+
+# 页面、上下文或浏览器已关闭时重试没有意义
+FATAL_MESSAGES = ("has been closed", "Target closed", "Browser closed")
+
+
+class FatalError(Exception):
+    """不应重试的错误，如 cookie 失效、视频不满足平台要求"""
+
+
+class CircuitOpenError(FatalError):
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} 连续失败过多，已熔断，{retry_after:.0f} 秒后恢复")
+        self.name = name
+        self.retry_after = retry_after
+
+
+FATAL_EXCEPTIONS = (FatalError, StageTimeout, ValueError, TypeError, KeyError, AttributeError,
+                    NotImplementedError, AssertionError, FileNotFoundError, PermissionError)
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, FATAL_EXCEPTIONS):
+        return False
+    message = str(exc)
+    return not any(text in message for text in FATAL_MESSAGES)
+
+
+def backoff_delay(attempt: int, base_delay: float = 1.0, max_delay: float = 30.0) -> float:
+    """第 attempt 次重试前的等待时间（全抖动）"""
+    return random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+
+
+class CircuitBreaker(object):
+    def __init__(self, name: str, failure_rate: float = BREAKER_FAILURE_RATE, min_calls: int = BREAKER_MIN_CALLS,
+                 window: float = BREAKER_WINDOW, cooldown: float = BREAKER_COOLDOWN):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.cooldown = cooldown
+        # (时间, 是否成功)
+        self._events = deque()
+        self._failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    @property
+    def is_open(self) -> bool:
+        """处于冷却期：所有调用都会被拒绝"""
+        return self.opened_at is not None and time.monotonic() - self.opened_at < self.cooldown
+
+    @property
+    def retry_after(self) -> float:
+        """距离冷却结束的秒数"""
+        return max(0, self.cooldown - (time.monotonic() - self.opened_at)) if self.is_open else 0
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if self.is_open or self._probing:
+            return False
+        # 半开：只放行一次试探调用
+        self._probing = True
+        return True
+
+    def check(self):
+        if not self.allow():
+            raise CircuitOpenError(self.name, max(self.retry_after, 1))
+
+    def record(self, ok):
+        """ok 为 None 表示与平台状态无关的失败（如参数错误），只结束试探"""
+        now = time.monotonic()
+        if self._probing:
+            self._probing = False
+            if ok is None:
+                return
+            if ok:
+                self._close()
+            else:
+                self.opened_at = now
+                print(f"[-] {self.name} 试探失败，继续熔断 {self.cooldown:.0f} 秒")
+            return
+        if ok is None or self.opened_at is not None:
+            return
+        self._events.append((now, ok))
+        self._failures += not ok
+        while self._events and now - self._events[0][0] > self.window:
+            self._failures -= not self._events.popleft()[1]
+        total = len(self._events)
+        if total >= self.min_calls and self._failures / total >= self.failure_rate:
+            self.opened_at = now
+            print(f"[-] {self.name} 最近 {total} 次调用失败 {self._failures} 次，熔断 {self.cooldown:.0f} 秒")
+
+    def _close(self):
+        self.opened_at = None
+        self._events.clear()
+        self._failures = 0
+        print(f"[+] {self.name} 已恢复")
+
+
+class RetryBudget(object):
+    """所有 worker 共享的重试令牌桶"""
+
+    def __init__(self, capacity: float = RETRY_BUDGET_CAPACITY, refill_per_second: float = RETRY_BUDGET_REFILL):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def try_acquire(self) -> bool:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.refill_per_second)
+        self._updated = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+
+_breakers = {}
+_budgets = {}
+
+
+def get_breaker(platform: str) -> CircuitBreaker:
+    if platform not in _breakers:
+        _breakers[platform] = CircuitBreaker(platform)
+    return _breakers[platform]
+
+
+def get_retry_budget(platform: str) -> RetryBudget:
+    if platform not in _budgets:
+        _budgets[platform] = RetryBudget()
+    return _budgets[platform]
+
+
+async def with_retry(platform, stage: str, func, max_retries: int = 3, timeout: float = None,
+                     base_delay: float = 1.0, max_delay: float = 30.0, use_breaker: bool = True):
+    """
+    调用 func()（返回 awaitable），可重试的异常按退避重试，整个调用的结果计入平台的熔断器。
+    platform 为 None 时不经过熔断器和重试预算；use_breaker 为 False 时只使用重试预算，由调用方记录结果。
+    重试用尽时抛出最后一次的异常。
+    """
+    breaker = get_breaker(platform) if platform and use_breaker else None
+    budget = get_retry_budget(platform) if platform else None
+    name = f"{platform}/{stage}" if platform else stage
+    if breaker is not None:
+        breaker.check()
+    # 熔断器半开时，本次调用就是那一次试探
+    probing = breaker is not None and breaker.opened_at is not None
+    start = time.monotonic()
+    attempt = 0
+    try:
+        while True:
+            try:
+                result = await func()
+            except Exception as e:
+                if not is_retryable(e):
+                    if breaker is not None:
+                        breaker.record(None)
+                        probing = False
+                    raise
+                attempt += 1
+                delay = backoff_delay(attempt, base_delay, max_delay)
+                if max_retries is not None and attempt > max_retries:
+                    print(f"[-] {name} 重试 {max_retries} 次后仍失败: {e}")
+                elif timeout is not None and time.monotonic() - start + delay > timeout:
+                    print(f"[-] {name} 超过 {timeout} 秒仍失败: {e}")
+                elif breaker is not None and breaker.is_open:
+                    # 其他 worker 已触发熔断，不再继续请求
+                    raise CircuitOpenError(platform, breaker.retry_after) from e
+                elif budget is not None and not budget.try_acquire():
+                    print(f"[-] {platform} 重试预算已用完，{name} 不再重试: {e}")
+                else:
+                    print(f"[-] {name} 第 {attempt} 次失败: {e}，{delay:.1f} 秒后重试")
+                    await asyncio.sleep(delay)
+                    continue
+                if breaker is not None:
+                    breaker.record(False)
+                    probing = False
+                raise
+            else:
+                if breaker is not None:
+                    breaker.record(True)
+                    probing = False
+                return result
+    finally:
+        if probing:
+            # 试探被取消（如超过任务期限）或在记录结果前退出：结束试探，否则熔断器会一直拒绝调用
+            breaker.record(None)
+
+
+async def repeat_until_confirmed(platform, stage: str, action, confirmed, timeout=PUBLISH_TIMEOUT,
+                                 interval: float = 3, base_delay: float = 0.5, max_delay: float = 5):
+    """
+    执行 action()，再最多等待 interval 秒让 confirmed(timeout_ms) 返回 True；未确认时重复，直到总截止时间，
+    超时抛出 StageTimeout。用于点击发布后等待跳转：
+
+    - 尚未确认是正常的等待，不消耗重试预算；
+    - action 本身抛出的异常经 with_retry 退避重试；
+    - 整个发布只计入熔断器一次：确认成功记为成功，到截止时间仍未确认或 action 重试用尽记为失败，
+      每次轮询的点击不单独记录，否则发布卡住的平台永远不会熔断。
+    """
+    breaker = get_breaker(platform) if platform else None
+    if breaker is not None:
+        breaker.check()
+    deadline = Deadline(timeout, stage)
+    outcome = None
+    try:
+        while True:
+            deadline.check()
+            await with_retry(platform, stage, action, base_delay=base_delay, max_delay=max_delay, use_breaker=False)
+            if await confirmed(max(1, min(interval, deadline.remaining()) * 1000)):
+                outcome = True
+                return
+    except StageTimeout:
+        outcome = False
+        raise
+    except Exception as e:
+        # 不可重试的异常与平台状态无关，只结束可能的试探
+        outcome = False if is_retryable(e) else None
+        raise
+    finally:
+        if breaker is not None:
+            # 被取消时 outcome 为 None，同样结束试探
+            breaker.record(outcome)
+
 
-def async_retry(timeout=60, max_retries=None):
+def async_retry(timeout=60, max_retries=None, platform: str = None, stage: str = None,
+                base_delay: float = 1.0, max_delay: float = 30.0):
+    """with_retry 的装饰器形式，stage 缺省为函数名"""
     def decorator(func):
         @wraps(func)
         async def wrapper(*args, **kwargs):
-            start_time = time.time()
-            attempts = 0
-            while True:
-                try:
-                    return await func(*args, **kwargs)
-                except Exception as e:
-                    attempts += 1
-                    if max_retries is not None and attempts >= max_retries:
-                        print(f"Reached maximum retries of {max_retries}.")
-                        raise Exception(f"Failed after {max_retries} retries.") from e
-                    if time.time() - start_time > timeout:
-                        print(f"Function timeout after {timeout} seconds.")
-                        raise TimeoutError(f"Function execution exceeded {timeout} seconds timeout.") from e
-                    print(f"Attempt {attempts} failed: {e}. Retrying...")
-                    await asyncio.sleep(1)  # Sleep to avoid tight loop or provide backoff logic here
+            return await with_retry(platform, stage or func.__name__, lambda: func(*args, **kwargs),
+                                    max_retries=max_retries, timeout=timeout,
+                                    base_delay=base_delay, max_delay=max_delay)
 
         return wrapper
 
-    return decorator
\ No newline at end of file
+    return decorator
@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+"""
+上传前的视频预检：在打开浏览器、消耗上传带宽之前，检查视频是否满足平台的时长、分辨率、大小和编码限制。
+
+- MP4/MOV 只读取 box 头和 moov 中需要的几个 box（mvhd、tkhd、mdhd、hdlr、stsd），不读取 mdat 和采样表；
+- 解析结果按 (path, size, mtime) 缓存在 SQLite 中，平台限制调整后无需重新解析；
+- 整个目录的解析放到进程池中进行::
+
+    python -m utils.preflight videos --platform douyin tencent
+"""
+import argparse
+import json
+import os
+import sqlite3
+import struct
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from conf import BASE_DIR
+from utils.base_social_media import SOCIAL_MEDIA_DOUYIN, SOCIAL_MEDIA_TENCENT, SOCIAL_MEDIA_TIKTOK, \
+    SOCIAL_MEDIA_BILIBILI, SOCIAL_MEDIA_KUAISHOU, SOCIAL_MEDIA_BAIJIAHAO, SOCIAL_MEDIA_XHS
+
+PREFLIGHT_DB_FILE = Path(BASE_DIR / "db" / "preflight.db")
+MP4_SUFFIXES = {".mp4", ".m4v", ".mov"}
+# 少于这个数量的文件直接在当前进程解析，省去进程池的启动开销
+POOL_THRESHOLD = 16
+
+GB = 1024 * 1024 * 1024
+H264_H265 = {"avc1", "avc3", "hvc1", "hev1"}
+
+# 各平台上传页标注的限制，None 表示不检查；平台调整规则后只需修改这里
+PLATFORM_LIMITS = {
+    SOCIAL_MEDIA_DOUYIN: {"max_size": 16 * GB, "max_duration": 60 * 60, "min_short_side": 360,
+                          "video_codecs": H264_H265},
+    SOCIAL_MEDIA_TENCENT: {"max_size": 20 * GB, "max_duration": 8 * 60 * 60, "min_short_side": 360,
+                           "video_codecs": H264_H265},
+    SOCIAL_MEDIA_TIKTOK: {"max_size": 10 * GB, "max_duration": 60 * 60, "min_short_side": 360,
+                          "video_codecs": H264_H265},
+    SOCIAL_MEDIA_KUAISHOU: {"max_size": 4 * GB, "max_duration": 15 * 60, "min_short_side": 360,
+                            "video_codecs": H264_H265},
+    SOCIAL_MEDIA_BAIJIAHAO: {"max_size": 4 * GB, "min_short_side": 360, "video_codecs": H264_H265},
+    SOCIAL_MEDIA_BILIBILI: {"max_size": 16 * GB, "max_duration": 10 * 60 * 60,
+                            "video_codecs": H264_H265 | {"av01"}},
+    SOCIAL_MEDIA_XHS: {"max_size": 20 * GB, "max_duration": 60 * 60, "video_codecs": H264_H265},
+}
+DEFAULT_MIN_DURATION = 1
+
+_CONTAINER_BOXES = {b"moov", b"trak", b"mdia", b"minf", b"stbl", b"mvex"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS probes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    info TEXT,
+    error TEXT
+);
+"""
+
+
+class Mp4ParseError(Exception):
+    pass
+
+
+def _iter_boxes(f, start: int, end: int):
+    """依次返回 [start, end) 范围内的 (type, payload 起点, payload 长度)"""
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        header = f.read(8)
+        if len(header) < 8:
+            break
+        size, box_type = struct.unpack(">I4s", header)
+        header_size = 8
+        if size == 1:
+            largesize = f.read(8)
+            if len(largesize) < 8:
+                break
+            size = struct.unpack(">Q", largesize)[0]
+            header_size = 16
+        elif size == 0:
+            # 延伸到文件末尾
+            size = end - offset
+        if size < header_size:
+            raise Mp4ParseError(f"box {box_type!r} 长度错误")
+        if offset + size > end:
+            raise Mp4ParseError(f"box {box_type!r} 超出所在范围，文件可能未写完或已损坏")
+        yield box_type, offset + header_size, size - header_size
+        offset += size
+
+
+def _read_boxes(f, start: int, end: int, boxes: dict, path: tuple = ()):
+    """把 moov 中需要的 leaf box 读出来，按 (父 box..., type) 存入 boxes，同名的 trak 依次追加"""
+    for box_type, payload, length in _iter_boxes(f, start, end):
+        key = path + (box_type,)
+        if box_type in _CONTAINER_BOXES:
+            if box_type == b"trak":
+                track = {}
+                boxes.setdefault(key, []).append(track)
+                _read_boxes(f, payload, payload + length, track)
+            else:
+                _read_boxes(f, payload, payload + length, boxes, key)
+        elif box_type in (b"mvhd", b"tkhd", b"mdhd", b"hdlr", b"stsd", b"mehd"):
+            f.seek(payload)
+            # stsd 只需要第一个 sample entry 的头部
+            boxes[key] = f.read(min(length, 256))
+
+
+def _times(data: bytes):
+    """mvhd / mdhd 的 (timescale, duration)"""
+    if data[0] == 1:
+        return struct.unpack(">IQ", data[20:32])
+    return struct.unpack(">II", data[12:20])
+
+
+def _parse_track(track: dict) -> dict:
+    hdlr = track.get((b"mdia", b"hdlr"))
+    mdhd = track.get((b"mdia", b"mdhd"))
+    stsd = track.get((b"mdia", b"minf", b"stbl", b"stsd"))
+    tkhd = track.get((b"tkhd",))
+    result = {"handler": hdlr[8:12].decode('latin-1') if hdlr and len(hdlr) >= 12 else None}
+    if stsd and len(stsd) >= 16:
+        result["codec"] = stsd[12:16].decode('latin-1')
+    if mdhd:
+        timescale, duration = _times(mdhd)
+        result["duration"] = duration / timescale if timescale else 0
+    if tkhd:
+        # matrix 之后是 16.16 定点数的 width / height；matrix 的 a、b 判断是否旋转 90°
+        matrix = 52 if tkhd[0] == 1 else 40
+        if len(tkhd) >= matrix + 44:
+            a, b = struct.unpack(">ii", tkhd[matrix:matrix + 8])
+            width, height = struct.unpack(">II", tkhd[matrix + 36:matrix + 44])
+            result["width"], result["height"] = width >> 16, height >> 16
+            result["rotation"] = 90 if a == 0 and b != 0 else 0
+    if stsd and len(stsd) >= 44 and not result.get("width"):
+        # 视觉 sample entry 中的宽高
+        result["width"], result["height"] = struct.unpack(">HH", stsd[40:44])
+    return result
+
+
+def parse_mp4(path) -> dict:
+    """解析 MP4/MOV 的容器信息：时长（秒）、显示宽高、视频/音频编码、码率"""
+    size = os.path.getsize(path)
+    boxes = {}
+    with open(path, 'rb') as f:
+        top_level = []
+        for box_type, payload, length in _iter_boxes(f, 0, size):
+            top_level.append(box_type)
+            if box_type == b"ftyp":
+                f.seek(payload)
+                boxes[(b"ftyp",)] = f.read(4)
+            elif box_type == b"moov":
+                _read_boxes(f, payload, payload + length, boxes, (b"moov",))
+                break
+    if not top_level or top_level[0] not in (b"ftyp", b"moov", b"free", b"wide", b"mdat", b"skip"):
+        raise Mp4ParseError("不是 MP4/MOV 文件")
+    if (b"moov", b"mvhd") not in boxes:
+        raise Mp4ParseError("缺少 moov，文件可能未写完或已损坏")
+
+    timescale, duration = _times(boxes[(b"moov", b"mvhd")])
+    mehd = boxes.get((b"moov", b"mvex", b"mehd"))
+    if not duration and mehd:
+        # fragmented MP4 的总时长在 mehd 中
+        duration = struct.unpack(">Q", mehd[4:12])[0] if mehd[0] == 1 else struct.unpack(">I", mehd[4:8])[0]
+    info = {
+        "brand": boxes.get((b"ftyp",), b"").decode('latin-1') or None,
+        "size": size,
+        "duration": round(duration / timescale, 3) if timescale else 0,
+        "width": None,
+        "height": None,
+        "video_codec": None,
+        "audio_codec": None,
+        # moov 在 mdat 之前时浏览器/平台无需读完整个文件即可开始解析
+        "faststart": b"mdat" not in top_level,
+    }
+    for track in boxes.get((b"moov", b"trak"), []):
+        track = _parse_track(track)
+        if track["handler"] == "vide" and info["video_codec"] is None:
+            info["video_codec"] = track.get("codec")
+            width, height = track.get("width"), track.get("height")
+            if track.get("rotation"):
+                width, height = height, width
+            info["width"], info["height"] = width, height
+            if not info["duration"]:
+                info["duration"] = round(track.get("duration", 0), 3)
+        elif track["handler"] == "soun" and info["audio_codec"] is None:
+            info["audio_codec"] = track.get("codec")
+    info["bitrate"] = int(size * 8 / info["duration"]) if info["duration"] else None
+    return info
+
+
+def probe(path) -> dict:
+    """MP4/MOV 返回 parse_mp4() 的结果，其他格式只返回大小"""
+    if Path(path).suffix.lower() in MP4_SUFFIXES:
+        return parse_mp4(path)
+    return {"size": os.path.getsize(path)}
+
+
+def _probe_worker(path: str):
+    try:
+        return path, probe(path), None
+    except (Mp4ParseError, struct.error, OSError) as e:
+        return path, None, str(e) or e.__class__.__name__
+
+
+class PreflightCache(object):
+    """parse 结果按 (path, size, mtime) 缓存，文件被修改后自动失效"""
+
+    def __init__(self, path=PREFLIGHT_DB_FILE):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def get(self, key: str, size: int, mtime: int):
+        """命中时返回 (info, error)，否则返回 None"""
+        with self._lock:
+            row = self._conn.execute("SELECT size, mtime, info, error FROM probes WHERE path = ?",
+                                     (key,)).fetchone()
+        if row and row[0] == size and row[1] == mtime:
+            return json.loads(row[2]) if row[2] else None, row[3]
+        return None
+
+    def put_many(self, rows):
+        """rows: (path, size, mtime, info, error)"""
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO probes (path, size, mtime, info, error) "
+                                   "VALUES (?, ?, ?, ?, ?)",
+                                   [(key, size, mtime, json.dumps(info) if info else None, error)
+                                    for key, size, mtime, info, error in rows])
+
+
+_default_cache = None
+
+
+def get_cache() -> PreflightCache:
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = PreflightCache()
+    return _default_cache
+
+
+def probe_many(paths, workers: int = None, cache: PreflightCache = None) -> dict:
+    """解析多个文件，返回 {绝对路径: (info, error)}；未命中缓存的文件较多时使用进程池"""
+    cache = cache or get_cache()
+    results, todo, stats = {}, [], {}
+    for path in paths:
+        key = os.path.abspath(path)
+        try:
+            stat = os.stat(key)
+        except OSError as e:
+            results[key] = None, str(e)
+            continue
+        cached = cache.get(key, stat.st_size, stat.st_mtime_ns)
+        if cached is not None:
+            results[key] = cached
+        else:
+            todo.append(key)
+            stats[key] = stat
+    if len(todo) >= POOL_THRESHOLD:
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            probed = list(executor.map(_probe_worker, todo, chunksize=max(1, len(todo) // (workers * 4))))
+    else:
+        probed = [_probe_worker(key) for key in todo]
+    rows = []
+    for key, info, error in probed:
+        results[key] = info, error
+        rows.append((key, stats[key].st_size, stats[key].st_mtime_ns, info, error))
+    if rows:
+        cache.put_many(rows)
+    return results
+
+
+def check_media(info: dict, platform: str) -> list[str]:
+    """返回不满足平台限制的原因，空列表表示通过"""
+    limits = PLATFORM_LIMITS.get(platform, {})
+    issues = []
+    max_size = limits.get("max_size")
+    if max_size and info["size"] > max_size:
+        issues.append(f"文件大小 {info['size'] / GB:.2f}GB 超过 {max_size / GB:.0f}GB")
+    if "duration" not in info:
+        # 非 MP4 容器，只检查大小
+        return issues
+    if info["video_codec"] is None:
+        issues.append("没有视频轨")
+        return issues
+    duration = info["duration"]
+    if duration < limits.get("min_duration", DEFAULT_MIN_DURATION):
+        issues.append(f"时长 {duration:.1f}s 过短")
+    max_duration = limits.get("max_duration")
+    if max_duration and duration > max_duration:
+        issues.append(f"时长 {duration / 60:.1f} 分钟超过 {max_duration / 60:.0f} 分钟")
+    min_short_side = limits.get("min_short_side")
+    if min_short_side and info["width"] and info["height"] and min(info["width"], info["height"]) < min_short_side:
+        issues.append(f"分辨率 {info['width']}x{info['height']} 低于 {min_short_side}p")
+    video_codecs = limits.get("video_codecs")
+    if video_codecs and info["video_codec"] not in video_codecs:
+        issues.append(f"视频编码 {info['video_codec']} 不受支持")
+    max_bitrate = limits.get("max_bitrate")
+    if max_bitrate and info["bitrate"] and info["bitrate"] > max_bitrate:
+        issues.append(f"码率 {info['bitrate'] / 1000000:.1f}Mbps 超过 {max_bitrate / 1000000:.0f}Mbps")
+    return issues
+
+
+def preflight(paths, platforms, workers: int = None, cache: PreflightCache = None) -> dict:
+    """批量预检，返回 {绝对路径: {platform: [原因, ...]}}，只包含未通过的文件"""
+    failures = {}
+    for key, (info, error) in probe_many(paths, workers, cache).items():
+        for platform in platforms:
+            issues = [error] if error else check_media(info, platform)
+            if issues:
+                failures.setdefault(key, {})[platform] = issues
+    return failures
+
+
+def check_video(path, platform: str, cache: PreflightCache = None) -> list[str]:
+    """单个视频的预检，供上传前调用"""
+    return preflight([path], [platform], cache=cache).get(os.path.abspath(path), {}).get(platform, [])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check videos against platform limits before uploading.")
+    parser.add_argument("paths", nargs='+', help="video files or directories")
+    parser.add_argument("--platform", nargs='+', default=list(PLATFORM_LIMITS), choices=list(PLATFORM_LIMITS))
+    parser.add_argument("--workers", type=int, help="probe processes, default: cpu count")
+    args = parser.parse_args()
+    files = []
+    for item in map(Path, args.paths):
+        if item.is_dir():
+            files.extend(sorted(file for file in item.iterdir()
+                                if file.suffix.lower() in MP4_SUFFIXES | {".webm", ".flv", ".mkv"}))
+        else:
+            files.append(item)
+    failures = preflight(files, args.platform, args.workers)
+    for key, platforms in failures.items():
+        for platform, issues in platforms.items():
+            print(f"[-] {key} {platform}: {'；'.join(issues)}")
+    print(f"共 {len(files)} 个视频，{len(failures)} 个未通过预检")
+    raise SystemExit(1 if failures else 0)
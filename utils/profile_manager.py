@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+"""
+每个账号一个持久化的浏览器配置目录（launch_persistent_context）。
+
+默认每次上传都用 storage_state 新建一个空的 context，创作者中心几 MB 的 JS 每次都要重新下载、编译。
+开启后每个账号使用 browser_profiles/<cookie 所在目录>_<cookie 文件名>-<路径哈希>/ 作为 user-data-dir，cookie、localStorage、
+HTTP 缓存和 V8 代码缓存都保留下来，同一账号之后的上传打开页面更快。
+
+- 锁：同一目录同时只能被一个 worker 打开。进程内按目录排队，进程间用文件锁（进程退出时自动释放），
+  等待超过 LOCK_TIMEOUT 秒报错；
+- 大小：HTTP 缓存由 --disk-cache-size 限制；关闭时若距上次检查已超过 PRUNE_INTERVAL，统计目录大小，
+  超过 max_mb 时按 PRUNABLE_DIRS 的顺序删除缓存（统计要遍历整个目录，不在每次关闭时进行）；
+- 请求拦截：配置目录的 context 不安装 utils.interception 的拦截。context.route() 会让 Playwright 关闭
+  HTTP 缓存，拦截后配置目录就失去了意义；两者同时开启时以配置目录为准；
+- 与 cookies/*.json 同步：cookie 文件比上次导入更新时（例如重新登录过），打开时导入其中的 cookie 和
+  localStorage；uploader 上传后照常调用 context.storage_state(path=...)，即导出回 cookie 文件。
+
+由 config.json 中的 "browser_profiles": {"enabled": true, "max_mb": 500} 或环境变量 SAU_BROWSER_PROFILES=1 开启。
+
+    python -m utils.profile_manager list
+    python -m utils.profile_manager export cookies/douyin_xiaoA.json
+    python -m utils.profile_manager prune --max-mb 300
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+from playwright.async_api import async_playwright
+
+from conf import BASE_DIR, get_config_section, on_config_reset
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+PROFILES_DIR = Path(BASE_DIR / "browser_profiles")
+DEFAULT_MAX_MB = 500
+# HTTP 缓存上限占目录上限的比例，其余留给代码缓存、localStorage 等
+DISK_CACHE_RATIO = 0.6
+LOCK_TIMEOUT = 600
+LOCK_POLL_INTERVAL = 0.5
+LOCK_FILE = "sau.lock"
+STATE_FILE = "sau_state.json"
+# 关闭时检查目录大小的最短间隔（秒）
+PRUNE_INTERVAL = 3600
+# 超过大小上限时依次删除，代码缓存最能加快页面加载，放在最后
+PRUNABLE_DIRS = (
+    "Default/Service Worker/CacheStorage",
+    "Default/Service Worker/ScriptCache",
+    "Default/GPUCache",
+    "GrShaderCache",
+    "ShaderCache",
+    "GraphiteDawnCache",
+    "Default/Cache",
+    "Default/Code Cache",
+)
+
+# 导入的 localStorage 只在页面中还没有该键时写入，不覆盖网站之后的修改
+_LOCAL_STORAGE_JS = """(origins => {
+    const items = origins[location.origin];
+    if (!items) return;
+    for (const {name, value} of items) {
+        if (localStorage.getItem(name) === null) localStorage.setItem(name, value);
+    }
+})(%s);"""
+
+_config = None
+
+
+class ProfileLockedError(Exception):
+    pass
+
+
+def get_profiles_config() -> dict:
+    global _config
+    if _config is None:
+        config = get_config_section("browser_profiles", {})
+        env = os.environ.get("SAU_BROWSER_PROFILES")
+        enabled = env.lower() in ("1", "true", "yes") if env is not None else bool(config.get("enabled", False))
+        _config = {"enabled": enabled, "max_mb": config.get("max_mb", DEFAULT_MAX_MB)}
+    return _config
+
+
+@on_config_reset
+def _reset_config():
+    global _config
+    _config = None
+
+
+def set_profiles_enabled(enabled: bool):
+    get_profiles_config()["enabled"] = enabled
+
+
+def _dir_size(path: Path) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def prune_profile(path: Path, max_bytes: int) -> int:
+    """删除缓存直到目录不超过 max_bytes，返回删除后的大小"""
+    size = _dir_size(path)
+    for name in PRUNABLE_DIRS:
+        if size <= max_bytes:
+            break
+        cache = path / name
+        if cache.is_dir():
+            size -= _dir_size(cache)
+            shutil.rmtree(cache, ignore_errors=True)
+    return size
+
+
+class _FileLock(object):
+    """跨进程的非阻塞文件锁，进程退出时由系统释放"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._fd = None
+
+    def try_acquire(self) -> bool:
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+
+class BrowserProfile(object):
+    """一个账号的配置目录，open() 返回持久化的 BrowserContext，close() 关闭并释放锁"""
+
+    def __init__(self, manager, account_file):
+        self.manager = manager
+        self.account_file = Path(account_file)
+        self.path = manager.profile_path(account_file)
+        self.context = None
+        self._opened_at = None
+        self._lock = _FileLock(self.path / LOCK_FILE)
+        self._queue_lock = manager.queue_lock(self.path)
+
+    async def _acquire(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        await self._queue_lock.acquire()
+        deadline = time.monotonic() + self.manager.lock_timeout
+        while not self._lock.try_acquire():
+            if time.monotonic() > deadline:
+                self._queue_lock.release()
+                raise ProfileLockedError(f"{self.path} 已被其他进程占用超过 {self.manager.lock_timeout} 秒")
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+
+    def _release(self):
+        self._lock.release()
+        self._queue_lock.release()
+
+    def _state(self) -> dict:
+        try:
+            return json.loads((self.path / STATE_FILE).read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return {}
+
+    def _update_state(self, **fields):
+        state = self._state()
+        state.update(fields)
+        (self.path / STATE_FILE).write_text(json.dumps(state), encoding='utf-8')
+
+    def _pending_import(self):
+        """cookie 文件比上次导入的更新时返回其内容"""
+        try:
+            mtime = self.account_file.stat().st_mtime
+        except OSError:
+            return None
+        if self._state().get("imported_mtime", 0) >= mtime:
+            return None
+        try:
+            return json.loads(self.account_file.read_text(encoding='utf-8')), mtime
+        except ValueError:
+            return None
+
+    async def _import(self, context, state: dict):
+        if state.get("cookies"):
+            await context.add_cookies(state["cookies"])
+        origins = {origin["origin"]: origin["localStorage"] for origin in state.get("origins", [])
+                   if origin.get("localStorage")}
+        if origins:
+            await context.add_init_script(script=_LOCAL_STORAGE_JS % json.dumps(origins, ensure_ascii=False))
+
+    def _launch_options(self, launch_options: dict, context_options: dict) -> dict:
+        options = dict(launch_options or {})
+        options.update(context_options or {})
+        # 持久化 context 的 cookie 来自配置目录，见 _import
+        options.pop('storage_state', None)
+        cache_bytes = int(self.manager.max_bytes * DISK_CACHE_RATIO)
+        options['args'] = list(options.get('args', [])) + [f"--disk-cache-size={cache_bytes}"]
+        return options
+
+    async def open(self, playwright, launch_options: dict = None, context_options: dict = None):
+        await self._acquire()
+        try:
+            pending = self._pending_import()
+            self._opened_at = time.time()
+            self.context = await playwright.chromium.launch_persistent_context(
+                str(self.path), **self._launch_options(launch_options, context_options))
+            # 见模块说明，intercept_requests 不在此 context 上安装拦截
+            self.context._sau_profile = True
+            if pending is not None:
+                state, mtime = pending
+                await self._import(self.context, state)
+                self._update_state(imported_mtime=mtime)
+        except BaseException:
+            self._release()
+            raise
+        return self.context
+
+    async def export(self, path=None):
+        """把 cookie 和 localStorage 写回 storage_state 文件，默认为账号的 cookie 文件"""
+        path = Path(path or self.account_file)
+        await self.context.storage_state(path=str(path))
+
+    async def close(self):
+        try:
+            if self.context is not None:
+                try:
+                    await self.context.close()
+                except Exception:
+                    # 浏览器已崩溃或已关闭
+                    pass
+            try:
+                mtime = self.account_file.stat().st_mtime
+            except OSError:
+                mtime = None
+            if mtime is not None and self._opened_at is not None and mtime >= self._opened_at:
+                # uploader 在这次使用中导出过 cookie 文件，内容来自本目录，下次打开时不需要再导入
+                self._update_state(imported_mtime=mtime)
+            # 在释放锁之前清理，避免删除缓存时被其他 worker 打开
+            if time.time() - self._state().get("pruned_at", 0) >= PRUNE_INTERVAL:
+                await asyncio.to_thread(prune_profile, self.path, self.manager.max_bytes)
+                self._update_state(pruned_at=time.time())
+        finally:
+            self.context = None
+            self._release()
+
+
+class ProfileManager(object):
+    """
+    用法::
+
+        profile = ProfileManager().profile(account_file)
+        context = await profile.open(playwright, launch_options)
+        try:
+            ...
+        finally:
+            await profile.close()
+    """
+
+    def __init__(self, directory=PROFILES_DIR, max_mb: float = None, lock_timeout: float = LOCK_TIMEOUT):
+        self.directory = Path(directory)
+        self.max_bytes = int((max_mb or get_profiles_config()["max_mb"]) * 1024 * 1024)
+        self.lock_timeout = lock_timeout
+        self._queue_locks = {}
+
+    def profile_path(self, account_file) -> Path:
+        """
+        按 cookie 文件的完整路径区分目录：各平台的示例都使用 cookies/<platform>_uploader/account.json，
+        只用文件名时不同平台会共用同一个目录
+        """
+        path = Path(account_file).resolve()
+        digest = hashlib.sha1(str(path).encode('utf-8')).hexdigest()[:8]
+        return self.directory / f"{path.parent.name}_{path.stem}-{digest}"
+
+    def queue_lock(self, path: Path) -> asyncio.Lock:
+        if path not in self._queue_locks:
+            self._queue_locks[path] = asyncio.Lock()
+        return self._queue_locks[path]
+
+    def profile(self, account_file) -> BrowserProfile:
+        return BrowserProfile(self, account_file)
+
+    def list_profiles(self) -> list:
+        """[(目录, 大小, 最后使用时间)]"""
+        if not self.directory.is_dir():
+            return []
+        profiles = []
+        for path in sorted(entry for entry in self.directory.iterdir() if entry.is_dir()):
+            lock = path / LOCK_FILE
+            used = lock.stat().st_mtime if lock.exists() else path.stat().st_mtime
+            profiles.append((path, _dir_size(path), used))
+        return profiles
+
+
+_default_manager = None
+
+
+def get_profile_manager() -> ProfileManager:
+    global _default_manager
+    if _default_manager is None:
+        _default_manager = ProfileManager()
+    return _default_manager
+
+
+async def _export(account_file: str):
+    profile = get_profile_manager().profile(account_file)
+    async with async_playwright() as playwright:
+        await profile.open(playwright, {'headless': True})
+        try:
+            await profile.export()
+        finally:
+            await profile.close()
+    print(f"[+] 已导出到 {account_file}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Manage persistent per-account browser profiles.")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+    subparsers.add_parser("list", help="show profiles with their size and last use")
+    export_parser = subparsers.add_parser("export", help="write a profile's cookies back to its storage_state file")
+    export_parser.add_argument("account_file")
+    prune_parser = subparsers.add_parser("prune", help="drop caches of profiles larger than the cap")
+    prune_parser.add_argument("--max-mb", type=float, default=None)
+    args = parser.parse_args()
+
+    if args.action == "list":
+        for path, size, used in get_profile_manager().list_profiles():
+            print(f"{path.name:<40}{size / 1024 / 1024:>10.1f} MB  {time.strftime('%Y-%m-%d %H:%M', time.localtime(used))}")
+    elif args.action == "export":
+        asyncio.run(_export(args.account_file))
+    else:
+        manager = ProfileManager(max_mb=args.max_mb)
+        for path, size, _ in manager.list_profiles():
+            lock = _FileLock(path / LOCK_FILE)
+            if not lock.try_acquire():
+                print(f"[-] {path.name} 正在使用，跳过")
+                continue
+            try:
+                pruned = prune_profile(path, manager.max_bytes)
+            finally:
+                lock.release()
+            print(f"[+] {path.name}: {size / 1024 / 1024:.1f} MB -> {pruned / 1024 / 1024:.1f} MB")
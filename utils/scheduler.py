@@ -0,0 +1,373 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+import shutil
+import time
+from datetime import datetime
+from pathlib import Path
+
+from conf import BASE_DIR
+from utils.base_social_media import SOCIAL_MEDIA_DOUYIN, SOCIAL_MEDIA_TENCENT, SOCIAL_MEDIA_TIKTOK, \
+    SOCIAL_MEDIA_KUAISHOU, SOCIAL_MEDIA_BAIJIAHAO
+from utils.browser_pool import BrowserPool
+from utils.covers import prepare_cover
+from utils.dedup import DedupIndex
+from utils.files_times import find_cover, localize
+from utils.interception import get_interception_stats
+from utils.log import log_context
+from utils.metadata_index import get_video_metadata
+from utils.job_store import JobStore, file_key, DONE_STATES, STATE_FAILED
+from utils.network import CircuitOpenError, get_breaker
+from utils.preflight import check_video, probe_many
+from utils.profile_manager import ProfileManager, get_profile_manager, get_profiles_config
+from utils.slot_planner import SlotPlanner
+from utils.transcode import upload_rendition
+from utils.tracing import bind_tags
+from utils.uploader_registry import load_uploader
+from utils.watcher import DirectoryWatcher, DEFAULT_STABLE_SECONDS
+
+# 每个平台同时进行的上传数
+DEFAULT_PLATFORM_LIMITS = {
+    SOCIAL_MEDIA_DOUYIN: 8,
+    SOCIAL_MEDIA_TENCENT: 4,
+    SOCIAL_MEDIA_TIKTOK: 4,
+    SOCIAL_MEDIA_KUAISHOU: 8,
+    SOCIAL_MEDIA_BAIJIAHAO: 4,
+}
+# 同一账号同时进行的上传数，抖音/快手会对单账号并发限流
+DEFAULT_ACCOUNT_LIMIT = 1
+# 账号 cookie 校验结果的有效期（秒），常驻进程中 cookie 过期或重新登录后能重新校验
+ACCOUNT_CHECK_TTL = 5 * 60
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_SKIPPED = "skipped"
+
+
+def get_account_file(platform: str, account: str) -> Path:
+    """与 cli_main.py 一致的 cookie 文件位置"""
+    return Path(BASE_DIR / "cookies" / f"{platform}_{account}.json")
+
+
+class UploadJob(object):
+    def __init__(self, platform: str, account: str, video, publish_time: datetime = None, thumbnail=None):
+        self.platform = platform
+        self.account = account
+        self.video = Path(video)
+        # None 或 0 表示立即发布
+        self.publish_time = publish_time or 0
+        self.thumbnail = Path(thumbnail) if thumbnail else None
+        self.status = JOB_PENDING
+        self.error = None
+        # JobStore 中的任务 id，未使用任务队列时为 None
+        self.job_id = None
+
+    @property
+    def account_file(self) -> Path:
+        return get_account_file(self.platform, self.account)
+
+    def __repr__(self):
+        return f"UploadJob({self.platform}, {self.account}, {self.video.name}, {self.status})"
+
+
+def load_manifest(manifest_path) -> list[UploadJob]:
+    """
+    读取上传清单，格式为 JSON 数组::
+
+        [{"platform": "douyin", "account": "xiaoA", "video": "videos/1.mp4", "publish_time": "2024-05-08 16:00"}]
+
+    video 为相对路径时相对于 BASE_DIR；publish_time 为 config.json 中 timezone 的时间，缺省表示立即发布。
+    """
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        items = json.load(f)
+    jobs = []
+    for item in items:
+        video = Path(item["video"])
+        if not video.is_absolute():
+            video = Path(BASE_DIR) / video
+        publish_time = item.get("publish_time")
+        if publish_time:
+            publish_time = localize(datetime.strptime(publish_time, '%Y-%m-%d %H:%M'))
+        jobs.append(UploadJob(item["platform"], item["account"], video, publish_time))
+    return jobs
+
+
+def resume_jobs(jobs: list[UploadJob], store: JobStore) -> list[UploadJob]:
+    """把任务登记到 store，返回其中尚未完成的任务，并关联任务 id"""
+    store.enqueue_many((job.video, job.platform, job.account, job.publish_time) for job in jobs)
+    runnable = {}
+    for platform, account in {(job.platform, job.account) for job in jobs}:
+        for row in store.runnable(platform, account):
+            runnable[(row['file'], platform, account)] = row['id']
+    resumable = []
+    for job in jobs:
+        job_id = runnable.get((file_key(job.video), job.platform, job.account))
+        if job_id is not None:
+            job.job_id = job_id
+            resumable.append(job)
+    return resumable
+
+
+def plan_publish_times(jobs: list[UploadJob], planner: SlotPlanner) -> int:
+    """为没有发布时间的任务分配定时发布时间，已有的时间先登记为占用；返回分配的任务数"""
+    unplanned = []
+    for job in jobs:
+        if job.publish_time:
+            planner.reserve(job.platform, job.account, job.publish_time)
+        else:
+            unplanned.append(job)
+    for job in unplanned:
+        job.publish_time = planner.next_slot(job.platform, job.account)
+    return len(unplanned)
+
+
+async def _setup_account(platform: str, account_file: Path) -> bool:
+    """检查 cookie 是否有效，不弹出登录"""
+    return await load_uploader(platform).setup(account_file, handle=False)
+
+
+class UploadScheduler(object):
+    """
+    并发执行多平台、多账号的上传任务。
+
+    - platform_limits: 每个平台的并发上限；
+    - account_limit: 同一账号的并发上限；
+    - max_contexts: 所有平台同时打开的 BrowserContext 总数上限；
+    - browsers: 浏览器池中常驻的浏览器数量；
+    - store: 可选的 JobStore，记录每个任务的状态以便中断后续传；
+    - dedup: 可选的 DedupIndex，同一账号已上传过相同内容的视频会被跳过；
+    - preflight: 上传前检查视频是否满足平台限制，不满足的任务直接跳过；
+    - job_timeout: 单个任务上传的期限（秒），超过时取消上传并保存失败现场（见 utils.diagnostics）；
+    - profiles: 可选的 ProfileManager，每个账号使用持久化的浏览器配置目录（见 utils.profile_manager），
+      缺省时按 config.json 中的 browser_profiles 决定；
+    - account_check_ttl: 账号 cookie 校验结果的有效期（秒），上传失败时立即失效。
+    """
+
+    def __init__(self, max_contexts: int = 16, browsers: int = 4, platform_limits: dict = None,
+                 account_limit: int = DEFAULT_ACCOUNT_LIMIT, pool: BrowserPool = None, store: JobStore = None,
+                 dedup: DedupIndex = None, preflight: bool = True, job_timeout: float = None,
+                 profiles: ProfileManager = None, account_check_ttl: float = ACCOUNT_CHECK_TTL):
+        self.max_contexts = max_contexts
+        self.browsers = browsers
+        self.platform_limits = dict(DEFAULT_PLATFORM_LIMITS, **(platform_limits or {}))
+        self.account_limit = account_limit
+        self.pool = pool
+        self.store = store
+        self.dedup = dedup
+        self.preflight = preflight
+        self.job_timeout = job_timeout
+        self.profiles = profiles
+        self.account_check_ttl = account_check_ttl
+        self._owns_pool = False
+        self._context_semaphore = None
+        self._platform_semaphores = {}
+        self._account_semaphores = {}
+        self._account_checks = {}
+
+    def _platform_semaphore(self, platform: str) -> asyncio.Semaphore:
+        if platform not in self._platform_semaphores:
+            limit = self.platform_limits.get(platform, self.max_contexts)
+            self._platform_semaphores[platform] = asyncio.Semaphore(limit)
+        return self._platform_semaphores[platform]
+
+    def _account_semaphore(self, platform: str, account: str) -> asyncio.Semaphore:
+        key = (platform, account)
+        if key not in self._account_semaphores:
+            self._account_semaphores[key] = asyncio.Semaphore(self.account_limit)
+        return self._account_semaphores[key]
+
+    async def _check_account(self, job: UploadJob) -> bool:
+        # 并发任务共享同一个校验结果，结果超过 account_check_ttl 后重新校验
+        key = (job.platform, job.account)
+        entry = self._account_checks.get(key)
+        if entry is None or (entry[0].done() and time.monotonic() - entry[1] >= self.account_check_ttl):
+            entry = (asyncio.ensure_future(_setup_account(job.platform, job.account_file)), time.monotonic())
+            self._account_checks[key] = entry
+        try:
+            return await entry[0]
+        except Exception:
+            # 校验本身出错时不缓存
+            if self._account_checks.get(key) is entry:
+                del self._account_checks[key]
+            raise
+
+    def _forget_account(self, job: UploadJob):
+        """上传失败（包括被重定向到登录页）后，下一个任务重新校验 cookie"""
+        self._account_checks.pop((job.platform, job.account), None)
+
+    async def _find_duplicate(self, job: UploadJob):
+        if self.dedup is None:
+            return None
+        # 大文件的全量哈希放到线程中计算，不阻塞其他任务
+        return await asyncio.to_thread(self.dedup.find_upload, job.video, job.platform, job.account_file)
+
+    async def _preflight_issues(self, job: UploadJob, video: Path) -> list:
+        if not self.preflight:
+            return []
+        return await asyncio.to_thread(check_video, video, job.platform)
+
+    async def _upload(self, job: UploadJob, video, thumbnail=None):
+        job.status = JOB_RUNNING
+        attempt = 1
+        if self.store and job.job_id is not None:
+            attempt = self.store.start(job.job_id)
+        plugin = load_uploader(job.platform)
+        # 读取 .txt 等附加文件，不阻塞其他任务
+        metadata = await asyncio.to_thread(get_video_metadata, job.video)
+        with bind_tags(attempt=attempt):
+            if plugin.uses_browser:
+                # UA、视口等平台兼容设置由浏览器池按 platform 设置
+                async with self.pool.context(job.account_file, platform=job.platform) as context:
+                    await asyncio.wait_for(plugin.upload(metadata.title, metadata.tags, video, job.publish_time,
+                                                         job.account_file, thumbnail, context,
+                                                         description=metadata.description),
+                                           self.job_timeout)
+            else:
+                # 直接调用接口的平台不占用浏览器
+                await asyncio.wait_for(plugin.upload(metadata.title, metadata.tags, video, job.publish_time,
+                                                     job.account_file, thumbnail,
+                                                     description=metadata.description), self.job_timeout)
+
+    async def run_job(self, job: UploadJob) -> UploadJob:
+        # 任务执行期间的业务日志都带上 job_id / platform / account
+        with log_context(job_id=job.job_id, platform=job.platform, account=job.account, video=job.video.name):
+            return await self._run_job(job)
+
+    async def _run_job(self, job: UploadJob) -> UploadJob:
+        try:
+            duplicate = await self._find_duplicate(job)
+            if duplicate:
+                job.status = JOB_SKIPPED
+                job.error = f"该账号已上传过相同内容的视频 {duplicate}"
+                print(f"[-] 跳过 {job.video.name}: {job.error}")
+                if self.store and job.job_id is not None:
+                    self.store.skip(job.job_id, job.error)
+                return job
+            if not await self._check_account(job):
+                job.status = JOB_SKIPPED
+                job.error = f"{job.account_file.name} cookie 文件不存在或已失效"
+                print(f"[-] 跳过 {job.video.name}: {job.error}")
+                if self.store and job.job_id is not None:
+                    # 记为 failed 而不是 skipped：不计入重试次数，重新登录后仍会执行
+                    self.store.fail(job.job_id, job.error)
+                return job
+            # 先取账号名额再取平台名额：等待同账号前序任务的任务不占用平台名额，否则积压的账号会拖住其他账号
+            async with self._account_semaphore(job.platform, job.account), \
+                    self._platform_semaphore(job.platform), \
+                    self._context_semaphore:
+                breaker = get_breaker(job.platform)
+                if breaker.is_open:
+                    # 平台熔断期间直接失败，立即释放并发名额；不计入重试次数，下次运行仍会执行
+                    raise CircuitOpenError(job.platform, breaker.retry_after)
+                # 同名封面在原始视频旁边，需在替换为转码文件之前查找
+                thumbnail = job.thumbnail or await prepare_cover(job.video, job.platform)
+                # 在取得并发名额后才转码，转码文件在上传结束前不会被其他任务的缓存淘汰删除；
+                # 开启转码时预检的是实际上传的文件
+                async with upload_rendition(job.video, job.platform) as video:
+                    issues = await self._preflight_issues(job, video)
+                    if issues:
+                        # 重试也不会通过，不计入失败
+                        job.status = JOB_SKIPPED
+                        job.error = f"未通过预检: {'；'.join(issues)}"
+                        print(f"[-] 跳过 {job.video.name}: {job.error}")
+                        if self.store and job.job_id is not None:
+                            self.store.skip(job.job_id, job.error)
+                        return job
+                    await self._upload(job, video, thumbnail)
+            job.status = JOB_DONE
+            if self.store and job.job_id is not None:
+                self.store.finish(job.job_id, scheduled=bool(job.publish_time))
+            if self.dedup is not None:
+                await asyncio.to_thread(self.dedup.record, job.video, job.platform, job.account_file)
+        except Exception as e:
+            started = job.status == JOB_RUNNING
+            job.status = JOB_FAILED
+            job.error = f"超过任务期限 {self.job_timeout} 秒" if isinstance(e, asyncio.TimeoutError) else str(e)
+            # 熔断时任务还没有开始，保持 pending，下次运行照常执行
+            if self.store and job.job_id is not None and (started or not isinstance(e, CircuitOpenError)):
+                self.store.fail(job.job_id, e)
+            if started:
+                self._forget_account(job)
+            print(f"[-] {job.platform}/{job.account} {job.video.name} 上传失败: {e}")
+        return job
+
+    async def start(self):
+        """启动浏览器池，之后可以持续调用 run_job()"""
+        self._context_semaphore = asyncio.Semaphore(self.max_contexts)
+        self._owns_pool = self.pool is None
+        if self._owns_pool:
+            profiles = self.profiles
+            if profiles is None and get_profiles_config()["enabled"]:
+                profiles = get_profile_manager()
+            self.pool = BrowserPool(size=self.browsers, profiles=profiles)
+            await self.pool.start()
+        return self
+
+    async def close(self):
+        if self._owns_pool and self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    async def run(self, jobs: list[UploadJob]) -> list[UploadJob]:
+        await self.start()
+        try:
+            if self.preflight:
+                # 先在进程池中解析全部视频，run_job 中的预检都会命中缓存
+                await asyncio.to_thread(probe_many, {job.video for job in jobs})
+            return list(await asyncio.gather(*(self.run_job(job) for job in jobs)))
+        finally:
+            await self.close()
+            for platform, stats in get_interception_stats().items():
+                print(f"[+] {platform} {stats}")
+
+
+def archive_video(video: Path, published_dir: Path):
+    """把视频及同名的封面图、txt 移动到 published_dir"""
+    published_dir.mkdir(parents=True, exist_ok=True)
+    for file in (video, find_cover(video), video.with_suffix('.txt')):
+        if file is not None and file.exists():
+            shutil.move(str(file), str(published_dir / file.name))
+
+
+async def _upload_and_archive(scheduler: UploadScheduler, job: UploadJob, published_dir: Path):
+    await scheduler.run_job(job)
+    if job.status == JOB_DONE:
+        archive_video(job.video, published_dir)
+        print(f"[+] {job.video.name} 上传完成，已移动到 {published_dir}")
+
+
+async def watch_directory(platform: str, account: str, directory, published_dir=None, workers: int = 1,
+                          stable_seconds: float = DEFAULT_STABLE_SECONDS, store: JobStore = None):
+    """
+    常驻进程：监视 directory，视频写完后交给常驻浏览器池上传，成功后连同封面图、txt 移入 published_dir。
+    已完成或重试次数用尽的视频不会重复上传。
+    """
+    directory = Path(directory)
+    published_dir = Path(published_dir) if published_dir else directory / "published"
+    store = store or JobStore()
+    scheduler = UploadScheduler(max_contexts=workers, browsers=1, account_limit=workers, store=store,
+                                dedup=DedupIndex())
+    await scheduler.start()
+    tasks = set()
+    print(f"[+] 正在监视 {directory}，按 Ctrl+C 退出")
+    try:
+        async for video in DirectoryWatcher(directory, stable_seconds=stable_seconds):
+            job_id = store.enqueue(video, platform, account)
+            row = store.get(video, platform, account)
+            if row['state'] in DONE_STATES or (row['state'] == STATE_FAILED and
+                                               row['attempts'] >= store.max_attempts):
+                print(f"[-] 跳过 {video.name}: 任务状态为 {row['state']}")
+                continue
+            job = UploadJob(platform, account, video, thumbnail=find_cover(video))
+            job.job_id = job_id
+            print(f"[+] 发现新视频 {video.name}，加入上传队列")
+            task = asyncio.ensure_future(_upload_and_archive(scheduler, job, published_dir))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    finally:
+        # 等待进行中的上传结束后再关闭浏览器
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        await scheduler.close()
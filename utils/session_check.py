@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from conf import BASE_DIR, get_config_section, on_config_reset
+from utils.base_social_media import SOCIAL_MEDIA_DOUYIN, SOCIAL_MEDIA_TENCENT, SOCIAL_MEDIA_TIKTOK, \
+    SOCIAL_MEDIA_KUAISHOU, SOCIAL_MEDIA_BAIJIAHAO
+
+# cookie 校验结果的缓存时间（秒），有效期内的重复任务不再打开浏览器校验
+SESSION_CACHE_TTL = 30 * 60
+SESSION_CACHE_FILE = Path(BASE_DIR / "cookies" / "session_cache.json")
+
+# domain: 登录 cookie 所在域名；session_cookies: 登录态 cookie，任一存在且未过期即可；
+# probe_url: 轻量探测地址，被重定向到包含 login_markers 的地址即视为失效
+PLATFORM_SESSION_RULES = {
+    SOCIAL_MEDIA_DOUYIN: {
+        'domain': "douyin.com",
+        'session_cookies': ("sessionid", "sessionid_ss"),
+        'probe_url': "https://creator.douyin.com/creator-micro/content/upload",
+        'login_markers': ("login", "passport"),
+    },
+    SOCIAL_MEDIA_TENCENT: {
+        'domain': "weixin.qq.com",
+        'session_cookies': (),
+        'probe_url': "https://channels.weixin.qq.com/platform/post/create",
+        'login_markers': ("login",),
+    },
+    SOCIAL_MEDIA_TIKTOK: {
+        'domain': "tiktok.com",
+        'session_cookies': ("sessionid", "sessionid_ss"),
+        'probe_url': "https://www.tiktok.com/tiktokstudio/upload?lang=en",
+        'login_markers': ("login",),
+    },
+    SOCIAL_MEDIA_KUAISHOU: {
+        'domain': "kuaishou.com",
+        'session_cookies': (),
+        'probe_url': "https://cp.kuaishou.com/article/publish/video",
+        'login_markers': ("login", "passport"),
+    },
+    SOCIAL_MEDIA_BAIJIAHAO: {
+        'domain': "baidu.com",
+        'session_cookies': ("BDUSS",),
+        'probe_url': "https://baijiahao.baidu.com/builder/rc/home",
+        'login_markers': ("login", "passport"),
+    },
+}
+
+
+_probe_enabled = None
+
+
+def is_session_probe_enabled() -> bool:
+    """
+    是否在本地无法判定时用 HTTP 探测登录态，而不是启动浏览器。
+    由环境变量 SAU_SESSION_PROBE 或 config.json 中的 "session_probe": true 开启。
+    """
+    global _probe_enabled
+    if _probe_enabled is None:
+        env = os.environ.get("SAU_SESSION_PROBE")
+        if env is not None:
+            _probe_enabled = env.lower() in ("1", "true", "yes")
+        else:
+            _probe_enabled = bool(get_config_section("session_probe", False))
+    return _probe_enabled
+
+
+@on_config_reset
+def set_session_probe_enabled(enabled: bool = None):
+    """enabled 为 None 时恢复为按配置决定"""
+    global _probe_enabled
+    _probe_enabled = enabled
+
+
+def load_storage_state(account_file) -> Optional[dict]:
+    try:
+        with open(account_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _domain_matches(cookie_domain: str, domain: str) -> bool:
+    cookie_domain = cookie_domain.lstrip('.')
+    return cookie_domain == domain or cookie_domain.endswith('.' + domain)
+
+
+def _is_expired(cookie: dict, now: float) -> bool:
+    # playwright 中会话 cookie 的 expires 为 -1
+    expires = cookie.get('expires', -1)
+    return expires is not None and 0 <= expires < now
+
+
+def check_cookie_expiry(storage_state: dict, platform: str, now: float = None, rules: dict = None) -> bool:
+    """仅根据 storage_state 中 cookie 的过期时间判断登录态是否可能有效"""
+    now = time.time() if now is None else now
+    rule = (rules if rules is not None else PLATFORM_SESSION_RULES).get(platform, {})
+    cookies = storage_state.get('cookies') or []
+    if rule.get('domain'):
+        cookies = [c for c in cookies if _domain_matches(c.get('domain', ''), rule['domain'])]
+    alive = [c for c in cookies if not _is_expired(c, now)]
+    if not alive:
+        return False
+    session_cookies = rule.get('session_cookies')
+    if session_cookies:
+        return any(c.get('name') in session_cookies for c in alive)
+    return True
+
+
+def is_login_url(platform: str, url: str, rules: dict = None) -> bool:
+    """url 是否为平台的登录页，即上传页面被重定向到了登录"""
+    rule = (rules if rules is not None else PLATFORM_SESSION_RULES).get(platform) or {}
+    url = (url or '').lower()
+    return any(marker in url for marker in rule.get('login_markers', ()))
+
+
+class SessionValidator(object):
+    """
+    cookie 有效性校验层：
+
+    1. 本地检查 storage_state 中 cookie 的过期时间，已过期直接判定失效；
+    2. 命中 TTL 内的缓存结果直接返回，不再启动浏览器；
+    3. 开启了探测时（probe_enabled，缺省按 is_session_probe_enabled()），用连接池化的 requests.Session
+       探测一个轻量地址，探测在线程中进行，不阻塞事件循环。
+
+    缓存文件只在内容变化时重写，先写入独立的临时文件再替换，多个进程同时写入时不会写坏。
+
+    check() 是协程，返回 None 表示无法在本地判定，调用方需回退到浏览器校验并通过 remember() 写回结果；
+    上传中被重定向到登录页时调用 invalidate() 清除缓存的结果。
+    """
+
+    def __init__(self, ttl: int = SESSION_CACHE_TTL, cache_file=SESSION_CACHE_FILE, rules: dict = None,
+                 http_session: requests.Session = None, probe_timeout: float = 5, probe_enabled: bool = None):
+        self.ttl = ttl
+        self.cache_file = Path(cache_file) if cache_file else None
+        self.rules = rules if rules is not None else PLATFORM_SESSION_RULES
+        self.probe_timeout = probe_timeout
+        self.probe_enabled = probe_enabled
+        self._http = http_session
+        self._lock = threading.Lock()
+        self._cache = None
+
+    @property
+    def http(self) -> requests.Session:
+        if self._http is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=32)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._http = session
+        return self._http
+
+    @staticmethod
+    def _key(account_file, platform: str) -> str:
+        return f"{platform}:{Path(account_file).resolve()}"
+
+    def _load_cache(self) -> dict:
+        if self._cache is None:
+            self._cache = {}
+            if self.cache_file and self.cache_file.exists():
+                try:
+                    with open(self.cache_file, 'r', encoding='utf-8') as f:
+                        self._cache = json.load(f)
+                except (OSError, ValueError):
+                    self._cache = {}
+        return self._cache
+
+    def _save_cache(self):
+        if not self.cache_file:
+            return
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        # 每次写入使用独立的临时文件，其他进程同时写入时不会互相覆盖一半的内容
+        fd, tmp_file = tempfile.mkstemp(prefix=self.cache_file.name, suffix='.tmp', dir=str(self.cache_file.parent))
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self._cache, f)
+            os.replace(tmp_file, self.cache_file)
+        except BaseException:
+            try:
+                os.remove(tmp_file)
+            except OSError:
+                pass
+            raise
+
+    def cached(self, account_file, platform: str) -> Optional[bool]:
+        with self._lock:
+            entry = self._load_cache().get(self._key(account_file, platform))
+        if entry and time.time() - entry['checked_at'] < self.ttl:
+            return entry['valid']
+        return None
+
+    def remember(self, account_file, platform: str, valid: bool):
+        """记录校验结果，只缓存有效的结果，失效的账号会走重新登录流程"""
+        with self._lock:
+            cache = self._load_cache()
+            key = self._key(account_file, platform)
+            if valid:
+                cache[key] = {'valid': True, 'checked_at': time.time()}
+            elif cache.pop(key, None) is None:
+                # 没有缓存过，不需要重写文件
+                return
+            self._save_cache()
+
+    def invalidate(self, account_file, platform: str):
+        self.remember(account_file, platform, False)
+
+    def probe(self, account_file, platform: str, storage_state: dict = None) -> Optional[bool]:
+        """
+        带上 cookie 请求探测地址：2xx / 3xx 为有效，401 / 403 或被重定向到登录页为失效；
+        网络异常、5xx、429 等无法说明登录态的结果返回 None，不缓存，由调用方回退到浏览器校验。
+        """
+        rule = self.rules.get(platform) or {}
+        probe_url = rule.get('probe_url')
+        if not probe_url:
+            return None
+        storage_state = storage_state or load_storage_state(account_file) or {}
+        cookies = {c['name']: c['value'] for c in storage_state.get('cookies') or []
+                   if not rule.get('domain') or _domain_matches(c.get('domain', ''), rule['domain'])}
+        try:
+            response = self.http.get(probe_url, cookies=cookies, timeout=self.probe_timeout, allow_redirects=True)
+        except requests.RequestException:
+            return None
+        if response.status_code in (401, 403):
+            return False
+        if is_login_url(platform, response.url, self.rules):
+            return False
+        if 200 <= response.status_code < 400:
+            return True
+        return None
+
+    async def check(self, account_file, platform: str, probe: bool = None) -> Optional[bool]:
+        if probe is None:
+            probe = self.probe_enabled if self.probe_enabled is not None else is_session_probe_enabled()
+        storage_state = load_storage_state(account_file)
+        if storage_state is None or not check_cookie_expiry(storage_state, platform, rules=self.rules):
+            self.invalidate(account_file, platform)
+            return False
+        verdict = self.cached(account_file, platform)
+        if verdict is not None:
+            return verdict
+        if probe:
+            verdict = await asyncio.to_thread(self.probe, account_file, platform, storage_state)
+            if verdict is not None:
+                self.remember(account_file, platform, verdict)
+            return verdict
+        return None
+
+
+session_validator = SessionValidator()
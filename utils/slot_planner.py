@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+多账号发布时间规划：为大量 (视频, 平台, 账号) 分配定时发布时间。
+
+同一平台下的每个账号按 SlotRule 约束：
+- daily_times: 每天的候选发布时间，如 ["08:00", "12:30"]；未设置时在 window 内按 min_spacing 取时间点；
+- daily_cap: 每天最多发布的条数；
+- min_spacing: 同一账号两次发布的最小间隔（分钟）；
+- blackouts: 禁止发布的时段，每天重复的 ["23:00", "07:00"]（可跨午夜）或具体的 ["2024-05-08 12:00", "2024-05-08 18:00"]；
+- timezone: 以上时间所在的时区，默认为 config.json 中的 timezone。
+
+每个账号维护一个只向前移动的候选时间游标和已占用时间的有序数组（bisect 查找相邻的占用时间检查间隔），
+分配一个时间的开销与队列长度无关。返回带时区的 datetime，uploader 填写时会换算成浏览器所在的时区。
+
+config.json 中可以按平台或 "平台/账号" 覆盖默认规则::
+
+    "slot_rules": {
+        "default": {"daily_cap": 2, "min_spacing": 120, "blackouts": [["00:00", "07:00"]]},
+        "douyin/xiaoA": {"daily_times": ["12:00", "18:00", "21:00"]}
+    }
+
+默认规则的 daily_times 取 publish_times，最早的发布时间不早于 publish_date。
+"""
+import argparse
+import bisect
+from datetime import datetime, time, timedelta
+
+from conf import get_config_section
+from utils.files_times import get_timezone, localize
+
+# 部分平台要求定时发布至少在两小时之后
+DEFAULT_LEAD_MINUTES = 120
+DEFAULT_WINDOW = ("08:00", "22:00")
+# 未设置 daily_times 和 min_spacing 时，window 内每小时一个候选时间
+DEFAULT_STEP_MINUTES = 60
+# 规则过严（如全天都在 blackouts 中）时，规划到这么多天之后仍没有空位即报错
+MAX_PLAN_DAYS = 3660
+
+
+def _parse_clock(value) -> int:
+    """"HH:MM" 或整数小时，返回当天的第几分钟"""
+    if isinstance(value, int):
+        hour, minute = value, 0
+    else:
+        hour, minute = map(int, str(value).split(':'))
+    if not (0 <= hour <= 23 and 0 <= minute <= 59):
+        raise ValueError(f"无效的时间 {value!r}，应为 HH:MM")
+    return hour * 60 + minute
+
+
+class SlotRule(object):
+    def __init__(self, daily_times=None, daily_cap: int = None, min_spacing: int = 0, blackouts=(),
+                 timezone: str = None, window=DEFAULT_WINDOW):
+        self.daily_times = sorted({_parse_clock(value) for value in daily_times}) if daily_times else None
+        self.daily_cap = daily_cap
+        self.min_spacing = timedelta(minutes=min_spacing)
+        self.tz = get_timezone(timezone)
+        self.window = (_parse_clock(window[0]), _parse_clock(window[1]))
+        # 每天重复的时段为 (起始分钟, 结束分钟)，具体时段为 (起始时间戳, 结束时间戳)
+        self.daily_blackouts, self.blackouts = [], []
+        for start, end in blackouts:
+            if ' ' in str(start):
+                self.blackouts.append(tuple(localize(datetime.strptime(value, '%Y-%m-%d %H:%M'), self.tz).timestamp()
+                                            for value in (start, end)))
+            else:
+                self.daily_blackouts.append((_parse_clock(start), _parse_clock(end)))
+
+    def clock_times(self) -> list:
+        """每天的候选时间（当天的第几分钟）"""
+        if self.daily_times:
+            return self.daily_times
+        step = int(self.min_spacing.total_seconds() // 60) or DEFAULT_STEP_MINUTES
+        return list(range(self.window[0], self.window[1] + 1, step))
+
+    def blocked(self, when: datetime) -> bool:
+        minute = when.hour * 60 + when.minute
+        for start, end in self.daily_blackouts:
+            if (start <= minute < end) if start <= end else (minute >= start or minute < end):
+                return True
+        timestamp = when.timestamp()
+        return any(start <= timestamp < end for start, end in self.blackouts)
+
+
+class _AccountCalendar(object):
+    def __init__(self, rule: SlotRule, start: datetime):
+        self.rule = rule
+        self.start = start
+        self.taken = []
+        self.per_day = {}
+        self._candidates = self._iter_candidates()
+
+    def _iter_candidates(self):
+        tz = self.rule.tz
+        day = self.start.astimezone(tz).date()
+        for _ in range(MAX_PLAN_DAYS):
+            for minute in self.rule.clock_times():
+                local = localize(datetime.combine(day, time(minute // 60, minute % 60)), tz)
+                # 夏令时切换时不存在的钟点（如 02:30）换算后会变成另一个时间，跳过
+                normalized = datetime.fromtimestamp(local.timestamp(), tz)
+                if (normalized.hour, normalized.minute) != (local.hour, local.minute):
+                    continue
+                if normalized >= self.start and not self.rule.blocked(normalized):
+                    yield normalized
+            day += timedelta(days=1)
+
+    def reserve(self, when: datetime):
+        bisect.insort(self.taken, when.timestamp())
+        day = when.astimezone(self.rule.tz).date()
+        self.per_day[day] = self.per_day.get(day, 0) + 1
+
+    def _fits(self, when: datetime) -> bool:
+        cap = self.rule.daily_cap
+        if cap is not None and self.per_day.get(when.date(), 0) >= cap:
+            return False
+        timestamp = when.timestamp()
+        # 间隔为 0 时也不允许同一账号在同一时刻发布两条
+        spacing = max(self.rule.min_spacing.total_seconds(), 1)
+        index = bisect.bisect_left(self.taken, timestamp)
+        if index < len(self.taken) and self.taken[index] - timestamp < spacing:
+            return False
+        return index == 0 or timestamp - self.taken[index - 1] >= spacing
+
+    def next_slot(self) -> datetime:
+        for when in self._candidates:
+            if self._fits(when):
+                self.reserve(when)
+                return when
+        raise ValueError(f"{MAX_PLAN_DAYS} 天内没有可用的发布时间，请检查 daily_cap / blackouts 设置")
+
+
+class SlotPlanner(object):
+    """
+    用法::
+
+        planner = SlotPlanner(SlotRule(daily_times=["12:00", "18:00"], min_spacing=60))
+        for (video, platform, account), publish_time in planner.plan(items):
+            ...
+
+    rules: {(platform, account) 或 platform: SlotRule}，都未匹配时使用 default。
+    start: 最早的发布时间，默认为当前时间加 DEFAULT_LEAD_MINUTES。
+    """
+
+    def __init__(self, default: SlotRule = None, rules: dict = None, start: datetime = None):
+        self.default = default or SlotRule()
+        self.rules = rules or {}
+        if start is None:
+            start = datetime.now().astimezone() + timedelta(minutes=DEFAULT_LEAD_MINUTES)
+        self.start = localize(start, self.default.tz)
+        self._calendars = {}
+
+    def rule_for(self, platform: str, account: str) -> SlotRule:
+        return self.rules.get((platform, account)) or self.rules.get(platform) or self.default
+
+    def _calendar(self, platform: str, account: str) -> _AccountCalendar:
+        key = (platform, account)
+        if key not in self._calendars:
+            self._calendars[key] = _AccountCalendar(self.rule_for(platform, account), self.start)
+        return self._calendars[key]
+
+    def reserve(self, platform: str, account: str, when: datetime):
+        """登记已经确定的发布时间（如清单中写明的时间），之后分配的时间会避开它"""
+        calendar = self._calendar(platform, account)
+        calendar.reserve(localize(when, calendar.rule.tz))
+
+    def next_slot(self, platform: str, account: str) -> datetime:
+        return self._calendar(platform, account).next_slot()
+
+    def plan(self, items) -> list:
+        """items: (video, platform, account) 序列，按顺序分配，返回 [(item, 发布时间)]"""
+        return [(item, self.next_slot(item[1], item[2])) for item in items]
+
+
+def load_planner(start: datetime = None) -> SlotPlanner:
+    """按 config.json 中的 timezone、publish_date、publish_times 和 slot_rules 创建规划器"""
+    base = {"daily_times": get_config_section("publish_times"), "timezone": get_config_section("timezone")}
+    overrides = dict(get_config_section("slot_rules", {}))
+    base.update(overrides.pop("default", {}))
+    rules = {}
+    for key, override in overrides.items():
+        platform, _, account = key.partition('/')
+        rules[(platform, account) if account else platform] = SlotRule(**dict(base, **override))
+    planner = SlotPlanner(SlotRule(**base), rules, start)
+    if get_config_section("publish_date"):
+        first_day = datetime.strptime(get_config_section("publish_date"), "%Y-%m-%d")
+        planner.start = max(planner.start, localize(first_day, planner.default.tz))
+    return planner
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Preview publish slots planned from config.json.")
+    parser.add_argument("platform")
+    parser.add_argument("account", nargs='+')
+    parser.add_argument("--count", type=int, default=10, help="slots per account")
+    args = parser.parse_args()
+    planner = load_planner()
+    for account in args.account:
+        for _ in range(args.count):
+            print(f"{args.platform}/{account} {planner.next_slot(args.platform, account).isoformat()}")
@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+"""
+上传各阶段的耗时追踪。
+
+每次上传是一条 trace，按顺序切换阶段（launch / navigate / transfer / form_fill / publish），
+同名阶段在一次上传中多次出现时耗时累加。trace 结束时把整体耗时与各阶段耗时写入
+logs/trace.jsonl（按大小轮转），每条记录带有 platform、account、file_size、attempt 标签。
+
+由环境变量 SAU_TRACE=1 或 config.json 中的 "tracing": true 开启；未开启时各接口均为空操作。
+
+汇总报告::
+
+    python -m utils.tracing report [--platform douyin]
+"""
+import argparse
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from pathlib import Path
+
+from conf import BASE_DIR, get_config_section, on_config_reset
+
+TRACE_FILE = Path(BASE_DIR / "logs" / "trace.jsonl")
+TRACE_ROTATION_BYTES = 10 * 1024 * 1024
+TRACE_BACKUPS = 5
+# 整次上传的记录名，各阶段的记录名即阶段名
+ROOT_SPAN = "upload"
+FIRST_STAGE = "launch"
+
+_enabled = None
+_current_trace = ContextVar("sau_current_trace", default=None)
+_bound_tags = ContextVar("sau_trace_tags", default={})
+
+
+def is_tracing_enabled() -> bool:
+    global _enabled
+    if _enabled is None:
+        env = os.environ.get("SAU_TRACE")
+        if env is not None:
+            _enabled = env.lower() in ("1", "true", "yes")
+        else:
+            _enabled = bool(get_config_section("tracing", False))
+    return _enabled
+
+
+@on_config_reset
+def set_tracing_enabled(enabled: bool = None):
+    """enabled 为 None 时恢复为按配置决定"""
+    global _enabled
+    _enabled = enabled
+
+
+class TraceWriter(object):
+    """线程安全、按大小轮转的 JSONL 写入器"""
+
+    def __init__(self, path=TRACE_FILE, max_bytes: int = TRACE_ROTATION_BYTES, backups: int = TRACE_BACKUPS):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._lock = threading.Lock()
+        self._file = None
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        for index in range(self.backups - 1, 0, -1):
+            source = self.path.with_name(f"{self.path.name}.{index}")
+            if source.exists():
+                os.replace(source, self.path.with_name(f"{self.path.name}.{index + 1}"))
+        os.replace(self.path, self.path.with_name(f"{self.path.name}.1"))
+
+    def write(self, records: list):
+        lines = ''.join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+        with self._lock:
+            if self._file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(lines)
+            self._file.flush()
+            if self._file.tell() >= self.max_bytes:
+                self._rotate()
+
+
+_writer = TraceWriter()
+
+
+def set_trace_file(path):
+    """把之后结束的 trace 写入 path，例如 benchmarks 中每次运行单独的文件"""
+    global _writer
+    _writer = TraceWriter(path)
+
+
+class _NoopTrace(object):
+    """未开启追踪时使用的空对象"""
+
+    def stage(self, name: str):
+        pass
+
+    def tag(self, **tags):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_TRACE = _NoopTrace()
+
+
+class UploadTrace(object):
+    def __init__(self, platform: str, tags: dict, writer: TraceWriter = None):
+        self.trace_id = uuid.uuid4().hex
+        self.platform = platform
+        self.tags = tags
+        self.writer = writer or _writer
+        self._stages = {}
+        self._stage = None
+        self._stage_start = 0.0
+        self._start_wall = 0.0
+        self._start = 0.0
+        self._token = None
+
+    def _close_stage(self, now: float):
+        if self._stage is not None:
+            self._stages[self._stage] = self._stages.get(self._stage, 0.0) + now - self._stage_start
+            self._stage = None
+
+    def stage(self, name: str):
+        """结束当前阶段并开始新阶段"""
+        now = time.perf_counter()
+        self._close_stage(now)
+        self._stage = name
+        self._stage_start = now
+
+    def tag(self, **tags):
+        self.tags.update(tags)
+
+    def __enter__(self):
+        self._start_wall = time.time()
+        self._start = time.perf_counter()
+        self._token = _current_trace.set(self)
+        self.stage(FIRST_STAGE)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        now = time.perf_counter()
+        # 出错时记录失败发生在哪个阶段
+        failed_stage = self._stage
+        self._close_stage(now)
+        _current_trace.reset(self._token)
+        base = {"trace_id": self.trace_id, "ts": round(self._start_wall, 3), "platform": self.platform}
+        base.update(self.tags)
+        status = {"status": "ok"} if exc_type is None else {
+            "status": "error", "error": f"{exc_type.__name__}: {exc}"[:500], "failed_stage": failed_stage}
+        records = [dict(base, span=ROOT_SPAN, duration_ms=round((now - self._start) * 1000, 1), **status)]
+        for name, seconds in self._stages.items():
+            records.append(dict(base, span=name, duration_ms=round(seconds * 1000, 1),
+                                status="error" if exc_type is not None and name == failed_stage else "ok"))
+        try:
+            self.writer.write(records)
+        except OSError:
+            # 追踪失败不影响上传
+            pass
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+
+def _file_size(file) -> int:
+    try:
+        return os.path.getsize(file)
+    except (OSError, TypeError):
+        return None
+
+
+def trace_upload(platform: str, account_file=None, file=None, **tags):
+    """
+    追踪一次上传，作为 with / async with 使用::
+
+        async with trace_upload(SOCIAL_MEDIA_DOUYIN, self.account_file, self.file_path):
+            await self.upload(playwright)
+
+    进入时处于 launch 阶段，uploader 内部用 trace_stage() 切换阶段。
+    """
+    if not is_tracing_enabled():
+        return _NOOP_TRACE
+    merged = dict(_bound_tags.get())
+    merged.update({
+        "account": Path(account_file).stem if account_file else None,
+        "file_size": _file_size(file) if file else None,
+    })
+    merged.setdefault("attempt", 1)
+    merged.update(tags)
+    return UploadTrace(platform, merged)
+
+
+def trace_stage(name: str):
+    """切换当前上传的阶段，不在 trace 中或未开启时为空操作"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.stage(name)
+
+
+def trace_tag(**tags):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.tag(**tags)
+
+
+def bound_tag(name: str, default=None):
+    """bind_tags 绑定的标签值，例如当前任务的 attempt"""
+    return _bound_tags.get().get(name, default)
+
+
+class bind_tags(object):
+    """为其中开始的 trace 附加标签，例如调度器传入的 attempt"""
+
+    def __init__(self, **tags):
+        self.tags = tags
+        self._token = None
+
+    def __enter__(self):
+        merged = dict(_bound_tags.get())
+        merged.update(self.tags)
+        self._token = _bound_tags.set(merged)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _bound_tags.reset(self._token)
+        return False
+
+
+# ---- 汇总报告 ----
+
+def _trace_files(path: Path) -> list:
+    # 轮转的备份编号越大越旧
+    backups = [f for f in path.parent.glob(f"{path.name}.*") if f.suffix.lstrip('.').isdigit()]
+    backups.sort(key=lambda f: int(f.suffix.lstrip('.')), reverse=True)
+    return backups + ([path] if path.exists() else [])
+
+
+def load_records(path=TRACE_FILE) -> list:
+    records = []
+    for file in _trace_files(Path(path)):
+        with open(file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # 进程中断时可能留下半行
+                    continue
+    return records
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """最近秩法百分位数"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+_STAGE_ORDER = {name: index for index, name in
+                enumerate([ROOT_SPAN, "launch", "navigate", "transfer", "form_fill", "publish"])}
+
+
+def summarize(records: list, platform: str = None) -> list:
+    groups = {}
+    for record in records:
+        if platform and record.get("platform") != platform:
+            continue
+        groups.setdefault((record.get("platform"), record.get("span")), []).append(record)
+    rows = []
+    for (group_platform, span), items in groups.items():
+        durations = sorted(item["duration_ms"] for item in items)
+        rows.append({
+            "platform": group_platform,
+            "span": span,
+            "count": len(items),
+            "errors": sum(1 for item in items if item.get("status") == "error"),
+            "p50": percentile(durations, 50),
+            "p95": percentile(durations, 95),
+            "p99": percentile(durations, 99),
+            "max": durations[-1],
+        })
+    rows.sort(key=lambda row: (row["platform"] or "", _STAGE_ORDER.get(row["span"], len(_STAGE_ORDER)), row["span"]))
+    return rows
+
+
+def print_report(rows: list):
+    header = f"{'platform':<12}{'stage':<12}{'count':>7}{'errors':>8}{'p50(s)':>10}{'p95(s)':>10}{'p99(s)':>10}{'max(s)':>10}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(f"{row['platform'] or '-':<12}{row['span']:<12}{row['count']:>7}{row['errors']:>8}"
+              f"{row['p50'] / 1000:>10.2f}{row['p95'] / 1000:>10.2f}{row['p99'] / 1000:>10.2f}{row['max'] / 1000:>10.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Upload stage latency report.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    report_parser = subparsers.add_parser("report", help="p50/p95/p99 per stage and platform")
+    report_parser.add_argument("--file", default=str(TRACE_FILE), help="trace file, rotated backups are included")
+    report_parser.add_argument("--platform", help="only this platform")
+    args = parser.parse_args()
+    if args.command == "report":
+        print_report(summarize(load_records(args.file), args.platform))
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""
+按平台转码：高码率的原片先用本地 ffmpeg 压到平台实际保留的分辨率和码率，再上传更小的文件。
+
+- 只有超出 RENDITION_PROFILES 中分辨率/码率上限或编码不受支持的视频才重新编码，
+  其余 moov 不在文件头的视频只做一次 faststart 封装（-c copy）；
+- 转码结果以 "源文件内容哈希 + 平台参数" 命名，缓存在 cache/transcode 下，超过磁盘预算时按最近使用时间淘汰，
+  本进程中正在上传的文件（见 upload_rendition）不会被淘汰；
+- 同时运行的 ffmpeg 进程数按 CPU 核数限制。
+
+由环境变量 SAU_TRANSCODE=1 或 config.json 中的 "transcode": true 开启，预算由 "transcode_cache_gb" 设置；
+未开启或找不到 ffmpeg 时直接返回原文件。批量预先转码::
+
+    python -m utils.transcode videos --platform douyin
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from conf import BASE_DIR, get_config_section, on_config_reset
+from utils.base_social_media import SOCIAL_MEDIA_DOUYIN, SOCIAL_MEDIA_TENCENT, SOCIAL_MEDIA_TIKTOK, \
+    SOCIAL_MEDIA_BILIBILI, SOCIAL_MEDIA_KUAISHOU, SOCIAL_MEDIA_BAIJIAHAO, SOCIAL_MEDIA_XHS
+from utils.dedup import content_hash
+from utils.preflight import H264_H265, MP4_SUFFIXES, probe_many
+
+TRANSCODE_CACHE_DIR = Path(BASE_DIR / "cache" / "transcode")
+DEFAULT_CACHE_GB = 20
+# 每个 ffmpeg 进程使用的线程数，同时运行的进程数 = CPU 核数 // THREADS_PER_JOB
+THREADS_PER_JOB = 4
+# 码率超出上限不多时不值得重新编码
+BITRATE_TOLERANCE = 1.15
+
+# 各平台二次编码后保留的大致规格，上传超出的部分只会被平台丢弃
+RENDITION_PROFILES = {
+    SOCIAL_MEDIA_DOUYIN: {"max_short_side": 1080, "video_kbps": 8000, "audio_kbps": 192},
+    SOCIAL_MEDIA_TENCENT: {"max_short_side": 1080, "video_kbps": 6000, "audio_kbps": 128},
+    SOCIAL_MEDIA_TIKTOK: {"max_short_side": 1080, "video_kbps": 6000, "audio_kbps": 128},
+    SOCIAL_MEDIA_KUAISHOU: {"max_short_side": 1080, "video_kbps": 8000, "audio_kbps": 192},
+    SOCIAL_MEDIA_BAIJIAHAO: {"max_short_side": 1080, "video_kbps": 6000, "audio_kbps": 128},
+    SOCIAL_MEDIA_BILIBILI: {"max_short_side": 2160, "video_kbps": 20000, "audio_kbps": 320},
+    SOCIAL_MEDIA_XHS: {"max_short_side": 1080, "video_kbps": 8000, "audio_kbps": 192},
+}
+
+_settings = None
+_slots = threading.BoundedSemaphore(max(1, (os.cpu_count() or 1) // THREADS_PER_JOB))
+_locks_guard = threading.Lock()
+_output_locks = {}
+# 正在使用的转码文件 -> 引用数，受 _locks_guard 保护
+_pinned = {}
+
+
+def _load_settings() -> dict:
+    global _settings
+    if _settings is None:
+        env = os.environ.get("SAU_TRANSCODE")
+        enabled = get_config_section("transcode", False)
+        _settings = {
+            "enabled": env.lower() in ("1", "true", "yes") if env is not None else bool(enabled),
+            "budget": float(get_config_section("transcode_cache_gb", DEFAULT_CACHE_GB)) * 1024 * 1024 * 1024,
+            "ffmpeg": os.environ.get("SAU_FFMPEG") or shutil.which("ffmpeg"),
+        }
+    return _settings
+
+
+@on_config_reset
+def _reset_settings():
+    global _settings
+    _settings = None
+
+
+def is_transcode_enabled() -> bool:
+    settings = _load_settings()
+    return settings["enabled"] and settings["ffmpeg"] is not None
+
+
+def set_transcode_enabled(enabled: bool):
+    _load_settings()["enabled"] = enabled
+
+
+def ffmpeg_path():
+    """SAU_FFMPEG 或 PATH 中的 ffmpeg，找不到时返回 None"""
+    return _load_settings()["ffmpeg"]
+
+
+def _profile_tag(profile: dict) -> str:
+    return hashlib.sha1(json.dumps(profile, sort_keys=True).encode('utf-8')).hexdigest()[:8]
+
+
+def plan(info: dict, platform: str):
+    """根据 preflight 的解析结果决定处理方式：None（原样上传）、"remux" 或 "encode" """
+    profile = RENDITION_PROFILES.get(platform)
+    if profile is None or "duration" not in info or not info.get("video_codec"):
+        # 非 MP4 容器或无法识别的视频交给平台处理
+        return None
+    short_side = min(info["width"] or 0, info["height"] or 0)
+    max_bitrate = (profile["video_kbps"] + profile["audio_kbps"]) * 1000 * BITRATE_TOLERANCE
+    if short_side > profile["max_short_side"] or (info["bitrate"] or 0) > max_bitrate \
+            or info["video_codec"] not in H264_H265:
+        return "encode"
+    if info.get("faststart") is False:
+        return "remux"
+    return None
+
+
+def _ffmpeg_args(ffmpeg: str, source: Path, target: Path, mode: str, info: dict, profile: dict) -> list:
+    args = [ffmpeg, "-hide_banner", "-loglevel", "error", "-nostdin", "-y", "-i", str(source)]
+    if mode == "remux":
+        args += ["-c", "copy"]
+    else:
+        video_kbps = profile["video_kbps"]
+        args += ["-c:v", "libx264", "-preset", "medium", "-crf", "20", "-pix_fmt", "yuv420p",
+                 "-maxrate", f"{video_kbps}k", "-bufsize", f"{video_kbps * 2}k",
+                 "-c:a", "aac", "-b:a", f"{profile['audio_kbps']}k", "-threads", str(THREADS_PER_JOB)]
+        if min(info["width"] or 0, info["height"] or 0) > profile["max_short_side"]:
+            # 按短边缩放，保持宽高比；ffmpeg 默认先按旋转信息转正，iw/ih 即显示宽高
+            side = profile["max_short_side"]
+            args += ["-vf", f"scale='if(gte(iw,ih),-2,{side})':'if(gte(iw,ih),{side},-2)'"]
+    return args + ["-movflags", "+faststart", "-f", "mp4", str(target)]
+
+
+def _output_lock(target: Path) -> threading.Lock:
+    with _locks_guard:
+        return _output_locks.setdefault(target, threading.Lock())
+
+
+def _pin(target: Path) -> bool:
+    """文件仍存在时增加引用数，之后 evict 不会删除它"""
+    with _locks_guard:
+        if not target.exists():
+            return False
+        _pinned[target] = _pinned.get(target, 0) + 1
+        return True
+
+
+def _unpin(target: Path):
+    with _locks_guard:
+        if _pinned.get(target, 0) > 1:
+            _pinned[target] -= 1
+        else:
+            _pinned.pop(target, None)
+
+
+def evict(budget: float, cache_dir: Path = TRANSCODE_CACHE_DIR, keep: Path = None) -> int:
+    """按最近使用时间淘汰缓存，直到总大小不超过 budget，返回删除的文件数；跳过 keep 和正在使用的文件"""
+    entries = []
+    for file in cache_dir.glob("*.mp4"):
+        try:
+            stat = file.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, file))
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, file in sorted(entries):
+        if total <= budget:
+            break
+        if file == keep:
+            continue
+        with _locks_guard:
+            if file in _pinned:
+                continue
+            try:
+                file.unlink()
+            except OSError:
+                # Windows 下其他进程正在上传的文件无法删除
+                continue
+        total -= size
+        removed += 1
+    return removed
+
+
+def prepare_video(video, platform: str, cache_dir: Path = TRANSCODE_CACHE_DIR, pin: bool = False):
+    """
+    返回实际要上传的文件：需要时转码并缓存，否则返回原文件；类型与传入的 video 一致。
+    pin 为 True 时返回的转码文件在 _unpin 之前不会被淘汰。
+    """
+    if not is_transcode_enabled():
+        return video
+    source = Path(video).resolve()
+    if source.parent == cache_dir.resolve() or source.suffix.lower() not in MP4_SUFFIXES:
+        return video
+    info, _ = probe_many([source])[str(source)]
+    mode = plan(info, platform) if info else None
+    if mode is None:
+        return video
+
+    settings = _load_settings()
+    profile = RENDITION_PROFILES[platform]
+    target = cache_dir / f"{content_hash(source)[:32]}-{platform}-{_profile_tag(profile)}.mp4"
+    with _output_lock(target):
+        cached = _pin(target) if pin else target.exists()
+        if cached:
+            # 命中缓存，刷新最近使用时间
+            os.utime(target)
+        else:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            partial = target.with_suffix(".part")
+            with _slots:
+                proc = subprocess.run(_ffmpeg_args(settings["ffmpeg"], source, partial, mode, info, profile),
+                                      capture_output=True, text=True, errors='replace')
+            if proc.returncode != 0:
+                partial.unlink(missing_ok=True)
+                print(f"[-] {source.name} 转码失败，上传原文件: {proc.stderr.strip()[-500:]}")
+                return video
+            os.replace(partial, target)
+            if pin:
+                _pin(target)
+            print(f"[+] {source.name} -> {platform} ({mode}) "
+                  f"{info['size'] / 1024 / 1024:.1f}MB -> {target.stat().st_size / 1024 / 1024:.1f}MB")
+            evict(settings["budget"], cache_dir, keep=target)
+    return str(target) if isinstance(video, str) else target
+
+
+async def prepare_upload(video, platform: str):
+    """prepare_video 的异步版本，未开启转码时不切换线程"""
+    if not is_transcode_enabled():
+        return video
+    return await asyncio.to_thread(prepare_video, video, platform)
+
+
+@asynccontextmanager
+async def upload_rendition(video, platform: str):
+    """
+    prepare_upload 的上下文管理器版本，上传期间锁定转码文件，其他任务转码时的淘汰不会删除它::
+
+        async with upload_rendition(job.video, job.platform) as video:
+            await plugin.upload(..., video, ...)
+    """
+    if not is_transcode_enabled():
+        yield video
+        return
+    prepared = await asyncio.to_thread(prepare_video, video, platform, pin=True)
+    try:
+        yield prepared
+    finally:
+        if prepared is not video:
+            _unpin(Path(prepared))
+
+
+def prepare_many(videos, platform: str) -> list:
+    """批量预先转码，并发数与 ffmpeg 进程上限一致"""
+    probe_many(videos)
+    workers = max(1, (os.cpu_count() or 1) // THREADS_PER_JOB)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda video: prepare_video(video, platform), videos))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Transcode videos into per-platform renditions ahead of upload.")
+    parser.add_argument("directory", help="folder of source videos")
+    parser.add_argument("--platform", required=True, choices=list(RENDITION_PROFILES))
+    args = parser.parse_args()
+    set_transcode_enabled(True)
+    if not is_transcode_enabled():
+        raise SystemExit("找不到 ffmpeg，请安装或通过 SAU_FFMPEG 指定路径")
+    sources = sorted(file for file in Path(args.directory).iterdir() if file.suffix.lower() in MP4_SUFFIXES)
+    for source, output in zip(sources, prepare_many(sources, args.platform)):
+        print(f"{source} -> {output}")
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+uploader 插件注册表。
+
+注册表只记录平台名到插件入口（"模块:属性"）的映射，某个平台第一次被使用时才导入对应模块，
+因此 `cli_main.py --help` 或单个平台的 login 不会导入其他平台的 uploader 与 playwright。
+
+第三方插件可以在安装包的 entry points 中注册到 "social_auto_upload.uploaders" 组，
+或在运行时调用 register_uploader()。
+"""
+import importlib
+
+from utils.base_social_media import SOCIAL_MEDIA_DOUYIN, SOCIAL_MEDIA_TENCENT, SOCIAL_MEDIA_TIKTOK, \
+    SOCIAL_MEDIA_BILIBILI, SOCIAL_MEDIA_KUAISHOU, SOCIAL_MEDIA_BAIJIAHAO, SOCIAL_MEDIA_XHS
+
+ENTRY_POINT_GROUP = "social_auto_upload.uploaders"
+
+BUILTIN_UPLOADERS = {
+    SOCIAL_MEDIA_DOUYIN: "uploader.douyin_uploader.main:DouyinPlugin",
+    SOCIAL_MEDIA_TENCENT: "uploader.tencent_uploader.main:TencentPlugin",
+    SOCIAL_MEDIA_TIKTOK: "uploader.tk_uploader.main_chrome:TiktokPlugin",
+    SOCIAL_MEDIA_KUAISHOU: "uploader.ks_uploader.main:KuaishouPlugin",
+    SOCIAL_MEDIA_BAIJIAHAO: "uploader.baijiahao_uploader.main:BaijiahaoPlugin",
+    SOCIAL_MEDIA_BILIBILI: "uploader.bilibili_uploader.main:BilibiliPlugin",
+    SOCIAL_MEDIA_XHS: "uploader.xhs_uploader.main:XhsPlugin",
+}
+
+_entry_points = dict(BUILTIN_UPLOADERS)
+_installed = None
+_plugins = {}
+
+
+class UploaderPlugin(object):
+    """
+    一个平台的接入点，CLI 与 UploadScheduler 都通过它完成登录检查和上传。
+
+    基于 playwright 的平台实现 create()，返回带 async main() 的 uploader；
+    其他平台（例如直接调用接口的 bilibili、xhs）覆盖 upload()，并将 uses_browser 设为 False。
+    """
+    name = None
+    # 为 True 时 UploadScheduler 会从浏览器池中分配 context 注入给 uploader
+    uses_browser = True
+
+    async def setup(self, account_file, handle: bool = False) -> bool:
+        """检查 cookie 是否有效，handle 为 True 时在失效时引导登录"""
+        raise NotImplementedError
+
+    def create(self, short_title, tags, video, publish_date, account_file, thumbnail=None, context=None,
+               description=""):
+        """description 为 .txt 中标题之后的正文（不含话题），需要整段文字的平台用它拼接描述"""
+        raise NotImplementedError
+
+    async def upload(self, short_title, tags, video, publish_date, account_file, thumbnail=None,
+                     context=None, description=""):
+        app = self.create(short_title, tags, video, publish_date, account_file, thumbnail, context, description)
+        await app.main()
+
+
+def register_uploader(name: str, entry_point: str):
+    """注册或覆盖平台插件，entry_point 形如 "package.module:PluginClass" """
+    _entry_points[name] = entry_point
+    _plugins.pop(name, None)
+
+
+def _installed_entry_points() -> dict:
+    """已安装的包注册到 ENTRY_POINT_GROUP 的插件，只读取包的元数据，不导入插件模块"""
+    global _installed
+    if _installed is None:
+        from importlib.metadata import entry_points
+        _installed = {entry_point.name: entry_point.value for entry_point in entry_points(group=ENTRY_POINT_GROUP)}
+    return _installed
+
+
+def available_uploaders() -> list:
+    """已知的平台名：内置、register_uploader() 注册的以及已安装包的 entry points，不导入任何插件模块"""
+    return list(_entry_points) + [name for name in _installed_entry_points() if name not in _entry_points]
+
+
+def load_uploader(name: str) -> UploaderPlugin:
+    """按平台名加载插件，首次调用时才导入插件所在模块"""
+    plugin = _plugins.get(name)
+    if plugin is not None:
+        return plugin
+    spec = _entry_points.get(name) or _installed_entry_points().get(name)
+    if spec is None:
+        raise ValueError(f"不支持的平台: {name}")
+    module_name, _, attribute = spec.partition(':')
+    target = getattr(importlib.import_module(module_name), attribute)
+    plugin = target() if isinstance(target, type) else target
+    if plugin.name is None:
+        plugin.name = name
+    _plugins[name] = plugin
+    return plugin
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+事件驱动的等待引擎。
+
+取代 `while True: count() + asyncio.sleep(2)` 式的轮询：各条件交给 playwright 自身的
+wait_for / wait_for_function(polling="mutation") 在页面内等待，状态一变化立刻唤醒，
+同时每个阶段都有一个硬性的总截止时间。
+"""
+import asyncio
+import time
+
+# 各阶段默认的总截止时间（秒）
+NAVIGATION_TIMEOUT = 60
+UPLOAD_TIMEOUT = 60 * 60
+PUBLISH_TIMEOUT = 5 * 60
+
+
+class StageTimeout(TimeoutError):
+    """某个阶段超过了总截止时间"""
+
+    def __init__(self, stage: str, timeout: float):
+        super().__init__(f"{stage} 超过 {timeout:.0f} 秒仍未完成")
+        self.stage = stage
+        self.timeout = timeout
+
+
+class Deadline(object):
+    """一个阶段的总截止时间，在循环中多次等待时共享"""
+
+    def __init__(self, seconds: float, stage: str = "stage"):
+        self.seconds = seconds
+        self.stage = stage
+        self._end = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self._end - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def remaining_ms(self) -> float:
+        # playwright 把 timeout=0 视为不限时，截止时间已过时仍传 1 毫秒，让等待立即超时
+        return max(1.0, self.remaining() * 1000)
+
+    def check(self):
+        if self.expired:
+            raise StageTimeout(self.stage, self.seconds)
+
+
+def _is_timeout(exc: BaseException) -> bool:
+    # playwright 的 TimeoutError 不是内置 TimeoutError 的子类
+    return isinstance(exc, (TimeoutError, asyncio.TimeoutError)) or type(exc).__name__ == "TimeoutError"
+
+
+def _as_deadline(timeout, stage: str) -> Deadline:
+    return timeout if isinstance(timeout, Deadline) else Deadline(timeout, stage)
+
+
+async def _cancel(tasks):
+    for task in tasks:
+        task.cancel()
+    # 等待被取消的任务结束，吞掉它们的异常
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def wait_for_first(conditions: dict, timeout=NAVIGATION_TIMEOUT, stage: str = "wait") -> str:
+    """
+    同时等待多个 locator 条件，返回最先满足的条件名。
+
+    conditions: {name: locator} 或 {name: (locator, state)}，state 默认为 "visible"，
+    可取 playwright Locator.wait_for 支持的 attached/detached/visible/hidden。
+    timeout 可以是秒数或共享的 Deadline，超时抛出 StageTimeout；
+    所有条件都因其他原因失败（页面已关闭、目标崩溃等）时抛出第一个失败的异常。
+    """
+    deadline = _as_deadline(timeout, stage)
+    deadline.check()
+    errors = []
+    tasks = {}
+    for name, condition in conditions.items():
+        locator, state = condition if isinstance(condition, tuple) else (condition, "visible")
+        task = asyncio.ensure_future(locator.first.wait_for(state=state, timeout=deadline.remaining_ms()))
+        tasks[task] = name
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=deadline.remaining(),
+                                               return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for task in done:
+                if task.exception() is None:
+                    return tasks[task]
+                errors.append(task.exception())
+        if pending or deadline.expired or not errors or any(_is_timeout(e) for e in errors):
+            raise StageTimeout(deadline.stage, deadline.seconds) from (errors[0] if errors else None)
+        raise errors[0]
+    finally:
+        await _cancel(list(pending))
+
+
+async def wait_for_gone(locator, timeout=UPLOAD_TIMEOUT, stage: str = "wait") -> None:
+    """等待元素消失（不存在或不可见）"""
+    deadline = _as_deadline(timeout, stage)
+    try:
+        await locator.first.wait_for(state="hidden", timeout=deadline.remaining_ms())
+    except Exception as e:
+        if deadline.expired:
+            raise StageTimeout(deadline.stage, deadline.seconds) from e
+        raise
+
+
+async def wait_for_js(frame, expression: str, arg=None, timeout=NAVIGATION_TIMEOUT, stage: str = "wait"):
+    """
+    在页面内等待 JS 表达式为真，借助 MutationObserver 在 DOM 变化时才重新求值。
+    frame 可以是 Page 或 Frame。
+    """
+    deadline = _as_deadline(timeout, stage)
+    try:
+        handle = await frame.wait_for_function(expression, arg=arg, polling="mutation",
+                                               timeout=deadline.remaining_ms())
+    except Exception as e:
+        if deadline.expired:
+            raise StageTimeout(deadline.stage, deadline.seconds) from e
+        raise
+    return await handle.json_value()
+
+
+# 在 root 下出现任何子树变化、属性或文本变化时 resolve
+_MUTATION_PROMISE_JS = """
+([selector, timeoutMs]) => new Promise((resolve) => {
+    const root = (selector && document.querySelector(selector)) || document.body;
+    const timer = setTimeout(() => { observer.disconnect(); resolve(false); }, timeoutMs);
+    const observer = new MutationObserver(() => {
+        clearTimeout(timer);
+        observer.disconnect();
+        resolve(true);
+    });
+    observer.observe(root, {subtree: true, childList: true, attributes: true, characterData: true});
+})
+"""
+
+
+async def wait_for_mutation(frame, selector: str = None, timeout: float = 10) -> bool:
+    """等待 selector（默认 body）下的下一次 DOM 变化，超时返回 False"""
+    return await frame.evaluate(_MUTATION_PROMISE_JS, [selector, int(timeout * 1000)])
+
+
+async def wait_for_response(page, url_part: str, timeout=UPLOAD_TIMEOUT, stage: str = "wait", ok_only: bool = True):
+    """等待 URL 中包含 url_part 的网络响应"""
+    deadline = _as_deadline(timeout, stage)
+
+    def predicate(response):
+        return url_part in response.url and (response.ok or not ok_only)
+
+    try:
+        return await page.wait_for_event("response", predicate, timeout=deadline.remaining_ms())
+    except Exception as e:
+        if deadline.expired:
+            raise StageTimeout(deadline.stage, deadline.seconds) from e
+        raise
+
+
+async def wait_for_any_url(page, urls, timeout=NAVIGATION_TIMEOUT, stage: str = "navigate") -> str:
+    """等待页面跳转到 urls 中的任意一个，返回命中的地址"""
+    deadline = _as_deadline(timeout, stage)
+    urls = list(urls)
+
+    def matches(url: str) -> bool:
+        return any(url == target or url.startswith(target) for target in urls)
+
+    try:
+        await page.wait_for_url(matches, timeout=deadline.remaining_ms())
+    except Exception as e:
+        if deadline.expired:
+            raise StageTimeout(deadline.stage, deadline.seconds) from e
+        raise
+    return next(target for target in urls if page.url == target or page.url.startswith(target))
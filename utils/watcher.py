@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+监视投放目录，产出已经写完的视频文件。
+
+Linux 上通过 ctypes 调用 inotify，其他平台回退到基于 os.scandir 的轮询。
+视频的大小与 mtime 在 stable_seconds 内保持不变、且同名 .txt / 封面图也已写完时才视为就绪，
+避免上传复制到一半的文件。
+"""
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import struct
+import sys
+import time
+from pathlib import Path
+
+from utils.files_times import COVER_SUFFIXES
+
+# inotify 事件，见 <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+_EVENT_HEADER = struct.Struct("iIII")
+
+DEFAULT_STABLE_SECONDS = 5
+DEFAULT_POLL_INTERVAL = 2
+# 视频就绪后等待同名 .txt 出现的最长时间
+DEFAULT_TXT_WAIT = 30
+
+
+class _Inotify(object):
+    def __init__(self, directory: Path):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        if libc.inotify_add_watch(self.fd, os.fsencode(str(directory)), _WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, os.strerror(errno))
+
+    def read(self):
+        """读取已到达的事件，返回 (变化的文件名集合, 是否溢出)"""
+        names, overflow = set(), False
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return names, overflow
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(data):
+                _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b"\0")
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    overflow = True
+                elif name:
+                    names.add(os.fsdecode(name))
+
+    def close(self):
+        os.close(self.fd)
+
+
+class _Candidate(object):
+    def __init__(self, size: int, mtime: int, now: float):
+        self.size = size
+        self.mtime = mtime
+        self.first_seen = now
+        self.stable_since = now
+
+
+class DirectoryWatcher(object):
+    """
+    用法::
+
+        async for video in DirectoryWatcher(BASE_DIR / "videos"):
+            ...
+
+    已产出的文件在大小或 mtime 变化（被重新复制）之前不会再次产出。
+    """
+
+    def __init__(self, directory, suffixes=('.mp4',), stable_seconds: float = DEFAULT_STABLE_SECONDS,
+                 poll_interval: float = DEFAULT_POLL_INTERVAL, txt_wait: float = DEFAULT_TXT_WAIT,
+                 use_inotify: bool = None):
+        self.directory = Path(directory)
+        self.suffixes = tuple(s.lower() for s in suffixes)
+        self.stable_seconds = stable_seconds
+        self.poll_interval = poll_interval
+        self.txt_wait = txt_wait
+        self.use_inotify = sys.platform.startswith("linux") if use_inotify is None else use_inotify
+        self._pending = {}
+        self._emitted = {}
+
+    def _is_video(self, name: str) -> bool:
+        return not name.startswith('.') and name.lower().endswith(self.suffixes)
+
+    def _observe(self, path: Path, now: float):
+        key = str(path)
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            self._pending.pop(key, None)
+            self._emitted.pop(key, None)
+            return
+        signature = (stat.st_size, stat.st_mtime_ns)
+        if self._emitted.get(key) == signature:
+            return
+        candidate = self._pending.get(key)
+        if candidate is None:
+            self._pending[key] = _Candidate(stat.st_size, stat.st_mtime_ns, now)
+        elif (candidate.size, candidate.mtime) != signature:
+            candidate.size, candidate.mtime = signature
+            candidate.stable_since = now
+
+    def _scan(self, now: float):
+        seen = set()
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file() and self._is_video(entry.name):
+                    seen.add(entry.path)
+                    self._observe(Path(entry.path), now)
+        # 已被删除或移走的文件
+        for key in [k for k in self._pending if k not in seen]:
+            del self._pending[key]
+        for key in [k for k in self._emitted if k not in seen]:
+            del self._emitted[key]
+
+    def _companions_settled(self, video: Path, candidate: _Candidate, now: float) -> bool:
+        txt = video.with_suffix('.txt')
+        if not txt.exists() and now - candidate.first_seen < self.txt_wait:
+            return False
+        wall_now = time.time()
+        for companion in [txt] + [video.with_suffix(s) for s in COVER_SUFFIXES]:
+            try:
+                mtime = companion.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            if wall_now - mtime < self.stable_seconds:
+                return False
+        return True
+
+    def _collect_ready(self, now: float) -> list:
+        ready = []
+        for key, candidate in list(self._pending.items()):
+            if candidate.size == 0 or now - candidate.stable_since < self.stable_seconds:
+                continue
+            video = Path(key)
+            if not self._companions_settled(video, candidate, now):
+                continue
+            del self._pending[key]
+            self._emitted[key] = (candidate.size, candidate.mtime)
+            ready.append(video)
+        return sorted(ready)
+
+    def _on_names(self, names, now: float):
+        for name in names:
+            if self._is_video(name):
+                self._observe(self.directory / name, now)
+            else:
+                # .txt / 封面图的变化交给 _companions_settled 判断，这里只刷新对应的视频
+                stem = os.path.splitext(name)[0]
+                for key in list(self._pending):
+                    if os.path.splitext(os.path.basename(key))[0] == stem:
+                        self._observe(Path(key), now)
+
+    async def __aiter__(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        inotify = None
+        if self.use_inotify:
+            try:
+                inotify = _Inotify(self.directory)
+            except (OSError, AttributeError):
+                inotify = None
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+        if inotify is not None:
+            loop.add_reader(inotify.fd, wakeup.set)
+        try:
+            self._scan(time.monotonic())
+            while True:
+                for video in self._collect_ready(time.monotonic()):
+                    yield video
+                if inotify is None:
+                    await asyncio.sleep(self.poll_interval)
+                    self._scan(time.monotonic())
+                    continue
+                # inotify 下没有事件时也需要定时醒来，确认候选文件是否已稳定
+                timeout = min(1.0, self.stable_seconds) if self._pending else None
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                wakeup.clear()
+                names, overflow = inotify.read()
+                now = time.monotonic()
+                if overflow:
+                    self._scan(now)
+                else:
+                    self._on_names(names, now)
+                # 候选文件在没有新事件时也要重新 stat，以便检测外部修改
+                for key in list(self._pending):
+                    self._observe(Path(key), now)
+        finally:
+            if inotify is not None:
+                loop.remove_reader(inotify.fd)
+                inotify.close()